@@ -0,0 +1,7 @@
+"""
+DroneKit benchmarks.
+
+Each module can be run as a script and prints its own report. :py:mod:`benchmarks.suite` is the
+performance regression suite: it runs against :py:class:`dronekit.mock_autopilot.MockAutopilot`, writes
+its results as JSON and compares them with a stored baseline (``python -m benchmarks``).
+"""
@@ -0,0 +1,68 @@
+"""
+Fleet spatial index benchmark.
+
+For fleets of 10, 100 and 1000 vehicles spread over a few square kilometres, times position updates,
+k-nearest and radius queries, and the pairwise conflict check against the O(n^2) loop over every pair
+of vehicles that the index replaces.
+
+Usage: ``python -m benchmarks.fleet [--radius METRES] [--area METRES]``
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import timeit
+
+from dronekit import geo
+from dronekit.fleet import FleetIndex
+
+ORIGIN = (-35.36, 149.16)
+
+
+def brute_force_conflicts(points, radius):
+    result = []
+    for i in range(len(points)):
+        lat1, lon1 = points[i]
+        for j in range(i + 1, len(points)):
+            lat2, lon2 = points[j]
+            distance = geo.haversine_distance(lat1, lon1, lat2, lon2)
+            if distance <= radius:
+                result.append((i, j, distance))
+    return result
+
+
+def best(func, repeat, number=1):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dronekit.fleet.FleetIndex.')
+    parser.add_argument('--radius', type=float, default=50, help='conflict radius in metres')
+    parser.add_argument('--area', type=float, default=2000, help='side of the square area flown, in metres')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions (best time is reported)')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    spread = args.area / 111320.0 / 2
+    print('%6s %12s %12s %12s %14s %14s' % ('fleet', 'update', 'nearest(5)', 'within', 'conflicts', 'brute force'))
+    for n in (10, 100, 1000):
+        points = [(ORIGIN[0] + rng.uniform(-spread, spread), ORIGIN[1] + rng.uniform(-spread, spread))
+                  for _ in range(n)]
+        index = FleetIndex(cell_size=args.radius, origin=ORIGIN)
+
+        def update_all():
+            for i, (lat, lon) in enumerate(points):
+                index.update(i, lat, lon)
+
+        update = best(update_all, args.repeat) / n
+        nearest = best(lambda: index.nearest(ORIGIN[0], ORIGIN[1], k=5), args.repeat, number=100)
+        within = best(lambda: index.within(ORIGIN[0], ORIGIN[1], args.radius * 4), args.repeat, number=100)
+        conflicts = best(lambda: index.conflicts(args.radius), args.repeat)
+        brute = best(lambda: brute_force_conflicts(points, args.radius), args.repeat)
+        print('%6d %9.1f us %9.1f us %9.1f us %11.2f ms %11.2f ms' % (
+            n, update * 1e6, nearest * 1e6, within * 1e6, conflicts * 1e3, brute * 1e3))
+
+
+if __name__ == '__main__':
+    main()
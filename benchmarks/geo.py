@@ -0,0 +1,56 @@
+"""
+Geodesy benchmark: scalar loops against the vectorized ``dronekit.geo`` functions.
+
+Computes the distance from every vehicle to every geofence vertex, as a fleet monitor would on each
+tick, and reports the time per tick for each method.
+
+Usage: ``python -m benchmarks.geo [--vehicles N] [--vertices M]``
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+import numpy
+
+from dronekit import geo
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dronekit.geo.')
+    parser.add_argument('--vehicles', type=int, default=100, help='number of vehicles')
+    parser.add_argument('--vertices', type=int, default=10000, help='number of fence vertices')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions (best time is reported)')
+    args = parser.parse_args()
+
+    rng = numpy.random.RandomState(0)
+    vehicle_lats = -35.36 + rng.uniform(-0.05, 0.05, args.vehicles)
+    vehicle_lons = 149.16 + rng.uniform(-0.05, 0.05, args.vehicles)
+    fence_lats = -35.36 + rng.uniform(-0.1, 0.1, args.vertices)
+    fence_lons = 149.16 + rng.uniform(-0.1, 0.1, args.vertices)
+
+    # Plain Python lists for the scalar path, as an application without NumPy would have.
+    scalar_vehicles = list(zip(vehicle_lats.tolist(), vehicle_lons.tolist()))
+    scalar_fence = list(zip(fence_lats.tolist(), fence_lons.tolist()))
+    # The scalar loops are slow, so time them on a sample of the vehicles and scale up.
+    sample = scalar_vehicles[:max(1, args.vehicles // 20)]
+    scale = float(args.vehicles) / len(sample)
+
+    def scalar(distance):
+        return [[distance(lat, lon, flat, flon) for flat, flon in scalar_fence] for lat, lon in sample]
+
+    def vectorized(distance):
+        return distance(vehicle_lats[:, None], vehicle_lons[:, None], fence_lats, fence_lons)
+
+    pairs = args.vehicles * args.vertices
+    print('%d vehicles x %d vertices (%d distances)' % (args.vehicles, args.vertices, pairs))
+    for name, distance in (('haversine', geo.haversine_distance), ('vincenty', geo.vincenty_distance)):
+        scalar_time = min(timeit.repeat(lambda: scalar(distance), number=1, repeat=args.repeat)) * scale
+        vector_time = min(timeit.repeat(lambda: vectorized(distance), number=1, repeat=args.repeat))
+        print('%-9s scalar %9.1f ms  vectorized %8.1f ms  speedup %6.1fx' % (
+            name, scalar_time * 1e3, vector_time * 1e3, scalar_time / vector_time))
+
+
+if __name__ == '__main__':
+    main()
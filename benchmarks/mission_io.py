@@ -0,0 +1,58 @@
+"""
+Mission file round-trip benchmark.
+
+Writes and reads back a generated survey mission in QGC WPL 110 and ``.plan`` format and reports
+items per second for each step.
+
+Usage: ``python -m benchmarks.mission_io [--items N] [--repeat R]``
+"""
+
+from __future__ import print_function
+
+import argparse
+import io
+import timeit
+
+from dronekit import mission_io
+from dronekit.mission import MissionStore
+
+
+def make_store(n):
+    store = MissionStore()
+    store.extend(command=16, frame=3, x=[-353632620 + (i % 100) * 1000 for i in range(n)],
+                 y=[1491652370 + (i // 100) * 1000 for i in range(n)], z=30)
+    return store
+
+
+def load(read, text):
+    store = MissionStore()
+    for chunk in read(io.StringIO(text)):
+        store.extend(**chunk)
+    return store
+
+
+def save(write, store):
+    f = io.StringIO()
+    write(f, store)
+    return f.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark mission file import/export.')
+    parser.add_argument('--items', type=int, default=10000, help='number of mission items')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions (best time is reported)')
+    args = parser.parse_args()
+
+    store = make_store(args.items)
+    for name, read, write in (('wpl', mission_io.read_wpl, mission_io.write_wpl),
+                              ('plan', mission_io.read_plan, mission_io.write_plan)):
+        text = save(write, store)
+        assert load(read, text).count() == store.count()
+        write_time = min(timeit.repeat(lambda: save(write, store), number=1, repeat=args.repeat))
+        read_time = min(timeit.repeat(lambda: load(read, text), number=1, repeat=args.repeat))
+        print('%-4s %7d items  write %8.1f ms (%9.0f items/s)  read %8.1f ms (%9.0f items/s)' % (
+            name, args.items, write_time * 1e3, args.items / write_time, read_time * 1e3, args.items / read_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+"""
+Performance regression suite.
+
+Runs every benchmark against an in-process :py:class:`dronekit.mock_autopilot.MockAutopilot` (or a
+generated tlog, for the receive path), so it needs neither SITL nor hardware:
+
+* ``parse_dispatch``: messages per second parsed and dispatched by ``MAVConnection``, and by a
+  ``Vehicle`` with all of its built-in listeners.
+* ``notify``: cost of one attribute notification with 0, 1, 4 and 16 listeners.
+* ``connect``: time from ``connect()`` to ``wait_ready=True`` returning.
+* ``params``: time to download a 2000 entry parameter table.
+* ``mission``: mission upload and download times at 100, 1000 and 10000 items.
+* ``command``: ``COMMAND_LONG`` to ``COMMAND_ACK`` round-trip percentiles.
+
+Results are printed, and written as JSON with ``--output``. With ``--baseline`` they are compared with a
+stored run, and the exit status is 1 if any result is more than ``--threshold`` (a fraction) worse. A
+baseline entry can carry its own ``tolerance``, for results that are noisier than the rest;
+``--save-baseline`` keeps the tolerances of the file it replaces. A baseline is only compared with runs of
+the same size (with or without ``--quick``).
+
+Usage: ``python -m benchmarks [--quick] [--only NAME ...] [--output FILE] [--baseline FILE]
+[--threshold F] [--save-baseline FILE]``
+
+Timings depend on the machine: record a baseline on the machine that runs the comparison. The baseline in
+this directory holds the median of twelve ``--quick`` runs on a single-CPU Linux machine, with tolerances
+covering the spread between those runs.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+from pymavlink import mavutil
+
+from dronekit import connect
+from dronekit.mavlink import MAVConnection
+from dronekit.mock_autopilot import MockAutopilot
+from dronekit.tlog import TlogRecorder, wait_replay
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+mavlink = mavutil.mavlink
+
+
+class Results(object):
+    """
+    Benchmark results by name, with their unit and whether larger values are better.
+    """
+
+    def __init__(self):
+        self.values = collections.OrderedDict()
+
+    def add(self, name, value, unit, higher_is_better=False):
+        self.values[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        print('%-36s %14.4g %s' % (name, value, unit))
+        sys.stdout.flush()
+
+    def to_json(self, quick=False):
+        return {
+            'metadata': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'mavlink': mavlink.WIRE_PROTOCOL_VERSION,
+                'quick': quick,
+            },
+            'results': self.values,
+        }
+
+
+def percentile(values, fraction):
+    if not values:
+        raise ValueError('No values')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def write_log(path, count):
+    # A mix of telemetry roughly like a real log, sent by system 1.
+    mav = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    recorder = TlogRecorder(path)
+    t = 1500000000.0
+    for i in range(count // 10):
+        recorder.record(mav.heartbeat_encode(2, 3, 0, 0, 0).pack(mav), t)
+        recorder.record(mav.global_position_int_encode(i, -353600000 + i, 1491600000 + i, 584000, 10000,
+                                                       0, 0, 0, 0).pack(mav), t)
+        for _ in range(4):
+            recorder.record(mav.attitude_encode(i, 0.1, 0.2, 0.3, 0, 0, 0).pack(mav), t)
+            recorder.record(mav.vfr_hud_encode(10, 10, 90, 50, 20, 1).pack(mav), t)
+        t += 0.1
+    recorder.close()
+
+
+def replay_connection(path):
+    count = [0]
+
+    def counter(_, msg):
+        count[0] += 1
+
+    connection = MAVConnection('tlog:' + path, replay_speed=None)
+    connection.forward_message(counter)
+    connection.start()
+    start = time.time()
+    connection.master.play()
+    connection.master.finished.wait()
+    elapsed = time.time() - start
+    connection.close()
+    return count[0] / elapsed
+
+
+def replay_vehicle(path):
+    count = [0]
+    vehicle = connect('tlog:' + path, replay_speed=None)
+
+    @vehicle.on_message('*')
+    def counter(self, name, msg):
+        count[0] += 1
+
+    start = time.time()
+    wait_replay(vehicle)
+    elapsed = time.time() - start
+    vehicle.close()
+    return count[0] / elapsed
+
+
+def bench_parse_dispatch(results, args):
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'bench.tlog')
+        write_log(path, args.messages)
+        results.add('parse_dispatch.connection', max(replay_connection(path) for _ in range(args.repeat)),
+                    'msgs/s', True)
+        results.add('parse_dispatch.vehicle', max(replay_vehicle(path) for _ in range(args.repeat)),
+                    'msgs/s', True)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_notify(results, args):
+    tmp = tempfile.mkdtemp()
+    try:
+        # The replay is never played: the vehicle is only there for its listeners.
+        path = os.path.join(tmp, 'idle.tlog')
+        write_log(path, 10)
+        vehicle = connect('tlog:' + path)
+        attitude = vehicle.attitude
+        number = 20000
+        listeners = 0
+        for count in (0, 1, 4, 16):
+            while listeners < count:
+                vehicle.add_attribute_listener('attitude', lambda self, name, value: None)
+                listeners += 1
+            best = min(timeit.repeat(lambda: vehicle.notify_attribute_listeners('attitude', attitude),
+                                     number=number, repeat=args.repeat))
+            results.add('notify.listeners_%d' % count, best / number * 1e6, 'us')
+        vehicle.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_connect(results, args):
+    times = []
+    for _ in range(args.repeat):
+        with MockAutopilot() as mock:
+            start = time.time()
+            vehicle = connect(mock.connection_string, wait_ready=True, heartbeat_timeout=10)
+            times.append(time.time() - start)
+            vehicle.close()
+    results.add('connect.wait_ready', min(times), 's')
+
+
+def bench_params(results, args):
+    count = 2000
+    params = dict(('PARAM_%04d' % i, i) for i in range(count))
+    times = []
+    for _ in range(args.repeat):
+        with MockAutopilot(params=params) as mock:
+            start = time.time()
+            vehicle = connect(mock.connection_string, wait_ready=['parameters'], heartbeat_timeout=10)
+            times.append(time.time() - start)
+            assert len(vehicle.parameters) == count
+            vehicle.close()
+    results.add('params.download_%d' % count, min(times), 's')
+
+
+def bench_mission(results, args):
+    with MockAutopilot() as mock:
+        vehicle = connect(mock.connection_string, wait_ready=True, heartbeat_timeout=10)
+        cmds = vehicle.commands
+        downloaded = threading.Event()
+        vehicle.add_attribute_listener('commands', lambda self, name, value: downloaded.set())
+        cmds.download()
+        cmds.wait_ready()
+        for size in args.mission_sizes:
+            lats = [-35.3632 + i * 1e-6 for i in range(size)]
+            uploads = []
+            downloads = []
+            for _ in range(args.repeat):
+                cmds.clear()
+                cmds.add_many(mavlink.MAV_CMD_NAV_WAYPOINT, lats, 149.1652, 30)
+                start = time.time()
+                cmds.upload(timeout=600)
+                uploads.append(time.time() - start)
+                assert mock.missions[0].count() == size + 1
+
+                downloaded.clear()
+                start = time.time()
+                cmds.download()
+                downloaded.wait(600)
+                downloads.append(time.time() - start)
+                assert cmds.count == size
+            results.add('mission.upload_%d' % size, min(uploads), 's')
+            results.add('mission.download_%d' % size, min(downloads), 's')
+        vehicle.close()
+
+
+def bench_command(results, args):
+    with MockAutopilot() as mock:
+        vehicle = connect(mock.connection_string, wait_ready=True, heartbeat_timeout=10)
+        acked = threading.Event()
+
+        @vehicle.on_message('COMMAND_ACK')
+        def listener(self, name, msg):
+            if msg.command == mavlink.MAV_CMD_DO_CHANGE_SPEED:
+                acked.set()
+
+        runs = []
+        lost = 0
+        for _ in range(args.repeat):
+            times = []
+            for i in range(args.commands):
+                acked.clear()
+                msg = vehicle.message_factory.command_long_encode(0, 0, mavlink.MAV_CMD_DO_CHANGE_SPEED, 0,
+                                                                  1, 5, -1, 0, 0, 0, 0)
+                start = time.time()
+                vehicle.send_mavlink(msg)
+                if not acked.wait(1):
+                    lost += 1
+                    continue
+                times.append(time.time() - start)
+            if times:
+                runs.append(times)
+        vehicle.close()
+    if runs:
+        for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            best = min(percentile(times, fraction) for times in runs)
+            results.add('command.rtt_%s' % name, best * 1e3, 'ms')
+    results.add('command.lost', lost, 'commands')
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('parse_dispatch', bench_parse_dispatch),
+    ('notify', bench_notify),
+    ('connect', bench_connect),
+    ('params', bench_params),
+    ('mission', bench_mission),
+    ('command', bench_command),
+])
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline.
+
+    :returns: A list of ``(name, baseline_value, value, change, status)``, where ``change`` is the
+        relative change (positive when worse) and ``status`` is ``'regressed'``, ``'improved'``, ``'ok'``
+        or ``'new'``.
+    """
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, None, result['value'], None, 'new'))
+            continue
+        tolerance = base.get('tolerance', threshold)
+        if base['value'] == 0:
+            change = 0.0 if result['value'] == 0 else float('inf')
+        else:
+            change = (result['value'] - base['value']) / float(base['value'])
+        if result['higher_is_better']:
+            change = -change
+        if change > tolerance:
+            status = 'regressed'
+        elif change < -tolerance:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((name, base['value'], result['value'], change, status))
+    return rows
+
+
+def keep_tolerances(output, path):
+    """
+    Copy the ``tolerance`` of each result from the results file at ``path`` (if there is one) into
+    ``output``, so that saving a new baseline keeps the tolerances written by hand.
+    """
+    try:
+        with open(path) as f:
+            previous = json.load(f)['results']
+    except (IOError, OSError, ValueError, KeyError):
+        return
+    for name, result in output['results'].items():
+        if name in previous and 'tolerance' in previous[name]:
+            result['tolerance'] = previous[name]['tolerance']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the DroneKit performance regression suite.')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run (default: all)')
+    parser.add_argument('--quick', action='store_true', help='smaller workloads, for a fast check')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions (best result is reported)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', nargs='?', const=BASELINE,
+                        help='compare with this results file (default: benchmarks/baseline.json)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative change counted as a regression (default: 0.25)')
+    parser.add_argument('--save-baseline', nargs='?', const=BASELINE, metavar='FILE',
+                        help='write the results as the new baseline (default: benchmarks/baseline.json)')
+    args = parser.parse_args()
+    args.messages = 20000 if args.quick else 200000
+    args.mission_sizes = [100, 1000] if args.quick else [100, 1000, 10000]
+    args.commands = 100 if args.quick else 1000
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        quick = baseline['metadata'].get('quick')
+        if quick is not None and quick != args.quick:
+            sys.exit('%s was recorded %s --quick: compare it with a run of the same size'
+                     % (args.baseline, 'with' if quick else 'without'))
+
+    results = Results()
+    for name in args.only or BENCHMARKS:
+        BENCHMARKS[name](results, args)
+
+    output = results.to_json(args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.save_baseline:
+        keep_tolerances(output, args.save_baseline)
+        with open(args.save_baseline, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if baseline is not None:
+        rows = compare(results.values, baseline['results'], args.threshold)
+        print()
+        for name, base, value, change, status in rows:
+            if base is None:
+                print('%-36s %14s %14.4g %8s  %s' % (name, '-', value, '', status))
+            else:
+                print('%-36s %14.4g %14.4g %+7.1f%%  %s' % (name, base, value, change * 100, status))
+        if any(row[4] == 'regressed' for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Tlog reader benchmark.
+
+Writes a synthetic log with a mix of message types, then compares extracting the GLOBAL_POSITION_INT
+messages with a sequential ``mavutil`` scan against :py:class:`dronekit.tlog.TlogReader`: building the
+index, reopening with the cached index, iterating one message type, and decoding it in parallel. Then
+times the columnar export of every message type (:py:func:`dronekit.export.export_tlog`) against
+collecting rows with ``recv_match``.
+
+Usage: ``python -m benchmarks.tlog [--messages N] [--processes N]``
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from pymavlink import mavutil
+
+from dronekit.export import export_tlog
+from dronekit.tlog import TlogReader, TlogRecorder
+
+
+def write_log(path, count):
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    recorder = TlogRecorder(path)
+    t = 1500000000.0
+    for i in range(count // 10):
+        # One position for every nine other messages, roughly the mix of a real log.
+        recorder.record(mav.global_position_int_encode(i, -353600000 + i, 1491600000 + i, 584000, 10000,
+                                                       0, 0, 0, 0).pack(mav), t)
+        recorder.record(mav.heartbeat_encode(2, 3, 0, 0, 0).pack(mav), t)
+        for j in range(4):
+            recorder.record(mav.attitude_encode(i, 0.1, 0.2, 0.3, 0, 0, 0).pack(mav), t)
+            recorder.record(mav.vfr_hud_encode(10, 10, 90, 50, 20, 1).pack(mav), t)
+        t += 0.1
+    recorder.close()
+
+
+def lat_lon(msgs):
+    return [(m.lat, m.lon) for m in msgs]
+
+
+def timed(label, func):
+    start = time.time()
+    result = func()
+    print('%-32s %8.3f s' % (label, time.time() - start))
+    return result
+
+
+def mavutil_scan(path):
+    log = mavutil.mavlink_connection(path)
+    positions = []
+    while True:
+        msg = log.recv_match(type='GLOBAL_POSITION_INT')
+        if msg is None:
+            return positions
+        positions.append((msg.lat, msg.lon))
+
+
+def mavutil_rows(path):
+    log = mavutil.mavlink_connection(path)
+    rows = {}
+    while True:
+        msg = log.recv_match()
+        if msg is None:
+            return rows
+        rows.setdefault(msg.get_type(), []).append(msg.to_dict())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dronekit.tlog.TlogReader and dronekit.export.')
+    parser.add_argument('--messages', type=int, default=500000, help='number of messages in the log')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: all CPUs)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'bench.tlog')
+        write_log(path, args.messages)
+        print('%d messages, %.1f MB' % (args.messages, os.path.getsize(path) / 1e6))
+
+        expected = timed('mavutil sequential scan', lambda: mavutil_scan(path))
+        timed('TlogReader index build', lambda: TlogReader(path).close())
+        log = timed('TlogReader open (cached index)', lambda: TlogReader(path))
+        positions = timed('TlogReader one message type', lambda: lat_lon(log.messages('GLOBAL_POSITION_INT')))
+        chunks = timed('TlogReader parallel map', lambda: log.map(lat_lon, 'GLOBAL_POSITION_INT',
+                                                                 processes=args.processes))
+        log.close()
+        assert positions == expected == sum(chunks, [])
+
+        timed('recv_match rows, all types', lambda: mavutil_rows(path))
+        timed('export_tlog npz, all types', lambda: export_tlog(path, os.path.join(tmp, 'columns'), format='npz'))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -32,17 +32,23 @@ A number of other useful classes and methods are listed below.
 ----
 """
 import collections
+import concurrent.futures
+import contextlib
 import copy
 import logging
 import math
 import struct
 import time
+from array import array
 
 import monotonic
 from past.builtins import basestring
-from pymavlink import mavutil, mavwp
+from pymavlink import mavutil
 from pymavlink.dialects.v10 import ardupilotmega
 
+from dronekit import mission_io
+from dronekit.mission import MissionStore, _column_length
+from dronekit.timesync import TimeSync
 from dronekit.util import ErrprinterHandler
 
 
@@ -58,6 +64,57 @@ class TimeoutError(APIException):
     '''Raised by operations that have timeouts.'''
 
 
+class MissionAckError(APIException):
+    """
+    Raised when the autopilot rejects a mission transfer with an error ``MISSION_ACK``.
+
+    Specific results are raised as the subclasses below, so callers can catch either
+    this class or just the failure they know how to handle.
+
+    :param int result: The ``MAV_MISSION_RESULT`` code reported by the autopilot.
+    """
+
+    def __init__(self, result):
+        self.result = result
+        enum = mavutil.mavlink.enums['MAV_MISSION_RESULT']
+        name = enum[result].name if result in enum else 'UNKNOWN'
+        super(MissionAckError, self).__init__('Mission transfer rejected: %s (%s)' % (name, result))
+
+
+class MissionNoSpaceError(MissionAckError):
+    '''The autopilot has no space left to store the mission (``MAV_MISSION_NO_SPACE``).'''
+
+
+class MissionInvalidSequenceError(MissionAckError):
+    '''A mission item was received out of sequence (``MAV_MISSION_INVALID_SEQUENCE``).'''
+
+
+class MissionUnsupportedError(MissionAckError):
+    '''A command or frame in the mission is not supported (``MAV_MISSION_UNSUPPORTED*``).'''
+
+
+class MissionInvalidParamError(MissionAckError):
+    '''A mission item has an invalid parameter (``MAV_MISSION_INVALID*``).'''
+
+
+class MissionDeniedError(MissionAckError):
+    '''The autopilot is not accepting missions at the moment (``MAV_MISSION_DENIED``).'''
+
+
+def _mission_ack_error(result):
+    if result == mavutil.mavlink.MAV_MISSION_NO_SPACE:
+        return MissionNoSpaceError(result)
+    if result == mavutil.mavlink.MAV_MISSION_INVALID_SEQUENCE:
+        return MissionInvalidSequenceError(result)
+    if result in (mavutil.mavlink.MAV_MISSION_UNSUPPORTED, mavutil.mavlink.MAV_MISSION_UNSUPPORTED_FRAME):
+        return MissionUnsupportedError(result)
+    if mavutil.mavlink.MAV_MISSION_INVALID <= result <= mavutil.mavlink.MAV_MISSION_INVALID_PARAM7:
+        return MissionInvalidParamError(result)
+    if result == mavutil.mavlink.MAV_MISSION_DENIED:
+        return MissionDeniedError(result)
+    return MissionAckError(result)
+
+
 class Attitude(object):
     """
     Attitude information.
@@ -721,12 +778,22 @@ class HasObservers(object):
         return decorator
 
 
+# RC_CHANNELS_OVERRIDE carries 18 channels in MAVLink 2 dialects, 8 in MAVLink 1 ones.
+_OVERRIDE_CHANNELS = len([name for name in mavutil.mavlink.MAVLink_rc_channels_override_message.fieldnames
+                          if name.startswith('chan')])
+
+
 class ChannelsOverride(dict):
     """
     A dictionary class for managing Vehicle channel overrides.
 
     Channels can be read, written, or cleared by index or using a dictionary syntax.
-    To clear a value, set it to ``None`` or use ``del`` on the item.
+    To clear a value, set it to ``None`` or use ``del`` on the item. Channels 1 to 18 can be
+    overridden (1 to 8 with MAVLink 1).
+
+    Each change is sent to the vehicle straight away. To change several channels in one message, use
+    :py:func:`batch`. Autopilots drop overrides that are not refreshed (after ``RC_OVERRIDE_TIME`` on
+    ArduPilot), so they can be re-sent at a fixed rate with :py:func:`start`.
 
     An object of this type is returned by :py:attr:`Vehicle.channels.overrides <Channels.overrides>`.
 
@@ -735,8 +802,10 @@ class ChannelsOverride(dict):
 
     def __init__(self, vehicle):
         self._vehicle = vehicle
-        self._count = 8  # Fixed by MAVLink
+        self._count = _OVERRIDE_CHANNELS
         self._active = True
+        self._streamer = None
+        self._meter = None
 
     def __getitem__(self, key):
         return dict.__getitem__(self, str(key))
@@ -760,12 +829,90 @@ class ChannelsOverride(dict):
     def __len__(self):
         return self._count
 
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Change several overrides and send them in a single message, when the ``with`` block ends:
+
+        .. code:: python
+
+            with vehicle.channels.overrides.batch() as overrides:
+                overrides['1'] = roll
+                overrides['2'] = pitch
+                overrides['3'] = throttle
+                overrides['4'] = yaw
+
+        If the block raises an exception, the overrides are restored and nothing is sent.
+        """
+        if not self._active:
+            # Part of an enclosing batch.
+            yield self
+            return
+        saved = dict(self)
+        self._active = False
+        try:
+            yield self
+        except:
+            dict.clear(self)
+            dict.update(self, saved)
+            raise
+        finally:
+            self._active = True
+        self._send()
+
+    def start(self, rate=10):
+        """
+        Re-send the overrides ``rate`` times a second, from a dedicated thread, until :py:func:`stop`.
+
+        While the overrides are re-sent, changes go out with the next message instead of straight away.
+        """
+        if self._streamer is None:
+            from dronekit.setpoints import SetpointStreamer
+            self._streamer = SetpointStreamer(self._vehicle)
+        self._streamer.set_message(self._message())
+        self._streamer.start(rate)
+
+    def stop(self):
+        """
+        Stop re-sending the overrides. The autopilot keeps them until they time out or are cleared.
+        """
+        if self._streamer is not None:
+            self._streamer.stop()
+
+    @property
+    def rate(self):
+        """
+        Messages per second while the overrides are re-sent (see :py:func:`start`), otherwise ``None``.
+        """
+        return self._streamer.rate if self._streamer is not None else None
+
+    @property
+    def send_rate(self):
+        """
+        Override messages actually sent per second, over the last second.
+        """
+        if self._streamer is not None and self._streamer.running:
+            return self._streamer.send_rate
+        return self._meter.rate if self._meter is not None else 0.0
+
+    def _message(self):
+        # Unset channels are released to the RC radio: 0 for channels 1-8, UINT16_MAX - 1 for 9-18.
+        overrides = [0] * 8 + [65534] * (self._count - 8)
+        for k, v in self.items():
+            overrides[int(k) - 1] = v
+        return self._vehicle.message_factory.rc_channels_override_encode(0, 0, *overrides)
+
     def _send(self):
         if self._active:
-            overrides = [0] * 8
-            for k, v in self.items():
-                overrides[int(k) - 1] = v
-            self._vehicle._master.mav.rc_channels_override_send(0, 0, *overrides)
+            streamer = self._streamer
+            if streamer is not None and streamer.running:
+                streamer.set_message(self._message())
+                return
+            if self._meter is None:
+                from dronekit.setpoints import RateMeter
+                self._meter = RateMeter()
+            self._vehicle.send_mavlink(self._message())
+            self._meter.tick()
 
 
 class Channels(dict):
@@ -842,6 +989,17 @@ class Channels(dict):
             # Clear all overrides by setting an empty dictionary
             vehicle.channels.overrides = {}
 
+        Several channels can be changed in one message, and the overrides re-sent at a fixed rate
+        (so that the autopilot does not time them out):
+
+        .. code:: python
+
+            vehicle.channels.overrides.start(rate=20)
+            with vehicle.channels.overrides.batch() as overrides:
+                overrides['1'] = 1600
+                overrides['3'] = 1400
+            print " Sent at %.1f Hz" % vehicle.channels.overrides.send_rate
+
         Read the channel overrides either as a dictionary or by index. Note that you'll get
         a ``KeyError`` exception if you read a channel override that has not been set.
 
@@ -856,18 +1014,16 @@ class Channels(dict):
 
     @overrides.setter
     def overrides(self, newch):
-        self._overrides._active = False
-        self._overrides.clear()
-        for k, v in newch.items():
-            if v:
-                self._overrides[str(k)] = v
-            else:
-                try:
-                    del self._overrides[str(k)]
-                except:
-                    pass
-        self._overrides._active = True
-        self._overrides._send()
+        with self._overrides.batch() as overrides:
+            overrides.clear()
+            for k, v in newch.items():
+                if v:
+                    overrides[str(k)] = v
+                else:
+                    try:
+                        del overrides[str(k)]
+                    except:
+                        pass
 
 
 class Locations(HasObservers):
@@ -1263,17 +1419,43 @@ class Vehicle(HasObservers):
         # Waypoints.
 
         self._home_location = None
-        self._wploader = mavwp.MAVWPLoader()
+        self._wploader = MissionStore()
         self._wp_loaded = True
-        self._wp_uploaded = None
+        self._mission_upload = None
         self._wpts_dirty = False
+        # Items edited in place since the last confirmed upload (seq -> confirmed item),
+        # and whether the mission was resized (which requires a full upload).
+        self._wpts_edited = {}
+        self._wpts_resized = False
         self._commands = CommandSequence(self)
 
+        # Geofence and rally point transfers (MAVLink 2 mission_type).
+        self._mission_download = None
+        self._fence = FenceSequence(self)
+        self._rally = RallySequence(self)
+
+        # Onboard log listing and download, set up on first use.
+        self._logs = None
+
+        # Optional subsystems, set up on first use.
+        self._streams = None
+        self._setpoints = None
+        self._link_budget = None
+        self._listener_profiler = None
+
         @self.on_message(['WAYPOINT_COUNT', 'MISSION_COUNT'])
         def listener(self, name, msg):
+            download = self._mission_download
+            if download is not None:
+                download.handle_count(msg)
+            if getattr(msg, 'mission_type', 0) != 0:
+                return
             if not self._wp_loaded:
                 self._wploader.clear()
                 self._wploader.expected_count = msg.count
+                self._wpts_dirty = False
+                self._wpts_edited = {}
+                self._wpts_resized = False
                 # self._master.waypoint_request_send(0)
                 self._master.mav.mission_request_int_send(
                     target_system=self._master.target_system,
@@ -1286,8 +1468,21 @@ class Vehicle(HasObservers):
             self._home_location = LocationGlobal(msg.latitude / 1.0e7, msg.longitude / 1.0e7, msg.altitude / 1000.0)
             self.notify_attribute_listeners('home_location', self.home_location, cache=True)
 
+        # Local tangent plane converters, by origin ('home' or 'ekf').
+        self._ekf_origin = None
+        self._tangent_planes = {}
+
+        @self.on_message('GPS_GLOBAL_ORIGIN')
+        def listener(self, name, msg):
+            self._ekf_origin = LocationGlobal(msg.latitude / 1.0e7, msg.longitude / 1.0e7, msg.altitude / 1000.0)
+
         @self.on_message(['WAYPOINT', 'MISSION_ITEM_INT'])
         def listener(self, name, msg):
+            download = self._mission_download
+            if download is not None:
+                download.handle_item(msg)
+            if getattr(msg, 'mission_type', 0) != 0:
+                return
             if not self._wp_loaded:
                 if msg.seq == 0:
                     if not (msg.x == 0 and msg.y == 0 and msg.z == 0):
@@ -1316,11 +1511,24 @@ class Vehicle(HasObservers):
         # Waypoint send to master
         @self.on_message(['WAYPOINT_REQUEST', 'MISSION_REQUEST', 'MISSION_REQUEST_INT'])
         def listener(self, name, msg):
-            if self._wp_uploaded is not None:
-                wp = self._wploader.wp(msg.seq)
-                handler.fix_targets(wp)
-                self._master.mav.send(wp)
-                self._wp_uploaded[msg.seq] = True
+            upload = self._mission_upload
+            if upload is not None:
+                upload.handle_request(msg)
+
+        @self.on_message(['WAYPOINT_ACK', 'MISSION_ACK'])
+        def listener(self, name, msg):
+            upload = self._mission_upload
+            if upload is not None:
+                upload.handle_ack(msg)
+
+        @handler.forward_loop
+        def listener(_):
+            upload = self._mission_upload
+            if upload is not None:
+                upload.poll()
+            download = self._mission_download
+            if download is not None:
+                download.poll()
 
         # TODO: Waypoint loop listeners
 
@@ -1434,6 +1642,28 @@ class Vehicle(HasObservers):
                 self._last_heartbeat = monotonic.monotonic() - self._heartbeat_lastreceived
                 self.notify_attribute_listeners('last_heartbeat', self.last_heartbeat)
 
+        self._link_stats = None
+        self._link_stats_interval = 1
+        self._link_stats_last = monotonic.monotonic()
+
+        @handler.forward_loop
+        def listener(_):
+            now = monotonic.monotonic()
+            if now - self._link_stats_last >= self._link_stats_interval:
+                self._link_stats_last = now
+                self._link_stats = self._handler.link_stats.snapshot(self._handler.out_queue.qsize(), now)
+                self.notify_attribute_listeners('link_stats', self._link_stats)
+
+        self._timesync = TimeSync(lambda tc1, ts1: self._master.mav.timesync_send(tc1, ts1))
+
+        @handler.forward_loop
+        def listener(_):
+            self._timesync.poll()
+
+        @self.on_message('TIMESYNC')
+        def listener(self, name, msg):
+            self._timesync.handle(msg)
+
     @property
     def last_heartbeat(self):
         """
@@ -1471,6 +1701,73 @@ class Vehicle(HasObservers):
         """
         return self._last_heartbeat
 
+    @property
+    def link_stats(self):
+        """
+        Statistics of the connection to the vehicle (:py:class:`LinkStats <dronekit.link_stats.LinkStats>`),
+        or ``None`` until the first snapshot has been taken.
+
+        A new snapshot is taken every second, and observers of ``link_stats`` are notified with it. It gives
+        the rate, bandwidth and inter-arrival jitter of each message type, the rate and packet loss (from
+        the gaps in sequence numbers) of each sending system and component, the number of packets that
+        failed their checksum or could not be parsed, and how many packets are waiting to be sent:
+
+        .. code-block:: python
+
+            @vehicle.on_attribute('link_stats')
+            def listener(self, attr_name, stats):
+                print "%.0f packets/s, %s lost, %s queued" % (stats.rate, stats.lost, stats.queue_depth)
+                print stats.messages['ATTITUDE']
+        """
+        return self._link_stats
+
+    @property
+    def timesync(self):
+        """
+        The estimate of the vehicle's clock (:py:class:`TimeSync <dronekit.timesync.TimeSync>`).
+
+        ``TIMESYNC`` requests are sent once a second (more often just after connecting), and the answers
+        with the shortest round trips give the offset and drift of the vehicle's boot clock:
+
+        .. code-block:: python
+
+            if vehicle.timesync.synced:
+                print "Offset %.3f s, drift %.1f ppm, rtt %.1f ms" % (
+                    vehicle.timesync.offset, vehicle.timesync.drift * 1e6, vehicle.timesync.rtt * 1e3)
+
+        Set ``vehicle.timesync.enabled = False`` to stop sending requests.
+        """
+        return self._timesync
+
+    def to_host_time(self, boot_ms, wall=False):
+        """
+        Convert a vehicle timestamp in milliseconds since boot (the ``time_boot_ms`` field of ``ATTITUDE``,
+        ``GLOBAL_POSITION_INT`` and other messages) to host time, using the :py:attr:`timesync` estimate.
+
+        .. code-block:: python
+
+            @vehicle.on_message('ATTITUDE')
+            def listener(self, name, msg):
+                measured = self.to_host_time(msg.time_boot_ms, wall=True)
+
+        :param boot_ms: Milliseconds since the vehicle booted.
+        :param bool wall: Return ``time.time()`` seconds rather than ``time.monotonic()`` seconds.
+        :returns: The host time in seconds, or ``None`` if the vehicle has not answered ``TIMESYNC`` yet.
+        """
+        return self._timesync.to_host_time(boot_ms, wall)
+
+    def to_host_times(self, boot_ms, wall=False):
+        """
+        Convert many vehicle timestamps at once (see :py:func:`to_host_time`), for example a column of a log.
+
+        :param boot_ms: A sequence of milliseconds since boot, or a NumPy array (converted in one vectorized
+            operation).
+        :param bool wall: Return ``time.time()`` seconds rather than ``time.monotonic()`` seconds.
+        :returns: A NumPy array of float seconds if ``boot_ms`` is one, otherwise a list, or ``None`` if
+            the vehicle has not answered ``TIMESYNC`` yet.
+        """
+        return self._timesync.to_host_times(boot_ms, wall)
+
     def on_message(self, name):
         """
         Decorator for message listener callback functions.
@@ -1579,7 +1876,126 @@ class Vehicle(HasObservers):
             except Exception:
                 self._logger.exception('Exception in message handler for %s' % msg.get_type(), exc_info=True)
 
+    def enable_listener_profiling(self, slow_threshold=None):
+        """
+        Start timing every message, attribute and parameter listener call.
+
+        The returned :py:class:`ListenerProfiler <dronekit.profiling.ListenerProfiler>` keeps the call count
+        and the total and maximum wall-clock and CPU time of each listener function and of each message type
+        or attribute, and can print a report of the most expensive:
+
+        .. code:: python
+
+            profiler = vehicle.enable_listener_profiling(slow_threshold=0.005)
+            time.sleep(60)
+            print(profiler.report(limit=10))
+
+        Profiling has no cost until it is enabled, and none again after
+        :py:func:`disable_listener_profiling`.
+
+        :param float slow_threshold: Log a warning for each listener call that takes longer than this
+            many seconds.
+        :returns: The :py:class:`ListenerProfiler <dronekit.profiling.ListenerProfiler>`. Calling this
+            method again returns the same profiler, with its threshold updated.
+        """
+        if self._listener_profiler is None:
+            from dronekit.profiling import ListenerProfiler
+            self._listener_profiler = ListenerProfiler()
+            self._listener_profiler.attach(self)
+        self._listener_profiler.slow_threshold = slow_threshold
+        return self._listener_profiler
+
+    def disable_listener_profiling(self):
+        """
+        Stop timing listener calls.
+
+        :returns: The :py:class:`ListenerProfiler <dronekit.profiling.ListenerProfiler>` with the statistics
+            collected, or ``None`` if profiling was not enabled.
+        """
+        profiler = self._listener_profiler
+        if profiler is not None:
+            profiler.detach()
+            self._listener_profiler = None
+        return profiler
+
+    def enable_latency_tracing(self, boot_time=False):
+        """
+        Start recording the receive latency of every message, by stage and message type.
+
+        Messages are always stamped with their receive and dispatch times (see ``dronekit.latency``); the
+        returned :py:class:`LatencyTracer <dronekit.latency.LatencyTracer>` also keeps histograms of the time
+        from the start of the read to parsing, to dispatch and to the return of the last listener:
+
+        .. code:: python
+
+            tracer = vehicle.enable_latency_tracing(boot_time=True)
+            time.sleep(60)
+            print(tracer.report(types=['ATTITUDE', 'GLOBAL_POSITION_INT']))
+            print(tracer.histogram('total', 'ATTITUDE').percentile(99))
+
+        :param bool boot_time: Also record how long messages with a ``time_boot_ms`` field took to arrive
+            (compared with the fastest one until the vehicle clock is synchronised, see :py:attr:`timesync`).
+        :returns: The :py:class:`LatencyTracer <dronekit.latency.LatencyTracer>`. Calling this method again
+            returns the same tracer.
+        """
+        if self._handler.latency_tracer is None:
+            from dronekit.latency import LatencyTracer
+            self._handler.latency_tracer = LatencyTracer(timesync=self._timesync)
+        self._handler.latency_tracer.boot_time = boot_time
+        return self._handler.latency_tracer
+
+    def disable_latency_tracing(self):
+        """
+        Stop recording receive latencies.
+
+        :returns: The :py:class:`LatencyTracer <dronekit.latency.LatencyTracer>` with the latencies recorded,
+            or ``None`` if tracing was not enabled.
+        """
+        tracer = self._handler.latency_tracer
+        self._handler.latency_tracer = None
+        return tracer
+
+    def enable_link_budget(self, max_bandwidth=None):
+        """
+        Share the bandwidth of a slow radio link between commands, telemetry and bulk transfers.
+
+        The bandwidth is estimated from the ``RADIO_STATUS`` messages of the radios and the
+        :py:attr:`link_stats`. Commands are never delayed; telemetry requested through :py:attr:`streams` is
+        slowed down when the link is congested; parameter, mission and log transfer requests are sent at the
+        rate that is left (see ``dronekit.link_budget``):
+
+        .. code:: python
+
+            vehicle.streams.subscribe({'ATTITUDE': 10, 'GLOBAL_POSITION_INT': 5})
+            budget = vehicle.enable_link_budget()
+            vehicle.logs.download(1, 'flight.bin')  # Without starving the telemetry.
+
+        :param float max_bandwidth: Bytes per second the link can carry at best (both directions), if known.
+        :returns: The :py:class:`LinkBudget <dronekit.link_budget.LinkBudget>`. Calling this method again
+            returns the same object.
+        """
+        if self._link_budget is None:
+            from dronekit.link_budget import LinkBudget
+            self._link_budget = LinkBudget(self, max_bandwidth)
+            self._link_budget.attach()
+        return self._link_budget
+
+    def disable_link_budget(self):
+        """
+        Stop limiting telemetry and bulk transfers.
+
+        :returns: The :py:class:`LinkBudget <dronekit.link_budget.LinkBudget>`, or ``None`` if it was not enabled.
+        """
+        budget = self._link_budget
+        if budget is not None:
+            budget.detach()
+            self._link_budget = None
+        return budget
+
     def close(self):
+        if self._setpoints is not None:
+            self._setpoints.stop()
+        self._channels.overrides.stop()
         return self._handler.close()
 
     def flush(self):
@@ -2037,6 +2453,41 @@ class Vehicle(HasObservers):
             0, 0, 0,  # params 2-4
             pos.lat, pos.lon, pos.alt))
 
+    def local_tangent_plane(self, origin='home'):
+        """
+        Return a converter between global positions and a local north-east-down frame
+        (a :py:class:`LocalTangentPlane <dronekit.geo.LocalTangentPlane>`), anchored at the home location
+        or at the EKF origin.
+
+        The converter precomputes everything that depends on the origin, so it is much faster than
+        converting each point from scratch. It is a :py:class:`TrackingTangentPlane
+        <dronekit.geo.TrackingTangentPlane>`: it checks the origin before each conversion and re-anchors
+        itself when the origin moves (for example when the home location is set again), so it can be kept:
+
+        .. code:: python
+
+            ltp = vehicle.local_tangent_plane()
+            lat, lon, alt = ltp.to_global(north, east, down)   # numbers or NumPy arrays
+            local = ltp.location_local(LocationGlobalRelative(-35.36, 149.16, 20))
+
+        :param String origin: ``'home'`` for :py:attr:`home_location`, or ``'ekf'`` for the EKF origin
+            (the origin of :py:attr:`LocationLocal` positions, reported in ``GPS_GLOBAL_ORIGIN``).
+        :returns: The converter, or ``None`` if the origin is not known yet.
+        """
+        if origin == 'home':
+            attribute = '_home_location'
+        elif origin == 'ekf':
+            attribute = '_ekf_origin'
+        else:
+            raise ValueError("Expecting origin to be 'home' or 'ekf'.")
+        plane = self._tangent_planes.get(origin)
+        if plane is None:
+            if getattr(self, attribute) is None:
+                return None
+            from dronekit.geo import TrackingTangentPlane
+            plane = self._tangent_planes[origin] = TrackingTangentPlane(lambda: getattr(self, attribute))
+        return plane
+
     @property
     def commands(self):
         """
@@ -2048,6 +2499,81 @@ class Vehicle(HasObservers):
         """
         return self._commands
 
+    @property
+    def fence(self):
+        """
+        The geofence of this vehicle (:py:class:`FenceSequence`).
+
+        Use :py:func:`download() <MissionItemSequence.download>` to read the fence from the vehicle and
+        :py:func:`upload() <MissionItemSequence.upload>` to replace it. Needs MAVLink 2.
+        """
+        return self._fence
+
+    @property
+    def rally(self):
+        """
+        The rally points of this vehicle (:py:class:`RallySequence`). Needs MAVLink 2.
+        """
+        return self._rally
+
+    @property
+    def logs(self):
+        """
+        The logs stored on the vehicle (``dronekit.logs.LogList``), for listing and downloading them.
+
+        .. code:: python
+
+            entries = vehicle.logs.list()
+            download = vehicle.logs.download(entries[-1], 'last.bin')
+            print("%d bytes at %.0f bytes/s" % (download.bytes_received, download.throughput))
+        """
+        if self._logs is None:
+            from dronekit.logs import LogList
+            self._logs = LogList(self)
+        return self._logs
+
+    @property
+    def streams(self):
+        """
+        The telemetry rates requested from the vehicle (``dronekit.streams.StreamManager``), set up on first use.
+
+        Each part of an application declares the message rates it needs, and the vehicle is asked for the
+        highest rate of each message with ``MAV_CMD_SET_MESSAGE_INTERVAL`` (or ``REQUEST_DATA_STREAM`` on
+        autopilots without it):
+
+        .. code:: python
+
+            subscription = vehicle.streams.subscribe({'ATTITUDE': 50, 'SYS_STATUS': 1})
+            # Only stream the subscribed messages.
+            vehicle.streams.exclusive = True
+            vehicle.streams.wait_applied(timeout=5)
+        """
+        if self._streams is None:
+            from dronekit.streams import StreamManager
+            self._streams = StreamManager(self)
+        return self._streams
+
+    @property
+    def setpoints(self):
+        """
+        Guided-mode targets sent at a fixed rate (``dronekit.setpoints.SetpointStreamer``), set up on first use.
+
+        The streamer sends the latest target from its own thread, so that the autopilot keeps following it
+        between updates:
+
+        .. code:: python
+
+            vehicle.setpoints.start(rate=20)
+            vehicle.setpoints.set_velocity(2, 0, -0.5)
+            ...
+            vehicle.setpoints.stop()
+            print(vehicle.setpoints.lateness.percentile(99), vehicle.setpoints.missed)
+        """
+        if self._setpoints is None:
+            from dronekit.setpoints import SetpointStreamer
+            self._setpoints = SetpointStreamer(self)
+        return self._setpoints
+
     @property
     def parameters(self):
         """
@@ -2265,6 +2791,26 @@ class Vehicle(HasObservers):
         """
         self._master.mav.send(message)
 
+    def message_template(self, message):
+        """
+        Pack a message once, to send it many times with only some fields changed
+        (``dronekit.templates.MessageTemplate``).
+
+        This is much cheaper than :py:func:`send_mavlink` for messages sent at a high rate, such as setpoints:
+
+        .. code:: python
+
+            template = vehicle.message_template(vehicle.message_factory.set_position_target_local_ned_encode(
+                0, 0, 0, mavutil.mavlink.MAV_FRAME_LOCAL_NED, 0b0000111111000111, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+            template.send(vx=2, vy=0, vz=-0.5)
+
+        The ``target_system`` of the message is set to the vehicle's once, when the template is created.
+
+        :param message: A ``MAVLink_message`` instance, created using :py:func:`message_factory <dronekit.Vehicle.message_factory>`.
+        """
+        from dronekit.templates import MessageTemplate
+        return MessageTemplate(message, self._master.mav, self._handler.target_system)
+
     @property
     def message_factory(self):
         """
@@ -2971,6 +3517,286 @@ class Command(mavutil.mavlink.MAVLink_mission_item_int_message):
     pass
 
 
+class MissionUpload(object):
+    """
+    State machine for a single mission upload.
+
+    The upload is driven by the ``MISSION_REQUEST``/``MISSION_REQUEST_INT`` and ``MISSION_ACK`` messages
+    received from the autopilot: each request is answered immediately from the receive thread, and the
+    upload completes when the autopilot acknowledges the whole mission. If the autopilot goes quiet the
+    count (or the last item sent) is retransmitted, up to ``retries`` times in a row.
+
+    If ``start`` and ``end`` are given only that (inclusive) range of items is written, using
+    ``MISSION_WRITE_PARTIAL_LIST`` instead of ``MISSION_COUNT``.
+
+    Objects of this type are created by :py:func:`CommandSequence.upload_async`; the outcome is
+    reported through :py:attr:`future`.
+
+    :param vehicle: The :py:class:`Vehicle` to upload to.
+    :param loader: The mission store (indexed from 0, including the home location).
+    :param int mission_type: The ``MAV_MISSION_TYPE`` of the transfer.
+    :param progress: Optional callback ``progress(items_sent, count)``, called each time a new item is sent.
+    :param int retries: Number of consecutive retransmissions before the upload fails.
+    :param float retry_timeout: Seconds of silence from the autopilot before retransmitting.
+    :param int start: First item of a partial write.
+    :param int end: Last item of a partial write.
+    """
+
+    def __init__(self, vehicle, loader, mission_type=0, progress=None, retries=5, retry_timeout=1.0,
+                 start=None, end=None):
+        self._vehicle = vehicle
+        self._loader = loader
+        self._mission_type = mission_type
+        self._progress = progress
+        self._retries = retries
+        self._retry_timeout = retry_timeout
+
+        self.partial = start is not None
+        if self.partial:
+            self._first = start
+            self._last = loader.count() - 1 if end is None else end
+        else:
+            self._first = 0
+            self._last = loader.count() - 1
+        self.count = self._last - self._first + 1
+        self._sent = bytearray(self.count)
+        self._sent_count = 0
+        self._last_seq = None
+        self._attempts = 0
+        self._last_activity = None
+
+        self.future = concurrent.futures.Future()
+
+    @property
+    def items_sent(self):
+        """
+        Number of distinct mission items sent to the autopilot so far.
+        """
+        return self._sent_count
+
+    def start(self):
+        self._last_activity = monotonic.monotonic()
+        self._send_header()
+
+    def _send_header(self):
+        master = self._vehicle._master
+        if self.partial:
+            master.mav.mission_write_partial_list_send(master.target_system, master.target_component,
+                                                       self._first, self._last)
+        elif self._mission_type:
+            master.mav.mission_count_send(master.target_system, master.target_component, self.count,
+                                          mission_type=self._mission_type)
+        else:
+            master.waypoint_count_send(self.count)
+
+    def _send_item(self, seq):
+        wp = self._loader.wp(seq)
+        self._vehicle._handler.fix_targets(wp)
+        self._vehicle._master.mav.send(wp)
+
+    def handle_request(self, msg):
+        if self.future.done() or getattr(msg, 'mission_type', 0) != self._mission_type:
+            return
+        seq = msg.seq
+        if not self._first <= seq <= self._last:
+            self._vehicle._logger.debug('Ignoring mission request for out of range item %s' % seq)
+            return
+
+        self._send_item(seq)
+
+        self._last_seq = seq
+        self._attempts = 0
+        self._last_activity = monotonic.monotonic()
+        if not self._sent[seq - self._first]:
+            self._sent[seq - self._first] = 1
+            self._sent_count += 1
+            if self._progress:
+                self._progress(self._sent_count, self.count)
+
+    def handle_ack(self, msg):
+        if self.future.done() or getattr(msg, 'mission_type', 0) != self._mission_type:
+            return
+        if msg.type == mavutil.mavlink.MAV_MISSION_ACCEPTED:
+            if self._sent_count == self.count:
+                self.future.set_result(self.count)
+            else:
+                # Most likely a stale ACK for an earlier transfer.
+                self._vehicle._logger.debug('Ignoring mission ACK before all items were sent')
+        else:
+            self.future.set_exception(_mission_ack_error(msg.type))
+
+    def poll(self):
+        """
+        Retransmit if the autopilot has not responded within ``retry_timeout``.
+        """
+        if self.future.done() or self._last_activity is None:
+            return
+        now = monotonic.monotonic()
+        if now - self._last_activity < self._retry_timeout:
+            return
+        if self._attempts >= self._retries:
+            self.future.set_exception(
+                TimeoutError('Mission upload timed out after %s of %s items.' % (self._sent_count, self.count)))
+            return
+
+        self._attempts += 1
+        self._last_activity = now
+        if self._last_seq is None:
+            self._send_header()
+        else:
+            self._send_item(self._last_seq)
+
+
+class MissionDownload(object):
+    """
+    State machine for downloading the items of one mission type into a :py:class:`MissionStore`.
+
+    Up to ``window`` items are requested ahead of the last one received, so the transfer is not held up
+    by a full round trip per item. Items that arrive out of order are held until the gap is filled, and
+    requests that go unanswered for ``retry_timeout`` are repeated, up to ``retries`` times in a row.
+    The outcome (the number of items downloaded) is reported through :py:attr:`future`.
+
+    :param vehicle: The :py:class:`Vehicle` to download from.
+    :param store: The :py:class:`MissionStore` to fill. It is cleared when the download starts.
+    :param int mission_type: The ``MAV_MISSION_TYPE`` of the transfer.
+    :param int window: Maximum number of outstanding item requests.
+    :param int retries: Number of consecutive retransmissions before the download fails.
+    :param float retry_timeout: Seconds of silence from the autopilot before retransmitting.
+    """
+
+    def __init__(self, vehicle, store, mission_type=0, window=8, retries=5, retry_timeout=1.0):
+        self._vehicle = vehicle
+        self._store = store
+        self._mission_type = mission_type
+        self._window = window
+        self._retries = retries
+        self._retry_timeout = retry_timeout
+
+        self.count = None
+        self._requested = 0
+        self._pending = {}
+        self._attempts = 0
+        self._last_activity = None
+
+        self.future = concurrent.futures.Future()
+
+    def start(self):
+        self._store.clear()
+        self._last_activity = monotonic.monotonic()
+        self._send_request_list()
+
+    def _send_request_list(self):
+        master = self._vehicle._master
+        master.mav.mission_request_list_send(master.target_system, master.target_component,
+                                             mission_type=self._mission_type)
+
+    def _request(self, seq):
+        master = self._vehicle._master
+        master.mav.mission_request_int_send(master.target_system, master.target_component, seq,
+                                            mission_type=self._mission_type)
+
+    def _fill_window(self):
+        end = min(self._store.count() + self._window, self.count)
+        while self._requested < end:
+            self._request(self._requested)
+            self._requested += 1
+
+    def _finish(self):
+        master = self._vehicle._master
+        master.mav.mission_ack_send(master.target_system, master.target_component,
+                                    mavutil.mavlink.MAV_MISSION_ACCEPTED, mission_type=self._mission_type)
+        self.future.set_result(self.count)
+
+    def handle_count(self, msg):
+        if self.future.done() or self.count is not None or \
+                getattr(msg, 'mission_type', 0) != self._mission_type:
+            return
+        self.count = msg.count
+        self._store.expected_count = msg.count
+        self._attempts = 0
+        self._last_activity = monotonic.monotonic()
+        if self.count == 0:
+            self._finish()
+        else:
+            self._fill_window()
+
+    def handle_item(self, msg):
+        if self.future.done() or self.count is None or \
+                getattr(msg, 'mission_type', 0) != self._mission_type:
+            return
+        store = self._store
+        if not store.count() <= msg.seq < self.count:
+            return
+        self._pending[msg.seq] = msg
+        while store.count() in self._pending:
+            store.add(self._pending.pop(store.count()))
+        self._attempts = 0
+        self._last_activity = monotonic.monotonic()
+        if store.count() == self.count:
+            self._finish()
+        else:
+            self._fill_window()
+
+    def poll(self):
+        """
+        Retransmit if the autopilot has not responded within ``retry_timeout``.
+        """
+        if self.future.done() or self._last_activity is None:
+            return
+        now = monotonic.monotonic()
+        if now - self._last_activity < self._retry_timeout:
+            return
+        if self._attempts >= self._retries:
+            self.future.set_exception(TimeoutError('Mission download timed out after %s of %s items.'
+                                                   % (self._store.count(), self.count)))
+            return
+
+        self._attempts += 1
+        self._last_activity = now
+        if self.count is None:
+            self._send_request_list()
+        else:
+            # Re-request everything outstanding that has not been received.
+            for seq in range(self._store.count(), self._requested):
+                if seq not in self._pending:
+                    self._request(seq)
+
+
+# Edited items closer together than this are sent in a single partial write.
+_PARTIAL_WRITE_MERGE_GAP = 8
+# Above this many partial writes it is cheaper to re-send the whole mission.
+_PARTIAL_WRITE_MAX_RANGES = 8
+
+
+def _degrees_to_int(values):
+    # Latitude/longitude in degrees -> int degrees * 1e7, as used by MISSION_ITEM_INT.
+    # Rounded rather than truncated, so that values read back from the vehicle convert to the same integers.
+    if hasattr(values, 'astype'):
+        return (values * 1e7).round()
+    if hasattr(values, '__len__') and not isinstance(values, (str, bytes)):
+        return [int(round(v * 1e7)) for v in values]
+    return int(round(values * 1e7))
+
+
+def _partial_ranges(edited, count):
+    '''
+    Group the edited item indices into inclusive ``(start, end)`` ranges for ``MISSION_WRITE_PARTIAL_LIST``.
+
+    Returns ``None`` if a full upload would be cheaper.
+    '''
+    ranges = []
+    for seq in sorted(edited):
+        if ranges and seq - ranges[-1][1] <= _PARTIAL_WRITE_MERGE_GAP:
+            ranges[-1][1] = seq
+        else:
+            ranges.append([seq, seq])
+    if not ranges or len(ranges) > _PARTIAL_WRITE_MAX_RANGES:
+        return None
+    if sum(end - start + 1 for start, end in ranges) * 2 > count:
+        return None
+    return [tuple(r) for r in ranges]
+
+
 class CommandSequence(object):
     """
     A sequence of vehicle waypoints (a "mission").
@@ -3040,17 +3866,11 @@ class CommandSequence(object):
         This command will be sent to the vehicle only after you call :py:func:`upload() <Vehicle.commands.upload>`.
         '''
 
-        # Add home point again.
+        # Keep the home point.
         self.wait_ready()
-        home = None
-        try:
-            home = self._vehicle._wploader.wp(0)
-        except:
-            pass
-        self._vehicle._wploader.clear()
-        if home:
-            self._vehicle._wploader.add(home, comment='Added by DroneKit')
+        self._vehicle._wploader.truncate(1)
         self._vehicle._wpts_dirty = True
+        self._vehicle._wpts_resized = True
 
     def add(self, cmd):
         '''
@@ -3064,11 +3884,153 @@ class CommandSequence(object):
         '''
         self.wait_ready()
         cmd = copy.copy(cmd)
-        cmd.x = int(cmd.x * 1e7)
-        cmd.y = int(cmd.y * 1e7)
-        self._vehicle._handler.fix_targets(cmd)
-        self._vehicle._wploader.add(cmd, comment='Added by DroneKit')
+        cmd.x = _degrees_to_int(cmd.x)
+        cmd.y = _degrees_to_int(cmd.y)
+        self._vehicle._wploader.add(cmd)
         self._vehicle._wpts_dirty = True
+        self._vehicle._wpts_resized = True
+
+    def add_many(self, command, lat=0, lon=0, alt=0, frame=mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                 param1=0, param2=0, param3=0, param4=0, current=0, autocontinue=1, target_component=0):
+        '''
+        Add many commands at the end of the command list in one operation.
+
+        Each argument is either a sequence with one value per command (a list, ``array.array`` or
+        NumPy array) or a single value used for every command. NumPy arrays are converted in bulk,
+        so this is the fastest way to build large missions such as survey grids:
+
+        .. code:: python
+
+            lats = numpy.linspace(-35.3632, -35.3532, 10000)
+            lons = numpy.full(10000, 149.1652)
+            cmds.add_many(mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, lats, lons, 30)
+            cmds.upload()
+
+        .. note::
+
+            Commands are sent to the vehicle only after you call ::py:func:`upload() <Vehicle.commands.upload>`.
+
+        :param command: The mission command(s) (``MAV_CMD``).
+        :param lat: Latitude(s) in degrees (``x``).
+        :param lon: Longitude(s) in degrees (``y``).
+        :param alt: Altitude(s) (``z``), in the reference frame given by ``frame``.
+        :param frame: The frame(s) of reference (default ``MAV_FRAME_GLOBAL_RELATIVE_ALT``).
+        '''
+        self.wait_ready()
+        self._vehicle._wploader.extend(
+            command=command, x=_degrees_to_int(lat), y=_degrees_to_int(lon), z=alt, frame=frame,
+            param1=param1, param2=param2, param3=param3, param4=param4,
+            current=current, autocontinue=autocontinue, target_component=target_component)
+        self._vehicle._wpts_dirty = True
+        self._vehicle._wpts_resized = True
+
+    def replace_many(self, index, **columns):
+        '''
+        Replace a run of existing commands, starting at ``index``, in one operation.
+
+        The keyword arguments are the same as for :py:func:`add_many`; fields that are not given keep
+        their current values. For example, to change the altitude of commands 10 to 19:
+
+        .. code:: python
+
+            cmds.replace_many(10, alt=[50] * 10)
+
+        As with assigning individual commands, only the changed commands are sent by the next
+        :py:func:`upload() <Vehicle.commands.upload>`.
+
+        :param int index: Index of the first command to replace.
+        '''
+        vehicle = self._vehicle
+        store = vehicle._wploader
+        names = {'lat': 'x', 'lon': 'y', 'alt': 'z'}
+        columns = dict((names.get(k, k), v) for k, v in columns.items())
+        for name in ('x', 'y'):
+            if name in columns:
+                columns[name] = _degrees_to_int(columns[name])
+
+        start = index + 1
+        end = start + _column_length(columns)
+        confirmed = {}
+        if not vehicle._wpts_resized:
+            for seq in range(start, min(end, store.count())):
+                if seq not in vehicle._wpts_edited:
+                    confirmed[seq] = store.row(seq)
+        store.replace(start, **columns)
+
+        if vehicle._wpts_resized:
+            vehicle._wpts_dirty = True
+            return
+        vehicle._wpts_edited.update(confirmed)
+        for seq in range(start, end):
+            if store.row(seq) == vehicle._wpts_edited[seq]:
+                del vehicle._wpts_edited[seq]
+        vehicle._wpts_dirty = bool(vehicle._wpts_edited)
+
+    def column(self, name):
+        '''
+        Return a zero-copy view (a ``memoryview``) of one field of every command.
+
+        This is useful for inspecting large missions with NumPy without building any ``Command`` objects
+        (``numpy.asarray(cmds.column('z'))``). Note that latitude and longitude (``'x'`` and ``'y'``) are
+        returned as integers in degrees * 1e7, as they are sent to the vehicle. Commands cannot be added or
+        cleared while a view is held.
+
+        :param String name: One of ``'command'``, ``'frame'``, ``'current'``, ``'autocontinue'``,
+            ``'param1'`` .. ``'param4'``, ``'x'``, ``'y'``, ``'z'`` or ``'target_component'``.
+        '''
+        return self._vehicle._wploader.column(name, start=1)
+
+    def load(self, filename):
+        '''
+        Replace the command list with a mission read from a file.
+
+        Files ending in ``.plan`` are read as QGroundControl plans, anything else as QGC WPL 110
+        (the format used by Mission Planner). The file is streamed straight into the command list, so
+        even very large missions load quickly. The home location (the first item in a WPL file, or the
+        planned home position of a plan) is only used if the vehicle has not reported one.
+
+        .. code:: python
+
+            cmds.load('survey.waypoints')
+            cmds.upload()
+
+        :param String filename: Path of the mission file.
+        :raises ValueError: If the file is not a valid mission file. The command list is left cleared.
+        '''
+        self.wait_ready()
+        vehicle = self._vehicle
+        store = vehicle._wploader
+        read = mission_io.read_plan if mission_io.is_plan(filename) else mission_io.read_wpl
+        keep_home = store.count() > 0
+        store.truncate(1)
+        vehicle._wpts_dirty = True
+        vehicle._wpts_resized = True
+        try:
+            with open(filename) as f:
+                for i, chunk in enumerate(read(f)):
+                    if i == 0 and keep_home:
+                        chunk = dict((name, values[1:]) for name, values in chunk.items())
+                    store.extend(**chunk)
+        except Exception:
+            store.truncate(1)
+            raise
+
+    def save(self, filename):
+        '''
+        Write the command list (and home location) to a file.
+
+        Files ending in ``.plan`` are written as QGroundControl plans, anything else as QGC WPL 110.
+        Call :py:func:`download` first to save the mission that is on the vehicle.
+
+        :param String filename: Path of the mission file.
+        '''
+        vehicle = self._vehicle
+        with open(filename, 'w') as f:
+            if mission_io.is_plan(filename):
+                mission_io.write_plan(f, vehicle._wploader, vehicle_type=vehicle._vehicle_type,
+                                      firmware_type=vehicle._autopilot_type)
+            else:
+                mission_io.write_wpl(f, vehicle._wploader)
 
     def upload(self, timeout=None):
         """
@@ -3077,20 +4039,121 @@ class CommandSequence(object):
         After the return from ``upload()`` any writes are guaranteed to have completed (or thrown an
         exception) and future reads will see their effects.
 
+        If the autopilot rejects the mission a :py:class:`MissionAckError` (or one of its subclasses,
+        such as :py:class:`MissionNoSpaceError`) is raised.
+
         :param int timeout: The timeout for uploading the mission. No timeout if not provided or set to None.
         """
-        if self._vehicle._wpts_dirty:
-            self._vehicle._master.waypoint_clear_all_send()
-            start_time = time.time()
-            if self._vehicle._wploader.count() > 0:
-                self._vehicle._wp_uploaded = [False] * self._vehicle._wploader.count()
-                self._vehicle._master.waypoint_count_send(self._vehicle._wploader.count())
-                while False in self._vehicle._wp_uploaded:
-                    if timeout and time.time() - start_time > timeout:
-                        raise TimeoutError
-                    time.sleep(0.1)
-                self._vehicle._wp_uploaded = None
-            self._vehicle._wpts_dirty = False
+        future = self.upload_async()
+        try:
+            future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError('Mission upload timed out after %s seconds.' % timeout)
+
+    def upload_async(self, progress=None, retries=5, retry_timeout=1.0):
+        """
+        Start uploading the mission without blocking the calling thread.
+
+        The upload is driven by the requests and acknowledgements received from the autopilot.
+        The returned ``concurrent.futures.Future`` resolves to the number of items uploaded
+        (including the home location), or raises a :py:class:`MissionAckError` subclass if the autopilot
+        rejects the mission, or a :py:class:`TimeoutError` if it stops responding.
+
+        If the only changes since the last upload (or download) were made by assigning to existing
+        items (``vehicle.commands[i] = cmd``), only the changed items are sent, using
+        ``MISSION_WRITE_PARTIAL_LIST``. If the autopilot rejects the partial write the whole mission
+        is uploaded instead. Adding or clearing commands always uploads the whole mission.
+
+        .. code:: python
+
+            def show_progress(sent, count):
+                print "Uploaded %s of %s" % (sent, count)
+
+            future = vehicle.commands.upload_async(progress=show_progress)
+            # ... do other work ...
+            future.result(timeout=30)
+
+        :param progress: Optional callback ``progress(items_sent, count)``. It is called from the
+            receive thread, so it should return quickly.
+        :param int retries: Number of consecutive retransmissions before giving up.
+        :param float retry_timeout: Seconds to wait for the autopilot before retransmitting.
+        :returns: A ``concurrent.futures.Future``.
+        """
+        vehicle = self._vehicle
+        if not vehicle._wpts_dirty:
+            future = concurrent.futures.Future()
+            future.set_result(vehicle._wploader.count())
+            return future
+
+        if vehicle._mission_upload is not None and not vehicle._mission_upload.future.done():
+            raise APIException('A mission upload is already in progress.')
+
+        if vehicle._wploader.count() == 0:
+            vehicle._master.waypoint_clear_all_send()
+            self._upload_confirmed()
+            future = concurrent.futures.Future()
+            future.set_result(0)
+            return future
+
+        result = concurrent.futures.Future()
+        ranges = None if vehicle._wpts_resized else _partial_ranges(vehicle._wpts_edited,
+                                                                    vehicle._wploader.count())
+        pending = list(ranges or [])
+        uploaded = [0]
+        kwargs = dict(progress=progress, retries=retries, retry_timeout=retry_timeout)
+
+        def run(upload, on_error):
+            def done(future):
+                if vehicle._mission_upload is upload:
+                    vehicle._mission_upload = None
+                if result.done():
+                    return
+                if future.cancelled():
+                    result.cancel()
+                elif future.exception() is not None:
+                    on_error(future.exception())
+                else:
+                    uploaded[0] += future.result()
+                    if pending:
+                        write_partial(pending.pop(0))
+                    else:
+                        self._upload_confirmed()
+                        result.set_result(uploaded[0])
+
+            upload.future.add_done_callback(done)
+            vehicle._mission_upload = upload
+            upload.start()
+
+        def write_partial(item_range):
+            start, end = item_range
+            run(MissionUpload(vehicle, vehicle._wploader, start=start, end=end, **kwargs), write_all)
+
+        def write_all(error=None):
+            if error is not None:
+                vehicle._logger.info('Partial mission write failed (%s), uploading the whole mission.' % error)
+                del pending[:]
+                uploaded[0] = 0
+            run(MissionUpload(vehicle, vehicle._wploader, **kwargs), result.set_exception)
+
+        def cancelled(future):
+            upload = vehicle._mission_upload
+            if future.cancelled() and upload is not None:
+                upload.future.cancel()
+
+        result.add_done_callback(cancelled)
+
+        if pending:
+            write_partial(pending.pop(0))
+        else:
+            write_all()
+        return result
+
+    def _upload_confirmed(self):
+        vehicle = self._vehicle
+        vehicle._wpts_dirty = False
+        vehicle._wpts_edited = {}
+        vehicle._wpts_resized = False
 
     @property
     def count(self):
@@ -3123,31 +4186,388 @@ class CommandSequence(object):
         '''
         return max(self._vehicle._wploader.count() - 1, 0)
 
+    def _command(self, seq):
+        (target_component, frame, command, current, autocontinue,
+         param1, param2, param3, param4, x, y, z) = self._vehicle._wploader.row(seq)
+        return Command(self._vehicle._handler.target_system, target_component, seq, frame, command,
+                       current, autocontinue, param1, param2, param3, param4, x / 1.0e7, y / 1.0e7, z)
+
     def __getitem__(self, index):
         if isinstance(index, slice):
-            result = []
-            for ii in range(*index.indices(len(self))):
-                converted_ii = copy.copy(self[ii])
-                converted_ii.x /= 1.0e7
-                converted_ii.y /= 1.0e7
-                result.append(converted_ii)
-            return result
+            return [self._command(ii + 1) for ii in range(*index.indices(len(self)))]
         elif isinstance(index, int):
-            item = copy.copy(self._vehicle._wploader.wp(index + 1))
-            if not item:
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
                 raise IndexError('Index %s out of range.' % index)
-            item.x /= 1.0e7
-            item.y /= 1.0e7
-            return item
+            return self._command(index + 1)
         else:
             raise TypeError('Invalid argument type.')
 
     def __setitem__(self, index, value):
+        if not isinstance(index, int):
+            raise TypeError('Invalid argument type.')
+        if index < 0:
+            index += len(self)
+        # Assigning just past the end appends.
+        if not 0 <= index <= len(self):
+            raise IndexError('Index %s out of range.' % index)
+        vehicle = self._vehicle
+        store = vehicle._wploader
+        seq = index + 1
+        if seq == store.count():
+            return self.add(value)
+
         value = copy.copy(value)
-        value.x = int(value.x * 1e7)
-        value.y = int(value.y * 1e7)
-        self._vehicle._wploader.set(value, index + 1)
-        self._vehicle._wpts_dirty = True
+        value.x = _degrees_to_int(value.x)
+        value.y = _degrees_to_int(value.y)
+        current = store.row(seq) if 0 < seq < store.count() else None
+        store.set(value, seq)
+
+        if vehicle._wpts_resized:
+            vehicle._wpts_dirty = True
+            return
+
+        # Remember the confirmed content of each edited item, so that edits which
+        # restore it don't need to be uploaded at all.
+        confirmed = vehicle._wpts_edited.setdefault(seq, current)
+        if store.row(seq) == confirmed:
+            del vehicle._wpts_edited[seq]
+        vehicle._wpts_dirty = bool(vehicle._wpts_edited)
+
+
+def _require_mission_type():
+    if 'mission_type' not in mavutil.mavlink.MAVLink_mission_count_message.fieldnames:
+        raise APIException('Geofence and rally point transfers need MAVLink 2: '
+                           'set the MAVLINK20 environment variable to 1 before importing dronekit.')
+
+
+def _future_result(future, timeout, what):
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError('%s timed out after %s seconds.' % (what, timeout))
+
+
+class MissionItemSequence(object):
+    """
+    A sequence of mission items of one ``MAV_MISSION_TYPE`` other than the mission itself.
+
+    This is the base class of :py:class:`FenceSequence` (:py:attr:`Vehicle.fence`) and
+    :py:class:`RallySequence` (:py:attr:`Vehicle.rally`). Items are kept in a compact
+    :py:class:`MissionStore <dronekit.mission.MissionStore>` and transferred with the same
+    request-driven mission protocol as :py:attr:`Vehicle.commands`, using the MAVLink 2
+    ``mission_type`` field. Unlike :py:class:`CommandSequence` there is no home item:
+    index 0 is the first item.
+
+    Changes are only sent to the vehicle by :py:func:`upload`, which always replaces the whole set.
+    """
+
+    _mission_type = None
+    _description = 'Mission item'
+
+    def __init__(self, vehicle):
+        self._vehicle = vehicle
+        self._store = MissionStore(self._mission_type)
+
+    def download(self, timeout=None):
+        """
+        Download the items from the vehicle, replacing the local copy. Blocks until the download is complete.
+
+        :param int timeout: Seconds to wait. No timeout if not provided or set to None.
+        :returns: The number of items downloaded.
+        """
+        return _future_result(self.download_async(), timeout, '%s download' % self._description)
+
+    def download_async(self, window=8, retries=5, retry_timeout=1.0):
+        """
+        Start downloading the items from the vehicle without blocking the calling thread.
+
+        :param int window: Maximum number of item requests outstanding at once.
+        :param int retries: Number of consecutive retransmissions before giving up.
+        :param float retry_timeout: Seconds to wait for the autopilot before retransmitting.
+        :returns: A ``concurrent.futures.Future`` resolving to the number of items downloaded.
+        """
+        _require_mission_type()
+        vehicle = self._vehicle
+        if vehicle._mission_download is not None and not vehicle._mission_download.future.done():
+            raise APIException('A mission item download is already in progress.')
+
+        download = MissionDownload(vehicle, self._store, self._mission_type, window=window, retries=retries,
+                                   retry_timeout=retry_timeout)
+
+        def done(future):
+            if vehicle._mission_download is download:
+                vehicle._mission_download = None
+
+        download.future.add_done_callback(done)
+        vehicle._mission_download = download
+        download.start()
+        return download.future
+
+    def upload(self, timeout=None):
+        """
+        Replace the items on the vehicle with the local copy. Blocks until the autopilot has accepted them.
+
+        If the autopilot rejects the items a :py:class:`MissionAckError` (or one of its subclasses) is raised.
+
+        :param int timeout: Seconds to wait. No timeout if not provided or set to None.
+        """
+        _future_result(self.upload_async(), timeout, '%s upload' % self._description)
+
+    def upload_async(self, progress=None, retries=5, retry_timeout=1.0):
+        """
+        Start uploading the items without blocking the calling thread.
+
+        :param progress: Optional callback ``progress(items_sent, count)``, called from the receive thread.
+        :param int retries: Number of consecutive retransmissions before giving up.
+        :param float retry_timeout: Seconds to wait for the autopilot before retransmitting.
+        :returns: A ``concurrent.futures.Future`` resolving to the number of items uploaded.
+        """
+        _require_mission_type()
+        vehicle = self._vehicle
+        if vehicle._mission_upload is not None and not vehicle._mission_upload.future.done():
+            raise APIException('A mission upload is already in progress.')
+
+        upload = MissionUpload(vehicle, self._store, mission_type=self._mission_type, progress=progress,
+                               retries=retries, retry_timeout=retry_timeout)
+
+        def done(future):
+            if vehicle._mission_upload is upload:
+                vehicle._mission_upload = None
+
+        upload.future.add_done_callback(done)
+        vehicle._mission_upload = upload
+        upload.start()
+        return upload.future
+
+    def clear(self):
+        """
+        Remove all items. The change is sent to the vehicle by :py:func:`upload`.
+        """
+        self._store.clear()
+
+    def add(self, cmd):
+        """
+        Add a :py:class:`Command` at the end of the sequence.
+        """
+        cmd = copy.copy(cmd)
+        cmd.x = _degrees_to_int(cmd.x)
+        cmd.y = _degrees_to_int(cmd.y)
+        self._store.add(cmd)
+
+    def column(self, name):
+        """
+        Return a zero-copy view (a ``memoryview``) of one field of every item.
+        See :py:func:`CommandSequence.column`.
+        """
+        return self._store.column(name)
+
+    @property
+    def count(self):
+        """
+        The number of items.
+        """
+        return self._store.count()
+
+    def __len__(self):
+        return self._store.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[ii] for ii in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Index %s out of range.' % index)
+        (target_component, frame, command, current, autocontinue,
+         param1, param2, param3, param4, x, y, z) = self._store.row(index)
+        return Command(self._vehicle._handler.target_system, target_component, index, frame, command,
+                       current, autocontinue, param1, param2, param3, param4, x / 1.0e7, y / 1.0e7, z)
+
+
+class FencePolygon(object):
+    """
+    A geofence polygon, as returned by :py:func:`FenceSequence.polygons`.
+
+    :param Boolean inclusion: ``True`` if the vehicle must stay inside the polygon, ``False`` if it must stay outside.
+    :param lat: Vertex latitudes in degrees (an ``array``).
+    :param lon: Vertex longitudes in degrees (an ``array``).
+    """
+
+    def __init__(self, inclusion, lat, lon):
+        self.inclusion = inclusion
+        self.lat = lat
+        self.lon = lon
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __str__(self):
+        return "FencePolygon:%s,vertices=%s" % ('inclusion' if self.inclusion else 'exclusion', len(self))
+
+
+class FenceCircle(object):
+    """
+    A circular geofence, as returned by :py:func:`FenceSequence.circles`.
+
+    :param Boolean inclusion: ``True`` if the vehicle must stay inside the circle, ``False`` if it must stay outside.
+    :param lat: Latitude of the centre in degrees.
+    :param lon: Longitude of the centre in degrees.
+    :param radius: Radius in metres.
+    """
+
+    def __init__(self, inclusion, lat, lon, radius):
+        self.inclusion = inclusion
+        self.lat = lat
+        self.lon = lon
+        self.radius = radius
+
+    def __str__(self):
+        return "FenceCircle:%s,lat=%s,lon=%s,radius=%s" % (
+            'inclusion' if self.inclusion else 'exclusion', self.lat, self.lon, self.radius)
+
+
+class FenceSequence(MissionItemSequence):
+    """
+    The geofence of a vehicle (``MAV_MISSION_TYPE_FENCE``), accessed through :py:attr:`Vehicle.fence`.
+
+    Polygons are stored as runs of vertex items in compact columns, so fences with many thousands of
+    vertices (inclusion and exclusion zones around airports, for example) can be built from NumPy arrays
+    and uploaded without creating an object per vertex:
+
+    .. code:: python
+
+        vehicle.fence.clear()
+        vehicle.fence.add_polygon(boundary_lats, boundary_lons)
+        for lats, lons in no_fly_zones:
+            vehicle.fence.add_polygon(lats, lons, inclusion=False)
+        vehicle.fence.add_circle(-35.363, 149.165, radius=50, inclusion=False)
+        vehicle.fence.upload()
+
+    Fence transfers need an autopilot that supports the MAVLink 2 mission protocol for fences
+    (ArduPilot 4.0 and later, PX4).
+    """
+
+    _mission_type = mavutil.mavlink.MAV_MISSION_TYPE_FENCE
+    _description = 'Geofence'
+
+    _POLYGON_COMMANDS = {
+        mavutil.mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION: True,
+        mavutil.mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_EXCLUSION: False,
+    }
+    _CIRCLE_COMMANDS = {
+        mavutil.mavlink.MAV_CMD_NAV_FENCE_CIRCLE_INCLUSION: True,
+        mavutil.mavlink.MAV_CMD_NAV_FENCE_CIRCLE_EXCLUSION: False,
+    }
+
+    def add_polygon(self, lat, lon, inclusion=True):
+        """
+        Add a polygon.
+
+        :param lat: Vertex latitudes in degrees (a sequence or NumPy array).
+        :param lon: Vertex longitudes in degrees.
+        :param Boolean inclusion: ``True`` for an inclusion zone (the default), ``False`` for an exclusion zone.
+        """
+        if len(lat) < 3 or len(lat) != len(lon):
+            raise ValueError('A fence polygon needs at least 3 vertices, with one longitude per latitude.')
+        if inclusion:
+            command = mavutil.mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION
+        else:
+            command = mavutil.mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_EXCLUSION
+        self._store.extend(command=command, frame=mavutil.mavlink.MAV_FRAME_GLOBAL, param1=len(lat),
+                           x=_degrees_to_int(lat), y=_degrees_to_int(lon))
+
+    def add_circle(self, lat, lon, radius, inclusion=True):
+        """
+        Add a circle.
+
+        :param lat: Latitude of the centre in degrees.
+        :param lon: Longitude of the centre in degrees.
+        :param radius: Radius in metres.
+        :param Boolean inclusion: ``True`` for an inclusion zone (the default), ``False`` for an exclusion zone.
+        """
+        if inclusion:
+            command = mavutil.mavlink.MAV_CMD_NAV_FENCE_CIRCLE_INCLUSION
+        else:
+            command = mavutil.mavlink.MAV_CMD_NAV_FENCE_CIRCLE_EXCLUSION
+        self._store.extend(command=command, frame=mavutil.mavlink.MAV_FRAME_GLOBAL, param1=[radius],
+                           x=[_degrees_to_int(lat)], y=[_degrees_to_int(lon)])
+
+    def set_return_point(self, lat, lon, alt):
+        """
+        Add the fence return point (where the vehicle goes on a breach, if the autopilot is configured to).
+        """
+        self._store.extend(command=mavutil.mavlink.MAV_CMD_NAV_FENCE_RETURN_POINT,
+                           frame=mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                           x=[_degrees_to_int(lat)], y=[_degrees_to_int(lon)], z=alt)
+
+    def polygons(self):
+        """
+        Return the polygons in the fence, as a list of :py:class:`FencePolygon`.
+        """
+        store = self._store
+        commands = store.column('command')
+        counts = store.column('param1')
+        result = []
+        i = 0
+        while i < len(commands):
+            inclusion = self._POLYGON_COMMANDS.get(commands[i])
+            if inclusion is None:
+                i += 1
+                continue
+            n = max(int(counts[i]), 1)
+            lat = array('d', (v / 1e7 for v in store.column('x', i, i + n)))
+            lon = array('d', (v / 1e7 for v in store.column('y', i, i + n)))
+            result.append(FencePolygon(inclusion, lat, lon))
+            i += n
+        return result
+
+    def circles(self):
+        """
+        Return the circles in the fence, as a list of :py:class:`FenceCircle`.
+        """
+        result = []
+        for i, command in enumerate(self._store.column('command')):
+            inclusion = self._CIRCLE_COMMANDS.get(command)
+            if inclusion is not None:
+                (_, _, _, _, _, radius, _, _, _, x, y, _) = self._store.row(i)
+                result.append(FenceCircle(inclusion, x / 1e7, y / 1e7, radius))
+        return result
+
+
+class RallySequence(MissionItemSequence):
+    """
+    The rally points of a vehicle (``MAV_MISSION_TYPE_RALLY``), accessed through :py:attr:`Vehicle.rally`.
+
+    .. code:: python
+
+        vehicle.rally.clear()
+        vehicle.rally.add_point(-35.362, 149.164, 40)
+        vehicle.rally.upload()
+    """
+
+    _mission_type = mavutil.mavlink.MAV_MISSION_TYPE_RALLY
+    _description = 'Rally point'
+
+    def add_point(self, lat, lon, alt):
+        """
+        Add a rally point.
+
+        :param lat: Latitude in degrees.
+        :param lon: Longitude in degrees.
+        :param alt: Altitude in metres, relative to home.
+        """
+        self.add_points([lat], [lon], [alt])
+
+    def add_points(self, lat, lon, alt):
+        """
+        Add many rally points at once, from sequences or NumPy arrays.
+        """
+        self._store.extend(command=mavutil.mavlink.MAV_CMD_NAV_RALLY_POINT,
+                           frame=mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                           x=_degrees_to_int(lat), y=_degrees_to_int(lon), z=alt)
 
 
 def default_still_waiting_callback(atts):
@@ -3167,7 +4587,10 @@ def connect(ip,
             heartbeat_timeout=30,
             source_system=255,
             source_component=0,
-            use_native=False):
+            use_native=False,
+            tlog=None,
+            replay_speed=1.0,
+            replay_capture=False):
     """
     Returns a :py:class:`Vehicle` object connected to the address specified by string parameter ``ip``.
     Connection string parameters (``ip``) for different targets are listed in the :ref:`getting started guide <get_started_connecting>`.
@@ -3205,6 +4628,13 @@ def connect(ip,
     :param int source_system: The MAVLink ID of the :py:class:`Vehicle` object returned by this method (by default 255).
     :param int source_component: The MAVLink Component ID fo the :py:class:`Vehicle` object returned by this method (by default 0).
     :param bool use_native: Use precompiled MAVLink parser.
+    :param tlog: Record the telemetry to a tlog file. Either a file name, or a
+        :py:class:`TlogRecorder <dronekit.tlog.TlogRecorder>` for rotation and compression options.
+    :param float replay_speed: For ``tlog:<filename>`` connection strings, the playback speed relative to
+        real time (default 1), or ``None`` to play the log back as fast as possible. The replay starts
+        paused (unless ``wait_ready`` is set): see ``dronekit.tlog.start_replay``.
+    :param bool replay_capture: For ``tlog:<filename>`` connection strings, keep the packets sent to the
+        "vehicle" instead of discarding them.
 
         .. note::
 
@@ -3229,13 +4659,19 @@ def connect(ip,
         vehicle_class = Vehicle
 
     handler = MAVConnection(ip, baud=baud, source_system=source_system, source_component=source_component,
-                            use_native=use_native)
+                            use_native=use_native, tlog=tlog, replay_speed=replay_speed,
+                            replay_capture=replay_capture)
     vehicle = vehicle_class(handler)
 
     if status_printer:
         vehicle._autopilot_logger.addHandler(ErrprinterHandler(status_printer))
 
-    if _initialize:
+    if ip.startswith('tlog:'):
+        # The replay has no vehicle to wait for: the log is played by dronekit.tlog.start_replay().
+        handler.start()
+        if wait_ready:
+            handler.master.play()
+    elif _initialize:
         vehicle.initialize(rate=rate, heartbeat_timeout=heartbeat_timeout)
 
     if wait_ready:
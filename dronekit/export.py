@@ -0,0 +1,328 @@
+"""
+Columnar export of telemetry, one table per message type.
+
+Each message type is written to its own file in an output directory, with one column per message field
+plus a ``_timestamp`` column holding the receive time (seconds since the epoch). Tables are written as
+NumPy ``.npz`` archives, or as Parquet files when ``pyarrow`` is installed; both load directly into
+pandas:
+
+.. code:: python
+
+    from dronekit.export import export_tlog
+
+    files = export_tlog('flight.tlog', 'flight_columns', types=['ATTITUDE', 'GLOBAL_POSITION_INT'])
+
+    import numpy
+    attitude = numpy.load(files['ATTITUDE'])
+    print(attitude['_timestamp'], attitude['roll'])
+
+Messages are converted in chunks of ``chunk_size`` rows, so memory use does not grow with the length of
+the log. Rather than decoding messages one at a time, the payloads of a chunk are gathered into an array
+and reinterpreted with a NumPy record type matching the MAVLink wire layout.
+
+A live stream can be recorded the same way with :py:func:`ColumnExporter.attach`:
+
+.. code:: python
+
+    exporter = ColumnExporter('flight_columns')
+    exporter.attach(vehicle)
+    ...
+    exporter.close()
+
+This module requires NumPy (``pip install dronekit[numpy]``).
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from array import array
+
+import numpy
+from pymavlink import mavutil
+
+from dronekit.tlog import TlogReader, _message_ids
+from dronekit.util import message_payload
+
+#: Default number of rows converted at a time.
+CHUNK_SIZE = 65536
+
+_STRUCT_TYPES = {
+    'b': 'i1', 'B': 'u1', 'h': 'i2', 'H': 'u2', 'i': 'i4', 'I': 'u4',
+    'q': 'i8', 'Q': 'u8', 'f': 'f4', 'd': 'f8', 'c': 'S1',
+}
+
+
+def _have_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def message_dtype(msgclass):
+    """
+    Return the NumPy record type of the payload of a MAVLink message class, in wire order.
+    """
+    fields = []
+    tokens = re.findall(r'(\d*)([a-zA-Z])', msgclass.unpacker.format)
+    for name, (count, code) in zip(msgclass.ordered_fieldnames, tokens):
+        if code == 's':
+            fields.append((name, 'S%s' % (count or 1)))
+        elif count:
+            fields.append((name, '<' + _STRUCT_TYPES[code], (int(count),)))
+        else:
+            fields.append((name, '<' + _STRUCT_TYPES[code]))
+    return numpy.dtype(fields)
+
+
+def _payloads(data, offsets, size):
+    # Gather the payloads of the packets after the tlog timestamps at ``offsets`` into an (n, size)
+    # array, zero-filling payloads that are shorter (MAVLink 2 truncates trailing zeros).
+    offsets = offsets.astype(numpy.int64)
+    start = offsets + numpy.where(data[offsets + 8] == 0xFD, 18, 14)
+    length = data[offsets + 9].astype(numpy.int64)
+    columns = numpy.arange(size)
+    present = columns < length[:, None]
+    rows = data[numpy.where(present, start[:, None] + columns, 0)]
+    rows[~present] = 0
+    return rows
+
+
+class _NpzSink(object):
+    # Appends each column to a raw file, and assembles the .npz archive from them when closed.
+
+    def __init__(self, path, compress):
+        self.path = path
+        self.compress = compress
+        self._tmp = tempfile.mkdtemp(dir=os.path.dirname(path) or '.')
+        self._columns = []
+        self._rows = 0
+
+    def write(self, columns):
+        if not self._columns:
+            self._columns = [(name, values.dtype, values.shape[1:]) for name, values in columns]
+        for name, values in columns:
+            with open(os.path.join(self._tmp, name), 'ab') as f:
+                f.write(numpy.ascontiguousarray(values).tobytes())
+        self._rows += len(columns[0][1])
+
+    def close(self):
+        mode = zipfile.ZIP_DEFLATED if self.compress else zipfile.ZIP_STORED
+        with zipfile.ZipFile(self.path, 'w', mode, allowZip64=True) as archive:
+            for name, dtype, shape in self._columns:
+                with archive.open(name + '.npy', 'w', force_zip64=True) as out:
+                    numpy.lib.format.write_array_header_1_0(out, {
+                        'descr': numpy.lib.format.dtype_to_descr(dtype),
+                        'fortran_order': False,
+                        'shape': (self._rows,) + shape,
+                    })
+                    with open(os.path.join(self._tmp, name), 'rb') as f:
+                        shutil.copyfileobj(f, out, 1 << 20)
+        shutil.rmtree(self._tmp)
+
+
+class _ParquetSink(object):
+    # Writes each chunk as a row group of a Parquet file.
+
+    def __init__(self, path, compress):
+        self.path = path
+        self.compression = 'zstd' if compress else 'snappy'
+        self._writer = None
+
+    def write(self, columns):
+        import pyarrow
+        import pyarrow.parquet
+
+        arrays = []
+        for name, values in columns:
+            if values.dtype.kind == 'S':
+                values = numpy.char.decode(values, 'utf-8', 'replace')
+            if values.ndim > 1:
+                arrays.append(pyarrow.FixedSizeListArray.from_arrays(pyarrow.array(values.ravel()),
+                                                                     values.shape[1]))
+            else:
+                arrays.append(pyarrow.array(values))
+        table = pyarrow.Table.from_arrays(arrays, names=[name for name, _ in columns])
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, table.schema, compression=self.compression)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class _Table(object):
+    # Pending rows of one message type.
+
+    def __init__(self, msgclass, sink, chunk_size):
+        self.msgclass = msgclass
+        self.dtype = message_dtype(msgclass)
+        self.size = self.dtype.itemsize
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._payloads = bytearray()
+        self._timestamps = array('d')
+
+    def append(self, payload, timestamp):
+        payload = payload[:self.size]
+        self._payloads += payload
+        if len(payload) < self.size:
+            self._payloads += bytes(self.size - len(payload))
+        self._timestamps.append(timestamp)
+        if len(self._timestamps) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, payloads, timestamps):
+        self._payloads += payloads.tobytes()
+        self._timestamps.frombytes(timestamps.astype(numpy.float64).tobytes())
+        if len(self._timestamps) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._timestamps:
+            return
+        records = numpy.frombuffer(bytes(self._payloads), dtype=self.dtype)
+        columns = [('_timestamp', numpy.frombuffer(self._timestamps, dtype=numpy.float64).copy())]
+        columns.extend((name, records[name]) for name in self.msgclass.fieldnames)
+        self.sink.write(columns)
+        self.rows += len(records)
+        self._payloads = bytearray()
+        self._timestamps = array('d')
+
+
+class ColumnExporter(object):
+    """
+    Converts MAVLink messages into one columnar file per message type.
+
+    :param str directory: Output directory (created if needed). Each message type is written to
+        ``<directory>/<TYPE>.npz`` or ``<directory>/<TYPE>.parquet``.
+    :param types: Message type name, or list of names, to export (all types by default).
+    :param str format: ``'npz'`` or ``'parquet'``. By default Parquet is used if ``pyarrow`` is installed.
+    :param int chunk_size: Number of rows of a message type that are converted and written at a time.
+    :param bool compress: Compress the output (deflate for NPZ, zstd for Parquet).
+    """
+
+    def __init__(self, directory, types=None, format=None, chunk_size=CHUNK_SIZE, compress=False):
+        if format is None:
+            format = 'parquet' if _have_pyarrow() else 'npz'
+        if format not in ('npz', 'parquet'):
+            raise ValueError("Unknown export format %r (expected 'npz' or 'parquet')" % format)
+        self.directory = directory
+        self.format = format
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self._wanted = None if types is None else _message_ids(types)
+        self._tables = {}
+        self._listeners = []
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def files(self):
+        """
+        The files written (or being written), by message type.
+        """
+        return dict((table.msgclass.msgname, table.sink.path) for table in self._tables.values())
+
+    def _table(self, msgid):
+        table = self._tables.get(msgid)
+        if table is None:
+            if self._wanted is not None and msgid not in self._wanted:
+                return None
+            msgclass = mavutil.mavlink.mavlink_map.get(msgid)
+            if msgclass is None:
+                return None
+            path = os.path.join(self.directory, '%s.%s' % (msgclass.msgname, self.format))
+            sink = (_ParquetSink if self.format == 'parquet' else _NpzSink)(path, self.compress)
+            table = self._tables[msgid] = _Table(msgclass, sink, self.chunk_size)
+        return table
+
+    def add(self, msg):
+        """
+        Add a received message.
+        """
+        table = self._table(msg.get_msgId())
+        if table is not None:
+            payload = message_payload(msg)
+            if payload is not None:
+                table.append(payload, getattr(msg, '_timestamp', None) or time.time())
+
+    def add_tlog(self, log, start=None, end=None):
+        """
+        Add the messages of a tlog received between ``start`` and ``end`` (seconds since the epoch,
+        both optional).
+
+        :param log: A :py:class:`TlogReader <dronekit.tlog.TlogReader>`.
+        """
+        if not len(log):
+            return
+        first = 0 if start is None else log.seek(start)
+        last = len(log) if end is None else log.seek(end)
+        data = numpy.frombuffer(log._data, dtype=numpy.uint8)
+        all_offsets = numpy.frombuffer(log.offsets, dtype=numpy.uint64)
+        all_timestamps = numpy.frombuffer(log.timestamps, dtype=numpy.float64)
+        all_msgids = numpy.frombuffer(log.msgids, dtype=numpy.uint32)
+        for block in range(first, last, self.chunk_size):
+            block_end = min(block + self.chunk_size, last)
+            msgids = all_msgids[block:block_end]
+            for msgid in numpy.unique(msgids).tolist():
+                table = self._table(msgid)
+                if table is None:
+                    continue
+                selected = numpy.flatnonzero(msgids == msgid) + block
+                table.extend(_payloads(data, all_offsets[selected], table.size), all_timestamps[selected])
+
+    def attach(self, vehicle):
+        """
+        Add every message received by a :py:class:`Vehicle <dronekit.Vehicle>` from now on.
+        """
+        def listener(_, name, msg):
+            self.add(msg)
+
+        self._listeners.append((vehicle, listener))
+        vehicle.add_message_listener('*', listener)
+
+    def detach(self):
+        """
+        Stop adding messages from the vehicles passed to :py:func:`attach`.
+        """
+        for vehicle, listener in self._listeners:
+            vehicle.remove_message_listener('*', listener)
+        self._listeners = []
+
+    def close(self):
+        """
+        Write out the remaining rows and finish the files.
+
+        :returns: The files written, by message type.
+        """
+        self.detach()
+        for table in self._tables.values():
+            table.flush()
+            table.sink.close()
+        return self.files
+
+
+def export_tlog(path, directory, types=None, format=None, chunk_size=CHUNK_SIZE, compress=False):
+    """
+    Convert a tlog into one columnar file per message type (see :py:class:`ColumnExporter`).
+
+    :returns: The files written, by message type.
+    """
+    with TlogReader(path) as log:
+        exporter = ColumnExporter(directory, types=types, format=format, chunk_size=chunk_size,
+                                  compress=compress)
+        exporter.add_tlog(log)
+        return exporter.close()
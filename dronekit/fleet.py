@@ -0,0 +1,233 @@
+"""
+Spatial index for proximity queries over many vehicles.
+
+:py:class:`FleetIndex` keeps the horizontal position of every vehicle in a local east-north plane,
+bucketed into a uniform grid, so that "which vehicles are near this point" and "which vehicles are too
+close to each other" only look at nearby grid cells instead of every pair of vehicles.
+
+Vehicles added with :py:func:`FleetIndex.add` update their own entry from ``GLOBAL_POSITION_INT``:
+
+.. code:: python
+
+    from dronekit.fleet import FleetIndex
+
+    fleet = FleetIndex(cell_size=50)
+    for vehicle in vehicles:
+        fleet.add(vehicle)
+
+    for a, b, distance in fleet.conflicts(50):
+        print("%s and %s are %.1f m apart" % (a, b, distance))
+"""
+
+import math
+import threading
+
+from dronekit.geo import LocalTangentPlane
+
+
+class FleetIndex(object):
+    """
+    Grid hash of vehicle positions, for nearest-neighbour, radius and pairwise-conflict queries.
+
+    Positions are projected onto a local tangent plane anchored at ``origin`` (or at the first position
+    received), which is accurate for fleets spread over up to a few tens of kilometres. Distances are
+    horizontal, in metres. Entries can be updated from any thread (typically the receive threads of the
+    vehicles); queries take a consistent snapshot.
+
+    :param float cell_size: Grid cell size in metres. Queries are fastest when it is close to the
+        radius usually queried.
+    :param origin: Optional ``(lat, lon)`` of the local plane origin.
+    """
+
+    def __init__(self, cell_size=50.0, origin=None):
+        self.cell_size = float(cell_size)
+        self._plane = LocalTangentPlane(origin[0], origin[1], 0) if origin else None
+        self._lock = threading.Lock()
+        # key -> (east, north, alt, cell)
+        self._positions = {}
+        # cell -> {key: (east, north)}
+        self._cells = {}
+        # (min x, min y, max x, max y) of every cell occupied since the index was last empty. It only grows
+        # (until the index empties), so it always covers the occupied cells without rescanning them.
+        self._bounds = None
+        self._listeners = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def add(self, vehicle, key=None):
+        """
+        Track a :py:class:`Vehicle <dronekit.Vehicle>`: its entry is updated on every ``GLOBAL_POSITION_INT``.
+
+        :param vehicle: The vehicle.
+        :param key: The key used for the vehicle in query results (the vehicle itself by default).
+        """
+        key = vehicle if key is None else key
+        if key in self._listeners:
+            old_vehicle, old_listener = self._listeners.pop(key)
+            old_vehicle.remove_message_listener('GLOBAL_POSITION_INT', old_listener)
+
+        def listener(_, name, msg):
+            self.update(key, msg.lat / 1.0e7, msg.lon / 1.0e7, msg.alt / 1000.0)
+
+        self._listeners[key] = (vehicle, listener)
+        vehicle.add_message_listener('GLOBAL_POSITION_INT', listener)
+
+    def remove(self, key):
+        """
+        Stop tracking a vehicle (or remove an entry added with :py:func:`update`).
+        """
+        if key in self._listeners:
+            vehicle, listener = self._listeners.pop(key)
+            vehicle.remove_message_listener('GLOBAL_POSITION_INT', listener)
+        with self._lock:
+            entry = self._positions.pop(key, None)
+            if entry is not None:
+                self._discard(key, entry[3])
+
+    def _discard(self, key, cell):
+        members = self._cells[cell]
+        del members[key]
+        if not members:
+            del self._cells[cell]
+            if not self._cells:
+                self._bounds = None
+
+    def _cell(self, east, north):
+        return (int(math.floor(east / self.cell_size)), int(math.floor(north / self.cell_size)))
+
+    def _project(self, lat, lon):
+        if self._plane is None:
+            with self._lock:
+                if self._plane is None:
+                    self._plane = LocalTangentPlane(lat, lon, 0)
+        north, east, _ = self._plane.to_local(lat, lon, 0)
+        return east, north
+
+    def update(self, key, lat, lon, alt=0):
+        """
+        Set the position of an entry, adding it if necessary.
+        """
+        east, north = self._project(lat, lon)
+        cell = self._cell(east, north)
+        with self._lock:
+            entry = self._positions.get(key)
+            if entry is not None and entry[3] != cell:
+                self._discard(key, entry[3])
+            self._positions[key] = (east, north, alt, cell)
+            self._cells.setdefault(cell, {})[key] = (east, north)
+            x, y = cell
+            bounds = self._bounds
+            if bounds is None:
+                self._bounds = (x, y, x, y)
+            elif not (bounds[0] <= x <= bounds[2] and bounds[1] <= y <= bounds[3]):
+                self._bounds = (min(bounds[0], x), min(bounds[1], y), max(bounds[2], x), max(bounds[3], y))
+
+    def position(self, key):
+        """
+        Return the ``(east, north, alt)`` position of an entry in the local plane.
+        """
+        east, north, alt, _ = self._positions[key]
+        return east, north, alt
+
+    def _near(self, east, north, radius):
+        # Entries in the cells overlapping the square around the point, as (distance, key).
+        span = int(math.ceil(radius / self.cell_size))
+        cx, cy = self._cell(east, north)
+        radius_sq = radius * radius
+        result = []
+        with self._lock:
+            cells = self._cells
+            if (2 * span + 1) ** 2 > len(cells):
+                # Cheaper to visit the occupied cells than to probe the whole square.
+                groups = [members for (x, y), members in cells.items()
+                          if abs(x - cx) <= span and abs(y - cy) <= span]
+            else:
+                groups = [cells.get((x, y)) for x in range(cx - span, cx + span + 1)
+                          for y in range(cy - span, cy + span + 1)]
+            for members in groups:
+                if not members:
+                    continue
+                for key, (e, n) in members.items():
+                    d_sq = (e - east) ** 2 + (n - north) ** 2
+                    if d_sq <= radius_sq:
+                        result.append((math.sqrt(d_sq), key))
+        return result
+
+    def within(self, lat, lon, radius):
+        """
+        Return the entries within ``radius`` metres of a point, as a list of ``(key, distance)``
+        sorted by distance.
+        """
+        east, north = self._project(lat, lon)
+        result = self._near(east, north, radius)
+        result.sort(key=lambda item: item[0])
+        return [(key, distance) for distance, key in result]
+
+    def nearest(self, lat, lon, k=1, exclude=None):
+        """
+        Return the ``k`` entries nearest to a point, as a list of ``(key, distance)`` sorted by distance.
+
+        :param exclude: Optional key to leave out (for example, the vehicle the query is about).
+        """
+        east, north = self._project(lat, lon)
+        size = self.cell_size
+        with self._lock:
+            available = len(self._positions) - (1 if exclude in self._positions else 0)
+            bounds = self._bounds
+        # A radius that covers every occupied cell: the search stops growing there, even if entries have
+        # been removed meanwhile.
+        reach = 0
+        if bounds is not None:
+            min_x, min_y, max_x, max_y = bounds
+            reach = math.hypot(max(abs(min_x * size - east), abs((max_x + 1) * size - east)),
+                               max(abs(min_y * size - north), abs((max_y + 1) * size - north)))
+        k = min(k, available)
+        if k <= 0:
+            return []
+
+        # Grow the search radius until it holds k entries, then keep the k closest. Anything outside the
+        # radius is further away than everything inside it.
+        radius = size
+        while True:
+            found = [item for item in self._near(east, north, radius) if item[1] != exclude]
+            if len(found) >= k or radius >= reach:
+                break
+            radius *= 2
+        found.sort(key=lambda item: item[0])
+        return [(key, distance) for distance, key in found[:k]]
+
+    def conflicts(self, radius, vertical=None):
+        """
+        Return every pair of entries within ``radius`` metres of each other, as a list of ``(key1, key2, distance)``.
+
+        :param float vertical: If given, pairs are only reported if their altitudes also differ by less
+            than this many metres.
+        """
+        span = int(math.ceil(radius / self.cell_size))
+        # Half of the neighbourhood, so that each pair of cells is only visited once.
+        offsets = [(dx, dy) for dx in range(-span, span + 1) for dy in range(-span, span + 1) if (dx, dy) > (0, 0)]
+        radius_sq = radius * radius
+        result = []
+        with self._lock:
+            cells = self._cells
+            positions = self._positions
+            for (cx, cy), members in cells.items():
+                items = list(members.items())
+                candidates = []
+                for dx, dy in offsets:
+                    other = cells.get((cx + dx, cy + dy))
+                    if other:
+                        candidates.extend(other.items())
+                for i, (key, (east, north)) in enumerate(items):
+                    for other_key, (e, n) in items[i + 1:] + candidates:
+                        d_sq = (e - east) ** 2 + (n - north) ** 2
+                        if d_sq > radius_sq:
+                            continue
+                        if vertical is not None and abs(positions[key][2] - positions[other_key][2]) >= vertical:
+                            continue
+                        result.append((key, other_key, math.sqrt(d_sq)))
+        return result
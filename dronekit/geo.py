@@ -0,0 +1,438 @@
+"""
+Geodesy helpers: distances, bearings, offsets and coordinate frame conversions.
+
+Every function accepts either plain numbers or NumPy arrays (which are broadcast against each other,
+so for example the distances from 100 vehicles to 10,000 fence vertices can be computed in a single
+call by passing arrays of shape ``(100, 1)`` and ``(10000,)``). Plain numbers take a fast path that
+uses the :py:mod:`math` module and does not need NumPy at all.
+
+Angles are in degrees and distances in metres. Latitudes, longitudes and altitudes are WGS84,
+with altitude above the ellipsoid for the ECEF conversions.
+
+.. code:: python
+
+    from dronekit import geo
+
+    geo.haversine_distance(-35.3632, 149.1652, -35.3640, 149.1660)       # float
+    geo.haversine_distance(lats[:, None], lons[:, None], fence_lats, fence_lons)  # 2D array
+"""
+
+import math
+import numbers
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# WGS84 ellipsoid.
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+#: Mean earth radius (metres), used by the spherical functions.
+EARTH_RADIUS = 6371008.8
+
+
+class _Math(object):
+    # The subset of the NumPy API used below, on top of the math module.
+    sin = staticmethod(math.sin)
+    cos = staticmethod(math.cos)
+    tan = staticmethod(math.tan)
+    arcsin = staticmethod(math.asin)
+    arctan = staticmethod(math.atan)
+    arctan2 = staticmethod(math.atan2)
+    sqrt = staticmethod(math.sqrt)
+    hypot = staticmethod(math.hypot)
+    radians = staticmethod(math.radians)
+    degrees = staticmethod(math.degrees)
+
+    @staticmethod
+    def minimum(a, b):
+        return min(a, b)
+
+    @staticmethod
+    def mod(a, b):
+        return a % b
+
+
+def _ops(*values):
+    """
+    Return the module to compute with: ``math`` for plain numbers, ``numpy`` otherwise.
+    """
+    for v in values:
+        if type(v) is not float and type(v) is not int and not isinstance(v, numbers.Real):
+            break
+    else:
+        return _Math
+    if numpy is None:
+        raise ImportError('NumPy is required for array arguments to dronekit.geo functions.')
+    return numpy
+
+
+def _array(ops, value):
+    return value if ops is _Math else numpy.asarray(value, dtype=float)
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance between two points on a spherical earth.
+
+    Accurate to about 0.5%, and much faster than :py:func:`vincenty_distance`.
+    """
+    m = _ops(lat1, lon1, lat2, lon2)
+    phi1 = m.radians(_array(m, lat1))
+    phi2 = m.radians(_array(m, lat2))
+    dphi = phi2 - phi1
+    dlambda = m.radians(_array(m, lon2) - _array(m, lon1))
+    a = m.sin(dphi / 2) ** 2 + m.cos(phi1) * m.cos(phi2) * m.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * m.arcsin(m.minimum(m.sqrt(a), 1.0))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """
+    Initial bearing (degrees clockwise from north, in ``[0, 360)``) of the great circle from the first
+    point to the second.
+    """
+    m = _ops(lat1, lon1, lat2, lon2)
+    phi1 = m.radians(_array(m, lat1))
+    phi2 = m.radians(_array(m, lat2))
+    dlambda = m.radians(_array(m, lon2) - _array(m, lon1))
+    y = m.sin(dlambda) * m.cos(phi2)
+    x = m.cos(phi1) * m.sin(phi2) - m.sin(phi1) * m.cos(phi2) * m.cos(dlambda)
+    return m.mod(m.degrees(m.arctan2(y, x)) + 360.0, 360.0)
+
+
+def destination(lat, lon, bearing, distance):
+    """
+    The point reached by travelling ``distance`` metres from a point along the great circle with the given
+    initial ``bearing`` (degrees). Returns ``(lat, lon)``.
+    """
+    m = _ops(lat, lon, bearing, distance)
+    phi1 = m.radians(_array(m, lat))
+    lambda1 = m.radians(_array(m, lon))
+    theta = m.radians(_array(m, bearing))
+    delta = _array(m, distance) / EARTH_RADIUS
+    phi2 = m.arcsin(m.sin(phi1) * m.cos(delta) + m.cos(phi1) * m.sin(delta) * m.cos(theta))
+    lambda2 = lambda1 + m.arctan2(m.sin(theta) * m.sin(delta) * m.cos(phi1),
+                                  m.cos(delta) - m.sin(phi1) * m.sin(phi2))
+    return m.degrees(phi2), m.mod(m.degrees(lambda2) + 540.0, 360.0) - 180.0
+
+
+def offset(lat, lon, north, east):
+    """
+    The point ``north`` and ``east`` metres from a point. Returns ``(lat, lon)``.
+
+    This is the flat-earth approximation used in the DroneKit examples (``get_location_metres``): it is
+    accurate to about 10 metres over a kilometre, except close to the poles. Use :py:func:`ned_to_geodetic`
+    when more accuracy is needed.
+    """
+    m = _ops(lat, lon, north, east)
+    lat = _array(m, lat)
+    dlat = _array(m, north) / WGS84_A
+    dlon = _array(m, east) / (WGS84_A * m.cos(m.radians(lat)))
+    return lat + m.degrees(dlat), _array(m, lon) + m.degrees(dlon)
+
+
+def metres_per_degree(lat):
+    """
+    Length in metres of one degree of latitude and one degree of longitude at the given latitude
+    (on the WGS84 ellipsoid). Returns ``(lat_scale, lon_scale)``.
+
+    Multiplying small latitude/longitude differences by these gives an equirectangular projection, the
+    cheapest way to get local metric coordinates near a fixed point.
+    """
+    m = _ops(lat)
+    phi = m.radians(_array(m, lat))
+    w = 1 - WGS84_E2 * m.sin(phi) ** 2
+    meridional = WGS84_A * (1 - WGS84_E2) / w ** 1.5
+    normal = WGS84_A / m.sqrt(w)
+    return math.pi / 180 * meridional, math.pi / 180 * normal * m.cos(phi)
+
+
+def _vincenty_scalar(lat1, lon1, lat2, lon2, tolerance, max_iterations):
+    u1 = math.atan((1 - WGS84_F) * math.tan(math.radians(lat1)))
+    u2 = math.atan((1 - WGS84_F) * math.tan(math.radians(lat2)))
+    big_l = math.radians(lon2 - lon1)
+    sin_u1, cos_u1 = math.sin(u1), math.cos(u1)
+    sin_u2, cos_u2 = math.sin(u2), math.cos(u2)
+
+    lam = big_l
+    for _ in range(max_iterations):
+        sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+        sin_sigma = math.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        if sin_sigma == 0:
+            return 0.0
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = cos_u1 * cos_u2 * sin_lam / sin_sigma
+        cos2_alpha = 1 - sin_alpha ** 2
+        cos_2sigma_m = cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha if cos2_alpha else 0.0
+        c = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+        previous = lam
+        lam = big_l + (1 - c) * WGS84_F * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+        if abs(lam - previous) < tolerance:
+            break
+    else:
+        return float('nan')
+
+    u_sq = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+        big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    return WGS84_B * big_a * (sigma - delta_sigma)
+
+
+def _vincenty_array(lat1, lon1, lat2, lon2, tolerance, max_iterations):
+    lat1, lon1, lat2, lon2 = numpy.broadcast_arrays(*(numpy.asarray(v, dtype=float)
+                                                      for v in (lat1, lon1, lat2, lon2)))
+    u1 = numpy.arctan((1 - WGS84_F) * numpy.tan(numpy.radians(lat1)))
+    u2 = numpy.arctan((1 - WGS84_F) * numpy.tan(numpy.radians(lat2)))
+    big_l = numpy.radians(lon2 - lon1)
+    sin_u1, cos_u1 = numpy.sin(u1), numpy.cos(u1)
+    sin_u2, cos_u2 = numpy.sin(u2), numpy.cos(u2)
+
+    lam = big_l.copy()
+    converged = numpy.zeros(lam.shape, dtype=bool)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = numpy.sin(lam), numpy.cos(lam)
+            sin_sigma = numpy.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = numpy.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = numpy.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = numpy.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            c = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            new_lam = big_l + (1 - c) * WGS84_F * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            change = numpy.abs(new_lam - lam)
+            # Freeze the points that have converged, so they don't drift while the others iterate.
+            lam = numpy.where(converged, lam, new_lam)
+            converged |= change < tolerance
+            if converged.all():
+                break
+
+        u_sq = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        distance = WGS84_B * big_a * (sigma - delta_sigma)
+    return numpy.where(converged, distance, numpy.nan)
+
+
+def vincenty_distance(lat1, lon1, lat2, lon2, tolerance=1e-12, max_iterations=200):
+    """
+    Distance between two points on the WGS84 ellipsoid (Vincenty's inverse formula).
+
+    Accurate to well under a millimetre. Returns NaN for nearly antipodal points, where the iteration does
+    not converge.
+    """
+    if _ops(lat1, lon1, lat2, lon2) is _Math:
+        return _vincenty_scalar(lat1, lon1, lat2, lon2, tolerance, max_iterations)
+    return _vincenty_array(lat1, lon1, lat2, lon2, tolerance, max_iterations)
+
+
+def geodetic_to_ecef(lat, lon, alt):
+    """
+    Convert WGS84 latitude, longitude and altitude to Earth-Centred Earth-Fixed ``(x, y, z)``.
+    """
+    m = _ops(lat, lon, alt)
+    phi = m.radians(_array(m, lat))
+    lam = m.radians(_array(m, lon))
+    alt = _array(m, alt)
+    sin_phi, cos_phi = m.sin(phi), m.cos(phi)
+    n = WGS84_A / m.sqrt(1 - WGS84_E2 * sin_phi ** 2)
+    return ((n + alt) * cos_phi * m.cos(lam),
+            (n + alt) * cos_phi * m.sin(lam),
+            (n * (1 - WGS84_E2) + alt) * sin_phi)
+
+
+def ecef_to_geodetic(x, y, z):
+    """
+    Convert Earth-Centred Earth-Fixed coordinates to WGS84 ``(lat, lon, alt)``.
+
+    Uses Heikkinen's closed form solution, so there is no iteration.
+    """
+    m = _ops(x, y, z)
+    x, y, z = _array(m, x), _array(m, y), _array(m, z)
+    a2, b2 = WGS84_A ** 2, WGS84_B ** 2
+    ep2 = (a2 - b2) / b2
+    p = m.hypot(x, y)
+    f = 54 * b2 * z ** 2
+    g = p ** 2 + (1 - WGS84_E2) * z ** 2 - WGS84_E2 * (a2 - b2)
+    c = WGS84_E2 ** 2 * f * p ** 2 / g ** 3
+    s = (1 + c + m.sqrt(c ** 2 + 2 * c)) ** (1.0 / 3)
+    k = s + 1 + 1 / s
+    big_p = f / (3 * k ** 2 * g ** 2)
+    q = m.sqrt(1 + 2 * WGS84_E2 ** 2 * big_p)
+    r0 = -(big_p * WGS84_E2 * p) / (1 + q) + m.sqrt(
+        a2 / 2 * (1 + 1 / q) - big_p * (1 - WGS84_E2) * z ** 2 / (q * (1 + q)) - big_p * p ** 2 / 2)
+    u = m.hypot(p - WGS84_E2 * r0, z)
+    v = m.sqrt((p - WGS84_E2 * r0) ** 2 + (1 - WGS84_E2) * z ** 2)
+    z0 = b2 * z / (WGS84_A * v)
+    alt = u * (1 - b2 / (WGS84_A * v))
+    return m.degrees(m.arctan2(z + ep2 * z0, p)), m.degrees(m.arctan2(y, x)), alt
+
+
+def _rotation(m, lat0, lon0):
+    phi = m.radians(_array(m, lat0))
+    lam = m.radians(_array(m, lon0))
+    return m.sin(phi), m.cos(phi), m.sin(lam), m.cos(lam)
+
+
+def ecef_to_ned(x, y, z, lat0, lon0, alt0):
+    """
+    Convert Earth-Centred Earth-Fixed coordinates to ``(north, east, down)`` metres from a reference point
+    (given as latitude, longitude and altitude).
+    """
+    m = _ops(x, y, z, lat0, lon0, alt0)
+    x0, y0, z0 = geodetic_to_ecef(lat0, lon0, alt0)
+    dx, dy, dz = _array(m, x) - x0, _array(m, y) - y0, _array(m, z) - z0
+    sin_phi, cos_phi, sin_lam, cos_lam = _rotation(m, lat0, lon0)
+    t = cos_lam * dx + sin_lam * dy
+    return (-sin_phi * t + cos_phi * dz,
+            -sin_lam * dx + cos_lam * dy,
+            -cos_phi * t - sin_phi * dz)
+
+
+def ned_to_ecef(north, east, down, lat0, lon0, alt0):
+    """
+    Convert ``(north, east, down)`` metres from a reference point to Earth-Centred Earth-Fixed coordinates.
+    """
+    m = _ops(north, east, down, lat0, lon0, alt0)
+    north, east, down = _array(m, north), _array(m, east), _array(m, down)
+    x0, y0, z0 = geodetic_to_ecef(lat0, lon0, alt0)
+    sin_phi, cos_phi, sin_lam, cos_lam = _rotation(m, lat0, lon0)
+    t = -sin_phi * north - cos_phi * down
+    return (x0 + cos_lam * t - sin_lam * east,
+            y0 + sin_lam * t + cos_lam * east,
+            z0 + cos_phi * north - sin_phi * down)
+
+
+def geodetic_to_ned(lat, lon, alt, lat0, lon0, alt0):
+    """
+    Convert WGS84 positions to ``(north, east, down)`` metres from a reference point.
+    """
+    x, y, z = geodetic_to_ecef(lat, lon, alt)
+    return ecef_to_ned(x, y, z, lat0, lon0, alt0)
+
+
+def ned_to_geodetic(north, east, down, lat0, lon0, alt0):
+    """
+    Convert ``(north, east, down)`` metres from a reference point to WGS84 ``(lat, lon, alt)``.
+    """
+    x, y, z = ned_to_ecef(north, east, down, lat0, lon0, alt0)
+    return ecef_to_geodetic(x, y, z)
+
+
+class LocalTangentPlane(object):
+    """
+    Converter between WGS84 positions and a local north-east-down frame with a fixed origin.
+
+    The ECEF position of the origin and the rotation into the local frame are computed once, so
+    converting many points (or arrays of points) is much cheaper than calling :py:func:`geodetic_to_ned`
+    each time. :py:func:`Vehicle.local_tangent_plane() <dronekit.Vehicle.local_tangent_plane>` returns one
+    anchored at the vehicle's home location or EKF origin (a :py:class:`TrackingTangentPlane`).
+
+    Altitudes must use the same reference as ``alt0`` (usually AMSL); the difference between the
+    ellipsoid and the geoid is negligible over the area covered by a local frame.
+
+    :param lat0: Latitude of the origin in degrees.
+    :param lon0: Longitude of the origin in degrees.
+    :param alt0: Altitude of the origin in metres.
+    """
+
+    def __init__(self, lat0, lon0, alt0):
+        self._anchor(lat0, lon0, alt0)
+
+    def _anchor(self, lat0, lon0, alt0):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.alt0 = alt0
+        self._origin = geodetic_to_ecef(lat0, lon0, alt0)
+        self._sin_phi, self._cos_phi, self._sin_lam, self._cos_lam = _rotation(_Math, lat0, lon0)
+
+    def to_local(self, lat, lon, alt):
+        """
+        Convert WGS84 positions to ``(north, east, down)`` metres from the origin.
+        """
+        x, y, z = geodetic_to_ecef(lat, lon, alt)
+        x0, y0, z0 = self._origin
+        dx, dy, dz = x - x0, y - y0, z - z0
+        t = self._cos_lam * dx + self._sin_lam * dy
+        return (-self._sin_phi * t + self._cos_phi * dz,
+                -self._sin_lam * dx + self._cos_lam * dy,
+                -self._cos_phi * t - self._sin_phi * dz)
+
+    def to_global(self, north, east, down):
+        """
+        Convert ``(north, east, down)`` metres from the origin to WGS84 ``(lat, lon, alt)``.
+        """
+        m = _ops(north, east, down)
+        north, east, down = _array(m, north), _array(m, east), _array(m, down)
+        x0, y0, z0 = self._origin
+        t = -self._sin_phi * north - self._cos_phi * down
+        return ecef_to_geodetic(x0 + self._cos_lam * t - self._sin_lam * east,
+                                y0 + self._sin_lam * t + self._cos_lam * east,
+                                z0 + self._cos_phi * north - self._sin_phi * down)
+
+    def location_local(self, location):
+        """
+        Convert a ``LocationGlobal`` or ``LocationGlobalRelative`` to a ``LocationLocal``.
+        Relative altitudes are taken to be relative to the origin.
+        """
+        from dronekit import LocationGlobalRelative, LocationLocal
+        alt = location.alt + self.alt0 if isinstance(location, LocationGlobalRelative) else location.alt
+        return LocationLocal(*self.to_local(location.lat, location.lon, alt))
+
+    def location_global(self, location):
+        """
+        Convert a ``LocationLocal`` to a ``LocationGlobal``.
+        """
+        from dronekit import LocationGlobal
+        return LocationGlobal(*self.to_global(location.north, location.east, location.down))
+
+    def __str__(self):
+        return "LocalTangentPlane:lat0=%s,lon0=%s,alt0=%s" % (self.lat0, self.lon0, self.alt0)
+
+
+class TrackingTangentPlane(LocalTangentPlane):
+    """
+    A :py:class:`LocalTangentPlane` whose origin follows a location that can move, such as the home location
+    of a vehicle. The origin is read again before every conversion, and the frame re-anchored if it has
+    moved, so a converter that is kept never converts against an old origin.
+
+    :param origin: A function returning the current origin (an object with ``lat``, ``lon`` and ``alt``
+        attributes, such as a ``LocationGlobal``). While it returns ``None``, the last origin is kept.
+    """
+
+    def __init__(self, origin):
+        self._current_origin = origin
+        location = origin()
+        LocalTangentPlane.__init__(self, location.lat, location.lon, location.alt)
+
+    def _refresh(self):
+        location = self._current_origin()
+        if location is not None and (location.lat, location.lon, location.alt) != (self.lat0, self.lon0,
+                                                                                   self.alt0):
+            self._anchor(location.lat, location.lon, location.alt)
+
+    def to_local(self, lat, lon, alt):
+        self._refresh()
+        return LocalTangentPlane.to_local(self, lat, lon, alt)
+
+    def to_global(self, north, east, down):
+        self._refresh()
+        return LocalTangentPlane.to_global(self, north, east, down)
+
+    def location_local(self, location):
+        # Relative altitudes use the current origin altitude.
+        self._refresh()
+        return LocalTangentPlane.location_local(self, location)
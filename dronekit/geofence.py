@@ -0,0 +1,333 @@
+"""
+Geofence evaluation on the ground station.
+
+A :py:class:`Geofence` compiles inclusion and exclusion zones (polygons and circles) once, into
+projected coordinates with a bounding box and an edge grid per polygon, and then checks positions
+against them. Attached to a vehicle, it checks every ``GLOBAL_POSITION_INT`` and reports changes
+through the normal attribute observers:
+
+.. code:: python
+
+    from dronekit.geofence import Geofence
+
+    fence = Geofence.from_fence(vehicle.fence, margin=20)
+    fence.attach(vehicle)
+
+    @vehicle.on_attribute('fence_breach')
+    def breach(self, name, breached):
+        if breached:
+            self.mode = VehicleMode('RTL')
+
+Checks are cheap when the vehicle is far from every fence boundary: each full evaluation records how
+far the vehicle is from the nearest boundary, and until it has moved that far (less the warning margin)
+nothing can have changed, so later positions only cost a subtraction and a comparison.
+"""
+
+import math
+
+from dronekit.geo import metres_per_degree
+
+
+class GeofenceStatus(object):
+    """
+    The result of checking a position against a :py:class:`Geofence`.
+
+    Two statuses compare equal if they have the same ``breached``, ``near_breach`` and ``zone``, whatever
+    their ``distance``.
+
+    :param Boolean breached: ``True`` if the position is outside an inclusion zone or inside an exclusion zone.
+    :param Boolean near_breach: ``True`` if the position is not breached but is within the margin of a boundary.
+    :param zone: Index of the zone that is breached, or whose boundary is nearest (``None`` if no zone
+        is within range).
+    :param float distance: Distance in metres to the nearest boundary (a lower bound when it is large).
+    """
+
+    def __init__(self, breached, near_breach, zone, distance):
+        self.breached = breached
+        self.near_breach = near_breach
+        self.zone = zone
+        self.distance = distance
+
+    def __eq__(self, other):
+        return isinstance(other, GeofenceStatus) and \
+            (self.breached, self.near_breach, self.zone) == (other.breached, other.near_breach, other.zone)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __str__(self):
+        return "GeofenceStatus:breached=%s,near_breach=%s,zone=%s,distance=%s" % (
+            self.breached, self.near_breach, self.zone, self.distance)
+
+
+def _segment_distance_sq(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    if length_sq:
+        t = ((px - x1) * dx + (py - y1) * dy) / length_sq
+        if t < 0:
+            t = 0
+        elif t > 1:
+            t = 1
+        x1 += t * dx
+        y1 += t * dy
+    return (px - x1) ** 2 + (py - y1) ** 2
+
+
+class _Polygon(object):
+    # A polygon compiled into projected coordinates, a bounding box, a grid of cells listing the edges
+    # that overlap them (for distance queries) and the rows of that grid (for ray casting).
+
+    def __init__(self, inclusion, xs, ys):
+        self.inclusion = inclusion
+        n = len(xs)
+        self.edges = [(xs[i], ys[i], xs[(i + 1) % n], ys[(i + 1) % n]) for i in range(n)]
+        self.min_x, self.max_x = min(xs), max(xs)
+        self.min_y, self.max_y = min(ys), max(ys)
+
+        size = max(self.max_x - self.min_x, self.max_y - self.min_y, 1.0)
+        self.cell = max(size / math.ceil(math.sqrt(n)), 1.0)
+        self.rows = {}
+        self.cells = {}
+        for index, (x1, y1, x2, y2) in enumerate(self.edges):
+            row_lo, row_hi = self._index(min(y1, y2), self.min_y), self._index(max(y1, y2), self.min_y)
+            col_lo, col_hi = self._index(min(x1, x2), self.min_x), self._index(max(x1, x2), self.min_x)
+            for row in range(row_lo, row_hi + 1):
+                self.rows.setdefault(row, []).append(self.edges[index])
+                for col in range(col_lo, col_hi + 1):
+                    self.cells.setdefault((col, row), []).append(self.edges[index])
+
+    def _index(self, value, origin):
+        return int((value - origin) // self.cell)
+
+    def bbox_distance(self, x, y):
+        dx = max(self.min_x - x, 0, x - self.max_x)
+        dy = max(self.min_y - y, 0, y - self.max_y)
+        return math.sqrt(dx * dx + dy * dy)
+
+    def contains(self, x, y):
+        if not (self.min_x <= x <= self.max_x and self.min_y <= y <= self.max_y):
+            return False
+        inside = False
+        for x1, y1, x2, y2 in self.rows.get(self._index(y, self.min_y), ()):
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    def boundary_distance(self, x, y, horizon):
+        # Distance to the nearest edge, or ``horizon`` if no edge is closer than that.
+        best = horizon * horizon
+        col_lo, col_hi = self._index(x - horizon, self.min_x), self._index(x + horizon, self.min_x)
+        row_lo, row_hi = self._index(y - horizon, self.min_y), self._index(y + horizon, self.min_y)
+        cells = self.cells
+        if (col_hi - col_lo + 1) * (row_hi - row_lo + 1) > len(cells):
+            groups = [edges for (col, row), edges in cells.items()
+                      if col_lo <= col <= col_hi and row_lo <= row <= row_hi]
+        else:
+            groups = [cells.get((col, row)) for col in range(col_lo, col_hi + 1) for row in range(row_lo, row_hi + 1)]
+        for edges in groups:
+            if edges:
+                for x1, y1, x2, y2 in edges:
+                    d_sq = _segment_distance_sq(x, y, x1, y1, x2, y2)
+                    if d_sq < best:
+                        best = d_sq
+        return math.sqrt(best)
+
+
+class _Circle(object):
+
+    def __init__(self, inclusion, x, y, radius):
+        self.inclusion = inclusion
+        self.x = x
+        self.y = y
+        self.radius = radius
+
+    def evaluate(self, x, y):
+        d = math.hypot(x - self.x, y - self.y)
+        return d <= self.radius, abs(d - self.radius)
+
+
+class _Tracker(object):
+    # Per-vehicle state: where the last full evaluation was made, and how far it was from any boundary.
+
+    def __init__(self):
+        self.x = None
+        self.y = None
+        self.clearance = 0.0
+        self.status = None
+
+
+class Geofence(object):
+    """
+    Evaluates positions against a set of inclusion and exclusion zones.
+
+    A position is breached if it is outside any inclusion zone or inside any exclusion zone, and is a
+    near breach if it is not breached but is less than ``margin`` metres from a zone boundary.
+
+    Zones are projected around ``origin`` (by default the first vertex or centre added) with an
+    equirectangular projection. Its error grows with the square of the distance from the origin: about
+    0.1 m at 1 km and 10 m at 10 km at mid latitudes, so for large fences pass an origin near the middle.
+
+    :param float margin: Distance from a boundary, in metres, within which a position is a near breach.
+    :param origin: Optional ``(lat, lon)`` of the projection origin.
+    """
+
+    def __init__(self, margin=10.0, origin=None):
+        self.margin = float(margin)
+        # Boundaries further away than this are not measured exactly.
+        self._horizon = max(4 * self.margin, 50.0)
+        self._origin = None
+        self._zones = []
+        self._trackers = {}
+        self._listeners = {}
+        if origin is not None:
+            self._set_origin(*origin)
+
+    @classmethod
+    def from_fence(cls, fence, **kwargs):
+        """
+        Build a geofence from the polygons and circles of a :py:class:`FenceSequence <dronekit.FenceSequence>`
+        (for example :py:attr:`Vehicle.fence <dronekit.Vehicle.fence>` after a download).
+        Other arguments are passed to the constructor.
+        """
+        geofence = cls(**kwargs)
+        for polygon in fence.polygons():
+            geofence.add_polygon(polygon.lat, polygon.lon, inclusion=polygon.inclusion)
+        for circle in fence.circles():
+            geofence.add_circle(circle.lat, circle.lon, circle.radius, inclusion=circle.inclusion)
+        return geofence
+
+    def _set_origin(self, lat, lon):
+        self._origin = (lat, lon)
+        self._lat_scale, self._lon_scale = metres_per_degree(float(lat))
+
+    def _project(self, lat, lon):
+        return (lon - self._origin[1]) * self._lon_scale, (lat - self._origin[0]) * self._lat_scale
+
+    def add_polygon(self, lat, lon, inclusion=True):
+        """
+        Add a polygon zone.
+
+        :param lat: Vertex latitudes in degrees (any sequence or NumPy array).
+        :param lon: Vertex longitudes in degrees.
+        :param Boolean inclusion: ``True`` for an inclusion zone (the default), ``False`` for an exclusion zone.
+        :returns: The index of the zone (as reported in :py:attr:`GeofenceStatus.zone`).
+        """
+        lat, lon = [float(v) for v in lat], [float(v) for v in lon]
+        if len(lat) < 3 or len(lat) != len(lon):
+            raise ValueError('A fence polygon needs at least 3 vertices, with one longitude per latitude.')
+        if self._origin is None:
+            self._set_origin(lat[0], lon[0])
+        points = [self._project(a, b) for a, b in zip(lat, lon)]
+        self._zones.append(_Polygon(inclusion, [p[0] for p in points], [p[1] for p in points]))
+        self._trackers.clear()
+        return len(self._zones) - 1
+
+    def add_circle(self, lat, lon, radius, inclusion=True):
+        """
+        Add a circular zone.
+
+        :param lat: Latitude of the centre in degrees.
+        :param lon: Longitude of the centre in degrees.
+        :param radius: Radius in metres.
+        :param Boolean inclusion: ``True`` for an inclusion zone (the default), ``False`` for an exclusion zone.
+        :returns: The index of the zone.
+        """
+        if self._origin is None:
+            self._set_origin(lat, lon)
+        x, y = self._project(lat, lon)
+        self._zones.append(_Circle(inclusion, x, y, float(radius)))
+        self._trackers.clear()
+        return len(self._zones) - 1
+
+    def _evaluate(self, x, y):
+        # Returns the status and a lower bound on the distance to the nearest boundary.
+        horizon = self._horizon
+        breached_zone = None
+        nearest_zone = None
+        clearance = horizon
+        for index, zone in enumerate(self._zones):
+            if isinstance(zone, _Circle):
+                inside, distance = zone.evaluate(x, y)
+            else:
+                distance = zone.bbox_distance(x, y)
+                if distance > 0 and distance >= clearance:
+                    # Outside, and further away than a boundary we already know about.
+                    inside = False
+                else:
+                    inside = zone.contains(x, y)
+                    distance = zone.boundary_distance(x, y, clearance)
+            if inside != zone.inclusion and breached_zone is None:
+                breached_zone = index
+            if distance < clearance:
+                clearance = distance
+                nearest_zone = index
+
+        breached = breached_zone is not None
+        near_breach = not breached and clearance < self.margin
+        zone = breached_zone if breached else (nearest_zone if clearance < horizon else None)
+        return GeofenceStatus(breached, near_breach, zone, clearance), clearance
+
+    def check(self, lat, lon):
+        """
+        Check a single position. Returns a :py:class:`GeofenceStatus`.
+        """
+        if self._origin is None:
+            return GeofenceStatus(False, False, None, self._horizon)
+        x, y = self._project(lat, lon)
+        return self._evaluate(x, y)[0]
+
+    def update(self, key, lat, lon):
+        """
+        Check the latest position of a tracked object (usually a vehicle), skipping the evaluation if it
+        cannot have changed since the last one. Returns a :py:class:`GeofenceStatus`.
+
+        :param key: Identifies the object whose position this is.
+        """
+        if self._origin is None:
+            return self.check(lat, lon)
+        tracker = self._trackers.get(key)
+        if tracker is None:
+            tracker = self._trackers[key] = _Tracker()
+        x = (lon - self._origin[1]) * self._lon_scale
+        y = (lat - self._origin[0]) * self._lat_scale
+        if tracker.status is not None:
+            dx, dy = x - tracker.x, y - tracker.y
+            slack = tracker.clearance - self.margin
+            if slack > 0 and dx * dx + dy * dy < slack * slack:
+                return tracker.status
+        tracker.status, tracker.clearance = self._evaluate(x, y)
+        tracker.x, tracker.y = x, y
+        return tracker.status
+
+    def attach(self, vehicle):
+        """
+        Check every ``GLOBAL_POSITION_INT`` from a vehicle.
+
+        Changes are reported through the vehicle's attribute observers, as ``fence_breach`` and
+        ``fence_near_breach`` (both ``Boolean``). The latest :py:class:`GeofenceStatus` is available
+        from :py:func:`status`.
+        """
+        def listener(vehicle, name, msg):
+            status = self.update(vehicle, msg.lat / 1.0e7, msg.lon / 1.0e7)
+            vehicle.notify_attribute_listeners('fence_breach', status.breached, cache=True)
+            vehicle.notify_attribute_listeners('fence_near_breach', status.near_breach, cache=True)
+
+        self._listeners[vehicle] = listener
+        vehicle.add_message_listener('GLOBAL_POSITION_INT', listener)
+
+    def detach(self, vehicle):
+        """
+        Stop checking a vehicle's positions.
+        """
+        listener = self._listeners.pop(vehicle, None)
+        if listener is not None:
+            vehicle.remove_message_listener('GLOBAL_POSITION_INT', listener)
+        self._trackers.pop(vehicle, None)
+
+    def status(self, key):
+        """
+        The latest :py:class:`GeofenceStatus` of a tracked vehicle (or other key), or ``None``.
+        """
+        tracker = self._trackers.get(key)
+        return tracker.status if tracker is not None else None
@@ -0,0 +1,231 @@
+"""
+Receive latency tracing.
+
+Every message received by a :py:class:`MAVConnection <dronekit.mavlink.MAVConnection>` is stamped with
+``time.monotonic_ns()`` values: ``msg._receive_ns`` when the receive thread starts reading it,
+``msg._parse_ns`` once it has been parsed and ``msg._dispatch_ns`` when it is handed to the listeners
+(``msg._timestamp`` is the wall-clock receive time, as set by pymavlink).
+
+:py:func:`Vehicle.enable_latency_tracing() <dronekit.Vehicle.enable_latency_tracing>` additionally records
+the time spent in each stage in :py:class:`LatencyHistogram` objects:
+
+* ``parse``: from the start of the read to the parsed message.
+* ``dispatch``: from the parsed message to the first listener (telemetry log and link statistics).
+* ``callback``: running every listener, including user callbacks.
+* ``total``: from the start of the read to the return of the last listener.
+* ``transit``: with ``boot_time=True``, from the vehicle stamping the message (its ``time_boot_ms`` field)
+  to the start of the read. Once the vehicle clock has been synchronised (see ``dronekit.timesync``) this is
+  the one-way latency, to within the accuracy of the synchronisation and the 1 ms resolution of
+  ``time_boot_ms``. Before that, it is measured relative to the fastest message seen so far: the extra
+  latency of each message, a lower bound of its true latency.
+
+.. code:: python
+
+    tracer = vehicle.enable_latency_tracing(boot_time=True)
+    time.sleep(60)
+    print(tracer.report())
+    assert tracer.histogram('total', 'ATTITUDE').percentile(99) < 0.020
+"""
+
+import math
+
+# Each power of two is split into this many buckets (as 1 << _SUB_BITS), so a bucket is at most 1/8 of its
+# values wide and its middle is within 1/16 of any value in it.
+_SUB_BITS = 3
+_SUB = 1 << _SUB_BITS
+
+STAGES = ('parse', 'dispatch', 'callback', 'total', 'transit')
+
+
+def _bucket(ns):
+    if ns < _SUB:
+        return max(ns, 0)
+    shift = ns.bit_length() - _SUB_BITS - 1
+    return ((shift + 1) << _SUB_BITS) + ((ns >> shift) & (_SUB - 1))
+
+
+def _bucket_low(index):
+    # Smallest value in a bucket.
+    if index < _SUB:
+        return index
+    shift = (index >> _SUB_BITS) - 1
+    return ((index & (_SUB - 1)) | _SUB) << shift
+
+
+class LatencyHistogram(object):
+    """
+    Log-scaled histogram of durations, recorded in nanoseconds and reported in seconds.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self.count = 0
+        self._sum = 0
+        self._min = None
+        self._max = 0
+
+    def record(self, ns):
+        """
+        Add a duration, in nanoseconds.
+        """
+        index = _bucket(ns)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self._sum += ns
+        if self._min is None or ns < self._min:
+            self._min = ns
+        if ns > self._max:
+            self._max = ns
+
+    @property
+    def mean(self):
+        """
+        Mean duration, in seconds.
+        """
+        return self._sum / self.count * 1e-9 if self.count else 0.0
+
+    @property
+    def min(self):
+        """
+        Shortest duration, in seconds.
+        """
+        return (self._min or 0) * 1e-9
+
+    @property
+    def max(self):
+        """
+        Longest duration, in seconds.
+        """
+        return self._max * 1e-9
+
+    def percentile(self, p):
+        """
+        Return the duration (in seconds) below which ``p`` percent of the durations fall.
+
+        The value is the middle of the histogram bucket, so it is within 1/16 of the exact value.
+        """
+        if not self.count:
+            return 0.0
+        # The rank of the value, allowing for rounding errors in p.
+        rank = max(1, math.ceil(p * self.count / 100.0 - 1e-6))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                if index < _SUB:
+                    return index * 1e-9
+                middle = (_bucket_low(index) + _bucket_low(index + 1)) / 2.0
+                return min(max(middle, self._min), self._max) * 1e-9
+        return self.max
+
+    def buckets(self):
+        """
+        Return the histogram as a list of ``(lower_bound, upper_bound, count)``, bounds in seconds.
+        """
+        return [(_bucket_low(i) * 1e-9, _bucket_low(i + 1) * 1e-9, self._counts[i]) for i in sorted(self._counts)]
+
+    def __str__(self):
+        return 'LatencyHistogram:count=%s,mean=%.6f,p50=%.6f,p99=%.6f,max=%.6f' % (
+            self.count, self.mean, self.percentile(50), self.percentile(99), self.max)
+
+
+class LatencyTracer(object):
+    """
+    Records the receive latency of every message, by stage and message type.
+
+    Use :py:func:`Vehicle.enable_latency_tracing() <dronekit.Vehicle.enable_latency_tracing>` rather than
+    creating one directly.
+
+    :param bool boot_time: Also record the ``transit`` stage for messages with a ``time_boot_ms`` field.
+    :param timesync: The :py:class:`TimeSync <dronekit.timesync.TimeSync>` of the vehicle, used for the
+        ``transit`` stage once it is synchronised.
+    """
+
+    def __init__(self, boot_time=False, timesync=None):
+        self.boot_time = boot_time
+        self.timesync = timesync
+        self._histograms = {}
+        self._boot_offset = None
+        self._last_boot_ms = 0
+
+    def _add(self, stage, name, ns):
+        for key in ((stage, None), (stage, name)):
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(ns)
+
+    def record(self, msg, done_ns):
+        """
+        Record the stages of a message whose listeners returned at ``done_ns``.
+        """
+        name = msg._type
+        receive_ns = msg._receive_ns
+        self._add('parse', name, msg._parse_ns - receive_ns)
+        self._add('dispatch', name, msg._dispatch_ns - msg._parse_ns)
+        self._add('callback', name, done_ns - msg._dispatch_ns)
+        self._add('total', name, done_ns - receive_ns)
+
+        if self.boot_time:
+            boot_ms = getattr(msg, 'time_boot_ms', None)
+            if boot_ms is not None:
+                self._add('transit', name, self._transit(boot_ms, receive_ns))
+
+    def _transit(self, boot_ms, receive_ns):
+        if self.timesync is not None:
+            sent_ns = self.timesync.to_host_ns(boot_ms * 1000000)
+            if sent_ns is not None:
+                return max(receive_ns - sent_ns, 0)
+        if boot_ms < self._last_boot_ms:
+            # The vehicle rebooted.
+            self._boot_offset = None
+        self._last_boot_ms = boot_ms
+        offset = receive_ns - boot_ms * 1000000
+        if self._boot_offset is None or offset < self._boot_offset:
+            self._boot_offset = offset
+        return offset - self._boot_offset
+
+    def histogram(self, stage, type=None):
+        """
+        Return the :py:class:`LatencyHistogram` of a stage, for one message type or (by default) all of them.
+
+        :param str stage: ``'parse'``, ``'dispatch'``, ``'callback'``, ``'total'`` or ``'transit'``.
+        :param str type: A message type, such as ``'ATTITUDE'``.
+        """
+        if stage not in STAGES:
+            raise ValueError('Unknown stage %r (expected one of %s)' % (stage, ', '.join(STAGES)))
+        return self._histograms.get((stage, type)) or LatencyHistogram()
+
+    @property
+    def types(self):
+        """
+        The message types recorded.
+        """
+        # A copy of the keys: the receive thread adds histograms for new types.
+        return sorted(set(name for _, name in list(self._histograms) if name is not None))
+
+    def reset(self):
+        """
+        Discard the recorded latencies.
+        """
+        self._histograms = {}
+
+    def report(self, types=None):
+        """
+        Return a text table of the latency percentiles (in milliseconds) of each stage, over all messages
+        and for each message type.
+
+        :param types: Message types to include (by default all of them).
+        """
+        lines = ['%-24s %-9s %9s %9s %9s %9s %9s' % ('type', 'stage', 'count', 'p50 ms', 'p99 ms',
+                                                      'p99.9 ms', 'max ms')]
+        histograms = self._histograms
+        for name in [None] + (self.types if types is None else list(types)):
+            for stage in STAGES:
+                histogram = histograms.get((stage, name))
+                if histogram is None:
+                    continue
+                lines.append('%-24s %-9s %9d %9.3f %9.3f %9.3f %9.3f' % (
+                    name or '(all)', stage, histogram.count, histogram.percentile(50) * 1e3,
+                    histogram.percentile(99) * 1e3, histogram.percentile(99.9) * 1e3, histogram.max * 1e3))
+        return '\n'.join(lines)
@@ -0,0 +1,304 @@
+"""
+Bandwidth budget for slow telemetry radios.
+
+On a radio link such as a SiK telemetry radio, a bulk transfer (parameters, mission items, logs) competes
+for the same few kilobytes per second as telemetry and commands, and the radio's buffers fill until the
+transfer ends. :py:func:`Vehicle.enable_link_budget() <dronekit.Vehicle.enable_link_budget>` starts a
+:py:class:`LinkBudget` that estimates the bandwidth of the link from ``RADIO_STATUS`` (which the radios
+inject into the MAVLink stream) and the :py:attr:`link statistics <dronekit.Vehicle.link_stats>`, and
+shares it out once a second:
+
+* Commands and other control messages are never delayed. A share of the bandwidth
+  (:py:attr:`LinkBudget.control_reserve`) is kept free for them.
+* Telemetry requested through :py:attr:`Vehicle.streams <dronekit.Vehicle.streams>` is slowed down by a
+  common factor (:py:attr:`StreamManager.scale <dronekit.streams.StreamManager.scale>`), except for
+  subscriptions made with ``priority=True``.
+* Bulk transfer requests are queued separately and sent by a :py:class:`BulkPacer` at the rate that is
+  left, counting the bytes that each request makes the vehicle send back.
+
+.. code:: python
+
+    budget = vehicle.enable_link_budget()
+    ...
+    print("%.0f bytes/s, telemetry at %.0f%%, bulk %.0f bytes/s" % (
+        budget.capacity or 0, budget.stream_scale * 100, budget.bulk_rate or 0))
+
+The estimate follows the radio: it is cut when the radio's transmit buffer runs low (``txbuf``) or it
+reports receive errors, and grows back slowly while the buffer stays clear.
+"""
+
+import collections
+import math
+
+import monotonic
+from pymavlink import mavutil
+
+mavlink = mavutil.mavlink
+
+# Bytes each bulk request makes the vehicle send back (an estimate, including the packet header).
+_PARAM_VALUE = 37
+_MISSION_ITEM = 50
+_LOG_DATA = 105
+
+#: Bulk request messages, with the number of bytes of the answer they cause.
+BULK_MESSAGES = {
+    mavlink.MAVLINK_MSG_ID_PARAM_REQUEST_READ: _PARAM_VALUE,
+    mavlink.MAVLINK_MSG_ID_MISSION_REQUEST: _MISSION_ITEM,
+    mavlink.MAVLINK_MSG_ID_MISSION_REQUEST_INT: _MISSION_ITEM,
+    mavlink.MAVLINK_MSG_ID_MISSION_ITEM: 14,
+    mavlink.MAVLINK_MSG_ID_MISSION_ITEM_INT: 14,
+    mavlink.MAVLINK_MSG_ID_LOG_REQUEST_DATA: 0,
+    mavlink.MAVLINK_MSG_ID_FILE_TRANSFER_PROTOCOL: 263,
+}
+
+#: Messages sent by the vehicle in answer to bulk requests, not counted as telemetry.
+BULK_ANSWERS = ('PARAM_VALUE', 'MISSION_ITEM', 'MISSION_ITEM_INT', 'MISSION_REQUEST', 'MISSION_REQUEST_INT',
+                'LOG_DATA', 'LOG_ENTRY', 'FILE_TRANSFER_PROTOCOL')
+
+
+def _header(packet):
+    # Message id and payload offset of a packed MAVLink 1 or 2 packet.
+    if packet[0] == mavlink.PROTOCOL_MARKER_V2:
+        return packet[7] | (packet[8] << 8) | (packet[9] << 16), 10
+    return packet[5], 6
+
+
+def packet_cost(packet):
+    """
+    Return the bytes a bulk request packet costs: its own size and the size of the answers it asks for.
+    """
+    msgid, start = _header(packet)
+    cost = len(packet) + BULK_MESSAGES.get(msgid, 0)
+    if msgid == mavlink.MAVLINK_MSG_ID_LOG_REQUEST_DATA:
+        # The count field, which MAVLink 2 may have truncated if its high bytes are zero.
+        count = bytearray(packet[start + 4:start + 8])
+        count += bytearray(4 - len(count))
+        count = count[0] | (count[1] << 8) | (count[2] << 16) | (count[3] << 24)
+        cost += int(math.ceil(min(count, 1 << 24) / 90.0)) * _LOG_DATA
+    return cost
+
+
+class BulkPacer(object):
+    """
+    Holds bulk request packets back and releases them at :py:attr:`rate` bytes per second.
+
+    The send thread of the connection only takes packets from the pacer when nothing else is waiting to
+    be sent, so control messages always go first.
+
+    :param float rate: Bytes per second, or ``None`` for no limit.
+    """
+
+    #: Seconds of budget that can be spent at once.
+    burst = 0.25
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._queue = collections.deque()
+        self._tokens = 0.0
+        self._last = monotonic.monotonic()
+        #: Packets released so far.
+        self.sent = 0
+        #: Bytes of budget spent so far (see :py:func:`packet_cost`).
+        self.spent = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    @staticmethod
+    def accepts(packet):
+        """
+        Whether ``packet`` is a bulk request.
+        """
+        return _header(packet)[0] in BULK_MESSAGES
+
+    def put(self, packet):
+        """
+        Queue a bulk request packet.
+        """
+        self._queue.append(packet)
+
+    def get(self, now=None):
+        """
+        Return the next packet if the budget allows it to be sent now, otherwise ``None``.
+        """
+        if not self._queue:
+            return None
+        cost = packet_cost(self._queue[0])
+        rate = self.rate
+        if rate is not None:
+            if now is None:
+                now = monotonic.monotonic()
+            limit = rate * self.burst
+            self._tokens = min(self._tokens + (now - self._last) * rate, limit)
+            self._last = now
+            # A packet costing more than a burst may be sent with a full bucket, leaving a debt.
+            if self._tokens < min(cost, limit):
+                return None
+            self._tokens -= cost
+        self.sent += 1
+        self.spent += cost
+        return self._queue.popleft()
+
+    def timeout(self):
+        """
+        Seconds the send thread may wait for other packets before the next bulk packet is due.
+        """
+        if not self._queue or self.rate is None:
+            return 0.01
+        wait = (min(packet_cost(self._queue[0]), self.rate * self.burst) - self._tokens) / self.rate
+        return min(max(wait, 0.001), 0.01)
+
+    def drain(self):
+        """
+        Remove and return every queued packet.
+        """
+        packets = list(self._queue)
+        self._queue.clear()
+        return packets
+
+
+class LinkBudget(object):
+    """
+    Estimates the bandwidth of the link to a vehicle and shares it between control, telemetry and bulk
+    transfers.
+
+    Use :py:func:`Vehicle.enable_link_budget() <dronekit.Vehicle.enable_link_budget>` rather than creating
+    one directly.
+
+    :param float max_bandwidth: Bytes per second the link can carry at best (both directions), if known.
+        Without it, nothing is slowed down until the radio first reports congestion.
+    """
+
+    #: The radio is congested when its transmit buffer is less than this percentage free.
+    low_txbuf = 40
+    #: The estimate grows only while the transmit buffer is at least this percentage free.
+    high_txbuf = 80
+    #: Factor applied to the bandwidth in use when the link is congested.
+    decrease = 0.75
+    #: Fraction by which the estimate grows each second while the link is clear.
+    increase = 0.05
+    #: Share of the bandwidth kept free for control messages.
+    control_reserve = 0.15
+    #: Share of the bandwidth that bulk transfers always get.
+    bulk_share = 0.05
+    #: Telemetry is never slowed down by more than this factor.
+    min_stream_scale = 0.1
+
+    def __init__(self, vehicle, max_bandwidth=None):
+        self._vehicle = vehicle
+        self.max_bandwidth = max_bandwidth
+        #: Estimated bytes per second the link can carry, or ``None`` if there is no limit yet.
+        self.capacity = max_bandwidth
+        #: Bytes per second used in both directions, over the last second.
+        self.used = 0.0
+        #: Bytes per second of telemetry, over the last second.
+        self.telemetry = 0.0
+        #: Whether the radio reported congestion in the last second.
+        self.congested = False
+        #: The last ``RADIO_STATUS`` message received, or ``None``.
+        self.radio = None
+        #: The :py:class:`BulkPacer` of the connection.
+        self.pacer = BulkPacer()
+        self.stream_scale = 1.0
+        self._min_txbuf = None
+        self._rxerrors = None
+        self._errors = False
+        self._bytes_sent = None
+
+    @property
+    def bulk_rate(self):
+        """
+        Bytes per second allowed for bulk transfers, or ``None`` for no limit.
+        """
+        return self.pacer.rate
+
+    def attach(self):
+        """
+        Start following the radio and pacing the bulk transfers of the vehicle.
+        """
+        vehicle = self._vehicle
+        vehicle.add_message_listener('RADIO_STATUS', self._radio_listener)
+        vehicle.add_attribute_listener('link_stats', self._stats_listener)
+        vehicle._handler.set_bulk_pacer(self.pacer)
+
+    def detach(self):
+        """
+        Stop pacing bulk transfers and restore the full telemetry rates.
+        """
+        vehicle = self._vehicle
+        vehicle.remove_message_listener('RADIO_STATUS', self._radio_listener)
+        vehicle.remove_attribute_listener('link_stats', self._stats_listener)
+        vehicle._handler.set_bulk_pacer(None)
+        if vehicle._streams is not None:
+            vehicle._streams.scale = 1.0
+
+    def _radio_listener(self, vehicle, name, msg):
+        self.handle_radio_status(msg)
+
+    def _stats_listener(self, vehicle, name, stats):
+        self.update(stats)
+
+    def handle_radio_status(self, msg):
+        """
+        Take a ``RADIO_STATUS`` message into account.
+        """
+        self.radio = msg
+        if self._min_txbuf is None or msg.txbuf < self._min_txbuf:
+            self._min_txbuf = msg.txbuf
+        if self._rxerrors is not None and msg.rxerrors > self._rxerrors:
+            self._errors = True
+        self._rxerrors = msg.rxerrors
+
+    def update(self, stats):
+        """
+        Update the estimate from a :py:class:`LinkStats <dronekit.link_stats.LinkStats>` snapshot and share
+        the bandwidth out again.
+        """
+        sent = 0.0
+        if self._bytes_sent is not None and stats.interval > 0:
+            sent = (stats.bytes_sent - self._bytes_sent) / stats.interval
+        self._bytes_sent = stats.bytes_sent
+        self.used = stats.bandwidth + sent
+        self.telemetry = sum(m.bandwidth for name, m in stats.messages.items() if name not in BULK_ANSWERS)
+
+        txbuf, self._min_txbuf = self._min_txbuf, None
+        self.congested = self._errors or (txbuf is not None and txbuf < self.low_txbuf)
+        self._errors = False
+        if self.congested:
+            used = self.used if self.capacity is None else min(self.capacity, self.used)
+            self.capacity = used * self.decrease
+        elif self.capacity is not None and (txbuf is None or txbuf >= self.high_txbuf):
+            self.capacity *= 1 + self.increase
+        if self.capacity is not None and self.max_bandwidth is not None:
+            self.capacity = min(self.capacity, self.max_bandwidth)
+        self._allocate()
+
+    def _allocate(self):
+        if self.capacity is None:
+            self.pacer.rate = None
+            self._set_stream_scale(1.0)
+            return
+        available = self.capacity * (1 - self.control_reserve)
+        bulk_floor = self.capacity * self.bulk_share
+        # Telemetry at full rate. It can only be slowed down if it was requested through vehicle.streams.
+        demand = self.telemetry / self.stream_scale
+        scale = 1.0
+        if demand > 0 and self._vehicle._streams is not None:
+            scale = min(max((available - bulk_floor) / demand, self.min_stream_scale), 1.0)
+        self.pacer.rate = max(available - demand * scale, bulk_floor)
+        self._set_stream_scale(scale)
+
+    def _set_stream_scale(self, scale):
+        # Avoid resending every rate for small changes.
+        if scale != 1.0 and abs(scale - self.stream_scale) < 0.1 * self.stream_scale:
+            return
+        if scale == self.stream_scale:
+            return
+        self.stream_scale = scale
+        streams = self._vehicle._streams
+        if streams is not None:
+            streams.scale = scale
+
+    def __str__(self):
+        return 'LinkBudget:capacity=%s,used=%.0f,stream_scale=%.2f,bulk_rate=%s,congested=%s' % (
+            self.capacity, self.used, self.stream_scale, self.bulk_rate, self.congested)
@@ -0,0 +1,258 @@
+"""
+Link statistics.
+
+Every :py:class:`MAVConnection <dronekit.mavlink.MAVConnection>` counts what it receives and sends in a
+:py:class:`LinkCounters`. The counters are plain integers and lists updated from the receive and send
+threads, cheap enough to keep on every connection. Once a second the vehicle turns them into a
+:py:class:`LinkStats` snapshot, published as the observable :py:attr:`Vehicle.link_stats
+<dronekit.Vehicle.link_stats>` attribute:
+
+.. code:: python
+
+    @vehicle.on_attribute('link_stats')
+    def link_stats_listener(self, name, stats):
+        for source in stats.sources.values():
+            if source.loss > 0.05:
+                print("Losing %.0f%% of packets from %s" % (source.loss * 100, source.system))
+        print("ATTITUDE at %.1f Hz" % stats.messages['ATTITUDE'].rate)
+"""
+
+import monotonic
+from pymavlink import mavutil
+
+# Weight of a new sample in the running inter-arrival averages (as in RFC 3550).
+_GAIN = 1.0 / 16
+
+
+class MessageStats(object):
+    """
+    Statistics of one message type, in a :py:class:`LinkStats` snapshot.
+
+    :param str name: The message type.
+    :param int count: Messages received since the connection was opened.
+    :param int bytes: Bytes received (whole packets, including headers) since the connection was opened.
+    :param float rate: Messages per second since the previous snapshot.
+    :param float bandwidth: Bytes per second since the previous snapshot.
+    :param float interval: Smoothed time between messages, in seconds.
+    :param float jitter: Smoothed deviation of the time between messages from ``interval``, in seconds.
+    """
+
+    def __init__(self, name, count, bytes, rate, bandwidth, interval, jitter):
+        self.name = name
+        self.count = count
+        self.bytes = bytes
+        self.rate = rate
+        self.bandwidth = bandwidth
+        self.interval = interval
+        self.jitter = jitter
+
+    def __str__(self):
+        return 'MessageStats:name=%s,count=%s,rate=%.1f,bandwidth=%.0f,jitter=%.4f' % (
+            self.name, self.count, self.rate, self.bandwidth, self.jitter)
+
+
+class SourceStats(object):
+    """
+    Statistics of one sending system and component, in a :py:class:`LinkStats` snapshot.
+
+    :param int system: MAVLink system id.
+    :param int component: MAVLink component id.
+    :param int count: Packets received since the connection was opened.
+    :param int bytes: Bytes received since the connection was opened.
+    :param float rate: Packets per second since the previous snapshot.
+    :param int lost: Packets lost since the connection was opened, from the gaps in sequence numbers.
+    :param float loss: Fraction of the packets sent since the previous snapshot that were lost.
+    """
+
+    def __init__(self, system, component, count, bytes, rate, lost, loss):
+        self.system = system
+        self.component = component
+        self.count = count
+        self.bytes = bytes
+        self.rate = rate
+        self.lost = lost
+        self.loss = loss
+
+    def __str__(self):
+        return 'SourceStats:system=%s,component=%s,count=%s,rate=%.1f,lost=%s,loss=%.3f' % (
+            self.system, self.component, self.count, self.rate, self.lost, self.loss)
+
+
+class LinkStats(object):
+    """
+    A snapshot of the statistics of a connection.
+
+    :param messages: :py:class:`MessageStats` by message type.
+    :param sources: :py:class:`SourceStats` by ``(system, component)``.
+    :param int received: Packets received.
+    :param int bytes_received: Bytes received.
+    :param int sent: Packets sent.
+    :param int bytes_sent: Bytes sent.
+    :param int lost: Packets lost, over all sources.
+    :param int crc_errors: Packets dropped because their checksum was wrong.
+    :param int parse_errors: Other data that could not be parsed (bad lengths, garbage between packets,
+        unknown message ids).
+    :param int queue_depth: Packets waiting to be sent when the snapshot was taken.
+    :param int queue_peak: Largest number of packets seen waiting to be sent since the previous snapshot.
+    :param float interval: Seconds covered by the rates of the snapshot.
+    """
+
+    def __init__(self, messages, sources, received, bytes_received, sent, bytes_sent, lost, crc_errors,
+                 parse_errors, queue_depth, queue_peak, interval):
+        self.messages = messages
+        self.sources = sources
+        self.received = received
+        self.bytes_received = bytes_received
+        self.sent = sent
+        self.bytes_sent = bytes_sent
+        self.lost = lost
+        self.crc_errors = crc_errors
+        self.parse_errors = parse_errors
+        self.queue_depth = queue_depth
+        self.queue_peak = queue_peak
+        self.interval = interval
+
+    @property
+    def rate(self):
+        """
+        Packets received per second since the previous snapshot.
+        """
+        return sum(m.rate for m in self.messages.values())
+
+    @property
+    def bandwidth(self):
+        """
+        Bytes received per second since the previous snapshot.
+        """
+        return sum(m.bandwidth for m in self.messages.values())
+
+    def __str__(self):
+        return 'LinkStats:received=%s,rate=%.1f,bandwidth=%.0f,lost=%s,crc_errors=%s,parse_errors=%s,' \
+               'queue_depth=%s' % (self.received, self.rate, self.bandwidth, self.lost, self.crc_errors,
+                                   self.parse_errors, self.queue_depth)
+
+
+class LinkCounters(object):
+    """
+    Running counters of a connection, updated by its receive and send threads.
+
+    :py:func:`snapshot` computes rates over the time since the previous snapshot, so there should be a
+    single consumer (the vehicle's once-a-second update of :py:attr:`Vehicle.link_stats
+    <dronekit.Vehicle.link_stats>`).
+    """
+
+    def __init__(self):
+        # msgid -> [count, bytes, last arrival, mean interval, jitter]
+        self._messages = {}
+        # (system, component) -> [count, bytes, last sequence number, lost]
+        self._sources = {}
+        self.sent = 0
+        self.bytes_sent = 0
+        self.crc_errors = 0
+        self.parse_errors = 0
+        self.queue_peak = 0
+        self._previous = ({}, {}, monotonic.monotonic())
+
+    def record(self, msg, now=None):
+        """
+        Count a received message.
+        """
+        if now is None:
+            now = monotonic.monotonic()
+        # This runs for every message: read the header fields directly rather than through the getters.
+        header = msg._header
+        msgid = header.msgId
+        if msgid < 0:
+            # BAD_DATA, from a parser with robust_parsing set.
+            self.record_error(msg.reason)
+            return
+        size = len(msg._msgbuf)
+
+        stats = self._messages.get(msgid)
+        if stats is None:
+            self._messages[msgid] = [1, size, now, 0.0, 0.0]
+        else:
+            stats[0] += 1
+            stats[1] += size
+            elapsed = now - stats[2]
+            stats[2] = now
+            if stats[0] == 2:
+                stats[3] = elapsed
+            else:
+                interval = stats[3] = stats[3] + (elapsed - stats[3]) * _GAIN
+                stats[4] += (abs(elapsed - interval) - stats[4]) * _GAIN
+
+        key = (header.srcSystem, header.srcComponent)
+        seq = header.seq
+        source = self._sources.get(key)
+        if source is None:
+            self._sources[key] = [1, size, seq, 0]
+        else:
+            source[0] += 1
+            source[1] += size
+            source[3] += (seq - source[2] - 1) & 0xFF
+            source[2] = seq
+
+    def record_error(self, reason=''):
+        """
+        Count data that could not be parsed.
+
+        :param str reason: The parser's error message, used to tell checksum failures from other errors.
+        """
+        if 'CRC' in reason:
+            self.crc_errors += 1
+        else:
+            self.parse_errors += 1
+
+    def record_sent(self, size, queue_depth):
+        """
+        Count a sent packet of ``size`` bytes, with ``queue_depth`` packets still waiting.
+        """
+        self.sent += 1
+        self.bytes_sent += size
+        if queue_depth > self.queue_peak:
+            self.queue_peak = queue_depth
+
+    def snapshot(self, queue_depth=0, now=None):
+        """
+        Return a :py:class:`LinkStats` snapshot, with rates since the previous snapshot.
+
+        :param int queue_depth: The current number of packets waiting to be sent.
+        """
+        if now is None:
+            now = monotonic.monotonic()
+        previous_messages, previous_sources, previous_time = self._previous
+        interval = now - previous_time
+
+        messages = {}
+        current_messages = {}
+        for msgid, stats in list(self._messages.items()):
+            count, size = stats[0], stats[1]
+            current_messages[msgid] = (count, size)
+            count_before, size_before = previous_messages.get(msgid, (0, 0))
+            msgclass = mavutil.mavlink.mavlink_map.get(msgid)
+            name = msgclass.msgname if msgclass is not None else str(msgid)
+            messages[name] = MessageStats(name, count, size, _rate(count - count_before, interval),
+                                          _rate(size - size_before, interval), stats[3], stats[4])
+
+        sources = {}
+        current_sources = {}
+        for key, source in list(self._sources.items()):
+            count, size, lost = source[0], source[1], source[3]
+            current_sources[key] = (count, lost)
+            count_before, lost_before = previous_sources.get(key, (0, 0))
+            received, missed = count - count_before, lost - lost_before
+            loss = float(missed) / (received + missed) if received + missed else 0.0
+            sources[key] = SourceStats(key[0], key[1], count, size, _rate(received, interval), lost, loss)
+
+        queue_peak = max(self.queue_peak, queue_depth)
+        self.queue_peak = 0
+        self._previous = (current_messages, current_sources, now)
+        return LinkStats(messages, sources, sum(s.count for s in sources.values()),
+                         sum(s.bytes for s in sources.values()), self.sent, self.bytes_sent,
+                         sum(s.lost for s in sources.values()), self.crc_errors, self.parse_errors,
+                         queue_depth, queue_peak, interval)
+
+
+def _rate(count, interval):
+    return count / interval if interval > 0 else 0.0
@@ -0,0 +1,535 @@
+"""
+Download of the logs stored on the vehicle (for example ArduPilot DataFlash logs).
+
+The logs are accessed through :py:attr:`Vehicle.logs <dronekit.Vehicle.logs>`:
+
+.. code:: python
+
+    for entry in vehicle.logs.list():
+        print(entry.id, entry.size)
+
+    download = vehicle.logs.download(entry.id, 'flight.bin',
+                                     progress=lambda d: print('%.0f%% at %.1f kB/s'
+                                                              % (100.0 * d.fraction, d.throughput / 1000)))
+
+Rather than requesting one 90-byte ``LOG_DATA`` packet at a time, the downloader asks for large ranges of
+the log and lets the autopilot stream them. Received chunks are recorded in a bitmap and written straight
+into a memory-mapped file of the final size; once a range has been sent, only the chunks that were lost
+are requested again. The bitmap is saved next to the file (``<path>.partial``) while the download runs, so
+a download interrupted by a disconnect resumes where it stopped when it is started again. Saving is done
+by a thread of the download, once a second: it flushes the file, then writes only the bytes of the bitmap
+that changed.
+"""
+
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+
+import concurrent.futures
+import monotonic
+
+from dronekit import APIException, TimeoutError, _future_result
+from dronekit.util import message_payload
+
+#: Bytes of log data in each ``LOG_DATA`` message.
+CHUNK_SIZE = 90
+
+_PARTIAL_MAGIC = b'DKLOGPT2'
+# magic, log id, size, time_utc, then the bitmap (one bit per chunk, least significant bit first)
+_partial_header = struct.Struct('<8sIII')
+
+# Seconds between saves of the received data and bitmap.
+_SAVE_INTERVAL = 1.0
+
+# A bitmap byte with at least one missing chunk.
+_incomplete = re.compile(b'[^\xff]')
+
+
+class LogEntry(object):
+    """
+    A log stored on the vehicle, as listed by :py:func:`LogList.list`.
+
+    :param int id: The log number.
+    :param int size: Size in bytes.
+    :param int time_utc: UTC time the log was created, in seconds since the epoch (0 if unknown).
+    """
+
+    def __init__(self, id, size, time_utc):
+        self.id = id
+        self.size = size
+        self.time_utc = time_utc
+
+    def __str__(self):
+        return "LogEntry:id=%s,size=%s,time_utc=%s" % (self.id, self.size, self.time_utc)
+
+    def __eq__(self, other):
+        return isinstance(other, LogEntry) and \
+            (self.id, self.size, self.time_utc) == (other.id, other.size, other.time_utc)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class _LogListing(object):
+    # Collects LOG_ENTRY messages until every log has been listed.
+
+    def __init__(self, vehicle, retries, retry_timeout):
+        self._vehicle = vehicle
+        self._retries = retries
+        self._retry_timeout = retry_timeout
+        self._entries = {}
+        self._count = None
+        self._attempts = 0
+        self._last_activity = None
+        self.future = concurrent.futures.Future()
+
+    def start(self):
+        self._last_activity = monotonic.monotonic()
+        self._request()
+
+    def _request(self):
+        master = self._vehicle._master
+        master.mav.log_request_list_send(master.target_system, master.target_component, 0, 0xffff)
+
+    def handle_entry(self, msg):
+        if self.future.done():
+            return
+        self._attempts = 0
+        self._last_activity = monotonic.monotonic()
+        self._count = msg.num_logs
+        if msg.num_logs > 0:
+            self._entries[msg.id] = LogEntry(msg.id, msg.size, msg.time_utc)
+        if len(self._entries) >= self._count:
+            self.future.set_result(sorted(self._entries.values(), key=lambda entry: entry.id))
+
+    def poll(self, now):
+        if self.future.done() or now - self._last_activity < self._retry_timeout:
+            return
+        if self._attempts >= self._retries:
+            self.future.set_exception(TimeoutError('Log listing timed out after %s of %s entries.'
+                                                   % (len(self._entries), self._count)))
+            return
+        self._attempts += 1
+        self._last_activity = now
+        self._request()
+
+
+class LogDownload(object):
+    """
+    The state of a log download started by :py:func:`LogList.download_async`.
+
+    The outcome is reported through :py:attr:`future`, which resolves to this object once the whole log
+    has been written.
+    """
+
+    def __init__(self, vehicle, entry, path, request_size, retries, retry_timeout, progress,
+                 progress_interval):
+        self._vehicle = vehicle
+        #: The :py:class:`LogEntry` being downloaded.
+        self.entry = entry
+        #: The file the log is written to.
+        self.path = path
+        self._request_chunks = max(1, request_size // CHUNK_SIZE)
+        self._retries = retries
+        self._retry_timeout = retry_timeout
+        self._progress = progress
+        self._progress_interval = progress_interval
+
+        self._chunks = (entry.size + CHUNK_SIZE - 1) // CHUNK_SIZE
+        # Bit ``n % 8`` of byte ``n // 8`` is set once chunk n has been written.
+        self._received = bytearray((self._chunks + 7) // 8)
+        self._done = 0
+        self._file = None
+        self._map = None
+        self._partial = None
+        # Bytes [_dirty_start, _dirty_end) of the bitmap changed since it was last saved.
+        self._dirty_start = None
+        self._dirty_end = None
+        self._dirty_lock = threading.Lock()
+        self._saver = None
+        self._stop_saving = threading.Event()
+        # Chunks [_request_start, _request_end) have been requested.
+        self._request_start = 0
+        self._request_end = 0
+        self._attempts = 0
+        self._last_activity = None
+        self._last_progress = None
+        self._lock = threading.Lock()
+
+        #: Bytes already on disk when the download started (from an interrupted download).
+        self.resumed_bytes = 0
+        #: Bytes received from the vehicle by this download.
+        self.bytes_received = 0
+        #: Time the download started (``monotonic``) and, once it has, finished.
+        self.started = None
+        self.finished = None
+        self.future = concurrent.futures.Future()
+
+    @property
+    def bytes_done(self):
+        """
+        Bytes of the log written so far.
+        """
+        return min(self._done * CHUNK_SIZE, self.entry.size)
+
+    @property
+    def fraction(self):
+        """
+        Fraction of the log written so far, from 0 to 1.
+        """
+        return float(self._done) / self._chunks if self._chunks else 1.0
+
+    @property
+    def elapsed(self):
+        """
+        Seconds since the download started.
+        """
+        if self.started is None:
+            return 0.0
+        return (self.finished or monotonic.monotonic()) - self.started
+
+    @property
+    def throughput(self):
+        """
+        Average download rate so far, in bytes per second.
+        """
+        elapsed = self.elapsed
+        return self.bytes_received / elapsed if elapsed > 0 else 0.0
+
+    def _partial_path(self):
+        return self.path + '.partial'
+
+    def _has(self, chunk):
+        return self._received[chunk >> 3] & (1 << (chunk & 7))
+
+    def _missing(self, start):
+        # The first chunk at or after ``start`` that has not been received, or -1.
+        match = _incomplete.search(self._received, start >> 3)
+        while match is not None:
+            byte = match.start()
+            bits = self._received[byte]
+            for chunk in range(max(start, byte << 3), min((byte + 1) << 3, self._chunks)):
+                if not bits & (1 << (chunk & 7)):
+                    return chunk
+            match = _incomplete.search(self._received, byte + 1)
+        return -1
+
+    def _load_partial(self):
+        # Restore the bitmap of an interrupted download of the same log.
+        try:
+            with open(self._partial_path(), 'rb') as f:
+                header = f.read(_partial_header.size)
+                bitmap = f.read()
+        except (IOError, OSError):
+            return
+        if len(header) != _partial_header.size or len(bitmap) != len(self._received):
+            return
+        if _partial_header.unpack(header) != (_PARTIAL_MAGIC, self.entry.id, self.entry.size,
+                                              self.entry.time_utc):
+            return
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != self.entry.size:
+            return
+        self._received = bytearray(bitmap)
+        self._done = sum(1 for chunk in range(self._chunks) if self._has(chunk))
+        self.resumed_bytes = self.bytes_done
+
+    def _save(self):
+        # Write the chunks received so far to disk, then the part of the bitmap that records them.
+        with self._dirty_lock:
+            start, end = self._dirty_start, self._dirty_end
+            if start is None:
+                return
+            changed = self._received[start:end]
+            self._dirty_start = self._dirty_end = None
+        if self._map is not None:
+            self._map.flush()
+        self._partial.seek(_partial_header.size + start)
+        self._partial.write(changed)
+        self._partial.flush()
+
+    def _run_saver(self):
+        while not self._stop_saving.wait(_SAVE_INTERVAL):
+            try:
+                self._save()
+            except (IOError, OSError):
+                logging.getLogger(__name__).exception('Exception while saving log download', exc_info=True)
+
+    def start(self):
+        self._load_partial()
+        mode = 'r+b' if self.resumed_bytes else 'w+b'
+        self._file = open(self.path, mode)
+        self._file.truncate(self.entry.size)
+        if self.entry.size:
+            self._map = mmap.mmap(self._file.fileno(), self.entry.size)
+        self.started = self._last_activity = self._last_progress = monotonic.monotonic()
+        if self._done == self._chunks:
+            self._finish()
+            return
+        self._partial = open(self._partial_path(), 'w+b')
+        self._partial.write(_partial_header.pack(_PARTIAL_MAGIC, self.entry.id, self.entry.size,
+                                                 self.entry.time_utc))
+        self._partial.write(self._received)
+        self._partial.flush()
+        self._saver = threading.Thread(target=self._run_saver, name='dronekit-log-download')
+        self._saver.daemon = True
+        self._saver.start()
+        self._request_next(0)
+
+    def _request_next(self, start):
+        # Request the next run of missing chunks at or after ``start``, wrapping around to the beginning.
+        first = self._missing(start)
+        if first < 0:
+            first = self._missing(0)
+        request_chunks = self._request_chunks
+        bulk = self._vehicle._handler.bulk_pacer
+        if bulk is not None and bulk.rate is not None:
+            # Under a link budget, ask for no more than the budget allows at once.
+            request_chunks = min(request_chunks, max(1, int(bulk.rate * bulk.burst / CHUNK_SIZE)))
+        end = min(first + request_chunks, self._chunks)
+        for chunk in range(first + 1, end):
+            if self._has(chunk):
+                end = chunk
+                break
+        self._request_start = first
+        self._request_end = end
+        master = self._vehicle._master
+        master.mav.log_request_data_send(master.target_system, master.target_component, self.entry.id,
+                                         first * CHUNK_SIZE, (end - first) * CHUNK_SIZE)
+
+    def handle_data(self, msg):
+        if msg.id != self.entry.id:
+            return
+        with self._lock:
+            if self.future.done():
+                return
+            chunk, misaligned = divmod(msg.ofs, CHUNK_SIZE)
+            if misaligned or chunk >= self._chunks:
+                return
+            self._attempts = 0
+            self._last_activity = monotonic.monotonic()
+            if not self._has(chunk):
+                count = min(msg.count, self.entry.size - msg.ofs)
+                if count <= 0:
+                    return
+                # Copy from the raw payload (ofs, id, count, data) rather than the decoded list of ints.
+                data = message_payload(msg)[7:7 + count]
+                if len(data) < count:
+                    # MAVLink 2 drops trailing zero bytes.
+                    data += bytes(count - len(data))
+                self._map[msg.ofs:msg.ofs + count] = data
+                byte = chunk >> 3
+                with self._dirty_lock:
+                    self._received[byte] |= 1 << (chunk & 7)
+                    if self._dirty_start is None:
+                        self._dirty_start, self._dirty_end = byte, byte + 1
+                    else:
+                        self._dirty_start = min(self._dirty_start, byte)
+                        self._dirty_end = max(self._dirty_end, byte + 1)
+                self._done += 1
+                self.bytes_received += count
+            if self._done == self._chunks:
+                self._finish()
+            elif chunk + 1 >= self._request_end:
+                # The autopilot has sent the whole range: ask for the next gap.
+                self._request_next(self._request_end)
+
+    def _stop_saver(self):
+        # The saver never takes _lock, so it can be joined while _lock is held.
+        self._stop_saving.set()
+        if self._saver is not None:
+            self._saver.join()
+            self._saver = None
+
+    def _close(self):
+        self._stop_saver()
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._partial is not None:
+            self._partial.close()
+            self._partial = None
+
+    def _finish(self):
+        self.finished = monotonic.monotonic()
+        self._close()
+        if os.path.exists(self._partial_path()):
+            os.remove(self._partial_path())
+        master = self._vehicle._master
+        master.mav.log_request_end_send(master.target_system, master.target_component)
+        if self._progress:
+            self._progress(self)
+        self.future.set_result(self)
+
+    def _fail(self, error):
+        self.finished = monotonic.monotonic()
+        self._stop_saver()
+        try:
+            self._save()
+        finally:
+            self._close()
+        self.future.set_exception(error)
+
+    def cancel(self):
+        """
+        Stop the download. What has been received is kept, so the download can be resumed later.
+        """
+        with self._lock:
+            if self.future.done():
+                return
+            master = self._vehicle._master
+            master.mav.log_request_end_send(master.target_system, master.target_component)
+            self._fail(APIException('Log download cancelled.'))
+
+    def poll(self, now):
+        with self._lock:
+            if self.future.done() or self._last_activity is None:
+                return
+            if self._progress and now - self._last_progress >= self._progress_interval:
+                self._last_progress = now
+                self._progress(self)
+            if now - self._last_activity < self._retry_timeout:
+                return
+            if self._attempts >= self._retries:
+                self._fail(TimeoutError('Log download timed out after %s of %s bytes.'
+                                        % (self.bytes_done, self.entry.size)))
+                return
+            self._attempts += 1
+            self._last_activity = now
+            self._request_next(self._request_start)
+
+
+class LogList(object):
+    """
+    The logs stored on the vehicle (:py:attr:`Vehicle.logs <dronekit.Vehicle.logs>`).
+
+    Only one listing or download can be in progress at a time.
+    """
+
+    def __init__(self, vehicle):
+        self._vehicle = vehicle
+        self._listing = None
+        self._download = None
+        #: The entries found by the last :py:func:`list`.
+        self.entries = []
+
+        @vehicle.on_message('LOG_ENTRY')
+        def listener(_, name, msg):
+            listing = self._listing
+            if listing is not None:
+                listing.handle_entry(msg)
+
+        @vehicle.on_message('LOG_DATA')
+        def listener(_, name, msg):
+            download = self._download
+            if download is not None:
+                download.handle_data(msg)
+
+        @vehicle._handler.forward_loop
+        def poll(_):
+            now = monotonic.monotonic()
+            listing = self._listing
+            if listing is not None:
+                listing.poll(now)
+            download = self._download
+            if download is not None:
+                download.poll(now)
+
+    def _check_idle(self):
+        for transfer in (self._listing, self._download):
+            if transfer is not None and not transfer.future.done():
+                raise APIException('A log listing or download is already in progress.')
+
+    def list(self, timeout=None):
+        """
+        Ask the vehicle for its logs. Blocks until every entry has been received.
+
+        :param int timeout: Seconds to wait. No timeout if not provided or set to None.
+        :returns: A list of :py:class:`LogEntry`, ordered by log id.
+        """
+        return _future_result(self.list_async(), timeout, 'Log listing')
+
+    def list_async(self, retries=5, retry_timeout=1.0):
+        """
+        Start listing the logs without blocking the calling thread.
+
+        :returns: A ``concurrent.futures.Future`` resolving to the list of :py:class:`LogEntry`.
+        """
+        self._check_idle()
+        listing = self._listing = _LogListing(self._vehicle, retries, retry_timeout)
+
+        def done(future):
+            if not future.cancelled() and future.exception() is None:
+                self.entries = future.result()
+
+        listing.future.add_done_callback(done)
+        listing.start()
+        return listing.future
+
+    def _entry(self, log):
+        if isinstance(log, LogEntry):
+            return log
+        for entry in self.entries:
+            if entry.id == log:
+                return entry
+        for entry in self.list():
+            if entry.id == log:
+                return entry
+        raise ValueError('No log %s on the vehicle' % log)
+
+    def download(self, log, path, timeout=None, **kwargs):
+        """
+        Download a log into a file. Blocks until the download is complete.
+
+        Takes the same arguments as :py:func:`download_async`.
+
+        :param int timeout: Seconds to wait. No timeout if not provided or set to None.
+        :returns: The finished :py:class:`LogDownload`, with its transfer statistics.
+        """
+        download = self.download_async(log, path, **kwargs)
+        try:
+            return download.future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # Keep what has been received, so that the download can be resumed.
+            download.cancel()
+            raise TimeoutError('Log download timed out after %s seconds.' % timeout)
+
+    def download_async(self, log, path, request_size=64 * 1024, retries=10, retry_timeout=0.5, progress=None,
+                       progress_interval=1.0):
+        """
+        Start downloading a log into a file, without blocking the calling thread.
+
+        If an earlier download of the same log into the same file was interrupted, only the missing parts
+        are downloaded.
+
+        :param log: The :py:class:`LogEntry` or log id to download.
+        :param str path: The file to write the log to.
+        :param int request_size: Bytes requested from the autopilot at a time.
+        :param int retries: Number of consecutive re-requests without any data before giving up.
+        :param float retry_timeout: Seconds without data before re-requesting.
+        :param progress: Optional callback ``progress(download)``, called from the receive thread every
+            ``progress_interval`` seconds and once at the end.
+        :returns: A :py:class:`LogDownload`.
+        """
+        entry = self._entry(log)
+        self._check_idle()
+        download = LogDownload(self._vehicle, entry, path, request_size, retries, retry_timeout, progress,
+                               progress_interval)
+        self._download = download
+        download.start()
+        return download
+
+    def erase(self):
+        """
+        Erase all the logs on the vehicle.
+        """
+        self._check_idle()
+        master = self._vehicle._master
+        master.mav.log_erase_send(master.target_system, master.target_component)
+        self.entries = []
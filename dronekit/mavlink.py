@@ -9,9 +9,11 @@ import os
 import platform
 import copy
 from dronekit import APIException
+from dronekit.link_stats import LinkCounters
 from pymavlink import mavutil
 from queue import Queue, Empty
 from threading import Thread
+from time import monotonic_ns
 
 if platform.system() == 'Windows':
     from errno import WSAECONNRESET as ECONNABORTED
@@ -28,9 +30,15 @@ class MAVWriter(object):
     def __init__(self, queue):
         self._logger = logging.getLogger(__name__)
         self.queue = queue
+        # Bulk transfer requests are held back by this pacer, if set (see dronekit.link_budget).
+        self.bulk = None
 
     def write(self, pkt):
-        self.queue.put(pkt)
+        bulk = self.bulk
+        if bulk is not None and bulk.accepts(pkt):
+            bulk.put(pkt)
+        else:
+            self.queue.put(pkt)
 
     def read(self):
         self._logger.critical('writer should not have had a read request')
@@ -118,25 +126,33 @@ class MAVConnection(object):
 
     def stop_threads(self):
         if self.mavlink_thread_in is not None:
-            self.mavlink_thread_in.join()
+            if self.mavlink_thread_in.is_alive():
+                self.mavlink_thread_in.join()
             self.mavlink_thread_in = None
         if self.mavlink_thread_out is not None:
-            self.mavlink_thread_out.join()
+            if self.mavlink_thread_out.is_alive():
+                self.mavlink_thread_out.join()
             self.mavlink_thread_out = None
 
-    def __init__(self, ip, baud=115200, target_system=0, source_system=255, source_component=0, use_native=False):
+    def __init__(self, ip, baud=115200, target_system=0, source_system=255, source_component=0, use_native=False,
+                 tlog=None, replay_speed=1.0, replay_capture=False):
         self._logger = logging.getLogger(__name__)
 
         if ip.startswith("udpin:"):
             self.master = mavudpin_multi(ip[6:], input=True, baud=baud, source_system=source_system, source_component=source_component)
+        elif ip.startswith("tlog:"):
+            from dronekit.tlog import TlogReplay
+            self.master = TlogReplay(ip[5:], speed=replay_speed, capture=replay_capture,
+                                     source_system=source_system, source_component=source_component)
         else:
             self.master = mavutil.mavlink_connection(ip, baud=baud, source_system=source_system, source_component=source_component)
 
         # TODO get rid of "master" object as exposed,
         # keep it private, expose something smaller for dronekit
         self.out_queue = Queue()
+        self._writer = MAVWriter(self.out_queue)
         self.master.mav = mavutil.mavlink.MAVLink(
-            MAVWriter(self.out_queue),
+            self._writer,
             srcSystem=self.master.source_system,
             srcComponent=self.master.source_component,
             use_native=use_native)
@@ -157,6 +173,16 @@ class MAVConnection(object):
         self.loop_listeners = []
         self.message_listeners = []
 
+        # Link statistics, and receive latency tracing (see dronekit.latency).
+        self.link_stats = LinkCounters()
+        self.latency_tracer = None
+
+        # Telemetry log.
+        if tlog is not None and not hasattr(tlog, 'record'):
+            from dronekit.tlog import TlogRecorder
+            tlog = TlogRecorder(tlog)
+        self.tlog = tlog
+
         # Debug flag.
         self._accept_input = True
         self._alive = True
@@ -175,8 +201,17 @@ class MAVConnection(object):
             try:
                 while self._alive:
                     try:
-                        msg = self.out_queue.get(True, timeout=0.01)
+                        # Bulk transfer requests only go when nothing else is waiting.
+                        msg = None
+                        bulk = self._writer.bulk
+                        if bulk is not None and self.out_queue.empty():
+                            msg = bulk.get()
+                        if msg is None:
+                            msg = self.out_queue.get(True, timeout=0.01 if bulk is None else bulk.timeout())
                         self.master.write(msg)
+                        self.link_stats.record_sent(len(msg), self.out_queue.qsize())
+                        if self.tlog is not None and self.tlog.record_sent:
+                            self.tlog.record(msg)
                     except Empty:
                         continue
                     except socket.error as error:
@@ -217,6 +252,7 @@ class MAVConnection(object):
                     self.master.select(0.05)
 
                     while self._accept_input:
+                        receive_ns = monotonic_ns()
                         try:
                             msg = self.master.recv_msg()
                         except socket.error as error:
@@ -229,6 +265,7 @@ class MAVConnection(object):
                             #   invalid MAVLink prefix '73'
                             #   invalid MAVLink prefix '13'
                             self._logger.debug('mav recv error: %s' % str(e))
+                            self.link_stats.record_error(str(e))
                             msg = None
                         except Exception:
                             # Log any other unexpected exception
@@ -236,8 +273,16 @@ class MAVConnection(object):
                             msg = None
                         if not msg:
                             break
+                        msg._receive_ns = receive_ns
+                        msg._parse_ns = monotonic_ns()
+
+                        self.link_stats.record(msg, receive_ns * 1e-9)
+
+                        if self.tlog is not None:
+                            self.tlog.record(msg.get_msgbuf())
 
                         # Message listeners.
+                        msg._dispatch_ns = monotonic_ns()
                         for fn in self.message_listeners:
                             try:
                                 fn(self, msg)
@@ -246,6 +291,8 @@ class MAVConnection(object):
                                     'Exception in message handler for %s' % msg.get_type(),
                                     exc_info=True
                                 )
+                        if self.latency_tracer is not None:
+                            self.latency_tracer.record(msg, monotonic_ns())
 
             except APIException as e:
                 self._logger.exception('Exception in MAVLink input loop')
@@ -299,19 +346,44 @@ class MAVConnection(object):
         """
         self.message_listeners.append(fn)
 
+    @property
+    def bulk_pacer(self):
+        """
+        The pacer of bulk transfer requests (see :py:func:`set_bulk_pacer`), or ``None``.
+        """
+        return self._writer.bulk
+
+    def set_bulk_pacer(self, pacer):
+        """
+        Send bulk transfer requests through ``pacer`` (a ``dronekit.link_budget.BulkPacer``), or directly
+        again if ``pacer`` is ``None``.
+        """
+        previous = self._writer.bulk
+        self._writer.bulk = pacer
+        if previous is not None:
+            for pkt in previous.drain():
+                self._writer.write(pkt)
+
     def start(self):
+        if self.tlog is not None:
+            self.tlog.start()
         if not self.mavlink_thread_in.is_alive():
             self.mavlink_thread_in.start()
         if not self.mavlink_thread_out.is_alive():
             self.mavlink_thread_out.start()
 
     def close(self):
-        # TODO this can block forever if parameters continue to be added
+        # Let the send thread write what is already queued: once _alive is cleared it stops, and drops the
+        # rest of the queue. Give up after a second, in case more packets keep being queued.
+        deadline = monotonic_ns() + 1000000000
+        while not self.out_queue.empty() and self.mavlink_thread_out is not None and \
+                self.mavlink_thread_out.is_alive() and monotonic_ns() < deadline:
+            time.sleep(0.01)
         self._alive = False
-        while not self.out_queue.empty():
-            time.sleep(0.1)
         self.stop_threads()
         self.master.close()
+        if self.tlog is not None:
+            self.tlog.close()
 
     def pipe(self, target):
         target.target_system = self.target_system
@@ -0,0 +1,203 @@
+"""
+Compact storage for mission items.
+
+Missions are kept as a set of typed columns (one ``array.array`` per ``MISSION_ITEM_INT`` field)
+rather than as a list of message objects. A 10,000 item survey takes well under half a megabyte
+this way, items can be added and replaced in bulk from plain sequences or NumPy arrays, and
+``MISSION_ITEM_INT`` messages are only built when an item is actually read or uploaded.
+
+Latitude and longitude (``x`` and ``y``) are stored exactly as they are sent over the wire: as
+integers in degrees * 1e7.
+"""
+
+from array import array
+
+from pymavlink import mavutil
+
+# Field name -> array typecode, matching the MISSION_ITEM_INT wire types.
+COLUMNS = (
+    ('target_component', 'B'),
+    ('frame', 'B'),
+    ('command', 'H'),
+    ('current', 'B'),
+    ('autocontinue', 'B'),
+    ('param1', 'f'),
+    ('param2', 'f'),
+    ('param3', 'f'),
+    ('param4', 'f'),
+    ('x', 'i'),
+    ('y', 'i'),
+    ('z', 'f'),
+)
+
+_COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+
+
+def _column_values(typecode, values, n):
+    """
+    Return ``values`` as an ``array`` of ``n`` items of the given typecode.
+
+    ``values`` may be a scalar (repeated ``n`` times), a NumPy array (converted with a single
+    ``astype``/``tobytes`` rather than item by item), or any other iterable.
+    """
+    if hasattr(values, 'astype'):
+        result = array(typecode)
+        result.frombytes(values.astype(typecode, copy=False).tobytes())
+    elif hasattr(values, '__len__') and not isinstance(values, (str, bytes)):
+        result = array(typecode, values)
+    else:
+        return array(typecode, [values]) * n
+    if len(result) != n:
+        raise ValueError('Expected %s values, got %s.' % (n, len(result)))
+    return result
+
+
+def _column_length(columns):
+    n = None
+    for values in columns.values():
+        if hasattr(values, '__len__') and not isinstance(values, (str, bytes)):
+            if n is None:
+                n = len(values)
+            elif len(values) != n:
+                raise ValueError('Mission columns have different lengths.')
+    if n is None:
+        raise ValueError('At least one mission column must be a sequence.')
+    return n
+
+
+class MissionStore(object):
+    """
+    Column-oriented store of mission items, indexed from 0 (the home location).
+
+    It provides the subset of the ``pymavlink.mavwp.MAVWPLoader`` interface used by DroneKit
+    (``count``, ``wp``, ``add``, ``set``, ``clear``), plus bulk operations.
+
+    :param int mission_type: The ``MAV_MISSION_TYPE`` of the items held in the store.
+    """
+
+    def __init__(self, mission_type=0):
+        self.mission_type = mission_type
+        self.target_system = 0
+        self.expected_count = 0
+        self._columns = dict((name, array(typecode)) for name, typecode in COLUMNS)
+
+    def count(self):
+        """
+        Number of items in the store.
+        """
+        return len(self._columns['command'])
+
+    def __len__(self):
+        return self.count()
+
+    def clear(self):
+        self.truncate(0)
+
+    def truncate(self, n):
+        """
+        Drop every item from index ``n`` onwards.
+        """
+        for column in self._columns.values():
+            del column[n:]
+
+    def column(self, name, start=0, stop=None):
+        """
+        Return a zero-copy view of one column.
+
+        The view is a ``memoryview``, so it can be wrapped without copying by NumPy
+        (``numpy.asarray(store.column('x'))``). Items can be read and replaced while a view exists,
+        but the store cannot grow or shrink until the view has been released.
+
+        :param String name: Field name (e.g. ``'command'``, ``'x'``, ``'param1'``).
+        """
+        return memoryview(self._columns[name])[start:stop]
+
+    def row(self, i):
+        """
+        Return the fields of item ``i`` as a tuple, in :py:data:`COLUMNS` order.
+        """
+        return tuple(self._columns[name][i] for name in _COLUMN_NAMES)
+
+    def wp(self, i):
+        """
+        Build the ``MISSION_ITEM_INT`` message for item ``i`` (or return ``None`` if it does not exist).
+        """
+        if not 0 <= i < self.count():
+            return None
+        c = self._columns
+        msg = mavutil.mavlink.MAVLink_mission_item_int_message(
+            self.target_system, c['target_component'][i], i, c['frame'][i], c['command'][i],
+            c['current'][i], c['autocontinue'][i],
+            c['param1'][i], c['param2'][i], c['param3'][i], c['param4'][i],
+            c['x'][i], c['y'][i], c['z'][i])
+        if self.mission_type and hasattr(msg, 'mission_type'):
+            msg.mission_type = self.mission_type
+        return msg
+
+    def _item_values(self, msg):
+        values = [getattr(msg, name) for name in _COLUMN_NAMES]
+        if msg.get_type() in ('MISSION_ITEM', 'WAYPOINT'):
+            # Float mission items carry latitude and longitude in degrees.
+            values[9] = int(round(msg.x * 1e7))
+            values[10] = int(round(msg.y * 1e7))
+        return values
+
+    def add(self, msg):
+        """
+        Append a ``MISSION_ITEM_INT`` (or ``MISSION_ITEM``) message.
+        """
+        for column, value in zip(self._columns.values(), self._item_values(msg)):
+            column.append(value)
+
+    def set(self, msg, i):
+        """
+        Replace item ``i`` with a message. Setting the item just past the end appends it.
+        """
+        if i == self.count():
+            return self.add(msg)
+        if not 0 <= i < self.count():
+            raise IndexError('Index %s out of range.' % i)
+        for column, value in zip(self._columns.values(), self._item_values(msg)):
+            column[i] = value
+
+    def extend(self, **columns):
+        """
+        Append many items at once, given as columns.
+
+        Each keyword is a field name from :py:data:`COLUMNS`; its value is a sequence (list,
+        ``array.array``, NumPy array, ...) with one entry per item, or a scalar that applies to all
+        items. Fields which are not given default to 0, except ``autocontinue`` which defaults to 1.
+
+        :returns: The index of the first added item.
+        """
+        start = self.count()
+        n = _column_length(columns)
+        columns.setdefault('autocontinue', 1)
+        converted = self._convert(columns, n)
+        for name, column in self._columns.items():
+            column.extend(converted[name])
+        return start
+
+    def replace(self, start, **columns):
+        """
+        Overwrite the items from index ``start`` onwards with the given columns (see :py:func:`extend`).
+
+        Fields which are not given are left unchanged.
+        """
+        n = _column_length(columns)
+        if start < 0 or start + n > self.count():
+            raise IndexError('Replacement of %s items at %s is out of range.' % (n, start))
+        for name, values in self._convert(columns, n, defaults=False).items():
+            self._columns[name][start:start + n] = values
+
+    def _convert(self, columns, n, defaults=True):
+        unknown = set(columns) - set(_COLUMN_NAMES)
+        if unknown:
+            raise TypeError('Unknown mission columns: %s' % ', '.join(sorted(unknown)))
+        converted = {}
+        for name, typecode in COLUMNS:
+            if name in columns:
+                converted[name] = _column_values(typecode, columns[name], n)
+            elif defaults:
+                converted[name] = array(typecode, [0]) * n
+        return converted
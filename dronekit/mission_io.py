@@ -0,0 +1,191 @@
+"""
+Mission file import and export.
+
+Two formats are supported:
+
+* The *QGC WPL 110* text format used by Mission Planner and older QGroundControl releases
+  (one tab separated line per item, the first line being the home location).
+* The QGroundControl ``.plan`` JSON format (``SimpleItem`` mission items only).
+
+Readers yield the mission in chunks of columns, ready for :py:func:`MissionStore.extend
+<dronekit.mission.MissionStore.extend>`, so files are loaded without building a ``Command`` object
+per item. Writers stream from a :py:class:`MissionStore <dronekit.mission.MissionStore>` chunk by
+chunk. In both cases item 0 is the home location.
+
+Most applications will use :py:func:`CommandSequence.load() <dronekit.CommandSequence.load>` and
+:py:func:`CommandSequence.save() <dronekit.CommandSequence.save>` rather than this module directly.
+"""
+
+import json
+from array import array
+
+from dronekit.mission import COLUMNS
+
+WPL_HEADER = 'QGC WPL 110'
+
+# WPL column order: INDEX CURRENT_WP COORD_FRAME COMMAND PARAM1 PARAM2 PARAM3 PARAM4 X Y Z AUTOCONTINUE
+_WPL_COLUMNS = ('current', 'frame', 'command', 'param1', 'param2', 'param3', 'param4', 'x', 'y', 'z',
+                'autocontinue')
+_WPL_LINE = '%d\t%d\t%d\t%d\t%.9g\t%.9g\t%.9g\t%.9g\t%.7f\t%.7f\t%.9g\t%d\n'
+
+_TYPECODES = dict(COLUMNS)
+
+CHUNK_SIZE = 4096
+
+
+def _to_int(values):
+    # Latitude/longitude strings or floats in degrees -> int degrees * 1e7.
+    return array('i', [int(round(float(v) * 1e7)) for v in values])
+
+
+def _wpl_chunk(rows):
+    fields = list(zip(*rows))
+    if len(fields) < 12:
+        bad = next(row for row in rows if len(row) < 12)
+        raise ValueError('Invalid WPL line: %r' % '\t'.join(bad))
+    chunk = {}
+    for name, values in zip(_WPL_COLUMNS, fields[1:]):
+        typecode = _TYPECODES[name]
+        if name in ('x', 'y'):
+            chunk[name] = _to_int(values)
+        elif typecode == 'f':
+            chunk[name] = array(typecode, map(float, values))
+        else:
+            chunk[name] = array(typecode, map(int, values))
+    return chunk
+
+
+def read_wpl(f, chunk_size=CHUNK_SIZE):
+    """
+    Read a QGC WPL 110 file, yielding dicts of mission columns with at most ``chunk_size`` items each.
+
+    :param f: An open text file (or any iterable of lines).
+    :raises ValueError: If the file is not a valid WPL 110 file.
+    """
+    lines = iter(f)
+    header = next(lines, '')
+    if not header.startswith(WPL_HEADER):
+        raise ValueError('File is not a supported WP version (expected %s).' % WPL_HEADER)
+    rows = []
+    for line in lines:
+        row = line.split()
+        if not row:
+            continue
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield _wpl_chunk(rows)
+            rows = []
+    if rows:
+        yield _wpl_chunk(rows)
+
+
+def _chunks(store, chunk_size):
+    names = [name for name, _ in COLUMNS]
+    for start in range(0, store.count(), chunk_size):
+        stop = min(start + chunk_size, store.count())
+        yield start, [store.column(name, start, stop) for name in names]
+
+
+def write_wpl(f, store, chunk_size=CHUNK_SIZE):
+    """
+    Write the items of a :py:class:`MissionStore <dronekit.mission.MissionStore>` as a QGC WPL 110 file.
+
+    :param f: An open text file.
+    """
+    f.write(WPL_HEADER + '\n')
+    for start, columns in _chunks(store, chunk_size):
+        f.write(''.join(
+            _WPL_LINE % (seq, current, frame, command, p1, p2, p3, p4, x / 1e7, y / 1e7, z, autocontinue)
+            for seq, (_, frame, command, current, autocontinue, p1, p2, p3, p4, x, y, z)
+            in enumerate(zip(*columns), start)))
+
+
+def _param(value):
+    # QGroundControl uses null for NaN ("unused") parameters.
+    return float('nan') if value is None else value
+
+
+def read_plan(f, chunk_size=CHUNK_SIZE):
+    """
+    Read a QGroundControl ``.plan`` file, yielding dicts of mission columns with at most ``chunk_size``
+    items each. The first item is built from ``plannedHomePosition``.
+
+    :param f: An open text file.
+    :raises ValueError: If the file is not a plan, or contains complex items (surveys, corridor scans...)
+        which must be converted to simple items in QGroundControl first.
+    """
+    plan = json.load(f)
+    if plan.get('fileType') != 'Plan' or 'mission' not in plan:
+        raise ValueError('File is not a QGroundControl plan.')
+    mission = plan['mission']
+    home = mission.get('plannedHomePosition') or [0, 0, 0]
+    items = mission.get('items', [])
+
+    rows = [(0, 0, 16, 1, 0, 0, 0, 0, home[0], home[1], home[2])]
+    for item in items:
+        if item.get('type') != 'SimpleItem':
+            raise ValueError('Unsupported plan item type: %s' % item.get('type'))
+        params = item['params']
+        rows.append((0, item['frame'], item['command'], int(item.get('autoContinue', True)),
+                     _param(params[0]), _param(params[1]), _param(params[2]), _param(params[3]),
+                     params[4] or 0, params[5] or 0, _param(params[6])))
+        if len(rows) == chunk_size:
+            yield _plan_chunk(rows)
+            rows = []
+    if rows:
+        yield _plan_chunk(rows)
+
+
+def _plan_chunk(rows):
+    names = ('current', 'frame', 'command', 'autocontinue', 'param1', 'param2', 'param3', 'param4',
+             'x', 'y', 'z')
+    chunk = {}
+    for name, values in zip(names, zip(*rows)):
+        chunk[name] = _to_int(values) if name in ('x', 'y') else array(_TYPECODES[name], values)
+    return chunk
+
+
+def write_plan(f, store, chunk_size=CHUNK_SIZE, vehicle_type=None, firmware_type=None):
+    """
+    Write the items of a :py:class:`MissionStore <dronekit.mission.MissionStore>` as a QGroundControl
+    ``.plan`` file. Item 0 is written as the planned home position.
+
+    :param f: An open text file.
+    :param int vehicle_type: ``MAV_TYPE`` to record in the plan (optional).
+    :param int firmware_type: ``MAV_AUTOPILOT`` to record in the plan (optional).
+    """
+    home = [0, 0, 0]
+    if store.count():
+        row = store.row(0)
+        home = [row[9] / 1e7, row[10] / 1e7, row[11]]
+
+    f.write('{"fileType": "Plan", "version": 1, "groundStation": "DroneKit", '
+            '"geoFence": {"circles": [], "polygons": [], "version": 2}, '
+            '"rallyPoints": {"points": [], "version": 2}, '
+            '"mission": {"version": 2, "firmwareType": %s, "vehicleType": %s, '
+            '"plannedHomePosition": %s, "items": ['
+            % (json.dumps(firmware_type or 0), json.dumps(vehicle_type or 0), json.dumps(home)))
+
+    separator = ''
+    for start, columns in _chunks(store, chunk_size):
+        if start == 0:
+            columns = [column[1:] for column in columns]
+            start = 1
+        items = []
+        for seq, (_, frame, command, _, autocontinue, p1, p2, p3, p4, x, y, z) in enumerate(zip(*columns), start):
+            params = [p if p == p else None for p in (p1, p2, p3, p4)]
+            params.extend((x / 1e7, y / 1e7, z if z == z else None))
+            items.append(json.dumps({'type': 'SimpleItem', 'autoContinue': bool(autocontinue),
+                                     'command': command, 'doJumpId': seq, 'frame': frame,
+                                     'params': params}))
+        if items:
+            f.write(separator + ', '.join(items))
+            separator = ', '
+    f.write(']}}\n')
+
+
+def is_plan(filename):
+    """
+    Return ``True`` if ``filename`` should be read/written as a ``.plan`` file rather than as WPL.
+    """
+    return str(filename).lower().endswith('.plan')
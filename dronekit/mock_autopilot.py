@@ -0,0 +1,612 @@
+"""
+A lightweight simulated autopilot, for tests and benchmarks that cannot run SITL.
+
+:py:class:`MockAutopilot` speaks MAVLink over a UDP or TCP socket on the loopback interface. It behaves
+enough like ArduCopter for :py:func:`connect() <dronekit.connect>` (including ``wait_ready=True``) to
+succeed: it sends ``HEARTBEAT`` and a configurable set of telemetry streams at configurable rates, holds
+a parameter table and mission store, and acknowledges ``COMMAND_LONG``. It does not fly: state such as
+the position only changes when a test sets it.
+
+.. code:: python
+
+    from dronekit import connect
+    from dronekit.mock_autopilot import MockAutopilot
+
+    with MockAutopilot(streams={'ATTITUDE': 200}, loss=0.01, latency=0.02) as mock:
+        vehicle = connect(mock.connection_string, wait_ready=True)
+        vehicle.parameters['THR_MIN'] = 100
+        assert mock.params['THR_MIN'] == 100
+        vehicle.close()
+
+Packet loss and latency can be injected in both directions, with a seeded random generator so that runs
+are repeatable.
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import random
+import select
+import socket
+import threading
+
+import monotonic
+from pymavlink import mavutil
+
+from dronekit.mission import MissionStore
+from dronekit.streams import DATA_STREAMS
+
+mavlink = mavutil.mavlink
+
+#: Default telemetry streams and their rates in Hz.
+DEFAULT_STREAMS = {
+    'HEARTBEAT': 1,
+    'ATTITUDE': 10,
+    'GLOBAL_POSITION_INT': 5,
+    'GPS_RAW_INT': 2,
+    'SYS_STATUS': 2,
+    'VFR_HUD': 4,
+    'EKF_STATUS_REPORT': 1,
+}
+
+#: Default parameter table.
+DEFAULT_PARAMS = {
+    'SYSID_THISMAV': 1,
+    'FRAME_CLASS': 1,
+    'THR_MIN': 130,
+    'RTL_ALT': 1500,
+    'WPNAV_SPEED': 500,
+    'ARMING_CHECK': 1,
+}
+
+# EKF_STATUS_REPORT flags of a healthy EKF with an absolute position.
+_EKF_HEALTHY = 0x37F
+
+
+class _Writer(object):
+    # File-like object for the MAVLink encoder: outgoing packets go through loss and latency.
+
+    def __init__(self, mock):
+        self._mock = mock
+
+    def write(self, buf):
+        self._mock._transmit(bytes(buf))
+
+
+class MockAutopilot(object):
+    """
+    A simulated ArduCopter-like vehicle on a loopback socket.
+
+    :param str protocol: ``'udp'`` (the vehicle connects with ``udpout:``) or ``'tcp'``.
+    :param int port: Port to listen on; by default a free port is picked. See :py:attr:`connection_string`.
+    :param int system: MAVLink system id of the vehicle.
+    :param int component: MAVLink component id of the vehicle.
+    :param dict params: Initial parameter values (default :py:data:`DEFAULT_PARAMS`).
+    :param dict streams: Telemetry rates in Hz by message name, added to (or overriding)
+        :py:data:`DEFAULT_STREAMS`. A rate of 0 disables a stream.
+    :param float loss: Probability of dropping each packet, in each direction.
+    :param float latency: Delay added to each packet, in seconds, in each direction.
+    :param float jitter: Random extra delay of up to this many seconds per packet. Packets may be
+        reordered, as on a real radio link.
+    :param seed: Seed of the random generator used for loss and jitter.
+    :param float clock_rate: Rate of the mock's boot clock relative to the host clock (``1.00002`` is 20 ppm
+        fast), to test clock synchronisation.
+    :param bool data_streams: Apply ``REQUEST_DATA_STREAM`` to the streams of each group (see
+        ``dronekit.streams.DATA_STREAMS``). By default it is ignored, so that the streams keep their rates
+        when :py:func:`connect() <dronekit.connect>` asks for every stream.
+    """
+
+    def __init__(self, protocol='udp', port=0, system=1, component=1, params=None, streams=None, loss=0.0,
+                 latency=0.0, jitter=0.0, seed=None, clock_rate=1.0, data_streams=False):
+        if protocol not in ('udp', 'tcp'):
+            raise ValueError("protocol must be 'udp' or 'tcp'")
+        self._logger = logging.getLogger(__name__)
+        self.protocol = protocol
+        self.system = system
+        self.component = component
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.clock_rate = clock_rate
+        self.data_streams = data_streams
+        self._random = random.Random(seed)
+
+        #: Parameter values by name.
+        self.params = dict(DEFAULT_PARAMS if params is None else params)
+        #: Mission items by mission type (``MissionStore``). Item 0 of the mission is home, as on ArduPilot.
+        self.missions = {0: MissionStore()}
+        self.current_waypoint = 0
+
+        # Vehicle state, reported by the telemetry streams.
+        self.lat = -35.363261
+        self.lon = 149.165230
+        self.alt = 584.0
+        self.relative_alt = 0.0
+        self.roll = 0.0
+        self.pitch = 0.0
+        self.yaw = 0.0
+        self.vx = self.vy = self.vz = 0.0
+        self.armed = False
+        #: ArduCopter mode number (0 is STABILIZE).
+        self.custom_mode = 0
+        self.battery_voltage = 12.6
+        self.missions[0].add(self._home_item())
+
+        #: ``COMMAND_LONG`` handlers by command id: ``fn(mock, msg)`` returning a ``MAV_RESULT`` (``None``
+        #: for accepted). Commands without a handler are accepted.
+        self.command_handlers = {
+            mavlink.MAV_CMD_COMPONENT_ARM_DISARM: _arm_disarm,
+            mavlink.MAV_CMD_DO_SET_MODE: _set_mode,
+            mavlink.MAV_CMD_NAV_TAKEOFF: _takeoff,
+            mavlink.MAV_CMD_REQUEST_AUTOPILOT_CAPABILITIES: _send_autopilot_version,
+            mavlink.MAV_CMD_SET_MESSAGE_INTERVAL: _set_message_interval,
+        }
+        self._handlers = {}
+        #: Every ``COMMAND_LONG`` received, in order.
+        self.commands = []
+
+        #: Packet counters: sent, received, and dropped by the injected loss in each direction.
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.dropped_sent = 0
+        self.dropped_received = 0
+
+        self._streams = {}
+        self._start = monotonic.monotonic()
+        for name, rate in dict(DEFAULT_STREAMS, **(streams or {})).items():
+            self.set_stream(name, rate)
+
+        self.mav = mavlink.MAVLink(_Writer(self), srcSystem=system, srcComponent=component)
+        self._parser = mavlink.MAVLink(None)
+        self._parser.robust_parsing = True
+        self._delayed = []
+        self._counter = itertools.count()
+        self._upload = None
+        self._gcs = (255, 0)
+
+        if protocol == 'udp':
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('127.0.0.1', port))
+        if protocol == 'tcp':
+            self._socket.listen(1)
+        self.port = self._socket.getsockname()[1]
+        self._peer = None
+        self._client = None
+
+        self._running = False
+        self._thread = None
+
+    @property
+    def connection_string(self):
+        """
+        The string to pass to :py:func:`connect() <dronekit.connect>`.
+        """
+        if self.protocol == 'udp':
+            return 'udpout:127.0.0.1:%d' % self.port
+        return 'tcp:127.0.0.1:%d' % self.port
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Start the simulation thread.
+        """
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='mock-autopilot')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the simulation thread and close the socket.
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._client is not None:
+            self._client.close()
+        self._socket.close()
+
+    @property
+    def time_boot_ms(self):
+        """
+        Milliseconds since the mock was created, by its boot clock.
+        """
+        return self.time_boot_ns // 1000000
+
+    @property
+    def time_boot_ns(self):
+        """
+        Nanoseconds since the mock was created, by its boot clock.
+        """
+        return int((monotonic.monotonic() - self._start) * self.clock_rate * 1e9)
+
+    def set_stream(self, name, rate, factory=None):
+        """
+        Send a message at ``rate`` Hz (or stop sending it, if ``rate`` is 0).
+
+        :param str name: The message name, for example ``'ATTITUDE'``.
+        :param factory: Optional ``fn(mock)`` returning the message to send. Built-in factories exist for
+            the messages in :py:data:`DEFAULT_STREAMS`.
+        """
+        if not rate:
+            self._streams.pop(name, None)
+            return
+        if factory is None:
+            factory = _STREAM_FACTORIES.get(name)
+            if factory is None:
+                raise ValueError('No built-in factory for %s: pass one.' % name)
+        self._streams[name] = [1.0 / rate, monotonic.monotonic(), factory]
+
+    def stream_rate(self, name):
+        """
+        Return the rate in Hz at which a message is sent (0 if it is not sent).
+        """
+        stream = self._streams.get(name)
+        return 1.0 / stream[0] if stream else 0
+
+    def add_handler(self, name, fn):
+        """
+        Call ``fn(mock, msg)`` for every message of type ``name`` received from the ground station, after
+        the built-in handling.
+        """
+        self._handlers.setdefault(name, []).append(fn)
+
+    def _home_item(self):
+        return mavlink.MAVLink_mission_item_int_message(
+            0, 0, 0, mavlink.MAV_FRAME_GLOBAL, mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0,
+            int(self.lat * 1e7), int(self.lon * 1e7), self.alt)
+
+    # Transport.
+
+    def _delay(self):
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        return delay
+
+    def _transmit(self, buf):
+        if self.loss and self._random.random() < self.loss:
+            self.dropped_sent += 1
+            return
+        delay = self._delay()
+        if delay > 0:
+            heapq.heappush(self._delayed, (monotonic.monotonic() + delay, next(self._counter), self._send_now, buf))
+        else:
+            self._send_now(buf)
+
+    def _send_now(self, buf):
+        try:
+            if self.protocol == 'udp':
+                if self._peer is None:
+                    return
+                self._socket.sendto(buf, self._peer)
+            else:
+                if self._client is None:
+                    return
+                self._client.sendall(buf)
+        except socket.error:
+            return
+        self.packets_sent += 1
+
+    def _receive(self, data):
+        for msg in self._parser.parse_buffer(data) or []:
+            if msg.get_type() == 'BAD_DATA':
+                continue
+            if self.loss and self._random.random() < self.loss:
+                self.dropped_received += 1
+                continue
+            delay = self._delay()
+            if delay > 0:
+                heapq.heappush(self._delayed, (monotonic.monotonic() + delay, next(self._counter),
+                                               self._handle, msg))
+            else:
+                self._handle(msg)
+
+    def _restart_streams(self):
+        # A new ground station gets every stream straight away, rather than waiting up to a second for
+        # the first HEARTBEAT.
+        now = monotonic.monotonic()
+        for stream in self._streams.values():
+            stream[1] = now
+
+    def _run(self):
+        while self._running:
+            now = monotonic.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, fn, arg = heapq.heappop(self._delayed)
+                fn(arg)
+            next_due = now + 0.05
+            for stream in list(self._streams.values()):
+                if stream[1] <= now:
+                    self.mav.send(stream[2](self))
+                    stream[1] += stream[0]
+                    if stream[1] < now - stream[0]:
+                        # Fell behind: skip rather than send a burst.
+                        stream[1] = now + stream[0]
+                next_due = min(next_due, stream[1])
+            if self._delayed:
+                next_due = min(next_due, self._delayed[0][0])
+
+            sockets = [self._client if self._client is not None else self._socket]
+            readable, _, _ = select.select(sockets, [], [], max(0.0, next_due - monotonic.monotonic()))
+            if not readable:
+                continue
+            try:
+                if self.protocol == 'udp':
+                    data, peer = self._socket.recvfrom(65535)
+                    if peer != self._peer:
+                        self._peer = peer
+                        self._restart_streams()
+                elif self._client is None:
+                    self._client, _ = self._socket.accept()
+                    self._client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self._restart_streams()
+                    continue
+                else:
+                    data = self._client.recv(65535)
+                    if not data:
+                        # The ground station disconnected: wait for the next one.
+                        self._client.close()
+                        self._client = None
+                        continue
+            except socket.error:
+                continue
+            self._receive(data)
+
+    # Message handling.
+
+    def _handle(self, msg):
+        self.packets_received += 1
+        name = msg.get_type()
+        handler = getattr(self, '_on_' + name, None)
+        if handler is not None:
+            try:
+                handler(msg)
+            except Exception:
+                self._logger.exception('Mock autopilot failed to handle %s' % name)
+        for fn in self._handlers.get(name, ()):
+            fn(self, msg)
+
+    def _send_param(self, index):
+        names = sorted(self.params)
+        name = names[index]
+        self.mav.param_value_send(name.encode(), float(self.params[name]), mavlink.MAV_PARAM_TYPE_REAL32,
+                                  len(names), index)
+
+    def _on_PARAM_REQUEST_LIST(self, msg):
+        for i in range(len(self.params)):
+            self._send_param(i)
+
+    def _on_PARAM_REQUEST_READ(self, msg):
+        names = sorted(self.params)
+        param_id = _text(msg.param_id)
+        if msg.param_index >= 0:
+            if msg.param_index < len(names):
+                self._send_param(msg.param_index)
+        elif param_id in self.params:
+            self._send_param(names.index(param_id))
+
+    def _on_PARAM_SET(self, msg):
+        param_id = _text(msg.param_id)
+        if param_id in self.params:
+            self.params[param_id] = msg.param_value
+            self._send_param(sorted(self.params).index(param_id))
+
+    def _on_COMMAND_LONG(self, msg):
+        self.commands.append(msg)
+        handler = self.command_handlers.get(msg.command)
+        result = handler(self, msg) if handler is not None else None
+        self.mav.command_ack_send(msg.command, mavlink.MAV_RESULT_ACCEPTED if result is None else result)
+
+    def _on_REQUEST_DATA_STREAM(self, msg):
+        if not self.data_streams:
+            return
+        groups = DATA_STREAMS if msg.req_stream_id == mavlink.MAV_DATA_STREAM_ALL else \
+            {msg.req_stream_id: DATA_STREAMS.get(msg.req_stream_id, ())}
+        for names in groups.values():
+            for name in names:
+                if name in _STREAM_FACTORIES or name in self._streams:
+                    factory = self._streams[name][2] if name in self._streams else None
+                    self.set_stream(name, msg.req_message_rate if msg.start_stop else 0, factory)
+
+    def _on_TIMESYNC(self, msg):
+        if msg.tc1 == 0:
+            self.mav.timesync_send(self.time_boot_ns, msg.ts1)
+
+    def _on_SET_MODE(self, msg):
+        self.custom_mode = msg.custom_mode
+
+    def _mission(self, msg):
+        mission_type = getattr(msg, 'mission_type', 0)
+        return mission_type, self.missions.setdefault(mission_type, MissionStore(mission_type))
+
+    def _mission_kwargs(self, mission_type):
+        if 'mission_type' in mavlink.MAVLink_mission_count_message.fieldnames:
+            return {'mission_type': mission_type}
+        return {}
+
+    def _on_MISSION_REQUEST_LIST(self, msg):
+        mission_type, store = self._mission(msg)
+        self.mav.mission_count_send(msg.get_srcSystem(), msg.get_srcComponent(), store.count(),
+                                    **self._mission_kwargs(mission_type))
+
+    def _on_MISSION_REQUEST_INT(self, msg):
+        mission_type, store = self._mission(msg)
+        item = store.wp(msg.seq)
+        if item is not None:
+            item.target_system = msg.get_srcSystem()
+            item.target_component = msg.get_srcComponent()
+            item.current = int(msg.seq == self.current_waypoint and mission_type == 0)
+            self.mav.send(item)
+
+    _on_MISSION_REQUEST = _on_MISSION_REQUEST_INT
+
+    def _request_item(self, seq):
+        self.mav.mission_request_int_send(self._gcs[0], self._gcs[1], seq,
+                                          **self._mission_kwargs(self._upload[0]))
+
+    def _on_MISSION_COUNT(self, msg):
+        mission_type, _ = self._mission(msg)
+        self._gcs = (msg.get_srcSystem(), msg.get_srcComponent())
+        # A full upload replaces the whole mission once every item has arrived.
+        self._upload = (mission_type, 0, msg.count - 1, [], MissionStore(mission_type))
+        if msg.count == 0:
+            self.missions[mission_type] = self._upload[4]
+            self._upload = None
+            self._ack_upload(mission_type)
+        else:
+            self._request_item(0)
+
+    def _on_MISSION_WRITE_PARTIAL_LIST(self, msg):
+        mission_type, store = self._mission(msg)
+        self._gcs = (msg.get_srcSystem(), msg.get_srcComponent())
+        if not 0 <= msg.start_index <= msg.end_index < store.count():
+            self._ack_upload(mission_type, mavlink.MAV_MISSION_ERROR)
+            return
+        # A partial write replaces only the items sent.
+        self._upload = (mission_type, msg.start_index, msg.end_index, [], store)
+        self._request_item(msg.start_index)
+
+    def _on_MISSION_ITEM_INT(self, msg):
+        if self._upload is None:
+            return
+        mission_type, first, last, items, store = self._upload
+        expected = first + len(items)
+        if getattr(msg, 'mission_type', 0) != mission_type or msg.seq != expected:
+            self._request_item(expected)
+            return
+        items.append(msg)
+        if expected < last:
+            self._request_item(expected + 1)
+            return
+        for item in items:
+            store.set(item, item.seq)
+        self.missions[mission_type] = store
+        self._upload = None
+        self._ack_upload(mission_type)
+
+    _on_MISSION_ITEM = _on_MISSION_ITEM_INT
+
+    def _ack_upload(self, mission_type, result=mavlink.MAV_MISSION_ACCEPTED):
+        self.mav.mission_ack_send(self._gcs[0], self._gcs[1], result, **self._mission_kwargs(mission_type))
+
+    def _on_MISSION_CLEAR_ALL(self, msg):
+        mission_type, _ = self._mission(msg)
+        self.missions[mission_type] = MissionStore(mission_type)
+        if mission_type == 0:
+            self.missions[0].add(self._home_item())
+        self._gcs = (msg.get_srcSystem(), msg.get_srcComponent())
+        self._ack_upload(mission_type)
+
+    def _on_MISSION_SET_CURRENT(self, msg):
+        self.current_waypoint = msg.seq
+        self.mav.mission_current_send(msg.seq)
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'replace')
+    return value.rstrip('\x00')
+
+
+def _arm_disarm(mock, msg):
+    mock.armed = msg.param1 == 1
+
+
+def _set_mode(mock, msg):
+    mock.custom_mode = int(msg.param2)
+
+
+def _takeoff(mock, msg):
+    if not mock.armed:
+        return mavlink.MAV_RESULT_FAILED
+    mock.relative_alt = msg.param7
+    mock.alt += msg.param7
+
+
+def _send_autopilot_version(mock, msg):
+    capabilities = (mavlink.MAV_PROTOCOL_CAPABILITY_MISSION_FLOAT | mavlink.MAV_PROTOCOL_CAPABILITY_PARAM_FLOAT |
+                    mavlink.MAV_PROTOCOL_CAPABILITY_MISSION_INT | mavlink.MAV_PROTOCOL_CAPABILITY_COMMAND_INT |
+                    mavlink.MAV_PROTOCOL_CAPABILITY_SET_POSITION_TARGET_GLOBAL_INT)
+    mock.mav.autopilot_version_send(capabilities, 0x04000000, 0, 0, 0, [0] * 8, [0] * 8, [0] * 8, 0, 0, 0)
+
+
+def _set_message_interval(mock, msg):
+    msgclass = mavlink.mavlink_map.get(int(msg.param1))
+    if msgclass is None:
+        return mavlink.MAV_RESULT_DENIED
+    name = msgclass.msgname
+    if msg.param2 < 0:
+        mock.set_stream(name, 0)
+    elif msg.param2 == 0:
+        mock.set_stream(name, DEFAULT_STREAMS.get(name, 0))
+    elif name in _STREAM_FACTORIES or name in mock._streams:
+        factory = mock._streams[name][2] if name in mock._streams else None
+        mock.set_stream(name, 1e6 / msg.param2, factory)
+    else:
+        return mavlink.MAV_RESULT_DENIED
+
+
+def _heartbeat(mock):
+    base_mode = mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED
+    if mock.armed:
+        base_mode |= mavlink.MAV_MODE_FLAG_SAFETY_ARMED
+    return mock.mav.heartbeat_encode(mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, base_mode,
+                                     mock.custom_mode,
+                                     mavlink.MAV_STATE_ACTIVE if mock.armed else mavlink.MAV_STATE_STANDBY)
+
+
+def _attitude(mock):
+    return mock.mav.attitude_encode(mock.time_boot_ms, mock.roll, mock.pitch, mock.yaw, 0, 0, 0)
+
+
+def _global_position_int(mock):
+    heading = int(math.degrees(mock.yaw) % 360 * 100)
+    return mock.mav.global_position_int_encode(mock.time_boot_ms, int(mock.lat * 1e7), int(mock.lon * 1e7),
+                                               int(mock.alt * 1000), int(mock.relative_alt * 1000),
+                                               int(mock.vx * 100), int(mock.vy * 100), int(mock.vz * 100),
+                                               heading)
+
+
+def _gps_raw_int(mock):
+    return mock.mav.gps_raw_int_encode(mock.time_boot_ms * 1000, 3, int(mock.lat * 1e7), int(mock.lon * 1e7),
+                                       int(mock.alt * 1000), 121, 200, 0, 0, 10)
+
+
+def _sys_status(mock):
+    sensors = 0x0020FC2F
+    return mock.mav.sys_status_encode(sensors, sensors, sensors, 200, int(mock.battery_voltage * 1000), 100,
+                                      90, 0, 0, 0, 0, 0, 0)
+
+
+def _vfr_hud(mock):
+    return mock.mav.vfr_hud_encode(0, math.hypot(mock.vx, mock.vy), int(math.degrees(mock.yaw) % 360), 0,
+                                   mock.relative_alt, -mock.vz)
+
+
+def _ekf_status_report(mock):
+    return mock.mav.ekf_status_report_encode(_EKF_HEALTHY, 0.01, 0.01, 0.01, 0.01, 0)
+
+
+_STREAM_FACTORIES = {
+    'HEARTBEAT': _heartbeat,
+    'ATTITUDE': _attitude,
+    'GLOBAL_POSITION_INT': _global_position_int,
+    'GPS_RAW_INT': _gps_raw_int,
+    'SYS_STATUS': _sys_status,
+    'VFR_HUD': _vfr_hud,
+    'EKF_STATUS_REPORT': _ekf_status_report,
+}
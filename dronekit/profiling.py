@@ -0,0 +1,199 @@
+"""
+Listener profiling.
+
+When the receive thread falls behind, the cause is usually a message or attribute listener that takes
+too long. :py:func:`Vehicle.enable_listener_profiling() <dronekit.Vehicle.enable_listener_profiling>`
+times every listener call, and keeps the call count, total and maximum wall-clock and CPU time of each
+listener function and of each message type or attribute:
+
+.. code:: python
+
+    profiler = vehicle.enable_listener_profiling(slow_threshold=0.005)
+    time.sleep(60)
+    print(profiler.report(limit=10))
+    vehicle.disable_listener_profiling()
+
+Profiling works by replacing the vehicle's ``notify_message_listeners`` and
+``notify_attribute_listeners`` methods for as long as it is enabled, so it costs nothing when disabled.
+"""
+
+import logging
+import time
+
+
+class ListenerStats(object):
+    """
+    Timing of a listener function, or of all the listeners of a message type or attribute.
+
+    :param str kind: ``'message'`` or ``'attribute'``.
+    :param str name: The listener function name, or the message type or attribute name.
+    :param int count: Number of calls.
+    :param float wall: Total wall-clock time, in seconds.
+    :param float wall_max: Longest wall-clock time of one call.
+    :param float cpu: Total CPU time of the calling thread, in seconds.
+    :param float cpu_max: Longest CPU time of one call.
+    :param int slow: Number of calls longer than the profiler's ``slow_threshold``.
+    """
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.count = 0
+        self.wall = 0.0
+        self.wall_max = 0.0
+        self.cpu = 0.0
+        self.cpu_max = 0.0
+        self.slow = 0
+
+    @property
+    def wall_mean(self):
+        """
+        Mean wall-clock time of a call, in seconds.
+        """
+        return self.wall / self.count if self.count else 0.0
+
+    def _add(self, wall, cpu):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        if wall > self.wall_max:
+            self.wall_max = wall
+        if cpu > self.cpu_max:
+            self.cpu_max = cpu
+
+    def __str__(self):
+        return 'ListenerStats:kind=%s,name=%s,count=%s,wall=%.6f,wall_max=%.6f,cpu=%.6f' % (
+            self.kind, self.name, self.count, self.wall, self.wall_max, self.cpu)
+
+
+def _function_name(fn):
+    name = getattr(fn, '__qualname__', None) or getattr(fn, '__name__', None) or repr(fn)
+    module = getattr(fn, '__module__', None)
+    return '%s.%s' % (module, name) if module else name
+
+
+class ListenerProfiler(object):
+    """
+    Times the message and attribute listeners of a vehicle.
+
+    Use :py:func:`Vehicle.enable_listener_profiling() <dronekit.Vehicle.enable_listener_profiling>`
+    rather than creating one directly.
+
+    :param float slow_threshold: Log a warning for every listener call that takes longer than this many
+        seconds (wall-clock). ``None`` disables the warning.
+    """
+
+    def __init__(self, slow_threshold=None):
+        self.slow_threshold = slow_threshold
+        self._logger = logging.getLogger(__name__)
+        self._listeners = {}
+        self._names = {}
+        self._vehicle = None
+
+    def attach(self, vehicle):
+        """
+        Start timing the listeners of ``vehicle`` (and of its parameters).
+        """
+        parameters = vehicle.parameters
+
+        def notify_message_listeners(name, msg):
+            self._notify('message', vehicle, vehicle._message_listeners, name, msg)
+
+        def notify_attribute_listeners(attr_name, value, cache=False):
+            self._notify_attribute(vehicle, attr_name, value, cache)
+
+        def notify_parameter_listeners(attr_name, value, cache=False):
+            self._notify_attribute(parameters, attr_name.upper(), value, cache)
+
+        vehicle.notify_message_listeners = notify_message_listeners
+        vehicle.notify_attribute_listeners = notify_attribute_listeners
+        parameters.notify_attribute_listeners = notify_parameter_listeners
+        self._vehicle = vehicle
+
+    def detach(self):
+        """
+        Stop timing listeners, restoring the vehicle's own notification methods. The statistics are kept.
+        """
+        vehicle = self._vehicle
+        if vehicle is None:
+            return
+        del vehicle.notify_message_listeners
+        del vehicle.notify_attribute_listeners
+        del vehicle.parameters.notify_attribute_listeners
+        self._vehicle = None
+
+    def reset(self):
+        """
+        Discard the statistics collected so far.
+        """
+        self._listeners = {}
+        self._names = {}
+
+    def _notify_attribute(self, observers, attr_name, value, cache):
+        # As HasObservers.notify_attribute_listeners.
+        if cache:
+            if observers._attribute_cache.get(attr_name) == value:
+                return
+            observers._attribute_cache[attr_name] = value
+        self._notify('attribute', observers, observers._attribute_listeners, attr_name, value)
+
+    def _notify(self, kind, observers, listeners, name, value):
+        for key in (name, '*'):
+            for fn in listeners.get(key, []):
+                wall = time.perf_counter()
+                cpu = time.thread_time()
+                try:
+                    fn(observers, name, value)
+                except Exception:
+                    self._logger.exception('Exception in %s handler for %s' % (kind, name), exc_info=True)
+                cpu = time.thread_time() - cpu
+                wall = time.perf_counter() - wall
+                self._record(kind, name, fn, wall, cpu)
+
+    def _record(self, kind, name, fn, wall, cpu):
+        stats = self._listeners.get(fn)
+        if stats is None:
+            stats = self._listeners[fn] = ListenerStats(kind, _function_name(fn))
+        stats._add(wall, cpu)
+        totals = self._names.get((kind, name))
+        if totals is None:
+            totals = self._names[(kind, name)] = ListenerStats(kind, name)
+        totals._add(wall, cpu)
+
+        if self.slow_threshold is not None and wall > self.slow_threshold:
+            stats.slow += 1
+            totals.slow += 1
+            self._logger.warning('Slow %s listener %s for %s took %.1f ms' % (kind, stats.name, name, wall * 1e3))
+
+    @property
+    def listeners(self):
+        """
+        :py:class:`ListenerStats` of each listener function.
+        """
+        return list(self._listeners.values())
+
+    @property
+    def names(self):
+        """
+        :py:class:`ListenerStats` of each message type and attribute, over all of its listeners.
+        """
+        return list(self._names.values())
+
+    def report(self, sort='wall', limit=None):
+        """
+        Return a text report of the listeners and of the message types and attributes, most expensive first.
+
+        :param str sort: The :py:class:`ListenerStats` field to sort by: ``'wall'``, ``'wall_max'``, ``'cpu'``,
+            ``'cpu_max'``, ``'count'`` or ``'slow'``.
+        :param int limit: Maximum number of rows of each table.
+        """
+        lines = []
+        for title, rows in (('Listener', self.listeners), ('Message/attribute', self.names)):
+            rows = sorted(rows, key=lambda s: getattr(s, sort), reverse=True)[:limit]
+            lines.append('%10s %10s %10s %10s %10s %6s  %s' % ('calls', 'wall ms', 'mean us', 'max ms', 'cpu ms',
+                                                              'slow', title))
+            for s in rows:
+                lines.append('%10d %10.1f %10.1f %10.2f %10.1f %6d  %s %s' % (
+                    s.count, s.wall * 1e3, s.wall_mean * 1e6, s.wall_max * 1e3, s.cpu * 1e3, s.slow, s.kind, s.name))
+            lines.append('')
+        return '\n'.join(lines)
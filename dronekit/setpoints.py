@@ -0,0 +1,285 @@
+"""
+Fixed-rate setpoint streaming for guided-mode control.
+
+In guided mode the autopilot expects velocity, position or attitude targets to be sent again and again:
+ArduCopter stops a velocity or attitude target that has not been refreshed for a few seconds (one second for
+attitude). :py:attr:`Vehicle.setpoints <dronekit.Vehicle.setpoints>` is a :py:class:`SetpointStreamer` that
+sends the latest target at a fixed rate from its own thread, so a control loop only has to set new targets:
+
+.. code:: python
+
+    vehicle.setpoints.start(rate=20)
+    vehicle.setpoints.set_velocity(2, 0, 0)        # 2 m/s north
+    time.sleep(5)
+    vehicle.setpoints.set_attitude(pitch=-5, thrust=0.5)
+    ...
+    vehicle.setpoints.stop()
+    print(vehicle.setpoints.lateness.percentile(99), vehicle.setpoints.missed)
+
+Each target is packed once, when it is set, into a :py:class:`MessageTemplate
+<dronekit.templates.MessageTemplate>`; every send only updates the sequence number and checksum of the
+packet. Targets are replaced atomically, from any thread. The streamer schedules sends on absolute deadlines
+(``rate`` per second, without drift), and records how late each send was in a :py:class:`LatencyHistogram
+<dronekit.latency.LatencyHistogram>`. A deadline that is missed by more than a whole period is skipped
+rather than sent in a burst, and counted in :py:attr:`missed <SetpointStreamer.missed>`.
+"""
+
+import collections
+import math
+import threading
+import time
+
+from pymavlink import mavutil
+
+from dronekit.latency import LatencyHistogram
+
+mavlink = mavutil.mavlink
+
+# SET_POSITION_TARGET_* type_mask bits of the fields that are ignored (1 = ignore).
+_IGNORE_POSITION = 0b0000000000000111
+_IGNORE_VELOCITY = 0b0000000000111000
+_IGNORE_ACCELERATION = 0b0000000111000000
+_IGNORE_YAW = 0b0000010000000000
+_IGNORE_YAW_RATE = 0b0000100000000000
+
+# SET_ATTITUDE_TARGET type_mask bits.
+_IGNORE_BODY_ROLL_RATE = 0b00000001
+_IGNORE_BODY_PITCH_RATE = 0b00000010
+_IGNORE_BODY_YAW_RATE = 0b00000100
+
+
+def to_quaternion(roll=0.0, pitch=0.0, yaw=0.0):
+    """
+    Convert Euler angles in degrees to a ``[w, x, y, z]`` quaternion.
+    """
+    t0 = math.cos(math.radians(yaw * 0.5))
+    t1 = math.sin(math.radians(yaw * 0.5))
+    t2 = math.cos(math.radians(roll * 0.5))
+    t3 = math.sin(math.radians(roll * 0.5))
+    t4 = math.cos(math.radians(pitch * 0.5))
+    t5 = math.sin(math.radians(pitch * 0.5))
+    return [t0 * t2 * t4 + t1 * t3 * t5,
+            t0 * t3 * t4 - t1 * t2 * t5,
+            t0 * t2 * t5 + t1 * t3 * t4,
+            t1 * t2 * t4 - t0 * t3 * t5]
+
+
+class RateMeter(object):
+    """
+    Measures how many times a second something happens, over the last ``window`` seconds.
+    """
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self._times = collections.deque()
+
+    def tick(self, now=None):
+        """
+        Count one event, at ``now`` (``time.monotonic_ns()`` by default).
+        """
+        if now is None:
+            now = time.monotonic_ns()
+        times = self._times
+        times.append(now)
+        while now - times[0] > self.window * 1e9:
+            times.popleft()
+
+    @property
+    def rate(self):
+        """
+        Events per second.
+        """
+        now = time.monotonic_ns()
+        return sum(1 for t in list(self._times) if now - t <= self.window * 1e9) / self.window
+
+
+class SetpointStreamer(object):
+    """
+    Sends the latest guided-mode target of a vehicle at a fixed rate, from a dedicated thread.
+
+    Use :py:attr:`Vehicle.setpoints <dronekit.Vehicle.setpoints>` rather than creating one directly.
+    """
+
+    def __init__(self, vehicle):
+        self._vehicle = vehicle
+        self._target = None
+        self._thread = None
+        self._running = False
+        self._period_ns = 0
+        #: Setpoints sent since the streamer was started.
+        self.sent = 0
+        #: Deadlines skipped because the streamer thread was late by more than a period.
+        self.missed = 0
+        #: How late each send was, relative to its deadline (:py:class:`LatencyHistogram
+        #: <dronekit.latency.LatencyHistogram>`).
+        self.lateness = LatencyHistogram()
+        self._meter = RateMeter()
+
+    @property
+    def rate(self):
+        """
+        Setpoints sent per second, while running (``None`` when stopped).
+        """
+        return 1e9 / self._period_ns if self._running else None
+
+    @property
+    def send_rate(self):
+        """
+        Setpoints actually sent per second, over the last second.
+        """
+        return self._meter.rate
+
+    @property
+    def running(self):
+        """
+        ``True`` while the streamer thread is running.
+        """
+        return self._running
+
+    @property
+    def target(self):
+        """
+        The message being streamed, or ``None``.
+        """
+        target = self._target
+        return target.msg if target is not None else None
+
+    def start(self, rate=20):
+        """
+        Start sending the target ``rate`` times a second (or change the rate, if already running).
+
+        The statistics are reset.
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self._period_ns = int(1e9 / rate)
+        self.sent = 0
+        self.missed = 0
+        self.lateness = LatencyHistogram()
+        self._meter = RateMeter()
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='dronekit-setpoints')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop sending. The target is kept, so :py:func:`start` resumes with it.
+        """
+        self._running = False
+        if self._thread is not None:
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+
+    def clear(self):
+        """
+        Stop sending any target (the streamer thread keeps running).
+        """
+        self._target = None
+
+    def set_message(self, msg):
+        """
+        Stream ``msg``, a message created with :py:attr:`Vehicle.message_factory
+        <dronekit.Vehicle.message_factory>`, replacing the current target.
+        """
+        # A single assignment: the streamer thread sees either the old target or the new one.
+        self._target = self._vehicle.message_template(msg)
+
+    def set_velocity(self, vx, vy, vz, yaw_rate=None, frame=mavlink.MAV_FRAME_LOCAL_NED):
+        """
+        Stream a velocity target (``SET_POSITION_TARGET_LOCAL_NED``).
+
+        :param vx: Velocity north (or forward, in a body frame), in m/s.
+        :param vy: Velocity east (or right), in m/s.
+        :param vz: Velocity down, in m/s.
+        :param yaw_rate: Yaw rate in degrees per second, or ``None`` to leave the yaw alone.
+        :param frame: A ``MAV_FRAME``, for example ``MAV_FRAME_BODY_NED``.
+        """
+        mask = _IGNORE_POSITION | _IGNORE_ACCELERATION | _IGNORE_YAW
+        if yaw_rate is None:
+            mask |= _IGNORE_YAW_RATE
+        self.set_message(self._vehicle.message_factory.set_position_target_local_ned_encode(
+            0, 0, 0, frame, mask, 0, 0, 0, vx, vy, vz, 0, 0, 0, 0, math.radians(yaw_rate or 0)))
+
+    def set_position(self, north, east, down, yaw=None, frame=mavlink.MAV_FRAME_LOCAL_NED):
+        """
+        Stream a local position target (``SET_POSITION_TARGET_LOCAL_NED``), in metres from the EKF origin
+        (or from the vehicle, with an offset frame such as ``MAV_FRAME_LOCAL_OFFSET_NED``).
+
+        :param yaw: Heading in degrees, or ``None`` to leave the yaw alone.
+        """
+        mask = _IGNORE_VELOCITY | _IGNORE_ACCELERATION | _IGNORE_YAW_RATE
+        if yaw is None:
+            mask |= _IGNORE_YAW
+        self.set_message(self._vehicle.message_factory.set_position_target_local_ned_encode(
+            0, 0, 0, frame, mask, north, east, down, 0, 0, 0, 0, 0, 0, math.radians(yaw or 0), 0))
+
+    def set_location(self, location, yaw=None):
+        """
+        Stream a global position target (``SET_POSITION_TARGET_GLOBAL_INT``).
+
+        :param location: A :py:class:`LocationGlobalRelative <dronekit.LocationGlobalRelative>` (altitude
+            relative to home) or :py:class:`LocationGlobal <dronekit.LocationGlobal>` (altitude above mean
+            sea level).
+        :param yaw: Heading in degrees, or ``None`` to leave the yaw alone.
+        """
+        from dronekit import LocationGlobal
+        if isinstance(location, LocationGlobal):
+            frame = mavlink.MAV_FRAME_GLOBAL_INT
+        else:
+            frame = mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+        mask = _IGNORE_VELOCITY | _IGNORE_ACCELERATION | _IGNORE_YAW_RATE
+        if yaw is None:
+            mask |= _IGNORE_YAW
+        self.set_message(self._vehicle.message_factory.set_position_target_global_int_encode(
+            0, 0, 0, frame, mask, int(location.lat * 1e7), int(location.lon * 1e7), location.alt,
+            0, 0, 0, 0, 0, 0, math.radians(yaw or 0), 0))
+
+    def set_attitude(self, roll=0.0, pitch=0.0, yaw=None, yaw_rate=None, thrust=0.5):
+        """
+        Stream an attitude target (``SET_ATTITUDE_TARGET``), as in guided mode without GPS.
+
+        :param roll: Roll angle in degrees.
+        :param pitch: Pitch angle in degrees.
+        :param yaw: Heading in degrees. If ``None``, the current heading of the vehicle.
+        :param yaw_rate: Yaw rate in degrees per second, used instead of ``yaw`` if given.
+        :param thrust: From 0 to 1. On ArduCopter, 0.5 holds the altitude, more climbs and less descends.
+        """
+        if yaw is None:
+            attitude = self._vehicle.attitude
+            yaw = math.degrees(attitude.yaw) if attitude.yaw is not None else 0
+        mask = _IGNORE_BODY_ROLL_RATE | _IGNORE_BODY_PITCH_RATE
+        if yaw_rate is None:
+            mask |= _IGNORE_BODY_YAW_RATE
+        self.set_message(self._vehicle.message_factory.set_attitude_target_encode(
+            0, 0, 0, mask, to_quaternion(roll, pitch, yaw), 0, 0, math.radians(yaw_rate or 0), thrust))
+
+    def _run(self):
+        deadline = time.monotonic_ns()
+        while self._running:
+            wait = deadline - time.monotonic_ns()
+            if wait > 0:
+                time.sleep(wait * 1e-9)
+            now = time.monotonic_ns()
+            period = self._period_ns
+            late = now - deadline
+            if late >= period:
+                # Skip the deadlines that have passed, rather than sending a burst.
+                skipped = late // period
+                self.missed += skipped
+                deadline += skipped * period
+                late -= skipped * period
+
+            target = self._target
+            if target is not None:
+                target.send()
+                self._meter.tick(now)
+                self.sent += 1
+                self.lateness.record(late)
+            deadline += period
+
+    def __str__(self):
+        return 'SetpointStreamer:rate=%s,sent=%s,missed=%s,p99_late=%.6f' % (
+            self.rate, self.sent, self.missed, self.lateness.percentile(99))
@@ -0,0 +1,370 @@
+"""
+Per-message telemetry rates.
+
+:py:func:`Vehicle.initialize() <dronekit.Vehicle.initialize>` asks for every data stream at one rate
+(``REQUEST_DATA_STREAM`` with ``MAV_DATA_STREAM_ALL``). Applications that need some messages fast and others
+rarely, or not at all, declare the rates they need through :py:attr:`Vehicle.streams
+<dronekit.Vehicle.streams>`:
+
+.. code:: python
+
+    subscription = vehicle.streams.subscribe({'ATTITUDE': 50, 'SYS_STATUS': 1})
+    vehicle.streams.wait_applied(timeout=5)
+    ...
+    subscription.cancel()
+
+The :py:class:`StreamManager` sends each message the highest rate asked for by any subscription, one
+``MAV_CMD_SET_MESSAGE_INTERVAL`` command at a time, and checks the ``COMMAND_ACK`` of each. Autopilots
+that do not support the command are sent ``REQUEST_DATA_STREAM`` for the stream groups of the messages
+instead (see :py:data:`DATA_STREAMS`), which can only set the rate of a whole group.
+
+The rates are sent again when the link recovers from a heartbeat timeout, when the vehicle reboots, and
+when a message that should be streaming has not been received for :py:attr:`StreamManager.verify_interval`
+seconds (or a stopped message keeps arriving).
+"""
+
+import logging
+import math
+import threading
+
+import monotonic
+from pymavlink import mavutil
+
+mavlink = mavutil.mavlink
+
+#: Messages of each ArduPilot ``MAV_DATA_STREAM`` group, as set by ``REQUEST_DATA_STREAM``.
+DATA_STREAMS = {
+    mavlink.MAV_DATA_STREAM_RAW_SENSORS: ('RAW_IMU', 'SCALED_IMU2', 'SCALED_IMU3', 'SCALED_PRESSURE',
+                                          'SCALED_PRESSURE2', 'SCALED_PRESSURE3'),
+    mavlink.MAV_DATA_STREAM_EXTENDED_STATUS: ('SYS_STATUS', 'POWER_STATUS', 'MEMINFO', 'MISSION_CURRENT',
+                                              'GPS_RAW_INT', 'GPS_RTK', 'GPS2_RAW', 'GPS2_RTK',
+                                              'NAV_CONTROLLER_OUTPUT', 'FENCE_STATUS'),
+    mavlink.MAV_DATA_STREAM_RC_CHANNELS: ('SERVO_OUTPUT_RAW', 'RC_CHANNELS', 'RC_CHANNELS_RAW'),
+    mavlink.MAV_DATA_STREAM_POSITION: ('GLOBAL_POSITION_INT', 'LOCAL_POSITION_NED'),
+    mavlink.MAV_DATA_STREAM_EXTRA1: ('ATTITUDE', 'SIMSTATE', 'AHRS2', 'PID_TUNING'),
+    mavlink.MAV_DATA_STREAM_EXTRA2: ('VFR_HUD',),
+    mavlink.MAV_DATA_STREAM_EXTRA3: ('AHRS', 'HWSTATUS', 'SYSTEM_TIME', 'RANGEFINDER', 'DISTANCE_SENSOR',
+                                     'TERRAIN_REQUEST', 'BATTERY_STATUS', 'MOUNT_STATUS', 'OPTICAL_FLOW',
+                                     'GIMBAL_REPORT', 'MAG_CAL_REPORT', 'MAG_CAL_PROGRESS', 'EKF_STATUS_REPORT',
+                                     'VIBRATION', 'RPM', 'ESC_TELEMETRY_1_TO_4'),
+}
+
+_GROUPS = dict((name, group) for group, names in DATA_STREAMS.items() for name in names)
+
+
+def _message_id(name):
+    msg_id = getattr(mavlink, 'MAVLINK_MSG_ID_' + name, None)
+    if msg_id is None:
+        raise ValueError('Unknown message %r' % name)
+    return msg_id
+
+
+class StreamSubscription(object):
+    """
+    Message rates declared by one part of an application, returned by :py:func:`StreamManager.subscribe`.
+    """
+
+    def __init__(self, manager, rates, priority=False):
+        self._manager = manager
+        #: Rates in Hz by message name.
+        self.rates = rates
+        #: Whether the rates are kept when the :py:attr:`StreamManager.scale` is reduced.
+        self.priority = priority
+
+    def update(self, rates):
+        """
+        Replace the rates of this subscription.
+
+        :param dict rates: Rates in Hz by message name. A rate of 0 asks for the message to be stopped,
+            which only takes effect if no other subscription needs it.
+        """
+        self._manager._update(self, rates)
+
+    def cancel(self):
+        """
+        Withdraw the rates of this subscription.
+        """
+        self._manager._update(self, None)
+
+
+class StreamManager(object):
+    """
+    Aggregates the message rates needed by the subscribers of a vehicle and sets them on the autopilot.
+
+    Use :py:attr:`Vehicle.streams <dronekit.Vehicle.streams>` rather than creating one directly.
+    """
+
+    #: Seconds to wait for the ``COMMAND_ACK`` of a ``MAV_CMD_SET_MESSAGE_INTERVAL`` before sending it again.
+    ack_timeout = 0.5
+    #: Number of times a command is resent before giving up on it.
+    retries = 3
+    #: Seconds between checks that the streams are being received at all.
+    verify_interval = 5.0
+
+    def __init__(self, vehicle):
+        self._vehicle = vehicle
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._exclusive = False
+        self._scale = 1.0
+        # Rates to send (None for the autopilot's default rate), in order.
+        self._pending = {}
+        self._inflight = None
+        self._groups_dirty = False
+        self._counts = {}
+        self._verified = monotonic.monotonic()
+        self._link_lost = False
+        self._reboots = vehicle.timesync.reboots
+
+        #: Message rates confirmed by the autopilot (or sent as stream groups), in Hz by message name.
+        self.applied = {}
+        #: ``MAV_RESULT`` of the messages whose rate the autopilot refused, by message name.
+        self.denied = {}
+        #: Whether the autopilot supports ``MAV_CMD_SET_MESSAGE_INTERVAL`` (``None`` until it has answered).
+        self.message_interval = None
+        #: Number of times the rates have been sent again after a reconnect, reboot or missing stream.
+        self.reapplied = 0
+
+        @vehicle.on_message('COMMAND_ACK')
+        def listener(_, name, msg):
+            if msg.command == mavlink.MAV_CMD_SET_MESSAGE_INTERVAL:
+                self._handle_ack(msg)
+
+        @vehicle._handler.forward_loop
+        def poll(_):
+            self._poll(monotonic.monotonic())
+
+    def subscribe(self, rates, priority=False):
+        """
+        Declare message rates.
+
+        :param dict rates: Rates in Hz by message name, for example ``{'ATTITUDE': 50, 'SYS_STATUS': 1}``.
+            A rate of 0 asks for the message to be stopped, which only takes effect if no other subscription
+            needs it.
+        :param bool priority: Keep these rates when the :py:attr:`scale` is reduced (for example telemetry
+            that a control loop depends on).
+        :returns: A :py:class:`StreamSubscription`, to update or cancel the rates later.
+        """
+        subscription = StreamSubscription(self, {}, priority)
+        self._update(subscription, rates)
+        return subscription
+
+    def _update(self, subscription, rates):
+        if rates is not None:
+            rates = dict(rates)
+            for name in rates:
+                _message_id(name)
+        with self._lock:
+            before = self.rates
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+            if rates is not None:
+                subscription.rates = rates
+                self._subscriptions.append(subscription)
+            self._queue_changes(before)
+
+    def _queue_changes(self, before):
+        after = self.rates
+        for name in list(after) + [name for name in before if name not in after]:
+            if before.get(name) != after.get(name):
+                self._pending[name] = after.get(name, 0 if self._exclusive else None)
+                self._groups_dirty = True
+
+    @property
+    def rates(self):
+        """
+        The rate of each message, in Hz: the highest rate of all the subscriptions (multiplied by the
+        :py:attr:`scale`, except for priority subscriptions).
+        """
+        rates = {}
+        for subscription in self._subscriptions:
+            scale = 1.0 if subscription.priority else self._scale
+            for name, rate in subscription.rates.items():
+                rates[name] = max(rate * scale, rates.get(name, 0))
+        return rates
+
+    @property
+    def scale(self):
+        """
+        Factor applied to the rates of the subscriptions without priority, 1 by default. It is set by the
+        link budget (``dronekit.link_budget``) when the link is congested.
+        """
+        return self._scale
+
+    @scale.setter
+    def scale(self, value):
+        with self._lock:
+            before = self.rates
+            self._scale = value
+            self._queue_changes(before)
+
+    @property
+    def exclusive(self):
+        """
+        If ``True``, stream only the subscribed messages: every data stream is stopped first, and
+        unsubscribed messages are stopped rather than returned to their default rate.
+        """
+        return self._exclusive
+
+    @exclusive.setter
+    def exclusive(self, value):
+        self._exclusive = value
+        self.reapply()
+
+    @property
+    def pending(self):
+        """
+        ``True`` while some rates have not been confirmed by the autopilot yet.
+        """
+        return bool(self._pending) or self._inflight is not None or self._groups_dirty and \
+            self.message_interval is False
+
+    def wait_applied(self, timeout=None):
+        """
+        Block until the autopilot has confirmed (or refused) every rate.
+
+        :param int timeout: Seconds to wait. No timeout if not provided or set to None.
+        """
+        self._vehicle.wait_for(lambda: not self.pending, timeout, 0.05,
+                               'Stream rates not applied after %s seconds.' % timeout)
+
+    def reapply(self):
+        """
+        Send every rate again.
+        """
+        with self._lock:
+            self._queue_all()
+
+    def _queue_all(self):
+        if self._exclusive:
+            self._send_data_stream(mavlink.MAV_DATA_STREAM_ALL, 0)
+        rates = self.rates
+        for name in rates:
+            self._pending[name] = rates[name]
+        self._groups_dirty = True
+
+    def _reapply(self, reason):
+        self._logger.info('Sending stream rates again (%s)' % reason)
+        self.reapplied += 1
+        self._queue_all()
+
+    def _send_data_stream(self, stream, rate):
+        master = self._vehicle._master
+        master.mav.request_data_stream_send(master.target_system, master.target_component, stream,
+                                            int(math.ceil(rate)), 1 if rate else 0)
+
+    def _send_interval(self, name, rate):
+        if rate is None:
+            interval = 0
+        elif rate <= 0:
+            interval = -1
+        else:
+            interval = 1e6 / rate
+        master = self._vehicle._master
+        master.mav.command_long_send(master.target_system, master.target_component,
+                                     mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, 0, _message_id(name), interval,
+                                     0, 0, 0, 0, 0)
+
+    def _send_groups(self):
+        rates = self.rates
+        groups = dict((group, 0) for group in DATA_STREAMS) if self._exclusive else {}
+        for name, rate in rates.items():
+            group = _GROUPS.get(name)
+            if group is None:
+                self.denied[name] = mavlink.MAV_RESULT_UNSUPPORTED
+            else:
+                groups[group] = max(rate, groups.get(group, 0))
+        for group, rate in sorted(groups.items()):
+            self._send_data_stream(group, rate)
+        self.applied = dict((name, rate) for name, rate in rates.items() if name in _GROUPS)
+        self._pending.clear()
+        self._groups_dirty = False
+
+    def _handle_ack(self, msg):
+        with self._lock:
+            inflight = self._inflight
+            if inflight is None:
+                return
+            name, rate = inflight[0], inflight[1]
+            result = msg.result
+            if result == mavlink.MAV_RESULT_IN_PROGRESS:
+                return
+            if result == mavlink.MAV_RESULT_TEMPORARILY_REJECTED:
+                # Leave it in flight, to be sent again after ack_timeout.
+                return
+            self._inflight = None
+            if result == mavlink.MAV_RESULT_ACCEPTED:
+                self.message_interval = True
+                self.denied.pop(name, None)
+                if rate is None:
+                    self.applied.pop(name, None)
+                else:
+                    self.applied[name] = rate
+            elif result == mavlink.MAV_RESULT_UNSUPPORTED and not self.message_interval:
+                self._logger.info('MAV_CMD_SET_MESSAGE_INTERVAL is not supported, using data stream groups')
+                self.message_interval = False
+            else:
+                self._logger.warning('Autopilot refused a rate of %s Hz for %s (MAV_RESULT %s)' % (rate, name, result))
+                self.denied[name] = result
+
+    def _poll(self, now):
+        with self._lock:
+            self._check_link(now)
+            inflight = self._inflight
+            if inflight is not None:
+                name, rate, sent, attempts = inflight
+                if now - sent < self.ack_timeout:
+                    return
+                if attempts < self.retries:
+                    self._inflight = (name, rate, now, attempts + 1)
+                    self._send_interval(name, rate)
+                    return
+                self._inflight = None
+                if self.message_interval is None:
+                    self._logger.info('No answer to MAV_CMD_SET_MESSAGE_INTERVAL, using data stream groups')
+                    self.message_interval = False
+                else:
+                    self._logger.warning('No answer to the rate of %s, will try again' % name)
+                    self._pending.setdefault(name, rate)
+
+            if self.message_interval is False:
+                if self._groups_dirty:
+                    self._send_groups()
+            elif self._pending:
+                name = next(iter(self._pending))
+                rate = self._pending.pop(name)
+                self._inflight = (name, rate, now, 0)
+                self._send_interval(name, rate)
+
+    def _check_link(self, now):
+        vehicle = self._vehicle
+        if vehicle._heartbeat_timeout:
+            self._link_lost = True
+            return
+        if self._link_lost:
+            self._link_lost = False
+            self._reapply('link restored')
+            return
+        if vehicle.timesync.reboots != self._reboots:
+            self._reboots = vehicle.timesync.reboots
+            self._reapply('vehicle rebooted')
+            return
+
+        elapsed = now - self._verified
+        if elapsed < self.verify_interval:
+            return
+        self._verified = now
+        stats = vehicle.link_stats
+        if stats is None or self.pending:
+            self._counts = {}
+            return
+        counts = dict((name, stats.messages[name].count if name in stats.messages else 0) for name in self.applied)
+        previous, self._counts = self._counts, counts
+        for name, rate in self.applied.items():
+            if name not in previous:
+                continue
+            received = counts[name] - previous[name]
+            if (rate * elapsed >= 2 and received == 0) or (rate <= 0 and received >= 2):
+                self._reapply('%s is not streaming as requested' % name)
+                return
@@ -0,0 +1,184 @@
+"""
+Pre-packed message templates for high-rate sends.
+
+:py:func:`Vehicle.send_mavlink() <dronekit.Vehicle.send_mavlink>` packs every message from scratch: each field
+is converted with ``struct``, the target ids are fixed and the whole packet is checksummed. A
+:py:class:`MessageTemplate` does that work once, when it is created with :py:func:`Vehicle.message_template()
+<dronekit.Vehicle.message_template>`. Afterwards, :py:func:`MessageTemplate.update` packs only the fields that
+change into the template's buffer, and :py:func:`MessageTemplate.send` only adds the sequence number and the
+checksum:
+
+.. code:: python
+
+    template = vehicle.message_template(vehicle.message_factory.set_position_target_local_ned_encode(
+        0, 0, 0, mavutil.mavlink.MAV_FRAME_LOCAL_NED, 0b0000111111000111, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+    while flying:
+        template.send(vx=vx, vy=vy, vz=vz)
+
+The checksum of the header and payload is kept between sends and only recomputed after an update; the sequence
+number is folded into it from a table (the MAVLink checksum is linear). MAVLink 2 payloads are sent without
+stripping their trailing zero bytes, so a template always has the same length. Packets are packed from scratch
+when signing is enabled.
+
+A template is not thread-safe: update and send it from one thread, or replace it with a new template.
+"""
+
+import struct
+
+from pymavlink import mavutil
+
+mavlink = mavutil.mavlink
+
+# Checksum contributions of the sequence number, by the number of bytes that follow it (see _seq_crc_table).
+_SEQ_CRC = {}
+
+
+def _seq_crc_table(following):
+    # The checksum without a final xor is linear: changing one byte changes the checksum by the checksum
+    # (from a zero state) of the change followed by the bytes after it, as zeros.
+    table = _SEQ_CRC.get(following)
+    if table is None:
+        bits = []
+        for bit in range(8):
+            crc = mavlink.x25crc()
+            crc.crc = 0
+            crc.accumulate(bytearray([1 << bit]) + bytearray(following))
+            bits.append(crc.crc)
+        table = [0] * 256
+        for seq in range(1, 256):
+            low = seq & -seq
+            table[seq] = table[seq ^ low] ^ bits[low.bit_length() - 1]
+        _SEQ_CRC[following] = table
+    return table
+
+
+def _layout(msg):
+    # Offset and packer of each field, in wire order.
+    fields = {}
+    offset = 0
+    for i, name in enumerate(msg.ordered_fieldnames):
+        code = chr(msg.native_format[i + 1])
+        count = msg.array_lengths[i]
+        if not count:
+            kind, fmt = 'value', code
+        elif code == 'c':
+            kind, fmt = 'chars', '%ds' % count
+        else:
+            kind, fmt = 'array', '%d%s' % (count, code)
+        packer = struct.Struct('<' + fmt)
+        fields[name] = (offset, packer, kind)
+        offset += packer.size
+    return fields, offset
+
+
+class MessageTemplate(object):
+    """
+    A message packed once, to be updated and sent many times.
+
+    Use :py:func:`Vehicle.message_template() <dronekit.Vehicle.message_template>` rather than creating one
+    directly.
+
+    :param msg: The message, created with :py:attr:`Vehicle.message_factory <dronekit.Vehicle.message_factory>`.
+    :param mav: The ``MAVLink`` object of the connection.
+    :param target_system: If set, the ``target_system`` of the message is set to it (once).
+    """
+
+    def __init__(self, msg, mav, target_system=None):
+        if target_system is not None and 'target_system' in msg.fieldnames:
+            msg.target_system = target_system
+        #: The message, with the fields as last updated.
+        self.msg = msg
+        self._mav = mav
+        self._fields, size = _layout(msg)
+        if size != msg.unpacker.size:
+            raise ValueError('Cannot make a template of %s' % msg.get_type())
+
+        # The header of a normal packet, with the full payload length and no signature.
+        packet = bytearray(msg.pack(mav))
+        if packet[0] == mavlink.PROTOCOL_MARKER_V2:
+            header = packet[:10]
+            header[2] = 0
+            self._seq_index = 4
+        else:
+            header = packet[:6]
+            self._seq_index = 2
+        header[1] = size
+        header[self._seq_index] = 0
+        self._payload_index = len(header)
+        self._buf = header + bytearray(size + 2)
+        for name in self._fields:
+            # Recent pymavlink versions keep the bytes of char arrays apart from the decoded string.
+            self._pack_field(name, getattr(msg, '_%s_raw' % name, getattr(msg, name)))
+
+        crc = mavlink.x25crc(header[1:])
+        self._header_crc = crc.crc
+        self._crc_extra = bytearray([msg.crc_extra])
+        self._crc = None
+        self._seq_crc = _seq_crc_table(len(self._buf) - 2 - self._seq_index)
+
+    def __len__(self):
+        return len(self._buf)
+
+    def _pack_field(self, name, value):
+        offset, packer, kind = self._fields[name]
+        if kind == 'value':
+            packer.pack_into(self._buf, self._payload_index + offset, value)
+        elif kind == 'chars':
+            if not isinstance(value, bytes):
+                value = value.encode('ascii')
+            packer.pack_into(self._buf, self._payload_index + offset, value)
+        else:
+            packer.pack_into(self._buf, self._payload_index + offset, *value)
+        return value
+
+    def update(self, **fields):
+        """
+        Set fields of the message, for example ``template.update(vx=1.5, vy=0)``.
+
+        Arrays (such as ``q``) are set whole.
+        """
+        msg = self.msg
+        for name, value in fields.items():
+            if name not in self._fields:
+                raise ValueError('%s has no field %s' % (msg.get_type(), name))
+            value = self._pack_field(name, value)
+            if self._fields[name][2] == 'chars':
+                if hasattr(msg, '_%s_raw' % name):
+                    setattr(msg, '_%s_raw' % name, value)
+                value = value.decode('ascii')
+            setattr(msg, name, value)
+        self._crc = None
+
+    def pack(self):
+        """
+        Return the packet, with the next sequence number of the connection (which is not advanced).
+        """
+        mav = self._mav
+        if mav.signing.sign_outgoing:
+            return bytes(self.msg.pack(mav))
+        buf = self._buf
+        if self._crc is None:
+            crc = mavlink.x25crc()
+            crc.crc = self._header_crc
+            crc.accumulate(buf[self._payload_index:-2])
+            crc.accumulate(self._crc_extra)
+            self._crc = crc.crc
+        seq = mav.seq
+        crc = self._crc ^ self._seq_crc[seq]
+        buf[self._seq_index] = seq
+        buf[-2] = crc & 0xFF
+        buf[-1] = crc >> 8
+        return bytes(buf)
+
+    def send(self, **fields):
+        """
+        Send the message, after updating the given fields (see :py:func:`update`).
+        """
+        if fields:
+            self.update(**fields)
+        mav = self._mav
+        packet = self.pack()
+        mav.file.write(packet)
+        mav.seq = (mav.seq + 1) % 256
+        mav.total_packets_sent += 1
+        mav.total_bytes_sent += len(packet)
@@ -1,5 +1,6 @@
 import time
 from dronekit import connect
+from pymavlink import mavutil
 from dronekit.test import with_sitl
 
 
@@ -21,7 +22,9 @@ def test_timeout(connpath):
     vehicle = connect(connpath, wait_ready=True)
 
     assert len(vehicle.channels) == 8
-    assert len(vehicle.channels.overrides) == 8
+    # All 18 RC_CHANNELS_OVERRIDE channels with MAVLink 2, 8 with MAVLink 1.
+    override_count = 18 if mavutil.mavlink.WIRE_PROTOCOL_VERSION == '2.0' else 8
+    assert len(vehicle.channels.overrides) == override_count
 
     assert sorted(vehicle.channels.keys()) == [str(x) for x in range(1, 9)]
     assert sorted(vehicle.channels.overrides.keys()) == []
@@ -91,17 +94,18 @@ def test_timeout(connpath):
     vehicle.channels.overrides['8'] = 810
     assert_readback(vehicle, {'8': 810})
 
+    beyond = str(override_count + 1)
     try:
-        # Try to write channel 9 override to a value with brackets
-        vehicle.channels.overrides['9'] = 900
-        assert False, "can write channels.overrides 9"
+        # Try to write an override past the last channel with brackets
+        vehicle.channels.overrides[beyond] = 900
+        assert False, "can write channels.overrides %s" % beyond
     except:
         pass
 
     try:
-        # Try to write channel 9 override to a value with braces
-        vehicle.channels.overrides = {'9': 900}
-        assert False, "can write channels.overrides 9 with braces"
+        # Try to write an override past the last channel with braces
+        vehicle.channels.overrides = {beyond: 900}
+        assert False, "can write channels.overrides %s with braces" % beyond
     except:
         pass
 
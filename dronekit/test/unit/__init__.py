@@ -0,0 +1,35 @@
+from pymavlink import mavutil
+
+from dronekit import Vehicle
+from dronekit.mavlink import MAVConnection
+
+
+def offline_vehicle(vehicle_class=Vehicle):
+    """Create a vehicle whose connection threads are never started.
+
+    Outgoing packets accumulate in the connection's output queue (see :py:func:`sent_messages`)
+    and incoming messages are injected with :py:func:`receive`.
+    """
+    handler = MAVConnection('udpout:127.0.0.1:14999')
+    return vehicle_class(handler)
+
+
+def sent_messages(vehicle):
+    """Drain and decode everything the vehicle has queued for sending."""
+    parser = mavutil.mavlink.MAVLink(None)
+    queue = vehicle._handler.out_queue
+    msgs = []
+    while not queue.empty():
+        msgs.extend(parser.parse_buffer(queue.get()) or [])
+    return msgs
+
+
+def receive(vehicle, msg):
+    """Dispatch ``msg`` to the vehicle as if it had arrived on the link."""
+    vehicle.notify_message_listeners(msg.get_type(), msg)
+
+
+def run_loop(vehicle):
+    """Run the connection's loop listeners once."""
+    for fn in vehicle._handler.loop_listeners:
+        fn(vehicle._handler)
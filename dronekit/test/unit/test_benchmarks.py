@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from benchmarks.suite import Results, compare, keep_tolerances, percentile
+
+
+def result(value, higher_is_better=False, **extra):
+    entry = {'value': value, 'unit': 's', 'higher_is_better': higher_is_better}
+    entry.update(extra)
+    return entry
+
+
+def test_percentile():
+    values = list(range(100, 0, -1))
+    assert percentile(values, 0.5) == 51
+    assert percentile(values, 0.99) == 100
+    assert percentile(values, 1.0) == 100
+    assert percentile([3.0], 0.9) == 3.0
+    with pytest.raises(ValueError):
+        percentile([], 0.5)
+
+
+def test_compare():
+    baseline = {
+        'slower': result(1.0),
+        'faster': result(1.0),
+        'noisy': result(1.0, tolerance=1.0),
+        'throughput': result(100.0, True),
+        'lost': result(0),
+        'still_none_lost': result(0),
+    }
+    results = {
+        'slower': result(1.3),
+        'faster': result(0.7),
+        'noisy': result(1.9),
+        'throughput': result(70.0, True),
+        'lost': result(2),
+        'still_none_lost': result(0),
+        'added': result(5.0),
+    }
+    rows = dict((row[0], row[1:]) for row in compare(results, baseline, 0.25))
+    assert rows['slower'] == (1.0, 1.3, pytest.approx(0.3), 'regressed')
+    assert rows['faster'] == (1.0, 0.7, pytest.approx(-0.3), 'improved')
+    assert rows['noisy'] == (1.0, 1.9, pytest.approx(0.9), 'ok')
+    assert rows['throughput'] == (100.0, 70.0, pytest.approx(0.3), 'regressed')
+    assert rows['lost'] == (0, 2, float('inf'), 'regressed')
+    assert rows['still_none_lost'] == (0, 0, 0.0, 'ok')
+    assert rows['added'] == (None, 5.0, None, 'new')
+
+
+def test_saved_baseline_keeps_tolerances(tmpdir):
+    path = str(tmpdir.join('baseline.json'))
+    results = Results()
+    results.add('noisy', 2.0, 's')
+    results.add('steady', 1.0, 's')
+    output = results.to_json(quick=True)
+
+    # Nothing to keep without a previous baseline.
+    keep_tolerances(output, path)
+    assert 'tolerance' not in output['results']['noisy']
+
+    with open(path, 'w') as f:
+        json.dump({'metadata': {}, 'results': {'noisy': result(1.0, tolerance=0.8), 'gone': result(1.0)}}, f)
+    keep_tolerances(output, path)
+    assert output['results']['noisy'] == result(2.0, tolerance=0.8)
+    assert output['results']['steady'] == result(1.0)
+    assert output['metadata']['quick'] is True
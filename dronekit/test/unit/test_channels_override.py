@@ -0,0 +1,83 @@
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import connect
+from dronekit.mock_autopilot import MockAutopilot
+from dronekit.test.unit import offline_vehicle, sent_messages
+
+mavlink = mavutil.mavlink
+MAVLINK2 = mavlink.WIRE_PROTOCOL_VERSION == '2.0'
+
+
+def channels(msg):
+    return [getattr(msg, 'chan%d_raw' % i) for i in range(1, 19 if MAVLINK2 else 9)]
+
+
+def test_batch_sends_one_message():
+    vehicle = offline_vehicle()
+    overrides = vehicle.channels.overrides
+    with overrides.batch() as batch:
+        for channel in range(1, 5):
+            batch[channel] = 1500 + channel
+        with overrides.batch():
+            overrides['4'] = None
+    sent = sent_messages(vehicle)
+    assert len(sent) == 1
+    expected = [1501, 1502, 1503] + [0] * 5 + ([65534] * 10 if MAVLINK2 else [])
+    assert channels(sent[0]) == expected
+
+    # The setter is a batch too.
+    vehicle.channels.overrides = {'2': 1200, '6': None}
+    assert [channels(msg)[:3] for msg in sent_messages(vehicle)] == [[0, 1200, 0]]
+
+    # A failed batch sends nothing and leaves the overrides as they were.
+    with pytest.raises(KeyError):
+        with overrides.batch():
+            overrides['1'] = 1000
+            overrides[len(overrides) + 1] = 1000
+    assert dict(overrides) == {'2': 1200}
+    assert sent_messages(vehicle) == []
+    overrides['3'] = 1300
+    assert len(sent_messages(vehicle)) == 1
+    assert overrides.send_rate == pytest.approx(3)
+
+
+@pytest.mark.skipif(not MAVLINK2, reason='channels 9-18 need MAVLink 2')
+def test_upper_channels():
+    vehicle = offline_vehicle()
+    assert len(vehicle.channels.overrides) == 18
+    vehicle.channels.overrides['18'] = 1900
+    msg = sent_messages(vehicle)[0]
+    assert msg.chan18_raw == 1900 and msg.chan9_raw == 65534 and msg.chan1_raw == 0
+    with pytest.raises(KeyError):
+        vehicle.channels.overrides['19'] = 1900
+
+
+def test_periodic_overrides_with_mock():
+    received = []
+    with MockAutopilot() as mock:
+        mock.add_handler('RC_CHANNELS_OVERRIDE', lambda mock, msg: received.append(msg))
+        vehicle = connect(mock.connection_string, wait_ready=False, heartbeat_timeout=10)
+        try:
+            overrides = vehicle.channels.overrides
+            overrides.start(rate=50)
+            assert overrides.rate == pytest.approx(50)
+            time.sleep(0.5)
+            with overrides.batch():
+                overrides['1'] = 1600
+                overrides['2'] = 1400
+                overrides['3'] = 1300
+                overrides['4'] = 1700
+            time.sleep(0.6)
+            send_rate = overrides.send_rate
+            overrides.stop()
+        finally:
+            vehicle.close()
+
+    # One message per period, whatever the number of changes.
+    assert len(received) == pytest.approx(55, abs=4)
+    assert send_rate == pytest.approx(50, abs=3)
+    assert channels(received[0])[:4] == [0, 0, 0, 0]
+    assert channels(received[-1])[:4] == [1600, 1400, 1300, 1700]
@@ -0,0 +1,94 @@
+import pytest
+from pymavlink import mavutil
+
+numpy = pytest.importorskip('numpy')
+
+from dronekit.export import ColumnExporter, export_tlog  # noqa: E402
+from dronekit.test.unit import offline_vehicle, receive  # noqa: E402
+from dronekit.tlog import TlogReader, TlogRecorder  # noqa: E402
+
+
+def make_messages(count):
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    msgs = []
+    for i in range(count):
+        msgs.append(mav.attitude_encode(i, 0.01 * i, -0.5, 1.0 + i, 0, 0, 0))
+        msgs.append(mav.statustext_encode(6, ('message %d' % i).encode()))
+        msgs.append(mav.rc_channels_encode(i, 18, *([1500 + i] * 18 + [255])))
+        msgs.append(mav.param_value_encode(b'PARAM_%d' % i, i * 0.5, 9, count, i))
+    for msg in msgs:
+        # Set the wire bytes, as for a received message.
+        msg.pack(mav)
+    return msgs
+
+
+def write_log(path, msgs):
+    recorder = TlogRecorder(path)
+    for i, msg in enumerate(msgs):
+        recorder.record(bytes(msg.get_msgbuf()), timestamp=1500000000.0 + i)
+    recorder.close()
+
+
+def check_columns(files, count):
+    attitude = numpy.load(files['ATTITUDE'])
+    assert attitude['time_boot_ms'].tolist() == list(range(count))
+    assert attitude['roll'] == pytest.approx(0.01 * numpy.arange(count))
+    assert (attitude['pitch'] == numpy.float32(-0.5)).all()
+    assert attitude['_timestamp'].tolist() == [1500000000.0 + 4 * i for i in range(count)]
+
+    text = numpy.load(files['STATUSTEXT'])
+    assert text['text'][-1] == b'message %d' % (count - 1)
+    assert (text['severity'] == 6).all()
+
+    params = numpy.load(files['PARAM_VALUE'])
+    assert params['param_id'][3] == b'PARAM_3'
+    assert params['param_index'].tolist() == list(range(count))
+
+
+def test_export_tlog_in_chunks(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    write_log(path, make_messages(250))
+
+    files = export_tlog(path, str(tmpdir.join('columns')), format='npz', chunk_size=64)
+    assert sorted(files) == ['ATTITUDE', 'PARAM_VALUE', 'RC_CHANNELS', 'STATUSTEXT']
+    check_columns(files, 250)
+    rc = numpy.load(files['RC_CHANNELS'])
+    assert rc['chan18_raw'].tolist() == [1500 + i for i in range(250)]
+    assert sorted(tmpdir.join('columns').listdir()) == sorted(tmpdir.join('columns', name + '.npz')
+                                                               for name in files)
+
+
+def test_export_selected_types_and_times(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    write_log(path, make_messages(100))
+
+    with TlogReader(path) as log, ColumnExporter(str(tmpdir), types='ATTITUDE', format='npz',
+                                                 compress=True) as exporter:
+        exporter.add_tlog(log, start=1500000040.0, end=1500000080.0)
+    attitude = numpy.load(exporter.files['ATTITUDE'])
+    assert list(exporter.files) == ['ATTITUDE']
+    assert attitude['time_boot_ms'].tolist() == list(range(10, 20))
+
+
+def test_export_live_stream(tmpdir):
+    vehicle = offline_vehicle()
+    exporter = ColumnExporter(str(tmpdir), format='npz', chunk_size=16)
+    exporter.attach(vehicle)
+    for i, msg in enumerate(make_messages(50)):
+        msg._timestamp = 1500000000.0 + i
+        receive(vehicle, msg)
+    files = exporter.close()
+    receive(vehicle, make_messages(1)[0])
+    check_columns(files, 50)
+
+
+def test_parquet(tmpdir):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+
+    path = str(tmpdir.join('flight.tlog'))
+    write_log(path, make_messages(100))
+    files = export_tlog(path, str(tmpdir.join('columns')), format='parquet', chunk_size=30)
+    table = pyarrow.parquet.read_table(files['STATUSTEXT'])
+    assert table.column('text').to_pylist()[5] == 'message 5'
+    assert table.num_rows == 100
@@ -0,0 +1,133 @@
+import pytest
+from pymavlink import mavutil
+
+from dronekit import APIException, MissionDeniedError
+from dronekit.test.unit import offline_vehicle, receive, run_loop, sent_messages
+
+mavlink = mavutil.mavlink
+
+# Fence and rally transfers use the MAVLink 2 mission_type field; run with MAVLINK20=1.
+pytestmark = pytest.mark.skipif('mission_type' not in mavlink.MAVLink_mission_count_message.fieldnames,
+                                reason='needs the MAVLink 2 dialect (MAVLINK20=1)')
+
+FENCE = mavlink.MAV_MISSION_TYPE_FENCE
+RALLY = mavlink.MAV_MISSION_TYPE_RALLY
+
+
+def request(vehicle, seq, mission_type):
+    receive(vehicle, mavlink.MAVLink_mission_request_int_message(255, 0, seq, mission_type))
+
+
+def ack(vehicle, mission_type, result=mavlink.MAV_MISSION_ACCEPTED):
+    receive(vehicle, mavlink.MAVLink_mission_ack_message(255, 0, result, mission_type))
+
+
+def item(seq, command, lat, lon, param1=0, mission_type=FENCE):
+    return mavlink.MAVLink_mission_item_int_message(
+        255, 0, seq, mavlink.MAV_FRAME_GLOBAL, command, 0, 1, param1, 0, 0, 0,
+        int(lat * 1e7), int(lon * 1e7), 0, mission_type)
+
+
+def test_fence_polygons_and_circles():
+    vehicle = offline_vehicle()
+    vehicle.fence.add_polygon([-35.0, -35.0, -35.1, -35.1], [149.0, 149.1, 149.1, 149.0])
+    vehicle.fence.add_polygon([-35.05, -35.05, -35.06], [149.05, 149.06, 149.06], inclusion=False)
+    vehicle.fence.add_circle(-35.02, 149.02, 30, inclusion=False)
+    assert vehicle.fence.count == 8
+
+    polygons = vehicle.fence.polygons()
+    assert [(p.inclusion, len(p)) for p in polygons] == [(True, 4), (False, 3)]
+    assert polygons[0].lat[2] == pytest.approx(-35.1)
+    circles = vehicle.fence.circles()
+    assert [(c.inclusion, c.radius) for c in circles] == [(False, 30)]
+    with pytest.raises(ValueError):
+        vehicle.fence.add_polygon([-35.0, -35.1], [149.0, 149.1])
+
+
+def test_fence_upload_uses_mission_type():
+    vehicle = offline_vehicle()
+    vehicle.fence.add_circle(-35.02, 149.02, 30)
+    vehicle.fence.add_circle(-35.03, 149.03, 40)
+    future = vehicle.fence.upload_async()
+
+    msgs = sent_messages(vehicle)
+    assert [(m.get_type(), m.count, m.mission_type) for m in msgs] == [('MISSION_COUNT', 2, FENCE)]
+
+    # Requests and acks for other mission types are not ours.
+    request(vehicle, 0, 0)
+    ack(vehicle, 0)
+    assert sent_messages(vehicle) == []
+    assert not future.done()
+
+    request(vehicle, 0, FENCE)
+    request(vehicle, 1, FENCE)
+    items = sent_messages(vehicle)
+    assert [(m.seq, m.mission_type, m.param1) for m in items] == [(0, FENCE, 30), (1, FENCE, 40)]
+    ack(vehicle, FENCE)
+    assert future.result(0) == 2
+    assert vehicle._mission_upload is None
+
+
+def test_fence_upload_error():
+    vehicle = offline_vehicle()
+    vehicle.fence.add_circle(-35.02, 149.02, 30)
+    future = vehicle.fence.upload_async()
+    ack(vehicle, FENCE, mavlink.MAV_MISSION_DENIED)
+    with pytest.raises(MissionDeniedError):
+        future.result(0)
+
+
+def test_fence_download_is_windowed():
+    vehicle = offline_vehicle()
+    future = vehicle.fence.download_async(window=2)
+    msgs = sent_messages(vehicle)
+    assert [(m.get_type(), m.mission_type) for m in msgs] == [('MISSION_REQUEST_LIST', FENCE)]
+
+    receive(vehicle, mavlink.MAVLink_mission_count_message(255, 0, 3, FENCE))
+    assert [m.seq for m in sent_messages(vehicle)] == [0, 1]
+
+    command = mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION
+    # Out of order: item 1 is held until item 0 arrives.
+    receive(vehicle, item(1, command, -35.0, 149.1, 3))
+    assert vehicle.fence.count == 0
+    receive(vehicle, item(0, command, -35.0, 149.0, 3))
+    assert vehicle.fence.count == 2
+    assert [m.seq for m in sent_messages(vehicle)] == [2]
+
+    receive(vehicle, item(2, command, -35.1, 149.1, 3))
+    msgs = sent_messages(vehicle)
+    assert [(m.get_type(), m.type, m.mission_type) for m in msgs] == [
+        ('MISSION_ACK', mavlink.MAV_MISSION_ACCEPTED, FENCE)]
+    assert future.result(0) == 3
+    assert len(vehicle.fence.polygons()[0]) == 3
+    # The mission itself was left alone.
+    assert vehicle._wploader.count() == 0
+
+
+def test_download_retransmits_missing_items():
+    vehicle = offline_vehicle()
+    future = vehicle.rally.download_async(window=4, retry_timeout=0, retries=1)
+    receive(vehicle, mavlink.MAVLink_mission_count_message(255, 0, 3, RALLY))
+    receive(vehicle, item(1, mavlink.MAV_CMD_NAV_RALLY_POINT, -35.0, 149.0, mission_type=RALLY))
+    sent_messages(vehicle)
+
+    run_loop(vehicle)
+    assert sorted(m.seq for m in sent_messages(vehicle) if m.get_type() == 'MISSION_REQUEST_INT') == [0, 2]
+    run_loop(vehicle)
+    assert future.exception(0) is not None
+
+
+def test_rally_points_bulk_add():
+    vehicle = offline_vehicle()
+    vehicle.rally.add_points([-35.0, -35.1], [149.0, 149.1], 40)
+    assert vehicle.rally.count == 2
+    point = vehicle.rally[-1]
+    assert (point.command, point.x, point.z) == (mavlink.MAV_CMD_NAV_RALLY_POINT, pytest.approx(-35.1), 40)
+
+
+def test_one_upload_at_a_time():
+    vehicle = offline_vehicle()
+    vehicle.rally.add_point(-35.0, 149.0, 40)
+    vehicle.rally.upload_async()
+    with pytest.raises(APIException):
+        vehicle.fence.upload_async()
@@ -0,0 +1,138 @@
+import itertools
+import random
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import geo
+from dronekit.fleet import FleetIndex
+from dronekit.test.unit import offline_vehicle, receive
+
+ORIGIN = (-35.36, 149.16)
+
+
+def scatter(index, n, spread=0.01, seed=1):
+    rng = random.Random(seed)
+    points = {}
+    for i in range(n):
+        lat = ORIGIN[0] + rng.uniform(-spread, spread)
+        lon = ORIGIN[1] + rng.uniform(-spread, spread)
+        points[i] = (lat, lon)
+        index.update(i, lat, lon)
+    return points
+
+
+def test_within_and_nearest_match_brute_force():
+    index = FleetIndex(cell_size=50, origin=ORIGIN)
+    points = scatter(index, 200)
+    lat, lon = ORIGIN
+
+    distances = sorted((geo.vincenty_distance(lat, lon, p[0], p[1]), key) for key, p in points.items())
+    within = index.within(lat, lon, 300)
+    assert [key for key, _ in within] == [key for d, key in distances if d <= 300]
+    assert within[0][1] == pytest.approx(distances[0][0], rel=1e-3)
+
+    nearest = index.nearest(lat, lon, k=5)
+    assert [key for key, _ in nearest] == [key for _, key in distances[:5]]
+    assert [key for key, _ in index.nearest(lat, lon, k=1, exclude=distances[0][1])] == [distances[1][1]]
+    assert len(index.nearest(lat, lon, k=500)) == 200
+
+
+def test_conflicts_match_brute_force():
+    index = FleetIndex(cell_size=40, origin=ORIGIN)
+    points = scatter(index, 300, spread=0.005)
+    expected = set()
+    for a, b in itertools.combinations(points, 2):
+        (ea, na, _), (eb, nb, _) = index.position(a), index.position(b)
+        if (ea - eb) ** 2 + (na - nb) ** 2 <= 60 ** 2:
+            expected.add(frozenset((a, b)))
+    # The local plane agrees with the ellipsoid to well under a metre at this scale.
+    a, b = sorted(expected, key=len)[0]
+    assert geo.vincenty_distance(points[a][0], points[a][1], points[b][0], points[b][1]) < 61
+    found = set(frozenset((a, b)) for a, b, _ in index.conflicts(60))
+    assert found == expected
+    assert len(index.conflicts(60)) == len(expected)
+
+
+def test_conflicts_vertical_separation():
+    index = FleetIndex(origin=ORIGIN)
+    index.update('a', ORIGIN[0], ORIGIN[1], 20)
+    index.update('b', ORIGIN[0], ORIGIN[1] + 0.0001, 80)
+    assert len(index.conflicts(20)) == 1
+    assert index.conflicts(20, vertical=30) == []
+
+
+def test_moving_and_removing_entries():
+    index = FleetIndex(cell_size=10, origin=ORIGIN)
+    index.update('a', ORIGIN[0], ORIGIN[1])
+    index.update('a', ORIGIN[0] + 0.01, ORIGIN[1])
+    assert index.within(ORIGIN[0], ORIGIN[1], 100) == []
+    assert len(index._cells) == 1
+    index.remove('a')
+    assert len(index) == 0
+    assert index._cells == {}
+
+
+def test_vehicle_updates_from_global_position_int():
+    vehicle = offline_vehicle()
+    index = FleetIndex(origin=ORIGIN)
+    index.add(vehicle, key='copter')
+    receive(vehicle, mavutil.mavlink.MAVLink_global_position_int_message(
+        0, int(ORIGIN[0] * 1e7), int((ORIGIN[1] + 0.001) * 1e7), 600000, 20000, 0, 0, 0, 0))
+    east, north, alt = index.position('copter')
+    assert east == pytest.approx(90.8, abs=0.1)
+    assert alt == 600.0
+
+    index.remove('copter')
+    assert 'copter' not in index
+    receive(vehicle, mavutil.mavlink.MAVLink_global_position_int_message(
+        0, int(ORIGIN[0] * 1e7), int(ORIGIN[1] * 1e7), 600000, 20000, 0, 0, 0, 0))
+    assert 'copter' not in index
+
+
+def test_nearest_stops_when_entries_are_removed_during_search():
+    class Racing(FleetIndex):
+        def _near(self, east, north, radius):
+            # Another thread removes an entry after nearest() counted them.
+            if 'b' in self:
+                self.remove('b')
+            return FleetIndex._near(self, east, north, radius)
+
+    index = Racing(cell_size=10, origin=ORIGIN)
+    index.update('a', ORIGIN[0], ORIGIN[1] + 0.001)
+    index.update('b', ORIGIN[0] + 0.01, ORIGIN[1])
+    assert [key for key, _ in index.nearest(ORIGIN[0], ORIGIN[1], k=2)] == ['a']
+
+
+def test_nearest_search_is_bounded_by_the_occupied_cells():
+    class Racing(FleetIndex):
+        searches = 0
+
+        def _near(self, east, north, radius):
+            self.searches += 1
+            if 'b' in self:
+                self.remove('b')
+            return FleetIndex._near(self, east, north, radius)
+
+    index = Racing(cell_size=10, origin=ORIGIN)
+    index.update('a', ORIGIN[0], ORIGIN[1])
+    index.update('b', ORIGIN[0] + 0.01, ORIGIN[1])
+    # The cells occupied so far reach 1120 m north: the radius grows from 10 m to 1280 m, then stops.
+    assert [key for key, _ in index.nearest(ORIGIN[0], ORIGIN[1], k=2)] == ['a']
+    assert index.searches == 8
+    index.remove('a')
+    assert index._bounds is None
+    index.update('c', ORIGIN[0], ORIGIN[1])
+    assert index._bounds == (0, 0, 0, 0)
+
+
+def test_adding_a_key_again_replaces_its_listener():
+    vehicle = offline_vehicle()
+    listeners = vehicle._message_listeners['GLOBAL_POSITION_INT']
+    builtin = len(listeners)
+    index = FleetIndex(origin=ORIGIN)
+    index.add(vehicle, key='copter')
+    index.add(vehicle, key='copter')
+    assert len(listeners) == builtin + 1
+    index.remove('copter')
+    assert len(listeners) == builtin
@@ -0,0 +1,118 @@
+import math
+
+import pytest
+
+from dronekit import geo
+
+# Flinders Peak -> Buninyong, the worked example from Vincenty (1975).
+FLINDERS = (-(37 + 57 / 60.0 + 3.72030 / 3600), 144 + 25 / 60.0 + 29.52440 / 3600)
+BUNINYONG = (-(37 + 39 / 60.0 + 10.15610 / 3600), 143 + 55 / 60.0 + 35.38390 / 3600)
+
+
+def test_vincenty_reference_distance():
+    assert geo.vincenty_distance(FLINDERS[0], FLINDERS[1], BUNINYONG[0], BUNINYONG[1]) == \
+        pytest.approx(54972.271, abs=1e-3)
+    assert geo.vincenty_distance(10.0, 20.0, 10.0, 20.0) == 0.0
+
+
+def test_haversine_and_bearing():
+    # One degree of longitude along the equator.
+    assert geo.haversine_distance(0.0, 0.0, 0.0, 1.0) == pytest.approx(2 * math.pi * geo.EARTH_RADIUS / 360)
+    assert geo.bearing(0.0, 0.0, 0.0, 1.0) == pytest.approx(90)
+    assert geo.bearing(0.0, 0.0, -1.0, 0.0) == pytest.approx(180)
+    assert geo.bearing(0.0, 0.0, 0.0, -1.0) == pytest.approx(270)
+
+
+def test_destination_inverts_distance_and_bearing():
+    lat, lon = geo.destination(-35.36, 149.16, 37.0, 1500.0)
+    assert geo.haversine_distance(-35.36, 149.16, lat, lon) == pytest.approx(1500.0)
+    assert geo.bearing(-35.36, 149.16, lat, lon) == pytest.approx(37.0)
+
+
+def test_offset_matches_example_helper():
+    lat, lon = geo.offset(-35.36, 149.16, 100.0, -50.0)
+    assert lat == pytest.approx(-35.36 + 100.0 / 6378137.0 * 180 / math.pi)
+    assert lon == pytest.approx(149.16 - 50.0 / (6378137.0 * math.cos(math.radians(-35.36))) * 180 / math.pi)
+
+
+def test_ecef_round_trip():
+    x, y, z = geo.geodetic_to_ecef(-35.36, 149.16, 584.0)
+    assert math.sqrt(x * x + y * y + z * z) == pytest.approx(6372000, rel=1e-3)
+    lat, lon, alt = geo.ecef_to_geodetic(x, y, z)
+    assert (lat, lon, alt) == (pytest.approx(-35.36), pytest.approx(149.16), pytest.approx(584.0, abs=1e-6))
+
+
+def test_ned_round_trip():
+    north, east, down = geo.geodetic_to_ned(-35.3600, 149.1610, 600.0, -35.36, 149.16, 584.0)
+    assert north == pytest.approx(0.0, abs=1e-3)
+    assert east == pytest.approx(90.8, abs=0.1)
+    assert down == pytest.approx(-16.0, abs=1e-2)
+    lat, lon, alt = geo.ned_to_geodetic(north, east, down, -35.36, 149.16, 584.0)
+    assert (lat, lon, alt) == (pytest.approx(-35.36), pytest.approx(149.161), pytest.approx(600.0))
+
+
+def test_arrays_match_scalars():
+    numpy = pytest.importorskip('numpy')
+    lats = numpy.array([FLINDERS[0], -35.36, 10.0])
+    lons = numpy.array([FLINDERS[1], 149.16, 20.0])
+
+    distances = geo.vincenty_distance(lats[:, None], lons[:, None], lats, lons)
+    assert distances.shape == (3, 3)
+    for i in range(3):
+        for j in range(3):
+            assert distances[i, j] == pytest.approx(geo.vincenty_distance(lats[i], lons[i], lats[j], lons[j]))
+
+    haversine = geo.haversine_distance(lats[:, None], lons[:, None], lats, lons)
+    assert haversine[0, 1] == pytest.approx(geo.haversine_distance(lats[0], lons[0], lats[1], lons[1]))
+
+    x, y, z = geo.geodetic_to_ecef(lats, lons, 100.0)
+    back = geo.ecef_to_geodetic(x, y, z)
+    numpy.testing.assert_allclose(back[0], lats)
+    numpy.testing.assert_allclose(back[2], 100.0)
+
+
+def test_vincenty_antipodal_is_nan():
+    assert math.isnan(geo.vincenty_distance(0.0, 0.0, 0.5, 179.7))
+
+
+def test_local_tangent_plane_matches_functions():
+    ltp = geo.LocalTangentPlane(-35.36, 149.16, 584.0)
+    ned = ltp.to_local(-35.3610, 149.1625, 620.0)
+    expected = geo.geodetic_to_ned(-35.3610, 149.1625, 620.0, -35.36, 149.16, 584.0)
+    assert ned == pytest.approx(expected)
+    assert ltp.to_global(*ned) == (pytest.approx(-35.3610), pytest.approx(149.1625), pytest.approx(620.0))
+
+
+def test_local_tangent_plane_arrays():
+    numpy = pytest.importorskip('numpy')
+    ltp = geo.LocalTangentPlane(-35.36, 149.16, 584.0)
+    north = numpy.linspace(-500, 500, 11)
+    lat, lon, alt = ltp.to_global(north, 100.0, -10.0)
+    back = ltp.to_local(lat, lon, alt)
+    numpy.testing.assert_allclose(back[0], north, atol=1e-6)
+    numpy.testing.assert_allclose(back[1], 100.0, atol=1e-6)
+
+
+def test_vehicle_tangent_plane_follows_home():
+    from dronekit import LocationGlobal, LocationGlobalRelative
+    from dronekit.test.unit import offline_vehicle
+
+    vehicle = offline_vehicle()
+    assert vehicle.local_tangent_plane() is None
+
+    vehicle._home_location = LocationGlobal(-35.36, 149.16, 584.0)
+    ltp = vehicle.local_tangent_plane()
+    assert vehicle.local_tangent_plane() is ltp
+    local = ltp.location_local(LocationGlobalRelative(-35.36, 149.16, 20.0))
+    assert (local.north, local.east, local.down) == (pytest.approx(0, abs=1e-6), pytest.approx(0, abs=1e-6),
+                                                     pytest.approx(-20.0))
+
+    # A kept converter follows the new home.
+    vehicle._home_location = LocationGlobal(-35.37, 149.16, 600.0)
+    assert vehicle.local_tangent_plane() is ltp
+    local = ltp.location_local(LocationGlobalRelative(-35.37, 149.16, 20.0))
+    assert (local.north, local.down) == (pytest.approx(0, abs=1e-6), pytest.approx(-20.0))
+    assert ltp.to_global(0, 0, 0) == (pytest.approx(-35.37), pytest.approx(149.16), pytest.approx(600.0))
+    assert ltp.lat0 == -35.37
+    with pytest.raises(ValueError):
+        vehicle.local_tangent_plane('map')
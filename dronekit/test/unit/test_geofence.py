@@ -0,0 +1,122 @@
+import random
+
+from pymavlink import mavutil
+
+from dronekit import geo
+from dronekit.geofence import Geofence, GeofenceStatus
+from dronekit.test.unit import offline_vehicle, receive
+
+ORIGIN = (-35.36, 149.16)
+
+
+def square(north, east, size):
+    # Vertices of a square with its south-west corner north/east metres from ORIGIN.
+    corners = [(north, east), (north, east + size), (north + size, east + size), (north + size, east)]
+    lats, lons = [], []
+    for n, e in corners:
+        lat, lon = geo.offset(ORIGIN[0], ORIGIN[1], n, e)
+        lats.append(lat)
+        lons.append(lon)
+    return lats, lons
+
+
+def at(north, east):
+    return geo.offset(ORIGIN[0], ORIGIN[1], north, east)
+
+
+def make_fence():
+    fence = Geofence(margin=10, origin=ORIGIN)
+    fence.add_polygon(*square(-500, -500, 1000))
+    fence.add_polygon(*square(100, 100, 100), inclusion=False)
+    fence.add_circle(*at(-200, -200), radius=30, inclusion=False)
+    return fence
+
+
+def test_breach_and_near_breach():
+    fence = make_fence()
+    assert fence.check(*at(0, 0)) == GeofenceStatus(False, False, None, 50)
+    assert fence.check(*at(0, 495)) == GeofenceStatus(False, True, 0, 5)
+    assert fence.check(*at(0, 505)).breached
+    assert fence.check(*at(150, 150)) == GeofenceStatus(True, False, 1, 0)
+    assert fence.check(*at(95, 150)).near_breach
+    status = fence.check(*at(-200, -200))
+    assert (status.breached, status.zone) == (True, 2)
+    assert fence.check(*at(-200, -235)).near_breach
+
+
+def test_polygon_matches_naive_point_in_polygon():
+    rng = random.Random(2)
+    lats, lons = [], []
+    # A star-shaped polygon with many vertices.
+    for i in range(200):
+        lat, lon = geo.destination(ORIGIN[0], ORIGIN[1], i * 360.0 / 200, rng.uniform(300, 1000))
+        lats.append(lat)
+        lons.append(lon)
+    fence = Geofence(margin=5, origin=ORIGIN)
+    fence.add_polygon(lats, lons)
+    xs, ys = zip(*[fence._project(a, b) for a, b in zip(lats, lons)])
+
+    def naive(x, y):
+        inside = False
+        for i in range(len(xs)):
+            x1, y1, x2, y2 = xs[i], ys[i], xs[i - 1], ys[i - 1]
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    for _ in range(500):
+        lat, lon = at(rng.uniform(-1100, 1100), rng.uniform(-1100, 1100))
+        assert fence.check(lat, lon).breached == (not naive(*fence._project(lat, lon)))
+
+
+def test_update_skips_until_boundary_is_near():
+    fence = make_fence()
+    calls = []
+    evaluate = fence._evaluate
+    fence._evaluate = lambda x, y: calls.append((x, y)) or evaluate(x, y)
+
+    fence.update('a', *at(0, -100))
+    for east in range(-99, -50):
+        assert not fence.update('a', *at(0, east)).breached
+    # 50m clear of everything, 10m margin: one re-evaluation after 40m.
+    assert len(calls) == 2
+    for east in range(-50, 150):
+        fence.update('a', *at(150, east))
+    assert fence.status('a').breached
+    assert len(calls) > 20
+
+
+def test_attach_notifies_attribute_listeners():
+    vehicle = offline_vehicle()
+    fence = make_fence()
+    fence.attach(vehicle)
+    events = []
+    vehicle.add_attribute_listener('fence_breach', lambda v, name, value: events.append((name, value)))
+    vehicle.add_attribute_listener('fence_near_breach', lambda v, name, value: events.append((name, value)))
+
+    def position(north, east):
+        lat, lon = at(north, east)
+        receive(vehicle, mavutil.mavlink.MAVLink_global_position_int_message(
+            0, int(round(lat * 1e7)), int(round(lon * 1e7)), 0, 0, 0, 0, 0, 0))
+
+    position(0, 0)
+    position(1, 0)
+    position(0, 495)
+    position(0, 510)
+    assert events == [('fence_breach', False), ('fence_near_breach', False),
+                      ('fence_near_breach', True), ('fence_breach', True), ('fence_near_breach', False)]
+    assert fence.status(vehicle).zone == 0
+
+    fence.detach(vehicle)
+    position(0, 0)
+    assert fence.status(vehicle) is None
+
+
+def test_from_fence_sequence():
+    vehicle = offline_vehicle()
+    lats, lons = square(-500, -500, 1000)
+    vehicle.fence.add_polygon(lats, lons)
+    vehicle.fence.add_circle(*at(0, 0), radius=20, inclusion=False)
+    fence = Geofence.from_fence(vehicle.fence, origin=ORIGIN)
+    assert fence.check(*at(0, 0)).breached
+    assert not fence.check(*at(0, 100)).breached
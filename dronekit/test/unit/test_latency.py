@@ -0,0 +1,85 @@
+import random
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import connect
+from dronekit.latency import LatencyHistogram, LatencyTracer
+from dronekit.mock_autopilot import MockAutopilot
+from dronekit.timesync import TimeSync
+
+
+def test_histogram_percentiles():
+    rng = random.Random(1)
+    values = [int(rng.lognormvariate(14, 2)) for _ in range(10000)]
+    histogram = LatencyHistogram()
+    for ns in values:
+        histogram.record(ns)
+    values.sort()
+    for p in (1, 50, 90, 99, 99.9):
+        exact = values[int(p / 100.0 * len(values)) - 1] * 1e-9
+        assert histogram.percentile(p) == pytest.approx(exact, rel=0.07)
+    assert histogram.count == 10000
+    assert histogram.max == values[-1] * 1e-9 and histogram.min == values[0] * 1e-9
+    assert histogram.mean == pytest.approx(sum(values) / 1e4 * 1e-9)
+    assert sum(count for _, _, count in histogram.buckets()) == 10000
+    assert LatencyHistogram().percentile(50) == 0
+
+
+def stamped(boot_ms, receive_ns):
+    msg = mavutil.mavlink.MAVLink_attitude_message(boot_ms, 0, 0, 0, 0, 0, 0)
+    msg._receive_ns = receive_ns
+    msg._parse_ns = receive_ns + 1000
+    msg._dispatch_ns = receive_ns + 3000
+    return msg
+
+
+def test_tracer_stages_and_transit():
+    tracer = LatencyTracer(boot_time=True)
+    # Sent every 10 ms; the third message is 4 ms late, then the vehicle reboots.
+    for boot_ms, delay_ms in ((0, 5), (10, 5), (20, 9), (30, 5), (5, 105)):
+        tracer.record(stamped(boot_ms, (1000 + boot_ms + delay_ms) * 1000000), 0)
+    assert tracer.histogram('parse').percentile(50) == pytest.approx(1e-6, rel=0.07)
+    assert tracer.histogram('dispatch', 'ATTITUDE').percentile(50) == pytest.approx(2e-6, rel=0.07)
+    transit = tracer.histogram('transit', 'ATTITUDE')
+    assert transit.count == 5
+    assert transit.max == pytest.approx(0.004)
+    assert transit.percentile(50) == 0
+    assert tracer.types == ['ATTITUDE']
+    assert 'ATTITUDE' in tracer.report()
+    with pytest.raises(ValueError):
+        tracer.histogram('wire')
+
+
+def test_vehicle_latency_tracing():
+    with MockAutopilot(streams={'ATTITUDE': 50}, latency=0.005, jitter=0.01, seed=2) as mock:
+        vehicle = connect(mock.connection_string, wait_ready=False, heartbeat_timeout=10)
+        try:
+            stamps = []
+            vehicle.add_message_listener('ATTITUDE', lambda _, name, msg: stamps.append(
+                (msg._receive_ns, msg._dispatch_ns)))
+            tracer = vehicle.enable_latency_tracing(boot_time=True)
+            time.sleep(1)
+            assert vehicle.disable_latency_tracing() is tracer
+        finally:
+            vehicle.close()
+
+    assert stamps and all(receive <= dispatch for receive, dispatch in stamps)
+    total = tracer.histogram('total', 'ATTITUDE')
+    assert total.count >= 30
+    assert total.percentile(99) < 0.02
+    # Jitter of up to 10 ms in the mock, measured with the 1 ms resolution of time_boot_ms, plus the time
+    # the mock's sending thread waits to be scheduled.
+    transit = tracer.histogram('transit', 'ATTITUDE')
+    assert 0.003 < transit.max < 0.05
+
+
+def test_tracer_transit_with_timesync():
+    timesync = TimeSync(None)
+    timesync._offset, timesync._epoch = -1000 * 1000000, 0
+    tracer = LatencyTracer(boot_time=True, timesync=timesync)
+    for boot_ms, delay_ms in ((0, 5), (10, 7)):
+        tracer.record(stamped(boot_ms, (1000 + boot_ms + delay_ms) * 1000000), 0)
+    transit = tracer.histogram('transit')
+    assert transit.min == pytest.approx(0.005) and transit.max == pytest.approx(0.007)
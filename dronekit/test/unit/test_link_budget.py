@@ -0,0 +1,137 @@
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import connect
+from dronekit.link_budget import BulkPacer, packet_cost
+from dronekit.link_stats import LinkStats, MessageStats
+from dronekit.mock_autopilot import MockAutopilot
+from dronekit.test.unit import offline_vehicle, sent_messages
+
+mavlink = mavutil.mavlink
+mav = mavlink.MAVLink(None, srcSystem=255, srcComponent=0)
+
+
+def packet(msg):
+    return bytes(msg.pack(mav))
+
+
+def test_packet_cost():
+    read = packet(mav.param_request_read_encode(1, 1, b'', 3))
+    assert BulkPacer.accepts(read)
+    assert packet_cost(read) == len(read) + 37
+    log = packet(mav.log_request_data_encode(1, 1, 2, 900, 1800))
+    assert packet_cost(log) == len(log) + 20 * 105
+    assert not BulkPacer.accepts(packet(mav.command_long_encode(1, 1, 400, 0, 1, 0, 0, 0, 0, 0, 0)))
+
+
+def test_pacer_rate():
+    pacer = BulkPacer(rate=1000)
+    read = packet(mav.param_request_read_encode(1, 1, b'', 3))
+    for _ in range(100):
+        pacer.put(read)
+    start = pacer._last
+    released = 0
+    for i in range(1, 201):
+        while pacer.get(start + i * 0.01) is not None:
+            released += 1
+    # Two seconds at 1000 bytes/s.
+    assert released == pytest.approx(2000.0 / packet_cost(read), abs=1)
+    assert len(pacer) == 100 - released
+    assert 0.001 <= pacer.timeout() <= 0.01
+    assert len(pacer.drain()) == 100 - released and pacer.get() is None
+
+
+def snapshot(bytes_sent, telemetry, bulk=0):
+    messages = {'ATTITUDE': MessageStats('ATTITUDE', 0, 0, 0, telemetry, 0, 0),
+                'PARAM_VALUE': MessageStats('PARAM_VALUE', 0, 0, 0, bulk, 0, 0)}
+    return LinkStats(messages, {}, 0, 0, 0, bytes_sent, 0, 0, 0, 0, 0, 1.0)
+
+
+def radio_status(txbuf, rxerrors=0):
+    return mav.radio_status_encode(200, 190, txbuf, 40, 40, rxerrors, 0)
+
+
+def test_congestion_scales_streams_and_bulk():
+    vehicle = offline_vehicle()
+    streams = vehicle.streams
+    streams.subscribe({'ATTITUDE': 50, 'VFR_HUD': 10})
+    streams.subscribe({'GLOBAL_POSITION_INT': 10}, priority=True)
+    budget = vehicle.enable_link_budget()
+    assert vehicle.enable_link_budget() is budget
+    assert vehicle._handler.bulk_pacer is budget.pacer
+
+    # No limit until the radio reports congestion.
+    budget.update(snapshot(0, 3000))
+    assert budget.capacity is None and budget.bulk_rate is None
+
+    budget.handle_radio_status(radio_status(30))
+    budget.handle_radio_status(radio_status(90))
+    budget.update(snapshot(1000, 3000, 1000))
+    assert budget.congested
+    assert budget.capacity == pytest.approx(5000 * 0.75)
+    # 85% of the capacity, less the bulk share, is left for the telemetry.
+    assert budget.stream_scale == pytest.approx((3750 * 0.85 - 3750 * 0.05) / 3000)
+    assert budget.bulk_rate == pytest.approx(3750 * 0.05)
+    rates = streams.rates
+    assert rates['ATTITUDE'] == pytest.approx(50 * budget.stream_scale)
+    assert rates['GLOBAL_POSITION_INT'] == 10
+
+    # Receive errors count as congestion too.
+    budget.handle_radio_status(radio_status(100, 5))
+    budget.handle_radio_status(radio_status(100, 9))
+    budget.update(snapshot(1000, 3000 * budget.stream_scale))
+    assert budget.capacity == pytest.approx(3000 * rates['ATTITUDE'] / 50 * 0.75)
+
+    # The estimate grows back while the radio buffer is clear.
+    capacity = budget.capacity
+    for _ in range(3):
+        budget.handle_radio_status(radio_status(100, 9))
+        budget.update(snapshot(1000, 1000))
+    assert budget.capacity == pytest.approx(capacity * 1.05 ** 3)
+
+    assert vehicle.disable_link_budget() is budget
+    assert vehicle._handler.bulk_pacer is None
+    assert streams.scale == 1.0 and streams.rates['ATTITUDE'] == 50
+
+
+def test_disable_releases_held_packets():
+    vehicle = offline_vehicle()
+    budget = vehicle.enable_link_budget(max_bandwidth=100)
+    budget.pacer.rate = 1
+    vehicle._master.mav.param_request_read_send(1, 1, b'', 3)
+    vehicle._master.mav.command_long_send(1, 1, 400, 0, 1, 0, 0, 0, 0, 0, 0)
+    assert [msg.get_type() for msg in sent_messages(vehicle)] == ['COMMAND_LONG']
+    vehicle.disable_link_budget()
+    assert [msg.get_type() for msg in sent_messages(vehicle)] == ['PARAM_REQUEST_READ']
+
+
+def test_bulk_transfer_paced_behind_commands():
+    with MockAutopilot() as mock:
+        for i in range(20):
+            mock.missions[0].add(mock.mav.mission_item_int_encode(
+                0, 0, i + 1, mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT, mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0,
+                -353600000 + i * 1000, 1491600000, 20))
+        vehicle = connect(mock.connection_string, wait_ready=True, heartbeat_timeout=10)
+        try:
+            budget = vehicle.enable_link_budget(max_bandwidth=2000)
+            vehicle.wait_for(lambda: budget.bulk_rate is not None, timeout=5)
+            acks = []
+            vehicle.add_message_listener('COMMAND_ACK', lambda _, name, msg: acks.append(time.time()))
+
+            start = time.time()
+            vehicle.commands.download()
+            time.sleep(0.3)
+            sent = time.time()
+            vehicle._master.mav.command_long_send(1, 1, mavlink.MAV_CMD_DO_CHANGE_SPEED, 0, 1, 5, -1, 0, 0, 0, 0)
+            vehicle.commands.wait_ready(timeout=10)
+            elapsed = time.time() - start
+            assert vehicle.commands.count == 20
+        finally:
+            vehicle.close()
+
+    # About 21 requests of 63 bytes at (1700 - telemetry) bytes/s, rather than a few milliseconds.
+    assert elapsed > 0.8
+    assert acks and acks[0] - sent < 0.2
+    assert budget.pacer.sent >= 21
@@ -0,0 +1,105 @@
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import connect
+from dronekit.link_stats import LinkCounters
+from dronekit.mock_autopilot import MockAutopilot
+from dronekit.test.unit import offline_vehicle, receive, run_loop
+
+
+def packets(mav, msg, seqs):
+    for seq in seqs:
+        mav.seq = seq
+        buf = msg.pack(mav)
+        yield mavutil.mavlink.MAVLink(None).parse_buffer(buf)[0]
+
+
+def test_counts_rates_gaps_and_jitter():
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    counters = LinkCounters()
+    counters.snapshot(now=100.0)
+    attitude = mav.attitude_encode(0, 0, 0, 0, 0, 0, 0)
+    # Sequence numbers wrap, and 2 packets are missing (255 and 2).
+    seqs = [252, 253, 254, 0, 1, 3, 4]
+    for i, msg in enumerate(packets(mav, attitude, seqs)):
+        # Every 0.1 s, except for one late packet.
+        counters.record(msg, now=100.0 + i * 0.1 + (0.05 if i == 3 else 0))
+
+    other = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=154)
+    for msg in packets(other, other.heartbeat_encode(0, 0, 0, 0, 0), [7, 8]):
+        counters.record(msg, now=100.5)
+
+    stats = counters.snapshot(queue_depth=3, now=101.0)
+    assert stats.interval == pytest.approx(1.0)
+    assert stats.received == 9
+    assert stats.messages['ATTITUDE'].count == 7
+    assert stats.messages['ATTITUDE'].rate == pytest.approx(7)
+    assert stats.messages['ATTITUDE'].bytes == 7 * len(attitude.get_msgbuf())
+    assert stats.messages['ATTITUDE'].interval == pytest.approx(0.1, abs=0.01)
+    assert stats.messages['ATTITUDE'].jitter > 0
+    assert stats.messages['HEARTBEAT'].jitter == 0
+    assert stats.sources[(1, 1)].lost == 2
+    assert stats.sources[(1, 154)].lost == 0
+    assert stats.queue_depth == stats.queue_peak == 3
+
+    # Rates and loss cover the time since the previous snapshot; counts are totals.
+    for msg in packets(mav, attitude, [6, 7]):
+        counters.record(msg, now=101.5)
+    stats = counters.snapshot(now=103.0)
+    assert stats.messages['ATTITUDE'].rate == pytest.approx(1)
+    assert stats.messages['ATTITUDE'].count == 9
+    assert stats.sources[(1, 1)].loss == pytest.approx(1 / 3.0)
+    assert stats.queue_peak == 0
+
+
+def test_parse_errors():
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    buf = bytearray(mav.heartbeat_encode(0, 0, 0, 0, 0).pack(mav))
+    buf[-1] ^= 0xFF
+    parser = mavutil.mavlink.MAVLink(None)
+    parser.robust_parsing = True
+    counters = LinkCounters()
+    for msg in parser.parse_buffer(bytes(buf) + b'junk'):
+        counters.record(msg)
+    counters.record_error('invalid MAVLink prefix')
+    stats = counters.snapshot()
+    assert stats.crc_errors == 1
+    assert stats.parse_errors >= 2
+    assert stats.received == 0
+
+
+def test_vehicle_publishes_snapshots():
+    vehicle = offline_vehicle()
+    snapshots = []
+    vehicle.add_attribute_listener('link_stats', lambda _, name, value: snapshots.append(value))
+    assert vehicle.link_stats is None
+
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    for msg in packets(mav, mav.vfr_hud_encode(0, 0, 0, 0, 0, 0), [0, 1]):
+        vehicle._handler.link_stats.record(msg)
+        receive(vehicle, msg)
+    vehicle._link_stats_last -= 1
+    run_loop(vehicle)
+    run_loop(vehicle)
+    assert len(snapshots) == 1
+    assert vehicle.link_stats is snapshots[0]
+    assert vehicle.link_stats.messages['VFR_HUD'].count == 2
+    # The queued GCS heartbeat.
+    assert vehicle.link_stats.queue_depth >= 1
+
+
+def test_lossy_link():
+    with MockAutopilot(streams={'ATTITUDE': 100}, loss=0.2, seed=3) as mock:
+        vehicle = connect(mock.connection_string, wait_ready=False, heartbeat_timeout=10)
+        try:
+            time.sleep(1.5)
+            stats = vehicle.link_stats
+        finally:
+            vehicle.close()
+    source = stats.sources[(1, 1)]
+    assert 0.1 < source.loss < 0.3
+    assert source.lost > 0
+    assert 60 < stats.messages['ATTITUDE'].rate < 100
+    assert stats.sent > 0 and stats.bytes_sent > stats.sent
@@ -0,0 +1,143 @@
+import os
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import APIException
+from dronekit.test.unit import offline_vehicle, receive, sent_messages
+
+mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+
+
+def decode(msg):
+    msg.pack(mav)
+    return mavutil.mavlink.MAVLink(None).parse_buffer(msg.get_msgbuf())[0]
+
+
+def log_data(log_id, data, ofs):
+    chunk = data[ofs:ofs + 90]
+    return decode(mav.log_data_encode(log_id, ofs, len(chunk), list(chunk) + [0] * (90 - len(chunk))))
+
+
+def serve(vehicle, data, download, drop=(), log_id=3, limit=100):
+    """
+    Answer the vehicle's log requests, dropping the chunks at the offsets in ``drop`` the first time.
+
+    When no request is pending, the download is polled with a clock past its retry timeout, so that it
+    retries exactly then, however slow the machine.
+    """
+    dropped = set()
+    requests = []
+    for _ in range(limit):
+        if download.future.done():
+            break
+        pending = [msg for msg in sent_messages(vehicle) if msg.get_type() == 'LOG_REQUEST_DATA']
+        if not pending:
+            download.poll(download._last_activity + download._retry_timeout)
+            continue
+        for msg in pending:
+            requests.append((msg.ofs, msg.count))
+            for ofs in range(msg.ofs, min(msg.ofs + msg.count, len(data)), 90):
+                if ofs in drop and ofs not in dropped:
+                    dropped.add(ofs)
+                    continue
+                receive(vehicle, log_data(log_id, data, ofs))
+    return requests
+
+
+def test_list():
+    vehicle = offline_vehicle()
+    future = vehicle.logs.list_async()
+    assert [m.get_type() for m in sent_messages(vehicle)] == ['LOG_REQUEST_LIST']
+    receive(vehicle, decode(mav.log_entry_encode(2, 2, 2, 1500000000, 1000)))
+    assert not future.done()
+    receive(vehicle, decode(mav.log_entry_encode(1, 2, 2, 1400000000, 500)))
+    entries = future.result(0)
+    assert [(e.id, e.size, e.time_utc) for e in entries] == [(1, 500, 1400000000), (2, 1000, 1500000000)]
+    assert vehicle.logs.entries == entries
+
+    future = vehicle.logs.list_async()
+    receive(vehicle, decode(mav.log_entry_encode(0, 0, 0, 0, 0)))
+    assert future.result(0) == []
+
+
+def test_download_fills_gaps(tmpdir):
+    vehicle = offline_vehicle()
+    vehicle.logs.entries = [_entry(3, 10000)]
+    data = os.urandom(10000)
+    path = str(tmpdir.join('log.bin'))
+
+    download = vehicle.logs.download_async(3, path, request_size=4500)
+    requests = serve(vehicle, data, download, drop={900, 4500, 9990})
+    assert download.future.result(0) is download
+    assert open(path, 'rb').read() == data
+    assert not os.path.exists(path + '.partial')
+
+    # Large ranges first, then only the chunks that were lost.
+    assert requests[:3] == [(0, 4500), (4500, 4500), (9000, 1080)]
+    assert sorted(requests[3:]) == [(900, 90), (4500, 90), (9990, 90)]
+    assert download.bytes_received == 10000
+    assert download.fraction == 1.0 and download.throughput > 0
+
+
+def test_download_resumes(tmpdir):
+    vehicle = offline_vehicle()
+    vehicle.logs.entries = [_entry(3, 5000)]
+    data = os.urandom(5000)
+    path = str(tmpdir.join('log.bin'))
+
+    download = vehicle.logs.download_async(3, path, request_size=90 * 10)
+    sent_messages(vehicle)
+    for ofs in range(0, 2700, 90):
+        receive(vehicle, log_data(3, data, ofs))
+    download.cancel()
+    with pytest.raises(APIException):
+        download.future.result(0)
+    assert os.path.exists(path + '.partial')
+    sent_messages(vehicle)
+
+    download = vehicle.logs.download_async(3, path, request_size=90 * 10)
+    assert download.resumed_bytes == 2700
+    requests = serve(vehicle, data, download)
+    download.future.result(0)
+    assert requests[0][0] == 2700
+    assert download.bytes_received == 2300
+    assert open(path, 'rb').read() == data
+
+
+def test_download_saves_bitmap_from_its_own_thread(tmpdir, monkeypatch):
+    from dronekit import logs
+    monkeypatch.setattr(logs, '_SAVE_INTERVAL', 0.01)
+    vehicle = offline_vehicle()
+    vehicle.logs.entries = [_entry(3, 5000)]
+    data = os.urandom(5000)
+    path = str(tmpdir.join('log.bin'))
+
+    download = vehicle.logs.download_async(3, path, request_size=90 * 10)
+    for ofs in (0, 90, 180, 900, 4950):
+        receive(vehicle, log_data(3, data, ofs))
+    # One bit per chunk: 56 chunks in 7 bytes.
+    expected = b'\x07\x04' + b'\x00' * 4 + b'\x80'
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        bitmap = open(path + '.partial', 'rb').read()[logs._partial_header.size:]
+        if bitmap == expected:
+            break
+        time.sleep(0.01)
+    assert bitmap == expected
+    assert open(path, 'rb').read()[:270] == data[:270]
+    download.cancel()
+    assert download._saver is None
+
+
+def test_one_transfer_at_a_time(tmpdir):
+    vehicle = offline_vehicle()
+    vehicle.logs.list_async()
+    with pytest.raises(APIException):
+        vehicle.logs.list_async()
+
+
+def _entry(log_id, size):
+    from dronekit.logs import LogEntry
+    return LogEntry(log_id, size, 1500000000)
@@ -0,0 +1,103 @@
+import io
+import json
+import os
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import mission_io
+from dronekit.mission import MissionStore
+from dronekit.test.unit import offline_vehicle
+
+mavlink = mavutil.mavlink
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'examples', 'mission_import_export',
+                       'mpmission.txt')
+
+
+def load(reader, f, chunk_size=mission_io.CHUNK_SIZE):
+    store = MissionStore()
+    for chunk in reader(f, chunk_size=chunk_size):
+        store.extend(**chunk)
+    return store
+
+
+def make_store(n):
+    store = MissionStore()
+    store.extend(command=mavlink.MAV_CMD_NAV_WAYPOINT, frame=mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                 x=[-353632620 + i for i in range(n)], y=1491652370, z=[30 + i * 0.5 for i in range(n)],
+                 param1=[float('nan')] * n)
+    return store
+
+
+def test_read_wpl_example_file():
+    with open(EXAMPLE) as f:
+        store = load(mission_io.read_wpl, f, chunk_size=2)
+    assert store.count() == 7
+    home = store.row(0)
+    assert (home[9], home[10], home[11]) == (-353632620, 1491652370, 584)
+    assert store.row(1)[2] == mavlink.MAV_CMD_NAV_TAKEOFF
+
+
+def test_read_wpl_rejects_bad_files():
+    with pytest.raises(ValueError):
+        list(mission_io.read_wpl(io.StringIO('QGC WPL 100\n')))
+    with pytest.raises(ValueError):
+        list(mission_io.read_wpl(io.StringIO('QGC WPL 110\n0\t1\t0\t16\n')))
+
+
+@pytest.mark.parametrize('write, read', [(mission_io.write_wpl, mission_io.read_wpl),
+                                         (mission_io.write_plan, mission_io.read_plan)])
+def test_round_trip(write, read):
+    store = make_store(25)
+    f = io.StringIO()
+    write(f, store, chunk_size=10)
+    f.seek(0)
+    result = load(read, f, chunk_size=7)
+
+    assert result.count() == store.count()
+    for i in range(1, store.count()):
+        assert str(result.row(i)) == str(store.row(i))
+
+
+def test_write_plan_is_valid_json():
+    f = io.StringIO()
+    mission_io.write_plan(f, make_store(3), vehicle_type=mavlink.MAV_TYPE_QUADROTOR)
+    plan = json.loads(f.getvalue())
+    assert plan['mission']['vehicleType'] == mavlink.MAV_TYPE_QUADROTOR
+    assert plan['mission']['plannedHomePosition'] == [-35.363262, 149.165237, 30]
+    items = plan['mission']['items']
+    assert [item['doJumpId'] for item in items] == [1, 2]
+    assert items[0]['params'][0] is None
+
+
+def test_read_plan_rejects_complex_items():
+    plan = {'fileType': 'Plan', 'mission': {'items': [{'type': 'ComplexItem'}]}}
+    with pytest.raises(ValueError):
+        list(mission_io.read_plan(io.StringIO(json.dumps(plan))))
+
+
+def test_command_sequence_load_and_save(tmp_path):
+    vehicle = offline_vehicle()
+    vehicle._wploader.add(mavlink.MAVLink_mission_item_int_message(
+        0, 0, 0, 0, mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0, 1, 2, 3))
+    vehicle.commands.load(EXAMPLE)
+    assert vehicle.commands.count == 6
+    assert vehicle._wpts_dirty
+    # The vehicle's home location is kept.
+    assert vehicle._wploader.row(0)[9:] == (1, 2, 3)
+
+    path = str(tmp_path / 'mission.plan')
+    vehicle.commands.save(path)
+    vehicle.commands.load(path)
+    assert vehicle.commands.count == 6
+    assert vehicle.commands[0].command == mavlink.MAV_CMD_NAV_TAKEOFF
+
+
+def test_command_sequence_load_invalid_file(tmp_path):
+    vehicle = offline_vehicle()
+    path = tmp_path / 'mission.txt'
+    path.write_text('not a mission\n')
+    with pytest.raises(ValueError):
+        vehicle.commands.load(str(path))
+    assert vehicle.commands.count == 0
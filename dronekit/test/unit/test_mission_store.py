@@ -0,0 +1,136 @@
+from array import array
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import Command
+from dronekit.mission import MissionStore
+from dronekit.test.unit import offline_vehicle, sent_messages
+
+mavlink = mavutil.mavlink
+
+
+def make_vehicle():
+    vehicle = offline_vehicle()
+    vehicle._wploader.add(mavlink.MAVLink_mission_item_int_message(
+        0, 0, 0, 0, mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0, 0, 0, 0))
+    return vehicle
+
+
+def test_store_extend_and_build_messages():
+    store = MissionStore()
+    store.extend(command=mavlink.MAV_CMD_NAV_WAYPOINT, x=[1, 2, 3], y=array('i', [4, 5, 6]), z=30)
+    assert store.count() == 3
+
+    msg = store.wp(1)
+    assert msg.get_type() == 'MISSION_ITEM_INT'
+    assert (msg.seq, msg.x, msg.y, msg.z, msg.autocontinue) == (1, 2, 5, 30, 1)
+    assert store.wp(3) is None
+
+
+def test_store_rejects_mismatched_columns():
+    store = MissionStore()
+    with pytest.raises(ValueError):
+        store.extend(x=[1, 2], y=[1, 2, 3])
+    with pytest.raises(TypeError):
+        store.extend(latitude=[1])
+    assert store.count() == 0
+
+
+def test_store_replace_keeps_other_fields():
+    store = MissionStore()
+    store.extend(command=16, x=[1, 2, 3], z=[10, 20, 30])
+    store.replace(1, z=[25, 35])
+    assert list(store.column('z')) == [10, 25, 35]
+    assert list(store.column('x')) == [1, 2, 3]
+    with pytest.raises(IndexError):
+        store.replace(2, z=[1, 2])
+
+
+def test_store_accepts_numpy_columns():
+    numpy = pytest.importorskip('numpy')
+    store = MissionStore()
+    store.extend(command=16, x=numpy.arange(1000), z=numpy.full(1000, 12.5))
+    assert store.count() == 1000
+    assert numpy.asarray(store.column('x'))[-1] == 999
+    assert store.row(10)[-1] == 12.5
+
+
+def test_add_many_converts_degrees():
+    vehicle = make_vehicle()
+    vehicle.commands.add_many(mavlink.MAV_CMD_NAV_WAYPOINT, [-35.1, -35.2], [149.1, 149.2], [20, 30])
+    assert vehicle.commands.count == 2
+    assert vehicle._wpts_dirty
+
+    cmd = vehicle.commands[1]
+    assert isinstance(cmd, Command)
+    assert (cmd.x, cmd.y, cmd.z) == (pytest.approx(-35.2), pytest.approx(149.2), 30)
+    assert list(vehicle.commands.column('x')) == [-351000000, -352000000]
+
+
+def test_getitem_slices_and_negative_indices():
+    vehicle = make_vehicle()
+    vehicle.commands.add_many(mavlink.MAV_CMD_NAV_WAYPOINT, [-35.0, -35.5, -36.0], 149.0, 10)
+    assert [c.x for c in vehicle.commands[1:]] == [pytest.approx(-35.5), pytest.approx(-36.0)]
+    assert vehicle.commands[-1].x == pytest.approx(-36.0)
+    with pytest.raises(IndexError):
+        vehicle.commands[3]
+
+
+def test_clear_keeps_home():
+    vehicle = make_vehicle()
+    vehicle.commands.add_many(mavlink.MAV_CMD_NAV_WAYPOINT, [-35.0, -35.5], 149.0, 10)
+    vehicle.commands.clear()
+    assert vehicle.commands.count == 0
+    assert vehicle._wploader.count() == 1
+
+
+def test_replace_many_uses_partial_write():
+    vehicle = make_vehicle()
+    vehicle.commands.add_many(mavlink.MAV_CMD_NAV_WAYPOINT, [-35.0 - i * 1e-4 for i in range(100)], 149.0, 10)
+    vehicle.commands._upload_confirmed()
+
+    vehicle.commands.replace_many(20, alt=[50, 50])
+    assert sorted(vehicle._wpts_edited) == [21, 22]
+    vehicle.commands.upload_async()
+    msgs = sent_messages(vehicle)
+    assert [m.get_type() for m in msgs] == ['MISSION_WRITE_PARTIAL_LIST']
+    assert (msgs[0].start_index, msgs[0].end_index) == (21, 22)
+
+
+def test_replace_many_with_same_values_is_not_dirty():
+    vehicle = make_vehicle()
+    vehicle.commands.add_many(mavlink.MAV_CMD_NAV_WAYPOINT, [-35.0, -35.5], 149.0, 10)
+    vehicle.commands._upload_confirmed()
+    vehicle.commands.replace_many(0, alt=[10, 10])
+    assert not vehicle._wpts_dirty
+
+
+def test_read_modify_write_keeps_coordinates():
+    vehicle = make_vehicle()
+    vehicle._wploader.add(mavlink.MAVLink_mission_item_int_message(
+        0, 0, 1, 0, mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0, -353632600, 1491652300, 10))
+    vehicle.commands._upload_confirmed()
+    vehicle.commands[0] = vehicle.commands[0]
+    assert list(vehicle.commands.column('x')) == [-353632600]
+    assert not vehicle._wpts_dirty
+
+    vehicle.commands.add(vehicle.commands[0])
+    assert list(vehicle.commands.column('y')) == [1491652300, 1491652300]
+
+
+def test_setitem_negative_and_out_of_range_indices():
+    vehicle = make_vehicle()
+    vehicle.commands.add_many(mavlink.MAV_CMD_NAV_WAYPOINT, [-35.0, -35.5], 149.0, 10)
+    cmd = vehicle.commands[0]
+    cmd.z = 99
+    vehicle.commands[-1] = cmd
+    assert list(vehicle.commands.column('z')) == [10, 99]
+    # Home is untouched.
+    assert vehicle._wploader.row(0)[-1] == 0
+    with pytest.raises(IndexError):
+        vehicle.commands[-3] = cmd
+    with pytest.raises(IndexError):
+        vehicle.commands[3] = cmd
+    vehicle.commands[2] = cmd
+    assert vehicle.commands.count == 3
@@ -0,0 +1,160 @@
+import pytest
+from pymavlink import mavutil
+
+from dronekit import Command, MissionNoSpaceError, TimeoutError
+from dronekit.test.unit import offline_vehicle, receive, run_loop, sent_messages
+
+mavlink = mavutil.mavlink
+
+
+def make_vehicle(n):
+    vehicle = offline_vehicle()
+    # Home location, as it would be after a download.
+    vehicle._wploader.add(mavlink.MAVLink_mission_item_int_message(
+        0, 0, 0, 0, mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0, 0, 0, 0))
+    for i in range(n):
+        vehicle.commands.add(Command(0, 0, 0, mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                                     mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0,
+                                     -35.0 + i * 1e-4, 149.0, 30))
+    sent_messages(vehicle)
+    return vehicle
+
+
+def request(vehicle, seq):
+    receive(vehicle, mavlink.MAVLink_mission_request_int_message(255, 0, seq))
+
+
+def ack(vehicle, result=mavlink.MAV_MISSION_ACCEPTED):
+    receive(vehicle, mavlink.MAVLink_mission_ack_message(255, 0, result))
+
+
+def test_upload_completes_on_ack():
+    vehicle = make_vehicle(3)
+    progress = []
+    future = vehicle.commands.upload_async(progress=lambda sent, count: progress.append((sent, count)))
+
+    msgs = sent_messages(vehicle)
+    assert [m.get_type() for m in msgs] == ['MISSION_COUNT']
+    assert msgs[0].count == 4
+
+    for seq in range(4):
+        request(vehicle, seq)
+    items = sent_messages(vehicle)
+    assert [m.seq for m in items] == [0, 1, 2, 3]
+    assert not future.done()
+
+    ack(vehicle)
+    assert future.result(0) == 4
+    assert progress[-1] == (4, 4)
+    assert not vehicle._wpts_dirty
+    assert vehicle._mission_upload is None
+
+
+def test_upload_error_ack_raises_typed_exception():
+    vehicle = make_vehicle(2)
+    future = vehicle.commands.upload_async()
+    ack(vehicle, mavlink.MAV_MISSION_NO_SPACE)
+
+    with pytest.raises(MissionNoSpaceError) as excinfo:
+        future.result(0)
+    assert excinfo.value.result == mavlink.MAV_MISSION_NO_SPACE
+    assert vehicle._wpts_dirty
+
+
+def test_upload_ignores_stale_ack():
+    vehicle = make_vehicle(2)
+    future = vehicle.commands.upload_async()
+    request(vehicle, 0)
+    ack(vehicle)
+    assert not future.done()
+
+
+def test_upload_retransmits_count_then_times_out():
+    vehicle = make_vehicle(1)
+    future = vehicle.commands.upload_async(retries=2, retry_timeout=0)
+    sent_messages(vehicle)
+
+    run_loop(vehicle)
+    assert 'MISSION_COUNT' in [m.get_type() for m in sent_messages(vehicle)]
+
+    run_loop(vehicle)
+    run_loop(vehicle)
+    with pytest.raises(TimeoutError):
+        future.result(0)
+
+
+def test_upload_retransmits_last_item():
+    vehicle = make_vehicle(2)
+    vehicle.commands.upload_async(retry_timeout=0)
+    request(vehicle, 1)
+    sent_messages(vehicle)
+
+    run_loop(vehicle)
+    items = [m for m in sent_messages(vehicle) if m.get_type() == 'MISSION_ITEM_INT']
+    assert [m.seq for m in items] == [1]
+
+
+def edited(vehicle, index):
+    cmd = vehicle.commands[index]
+    cmd.z += 10
+    vehicle.commands[index] = cmd
+
+
+def test_edits_use_partial_write():
+    vehicle = make_vehicle(50)
+    vehicle.commands._upload_confirmed()
+    edited(vehicle, 5)
+    edited(vehicle, 7)
+
+    future = vehicle.commands.upload_async()
+    msgs = sent_messages(vehicle)
+    assert [m.get_type() for m in msgs] == ['MISSION_WRITE_PARTIAL_LIST']
+    assert (msgs[0].start_index, msgs[0].end_index) == (6, 8)
+
+    for seq in (6, 7, 8):
+        request(vehicle, seq)
+    assert [m.seq for m in sent_messages(vehicle)] == [6, 7, 8]
+    ack(vehicle)
+    assert future.result(0) == 3
+    assert not vehicle._wpts_dirty
+    assert vehicle._wpts_edited == {}
+
+
+def test_reverted_edit_is_not_uploaded():
+    vehicle = make_vehicle(10)
+    vehicle.commands._upload_confirmed()
+    original = vehicle.commands[3]
+    edited(vehicle, 3)
+    assert vehicle._wpts_dirty
+    vehicle.commands[3] = original
+    assert not vehicle._wpts_dirty
+
+    vehicle.commands.upload_async().result(0)
+    assert sent_messages(vehicle) == []
+
+
+def test_rejected_partial_write_falls_back_to_full_upload():
+    vehicle = make_vehicle(10)
+    vehicle.commands._upload_confirmed()
+    edited(vehicle, 2)
+
+    future = vehicle.commands.upload_async()
+    sent_messages(vehicle)
+    ack(vehicle, mavlink.MAV_MISSION_UNSUPPORTED)
+
+    msgs = sent_messages(vehicle)
+    assert [m.get_type() for m in msgs] == ['MISSION_COUNT']
+    for seq in range(11):
+        request(vehicle, seq)
+    ack(vehicle)
+    assert future.result(0) == 11
+
+
+def test_add_forces_full_upload():
+    vehicle = make_vehicle(10)
+    vehicle.commands._upload_confirmed()
+    edited(vehicle, 2)
+    vehicle.commands.add(vehicle.commands[0])
+
+    vehicle.commands.upload_async()
+    assert [m.get_type() for m in sent_messages(vehicle)] == ['MISSION_COUNT']
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import Command, VehicleMode, connect
+from dronekit.mock_autopilot import MockAutopilot
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.mark.parametrize('protocol', ['udp', 'tcp'])
+def test_connect_wait_ready(protocol):
+    with MockAutopilot(protocol=protocol) as mock:
+        vehicle = connect(mock.connection_string, wait_ready=True, heartbeat_timeout=10)
+        try:
+            assert vehicle.mode.name == 'STABILIZE'
+            assert vehicle.is_armable
+            assert vehicle.parameters['RTL_ALT'] == 1500
+            assert vehicle.location.global_frame.lat == pytest.approx(mock.lat)
+        finally:
+            vehicle.close()
+
+
+def test_parameters_commands_and_modes():
+    with MockAutopilot() as mock:
+        vehicle = connect(mock.connection_string, wait_ready=True, heartbeat_timeout=10)
+        try:
+            vehicle.parameters['THR_MIN'] = 100
+            assert mock.params['THR_MIN'] == 100
+
+            acks = []
+            vehicle.add_message_listener('COMMAND_ACK', lambda _, name, msg: acks.append(msg))
+            vehicle.armed = True
+            assert wait_for(lambda: vehicle.armed)
+            assert mock.armed
+            assert acks[0].command == mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM
+            assert acks[0].result == mavutil.mavlink.MAV_RESULT_ACCEPTED
+
+            vehicle.mode = VehicleMode('GUIDED')
+            assert wait_for(lambda: vehicle.mode.name == 'GUIDED')
+
+            # Unhandled commands are accepted too, and logged.
+            vehicle.send_mavlink(vehicle.message_factory.command_long_encode(
+                0, 0, mavutil.mavlink.MAV_CMD_DO_CHANGE_SPEED, 0, 1, 5, -1, 0, 0, 0, 0))
+            assert wait_for(lambda: mock.commands[-1].command == mavutil.mavlink.MAV_CMD_DO_CHANGE_SPEED)
+            assert mock.commands[-1].param2 == 5
+        finally:
+            vehicle.close()
+
+
+def test_mission_upload_and_download():
+    with MockAutopilot() as mock:
+        vehicle = connect(mock.connection_string, wait_ready=True, heartbeat_timeout=10)
+        try:
+            cmds = vehicle.commands
+            cmds.download()
+            cmds.wait_ready()
+            assert cmds.count == 0
+            cmds.clear()
+            for i in range(20):
+                cmds.add(Command(0, 0, 0, mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                                 mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, 0, 0, 0, 0, 0, 0,
+                                 -35.36 + i * 1e-4, 149.16, 20))
+            cmds.upload()
+            assert mock.missions[0].count() == 21
+            assert mock.missions[0].wp(20).x == int(round((-35.36 + 19 * 1e-4) * 1e7))
+
+            mock.missions[0].truncate(11)
+            cmds.download()
+            cmds.wait_ready()
+            assert cmds.count == 10
+            assert cmds[9].x == pytest.approx(-35.36 + 9 * 1e-4)
+        finally:
+            vehicle.close()
+
+
+def test_stream_rates_and_loss():
+    with MockAutopilot(streams={'ATTITUDE': 200}, loss=0.5, seed=1) as mock:
+        vehicle = connect(mock.connection_string, wait_ready=False, heartbeat_timeout=10)
+        try:
+            received = []
+            vehicle.add_message_listener('ATTITUDE', lambda _, name, msg: received.append(msg))
+            time.sleep(1)
+        finally:
+            vehicle.close()
+    assert mock.stream_rate('ATTITUDE') == 200
+    # Half of the 200 messages a second are lost.
+    assert 60 < len(received) < 140
+    assert mock.dropped_sent > 50 and mock.dropped_received > 0
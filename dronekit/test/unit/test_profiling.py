@@ -0,0 +1,71 @@
+import logging
+import time
+
+from pymavlink import mavutil
+
+from dronekit import Vehicle
+from dronekit.test.unit import offline_vehicle, receive
+
+mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+
+
+def slow_listener(self, name, msg):
+    time.sleep(0.02)
+
+
+def fast_listener(self, name, value):
+    pass
+
+
+def failing_listener(self, name, value):
+    raise ValueError('listener bug')
+
+
+def test_profiles_message_and_attribute_listeners(caplog):
+    vehicle = offline_vehicle()
+    vehicle.add_message_listener('VFR_HUD', slow_listener)
+    vehicle.add_attribute_listener('groundspeed', fast_listener)
+    vehicle.add_attribute_listener('*', failing_listener)
+    vehicle.parameters.add_attribute_listener('THR_MIN', fast_listener)
+
+    profiler = vehicle.enable_listener_profiling(slow_threshold=0.01)
+    with caplog.at_level(logging.WARNING, logger='dronekit.profiling'):
+        for i in range(3):
+            receive(vehicle, mav.vfr_hud_encode(0, i, 0, 0, 0, 0))
+    vehicle.parameters.notify_attribute_listeners('thr_min', 100, cache=True)
+    vehicle.parameters.notify_attribute_listeners('thr_min', 100, cache=True)
+
+    listeners = dict((s.name, s) for s in profiler.listeners)
+    slow = listeners[__name__ + '.slow_listener']
+    assert slow.count == 3 and slow.slow == 3
+    assert 0.02 <= slow.wall_max < 1 and slow.wall >= 0.06
+    assert slow.cpu < slow.wall
+    # The groundspeed listener, and the THR_MIN listener once (the repeated value is cached).
+    assert listeners[__name__ + '.fast_listener'].count == 4
+    # Exceptions are logged as before, and the calls still counted.
+    assert listeners[__name__ + '.failing_listener'].count > 0
+
+    names = dict(((s.kind, s.name), s) for s in profiler.names)
+    assert names[('message', 'VFR_HUD')].wall >= 0.06
+    assert names[('attribute', 'THR_MIN')].count == 1
+    # Only the warnings about this listener: the vehicle's own listeners can be slow on a loaded machine.
+    warnings = [r.getMessage() for r in caplog.records]
+    assert len([w for w in warnings if w.startswith('Slow message listener %s.slow_listener ' % __name__)]) == 3
+
+    report = profiler.report(limit=2).splitlines()
+    assert 'slow_listener' in report[1]
+    assert 'VFR_HUD' in report[5]
+
+
+def test_disable_restores_notification_methods():
+    vehicle = offline_vehicle()
+    profiler = vehicle.enable_listener_profiling()
+    assert vehicle.enable_listener_profiling() is profiler
+    assert vehicle.disable_listener_profiling() is profiler
+    assert vehicle.notify_message_listeners.__func__ is Vehicle.notify_message_listeners
+    assert 'notify_attribute_listeners' not in vars(vehicle)
+    assert 'notify_attribute_listeners' not in vars(vehicle.parameters)
+    assert vehicle.disable_listener_profiling() is None
+
+    receive(vehicle, mav.vfr_hud_encode(0, 1, 0, 0, 0, 0))
+    assert profiler.names == []
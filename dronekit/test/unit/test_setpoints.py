@@ -0,0 +1,112 @@
+import math
+import threading
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import LocationGlobalRelative, connect
+from dronekit.mock_autopilot import MockAutopilot
+from dronekit.test.unit import offline_vehicle, sent_messages
+
+mavlink = mavutil.mavlink
+
+
+def test_streams_latest_target_with_fresh_sequence_numbers():
+    vehicle = offline_vehicle()
+    setpoints = vehicle.setpoints
+    assert vehicle.setpoints is setpoints
+    vehicle._handler.target_system = 3
+    setpoints.set_velocity(1.5, -2, 0.5, yaw_rate=10)
+    setpoints.start(rate=200)
+    assert setpoints.running and setpoints.rate == pytest.approx(200)
+    time.sleep(0.1)
+    setpoints.set_location(LocationGlobalRelative(-35.36, 149.16, 20), yaw=90)
+    time.sleep(0.1)
+    setpoints.stop()
+    assert not setpoints.running
+
+    # The parser checks every checksum.
+    sent = sent_messages(vehicle)
+    assert len(sent) == setpoints.sent and len(sent) > 20
+    assert [msg.get_seq() for msg in sent] == [i % 256 for i in range(len(sent))]
+    assert vehicle._master.mav.total_packets_sent == len(sent)
+
+    velocity = sent[0]
+    assert velocity.get_type() == 'SET_POSITION_TARGET_LOCAL_NED'
+    assert velocity.target_system == 3
+    assert (velocity.vx, velocity.vy, velocity.vz) == (1.5, -2, 0.5)
+    assert velocity.yaw_rate == pytest.approx(math.radians(10))
+    assert velocity.type_mask == 0b0000010111000111
+
+    position = sent[-1]
+    assert position.get_type() == 'SET_POSITION_TARGET_GLOBAL_INT'
+    assert (position.lat_int, position.lon_int, position.alt) == (-353600000, 1491600000, 20)
+    assert position.coordinate_frame == mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+    assert position.type_mask == 0b0000100111111000
+    assert setpoints.target is not None and setpoints.target.get_type() == 'SET_POSITION_TARGET_GLOBAL_INT'
+
+    # Nothing is sent without a target.
+    setpoints.clear()
+    setpoints.start(rate=200)
+    time.sleep(0.05)
+    setpoints.stop()
+    assert sent_messages(vehicle) == [] and setpoints.sent == 0
+
+
+def test_attitude_quaternion():
+    vehicle = offline_vehicle()
+    vehicle.setpoints.set_attitude(roll=10, pitch=-5, yaw=90, thrust=0.6)
+    msg = vehicle.setpoints.target
+    assert msg.type_mask == 0b00000111 and msg.thrust == pytest.approx(0.6)
+    w, x, y, z = msg.q
+    roll = math.degrees(math.atan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y)))
+    pitch = math.degrees(math.asin(2 * (w * y - z * x)))
+    yaw = math.degrees(math.atan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z)))
+    assert (roll, pitch, yaw) == (pytest.approx(10), pytest.approx(-5), pytest.approx(90))
+
+
+def test_late_deadlines_are_skipped():
+    vehicle = offline_vehicle()
+    setpoints = vehicle.setpoints
+    setpoints.set_position(10, 0, -5)
+    stalled = threading.Event()
+
+    class Slow(object):
+        # A target that stalls the streamer thread once, for three periods.
+        msg = setpoints.target
+        packed = setpoints._target
+
+        def send(self):
+            if not stalled.is_set():
+                stalled.set()
+                time.sleep(0.03)
+            self.packed.send()
+
+    setpoints._target = Slow()
+    setpoints.start(rate=100)
+    time.sleep(0.1)
+    setpoints.stop()
+    assert stalled.is_set()
+    assert 2 <= setpoints.missed <= 4
+    # Sends caught up with the schedule instead of bursting.
+    assert setpoints.sent + setpoints.missed == pytest.approx(10, abs=2)
+
+
+def test_rate_with_mock():
+    received = []
+    with MockAutopilot() as mock:
+        mock.add_handler('SET_POSITION_TARGET_LOCAL_NED', lambda mock, msg: received.append(msg))
+        vehicle = connect(mock.connection_string, wait_ready=False, heartbeat_timeout=10)
+        try:
+            setpoints = vehicle.setpoints
+            setpoints.set_velocity(0, 0, 0)
+            setpoints.start(rate=50)
+            time.sleep(1)
+        finally:
+            vehicle.close()
+
+    assert not setpoints.running
+    assert len(received) == pytest.approx(50, abs=3)
+    assert setpoints.lateness.count == setpoints.sent
+    assert setpoints.lateness.percentile(50) < 0.02
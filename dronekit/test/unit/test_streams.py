@@ -0,0 +1,148 @@
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import connect
+from dronekit.mock_autopilot import MockAutopilot
+from dronekit.test.unit import offline_vehicle, receive, sent_messages
+
+mavlink = mavutil.mavlink
+mav = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+
+
+def sent_intervals(vehicle):
+    return [(int(msg.param1), msg.param2) for msg in sent_messages(vehicle)
+            if msg.get_type() == 'COMMAND_LONG' and msg.command == mavlink.MAV_CMD_SET_MESSAGE_INTERVAL]
+
+
+def ack(vehicle, result=mavlink.MAV_RESULT_ACCEPTED):
+    receive(vehicle, mav.command_ack_encode(mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, result))
+
+
+def test_aggregates_subscriptions_one_command_at_a_time():
+    vehicle = offline_vehicle()
+    streams = vehicle.streams
+    logger = streams.subscribe({'ATTITUDE': 10, 'SYS_STATUS': 1})
+    control = streams.subscribe({'ATTITUDE': 50})
+    assert streams.rates == {'ATTITUDE': 50, 'SYS_STATUS': 1}
+    with pytest.raises(ValueError):
+        streams.subscribe({'NOT_A_MESSAGE': 1})
+
+    streams._poll(0)
+    assert sent_intervals(vehicle) == [(mavlink.MAVLINK_MSG_ID_ATTITUDE, 20000)]
+    # Nothing else is sent until the ACK arrives.
+    streams._poll(0.1)
+    assert sent_intervals(vehicle) == []
+    ack(vehicle)
+    streams._poll(0.2)
+    assert sent_intervals(vehicle) == [(mavlink.MAVLINK_MSG_ID_SYS_STATUS, 1000000)]
+    ack(vehicle)
+    assert streams.applied == {'ATTITUDE': 50, 'SYS_STATUS': 1}
+    assert streams.message_interval is True and not streams.pending
+
+    # ATTITUDE drops to the remaining subscriber's rate, SYS_STATUS returns to the default.
+    control.cancel()
+    logger.update({'ATTITUDE': 10})
+    streams._poll(0.3)
+    ack(vehicle)
+    streams._poll(0.4)
+    ack(vehicle)
+    assert sent_intervals(vehicle) == [(mavlink.MAVLINK_MSG_ID_ATTITUDE, 100000),
+                                       (mavlink.MAVLINK_MSG_ID_SYS_STATUS, 0)]
+    assert streams.applied == {'ATTITUDE': 10}
+
+
+def test_retries_then_falls_back_to_data_streams():
+    vehicle = offline_vehicle()
+    streams = vehicle.streams
+    streams.subscribe({'ATTITUDE': 20, 'VFR_HUD': 2.5, 'GLOBAL_POSITION_INT': 5})
+    for i in range(streams.retries + 2):
+        streams._poll(i * streams.ack_timeout)
+    sent = sent_messages(vehicle)
+    assert len([msg for msg in sent if msg.get_type() == 'COMMAND_LONG']) == streams.retries + 1
+    assert streams.message_interval is False
+
+    requests = dict((msg.req_stream_id, (msg.req_message_rate, msg.start_stop))
+                    for msg in sent if msg.get_type() == 'REQUEST_DATA_STREAM')
+    assert requests == {mavlink.MAV_DATA_STREAM_EXTRA1: (20, 1), mavlink.MAV_DATA_STREAM_EXTRA2: (3, 1),
+                        mavlink.MAV_DATA_STREAM_POSITION: (5, 1)}
+    assert not streams.pending
+
+
+def test_denied_and_unsupported():
+    vehicle = offline_vehicle()
+    streams = vehicle.streams
+    streams.subscribe({'ATTITUDE': 1000, 'SYS_STATUS': 1})
+    streams._poll(0)
+    ack(vehicle, mavlink.MAV_RESULT_DENIED)
+    assert streams.denied == {'ATTITUDE': mavlink.MAV_RESULT_DENIED}
+    streams._poll(0.1)
+    ack(vehicle, mavlink.MAV_RESULT_UNSUPPORTED)
+    assert streams.message_interval is False
+
+    # Exclusive mode stops every stream group, then asks for the groups that are needed.
+    streams.exclusive = True
+    streams._poll(0.2)
+    requests = [(msg.req_stream_id, msg.req_message_rate, msg.start_stop)
+                for msg in sent_messages(vehicle) if msg.get_type() == 'REQUEST_DATA_STREAM']
+    assert requests[0] == (mavlink.MAV_DATA_STREAM_ALL, 0, 0)
+    assert (mavlink.MAV_DATA_STREAM_EXTRA1, 1000, 1) in requests
+    assert (mavlink.MAV_DATA_STREAM_RAW_SENSORS, 0, 0) in requests
+
+
+def test_reapplies_after_link_restored_and_reboot():
+    vehicle = offline_vehicle()
+    streams = vehicle.streams
+    streams.subscribe({'ATTITUDE': 20})
+    streams._poll(0)
+    ack(vehicle)
+    sent_messages(vehicle)
+
+    vehicle._heartbeat_timeout = True
+    streams._poll(1)
+    vehicle._heartbeat_timeout = False
+    streams._poll(2)
+    assert sent_intervals(vehicle) == [(mavlink.MAVLINK_MSG_ID_ATTITUDE, 50000)]
+    ack(vehicle)
+
+    vehicle.timesync.reboots += 1
+    streams._poll(3)
+    streams._poll(3)
+    assert sent_intervals(vehicle) == [(mavlink.MAVLINK_MSG_ID_ATTITUDE, 50000)]
+    assert streams.reapplied == 2
+
+
+def test_vehicle_rates_with_mock():
+    with MockAutopilot(streams={'ATTITUDE': 5, 'VFR_HUD': 4}) as mock:
+        vehicle = connect(mock.connection_string, wait_ready=False, heartbeat_timeout=10)
+        try:
+            streams = vehicle.streams
+            streams.verify_interval = 0.5
+            streams.subscribe({'ATTITUDE': 40, 'VFR_HUD': 0})
+            streams.wait_applied(timeout=5)
+            assert mock.stream_rate('ATTITUDE') == pytest.approx(40)
+            assert mock.stream_rate('VFR_HUD') == 0
+
+            # The autopilot forgets the rate, for example after a reboot without TIMESYNC.
+            mock.set_stream('ATTITUDE', 0)
+            vehicle.wait_for(lambda: mock.stream_rate('ATTITUDE'), timeout=5)
+            assert mock.stream_rate('ATTITUDE') == pytest.approx(40)
+            assert streams.reapplied >= 1
+        finally:
+            vehicle.close()
+
+
+def test_vehicle_fallback_with_mock():
+    with MockAutopilot(data_streams=True) as mock:
+        mock.command_handlers[mavlink.MAV_CMD_SET_MESSAGE_INTERVAL] = \
+            lambda mock, msg: mavlink.MAV_RESULT_UNSUPPORTED
+        vehicle = connect(mock.connection_string, wait_ready=False, heartbeat_timeout=10)
+        try:
+            vehicle.streams.subscribe({'ATTITUDE': 25})
+            vehicle.streams.wait_applied(timeout=5)
+            time.sleep(0.2)
+            assert vehicle.streams.message_interval is False
+            assert mock.stream_rate('ATTITUDE') == 25
+        finally:
+            vehicle.close()
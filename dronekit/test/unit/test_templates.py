@@ -0,0 +1,72 @@
+import pytest
+from pymavlink import mavutil
+
+from dronekit.test.unit import offline_vehicle, sent_messages
+
+mavlink = mavutil.mavlink
+
+
+def test_updates_and_sends_valid_packets():
+    vehicle = offline_vehicle()
+    vehicle._handler.target_system = 7
+    template = vehicle.message_template(vehicle.message_factory.set_position_target_local_ned_encode(
+        0, 0, 0, mavlink.MAV_FRAME_LOCAL_NED, 0b0000111111000111, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+    assert template.msg.target_system == 7
+
+    # Every sequence number, with and without field updates; the parser checks every checksum.
+    for i in range(300):
+        if i % 3:
+            template.send()
+        else:
+            template.send(vx=i / 10.0, vz=-1.0, time_boot_ms=i)
+    sent = sent_messages(vehicle)
+    assert [msg.get_seq() for msg in sent] == [i % 256 for i in range(300)]
+    assert vehicle._master.mav.total_packets_sent == 300
+    assert vehicle._master.mav.total_bytes_sent == 300 * len(template)
+    last = sent[-1]
+    assert last.vx == pytest.approx(29.7) and (last.vz, last.time_boot_ms, last.target_system) == (-1.0, 297, 7)
+    assert (last.type_mask, last.coordinate_frame) == (0b0000111111000111, mavlink.MAV_FRAME_LOCAL_NED)
+
+    with pytest.raises(ValueError):
+        template.update(velocity=1)
+
+
+def test_arrays_and_strings_match_normal_packing():
+    vehicle = offline_vehicle()
+    mav = vehicle._master.mav
+    factory = vehicle.message_factory
+    attitude = vehicle.message_template(factory.set_attitude_target_encode(0, 0, 0, 7, [1, 0, 0, 0], 0, 0, 0, 0.5))
+    attitude.update(q=[0.5, 0.5, -0.5, 0.5], thrust=0.75)
+    param = vehicle.message_template(factory.param_set_encode(0, 0, b'WPNAV_SPEED', 500, 9))
+    param.update(param_id='RTL_ALT')
+    attitude.send()
+    param.send()
+
+    decoded = sent_messages(vehicle)
+    assert decoded[0].q == [0.5, 0.5, -0.5, 0.5] and decoded[0].thrust == 0.75
+    assert decoded[1].param_id == 'RTL_ALT' and decoded[1].param_value == 500
+
+    # The same bytes as a normal pack, apart from MAVLink 2 dropping trailing zeros.
+    expected = bytearray(param.msg.pack(mav))
+    packet = bytearray(param.pack())
+    if packet[0] == mavlink.PROTOCOL_MARKER_V2:
+        assert packet[10:10 + expected[1]] == expected[10:-2]
+    else:
+        assert packet == expected
+
+
+def test_signed_connection_packs_from_scratch():
+    vehicle = offline_vehicle()
+    mav = vehicle._master.mav
+    if not hasattr(mav, 'signing') or mavlink.WIRE_PROTOCOL_VERSION != '2.0':
+        pytest.skip('MAVLink 2 only')
+    template = vehicle.message_template(vehicle.message_factory.rc_channels_override_encode(
+        0, 0, 1500, 1500, 1000, 1500, 0, 0, 0, 0))
+    mav.signing.secret_key = b'\x01' * 32
+    mav.signing.link_id = 1
+    mav.signing.timestamp = 1
+    mav.signing.sign_outgoing = True
+    template.send(chan3_raw=1200)
+    packet = bytearray(vehicle._handler.out_queue.get())
+    assert packet[2] & mavlink.MAVLINK_IFLAG_SIGNED
+    assert len(packet) == len(bytearray(template.msg.pack(mav)))
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import connect
+from dronekit.mock_autopilot import MockAutopilot
+from dronekit.test.unit import offline_vehicle, receive, run_loop, sent_messages
+from dronekit.timesync import TimeSync
+
+mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+
+S = 1000000000
+
+
+def exchange(timesync, now_ns, boot_ns, rtt_ns):
+    sent = []
+    timesync._send = lambda tc1, ts1: sent.append((tc1, ts1))
+    timesync.poll(now_ns)
+    if not sent:
+        return False
+    ts1 = sent[0][1]
+    timesync.handle(mav.timesync_encode(boot_ns(ts1 + rtt_ns // 2), ts1), ts1 + rtt_ns)
+    return True
+
+
+def test_offset_filters_slow_answers():
+    timesync = TimeSync(None)
+    assert not timesync.synced and timesync.to_host_time(1000) is None
+    # The vehicle booted 100 s after the host clock started; one answer is delayed on the way back.
+    for i, rtt in enumerate((2, 2, 30, 2, 3, 2)):
+        assert exchange(timesync, (200 + i) * S, lambda host: host - 100 * S, rtt * 1000000)
+    assert timesync.synced
+    assert timesync.offset == pytest.approx(-100, abs=1e-6)
+    assert timesync.rtt == pytest.approx(0.002)
+    assert timesync.drift == 0
+    assert timesync.to_host_time(5000) == pytest.approx(105)
+    assert timesync.to_host_time(5000, wall=True) == pytest.approx(105 + time.time() - time.monotonic(), abs=1e-3)
+
+
+def test_drift_and_batch_conversion():
+    timesync = TimeSync(None, window=64)
+    # The vehicle clock runs 50 ppm fast.
+    boot = lambda host: int((host - 10 * S) * 1.00005)
+    sent = 0
+    for ms in range(0, 60000, 200):
+        sent += exchange(timesync, 10 * S + ms * 1000000, boot, 1000000)
+    assert sent == 5 + 59
+    assert timesync.drift == pytest.approx(5e-5, rel=1e-3)
+
+    host = 75 * S
+    boot_ms = boot(host) / 1e6
+    assert timesync.to_host_ns(boot(host)) == pytest.approx(host, abs=1000)
+    assert timesync.to_host_times([boot_ms, boot_ms - 1000]) == pytest.approx([75, 75 - 1 / 1.00005], abs=1e-6)
+    numpy = pytest.importorskip('numpy')
+    converted = timesync.to_host_times(numpy.array([boot_ms, boot_ms + 1000]))
+    assert isinstance(converted, numpy.ndarray)
+    assert converted == pytest.approx([75, 75 + 1 / 1.00005], abs=1e-6)
+
+
+def test_reboot_and_unmatched_answers():
+    timesync = TimeSync(None)
+    for i in range(3):
+        exchange(timesync, (10 + i) * S, lambda host: host + 50 * S, 1000000)
+    assert timesync.offset == pytest.approx(50, abs=1e-6)
+    # An answer to someone else's request is ignored.
+    timesync.handle(mav.timesync_encode(1, 12345), 20 * S)
+    assert timesync.offset == pytest.approx(50, abs=1e-6)
+    # After a reboot the vehicle clock restarts from zero.
+    exchange(timesync, 20 * S, lambda host: host - 19 * S, 1000000)
+    assert timesync.offset == pytest.approx(-19, abs=1e-6)
+    assert len(timesync._samples) == 1
+
+
+def test_vehicle_answers_requests_and_polls():
+    vehicle = offline_vehicle()
+    receive(vehicle, mav.timesync_encode(0, 777))
+    run_loop(vehicle)
+    sent = [msg for msg in sent_messages(vehicle) if msg.get_type() == 'TIMESYNC']
+    answers = [msg for msg in sent if msg.tc1 != 0]
+    assert len(answers) == 1 and answers[0].ts1 == 777
+    # And the loop sent a request of its own.
+    assert [msg for msg in sent if msg.tc1 == 0]
+
+
+def test_vehicle_to_host_time():
+    with MockAutopilot(streams={'ATTITUDE': 20}, latency=0.002, clock_rate=1.0001) as mock:
+        vehicle = connect(mock.connection_string, wait_ready=False, heartbeat_timeout=10)
+        try:
+            received = []
+            vehicle.add_message_listener('ATTITUDE', lambda _, name, msg: received.append(
+                (msg.time_boot_ms, msg._receive_ns)))
+            deadline = time.time() + 5
+            while not vehicle.timesync.synced and time.time() < deadline:
+                time.sleep(0.05)
+            time.sleep(1)
+            assert vehicle.timesync.rtt < 0.05
+            # The vehicle clock started with the mock.
+            assert vehicle.timesync.offset == pytest.approx(-mock._start, abs=0.005)
+            assert vehicle.to_host_time(1000) == pytest.approx(mock._start + 1000 / 1.0001 / 1000, abs=0.005)
+            received = received[-10:]
+            times = vehicle.to_host_times([boot_ms for boot_ms, _ in received])
+        finally:
+            vehicle.close()
+
+    # Each message arrives 2 ms (plus scheduling) after the mock stamped it.
+    transit = [receive_ns * 1e-9 - sent for (_, receive_ns), sent in zip(received, times)]
+    assert all(-0.003 < t < 0.02 for t in transit)
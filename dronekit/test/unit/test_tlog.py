@@ -0,0 +1,258 @@
+import gzip
+import lzma
+import socket
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from dronekit import connect
+from dronekit.mavlink import MAVConnection
+from dronekit.tlog import TlogReader, TlogRecorder, wait_replay
+
+
+def heartbeat(seq=0):
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    mav.seq = seq % 256
+    return mav.heartbeat_encode(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0, 0).pack(mav)
+
+
+def read_tlog(path):
+    log = mavutil.mavlink_connection(path)
+    msgs = []
+    while True:
+        msg = log.recv_match()
+        if msg is None:
+            return msgs
+        msgs.append(msg)
+
+
+def test_records_timestamped_packets(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    recorder = TlogRecorder(path)
+    recorder.start()
+    for i in range(10):
+        recorder.record(heartbeat(i), timestamp=1500000000.0 + i)
+    recorder.close()
+
+    msgs = read_tlog(path)
+    assert [m.get_seq() for m in msgs] == list(range(10))
+    assert [m._timestamp for m in msgs] == [1500000000.0 + i for i in range(10)]
+    assert recorder.packets == 10
+    assert recorder.files == [path]
+
+
+def test_rotation_and_compression(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    size = 8 + len(heartbeat())
+    recorder = TlogRecorder(path, max_bytes=4 * size, compression='gzip')
+    for i in range(10):
+        recorder.record(heartbeat(i))
+    recorder.close()
+
+    assert recorder.files == [str(tmpdir.join('flight-%03d.tlog.gz' % n)) for n in (1, 2, 3)]
+    data = b''.join(gzip.open(name).read() for name in recorder.files)
+    assert len(data) == 10 * size
+    assert recorder.bytes_written == 10 * size
+
+
+def test_write_error_at_shutdown_is_logged(tmpdir, caplog):
+    class Failing(TlogRecorder):
+        stopped_drains = 0
+
+        def _drain(self):
+            # The writer thread drains once when woken by close(), then a last time after its loop.
+            if not self._running:
+                self.stopped_drains += 1
+                if self.stopped_drains == 2:
+                    raise IOError('disk full')
+            TlogRecorder._drain(self)
+
+    recorder = Failing(str(tmpdir.join('flight.tlog')), compression='xz', buffer_size=4096, flush_interval=10)
+    recorder.start()
+    recorder.record(heartbeat())
+    time.sleep(0.1)
+    recorder.close()
+    assert recorder.stopped_drains == 2
+    assert recorder._file is None
+    assert 'Exception while writing tlog' in caplog.text
+    assert len(lzma.open(recorder.files[0]).read()) == 8 + len(heartbeat())
+
+
+def test_connection_records_received_packets(tmpdir):
+    path = str(tmpdir.join('link.tlog'))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    connection = MAVConnection('udpin:127.0.0.1:%d' % port, tlog=path)
+    received = []
+    connection.forward_message(lambda _, msg: received.append(msg))
+    connection.start()
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    deadline = time.time() + 5
+    i = 0
+    while len(received) < 3 and time.time() < deadline:
+        sender.sendto(heartbeat(i), ('127.0.0.1', port))
+        i += 1
+        time.sleep(0.02)
+    sender.close()
+    connection.close()
+
+    msgs = read_tlog(path)
+    assert len(received) >= 3
+    assert [m.get_msgbuf() for m in msgs] == [m.get_msgbuf() for m in received]
+
+
+def attitude(roll, seq=0):
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    mav.seq = seq % 256
+    return mav.attitude_encode(0, roll, 0, 0, 0, 0, 0).pack(mav)
+
+
+def write_flight(path, count, interval):
+    recorder = TlogRecorder(path)
+    gcs = mavutil.mavlink.MAVLink(None, srcSystem=255, srcComponent=0)
+    for i in range(count):
+        recorder.record(heartbeat(2 * i), timestamp=1500000000.0 + i * interval)
+        recorder.record(attitude(0.01 * i, 2 * i + 1), timestamp=1500000000.0 + i * interval)
+        # Ground station traffic is in the log too, and must not be replayed.
+        recorder.record(gcs.attitude_encode(0, -1, 0, 0, 0, 0, 0).pack(gcs),
+                        timestamp=1500000000.0 + i * interval)
+    recorder.close()
+
+
+def test_replay_drives_vehicle(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    write_flight(path, 500, 1.0)
+
+    rolls = []
+    vehicle = connect('tlog:' + path, replay_speed=None, replay_capture=True)
+    vehicle.add_attribute_listener('attitude', lambda _, name, value: rolls.append(value.roll))
+    assert wait_replay(vehicle, 10)
+    vehicle.send_mavlink(vehicle.message_factory.command_long_encode(
+        0, 0, mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM, 0, 1, 0, 0, 0, 0, 0, 0))
+    # Commands sent to the vehicle are captured instead of going anywhere.
+    deadline = time.time() + 5
+    while 'COMMAND_LONG' not in sent_types(vehicle) and time.time() < deadline:
+        time.sleep(0.01)
+    vehicle.close()
+
+    assert vehicle.attitude.roll == pytest.approx(4.99)
+    assert len(rolls) == 500 and -1 not in rolls
+    assert 'COMMAND_LONG' in sent_types(vehicle)
+
+
+def sent_types(vehicle):
+    sent = mavutil.mavlink.MAVLink(None).parse_buffer(b''.join(list(vehicle._handler.master.sent)))
+    return [m.get_type() for m in sent or []]
+
+
+def test_close_writes_queued_packets(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    write_flight(path, 10, 1.0)
+    vehicle = connect('tlog:' + path, replay_speed=None, replay_capture=True)
+    for i in range(50):
+        vehicle.send_mavlink(vehicle.message_factory.command_long_encode(
+            0, 0, mavutil.mavlink.MAV_CMD_DO_CHANGE_SPEED, 0, 1, i, -1, 0, 0, 0, 0))
+    vehicle.close()
+    assert sent_types(vehicle).count('COMMAND_LONG') == 50
+
+
+def test_replay_speed(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    write_flight(path, 11, 0.1)
+
+    with TlogReader(path, index_path=False) as log:
+        span = log.end_time - log.start_time
+
+    vehicle = connect('tlog:' + path, replay_speed=4)
+    start = time.time()
+    assert wait_replay(vehicle, 5)
+    elapsed = time.time() - start
+    vehicle.close()
+    # Paced on the timestamps of the log, so never faster than 4x; the upper bound allows for a loaded machine.
+    assert span / 4 * 0.95 < elapsed < span * 2
+
+
+def rolls_of(msgs):
+    return [round(m.roll, 2) for m in msgs]
+
+
+def test_reader_index_and_random_access(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    write_flight(path, 100, 1.0)
+    # Garbage in the middle of the log is skipped.
+    with open(path, 'ab') as f:
+        f.write(b'\x00\xfe\x07garbage')
+    recorder = TlogRecorder(str(tmpdir.join('more.tlog')))
+    recorder.record(attitude(1.0), timestamp=1500000100.0)
+    recorder.close()
+    with open(path, 'ab') as f:
+        f.write(open(str(tmpdir.join('more.tlog')), 'rb').read())
+
+    with TlogReader(path) as log:
+        assert len(log) == 301
+        assert log.start_time == 1500000000.0 and log.end_time == 1500000100.0
+        assert [log[i].get_type() for i in range(3)] == ['HEARTBEAT', 'ATTITUDE', 'ATTITUDE']
+        assert rolls_of(log.messages('ATTITUDE', start=1500000098.0)) == [0.98, -1, 0.99, -1, 1.0]
+        assert len(list(log.indices(['HEARTBEAT', 'ATTITUDE'], end=1500000010.0))) == 30
+        assert log.seek(1500000050.5) == 153
+        offsets = log.offsets
+    assert tmpdir.join('flight.tlog.idx').check()
+
+    # The index is reused.
+    with TlogReader(path) as log:
+        assert log.offsets == offsets
+        assert log.msgids[:3].tolist() == [0, 30, 30]
+
+    with TlogReader(path, index_path=False) as log:
+        assert log.offsets == offsets
+
+
+def test_reader_parallel_map(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    write_flight(path, 100, 1.0)
+    with TlogReader(path) as log:
+        chunks = log.map(rolls_of, 'ATTITUDE', processes=2, chunk_size=30)
+        assert [len(c) for c in chunks] == [30, 30, 30, 30, 30, 30, 20]
+        assert sum(chunks, []) == rolls_of(log.messages('ATTITUDE'))
+
+
+def test_reader_keeps_indexing_across_clock_jumps(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    recorder = TlogRecorder(path)
+    # The clock of the recording computer is set at packet 50.
+    for i in range(100):
+        recorder.record(heartbeat(i), timestamp=(1790000000.0 if i >= 50 else 100.0) + i)
+    recorder.close()
+
+    with TlogReader(path, index_path=False) as log:
+        assert len(log) == 100
+        assert log.discontinuities == [50]
+        assert [log[i].get_seq() for i in (49, 50, 99)] == [49, 50, 99]
+        assert log.timestamps[50] == 1790000050.0
+
+
+def test_reader_resyncs_on_checksums(tmpdir):
+    path = str(tmpdir.join('flight.tlog'))
+    good = attitude(0.5)
+    corrupt = bytearray(attitude(0.25, 1))
+    corrupt[-1] ^= 0xFF
+    recorder = TlogRecorder(path)
+    recorder.record(heartbeat(), timestamp=1500000000.0)
+    recorder.record(bytes(corrupt), timestamp=1500000001.0)
+    recorder.record(good, timestamp=1500000002.0)
+    recorder.close()
+    with open(path, 'ab') as f:
+        # Garbage that looks like the start of a packet, followed by a real one.
+        f.write(b'\xfe\x09\x00\x00\x00\x00\x00\x00\xfe\xfd\x01\x02\x03' + b'\x00' * 20)
+        f.write(open(path, 'rb').read()[:8 + len(heartbeat())])
+
+    with TlogReader(path, index_path=False) as log:
+        assert [log[i].get_type() for i in range(len(log))] == ['HEARTBEAT', 'ATTITUDE', 'HEARTBEAT']
+        assert log[1].roll == 0.5
+        assert log.discontinuities == []
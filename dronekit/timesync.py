@@ -0,0 +1,198 @@
+"""
+Vehicle clock estimation with the MAVLink TIMESYNC protocol.
+
+Timestamps in telemetry (``time_boot_ms`` in ``ATTITUDE``, ``GLOBAL_POSITION_INT`` and so on) count from
+the boot of the autopilot. Every vehicle runs a :py:class:`TimeSync` exchange in the background: once a
+second it sends ``TIMESYNC`` with the host time, and the autopilot answers with its own clock. Each answer
+gives the offset between the clocks, to within half of the round-trip time. The estimate is fitted to the
+answers with the shortest round trips, with a linear term for the drift of the autopilot's crystal, so
+it stays within a fraction of a millisecond on a good link:
+
+.. code:: python
+
+    @vehicle.on_message('ATTITUDE')
+    def listener(self, name, msg):
+        # time.monotonic() at which the autopilot measured the attitude
+        measured = vehicle.to_host_time(msg.time_boot_ms)
+
+Host times are ``time.monotonic()`` seconds by default, or ``time.time()`` seconds with ``wall=True``.
+"""
+
+import time
+
+
+class TimeSync(object):
+    """
+    Estimates the offset and drift of a vehicle's boot clock relative to the host clock.
+
+    Use :py:attr:`Vehicle.timesync <dronekit.Vehicle.timesync>` rather than creating one directly.
+
+    :param send: Function ``send(tc1, ts1)`` sending a ``TIMESYNC`` message.
+    :param float interval: Seconds between requests, once the estimate is established.
+    :param int window: Number of recent answers kept.
+    """
+
+    #: Requests are sent more often until this many answers have been received.
+    fast_samples = 5
+    #: Answers kept for the fit are those whose round trip is at most this factor of the shortest.
+    rtt_tolerance = 1.5
+    #: Minimum span of the answers, in seconds, before the drift is estimated.
+    drift_span = 10.0
+
+    def __init__(self, send, interval=1.0, window=32):
+        self._send = send
+        self.interval = interval
+        self.window = window
+        self.enabled = True
+        #: Number of times the vehicle clock has been seen to restart (the vehicle rebooted).
+        self.reboots = 0
+        self._samples = []
+        self._pending = []
+        self._last_sent = None
+        self._last_vehicle_ns = None
+        # Fitted model: offset_ns = _offset + _drift * (host_ns - _epoch)
+        self._offset = None
+        self._drift = 0.0
+        self._epoch = 0
+
+    def poll(self, now_ns=None):
+        """
+        Send a request if one is due.
+        """
+        if not self.enabled:
+            return
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        interval = self.interval if len(self._samples) >= self.fast_samples else self.interval / 5.0
+        if self._last_sent is not None and now_ns - self._last_sent < interval * 1e9:
+            return
+        self._last_sent = now_ns
+        self._pending = self._pending[-7:] + [now_ns]
+        self._send(0, now_ns)
+
+    def handle(self, msg, now_ns=None):
+        """
+        Handle a ``TIMESYNC`` message from the vehicle.
+        """
+        if now_ns is None:
+            now_ns = getattr(msg, '_receive_ns', None) or time.monotonic_ns()
+        if msg.tc1 == 0:
+            # A request from the vehicle: answer with the host clock.
+            self._send(now_ns, msg.ts1)
+            return
+        if msg.ts1 not in self._pending:
+            return
+        self._pending.remove(msg.ts1)
+
+        rtt = now_ns - msg.ts1
+        host_ns = msg.ts1 + rtt // 2
+        offset = msg.tc1 - host_ns
+        if self._last_vehicle_ns is not None and msg.tc1 < self._last_vehicle_ns:
+            # The vehicle rebooted: the old answers describe a different clock.
+            self._samples = []
+            self.reboots += 1
+        self._last_vehicle_ns = msg.tc1
+        self._samples = self._samples[-(self.window - 1):] + [(host_ns, offset, rtt)]
+        self._fit()
+
+    def reset(self):
+        """
+        Discard the estimate, for example after reconnecting to a different vehicle.
+        """
+        self._samples = []
+        self._pending = []
+        self._last_vehicle_ns = None
+        self._offset = None
+        self._drift = 0.0
+
+    def _fit(self):
+        best = min(rtt for _, _, rtt in self._samples)
+        samples = [(h, o) for h, o, rtt in self._samples if rtt <= best * self.rtt_tolerance + 100000]
+        epoch = samples[-1][0]
+        n = len(samples)
+        mean_h = sum(h - epoch for h, _ in samples) / float(n)
+        mean_o = sum(o for _, o in samples) / float(n)
+        drift = 0.0
+        if n >= 4 and (samples[-1][0] - samples[0][0]) >= self.drift_span * 1e9:
+            sxx = sum((h - epoch - mean_h) ** 2 for h, _ in samples)
+            sxy = sum((h - epoch - mean_h) * (o - mean_o) for h, o in samples)
+            drift = sxy / sxx
+        self._epoch = epoch
+        self._drift = drift
+        self._offset = mean_o - drift * mean_h
+
+    @property
+    def synced(self):
+        """
+        ``True`` once the vehicle has answered at least one request.
+        """
+        return self._offset is not None
+
+    @property
+    def offset(self):
+        """
+        Vehicle boot clock minus host clock (``time.monotonic()``), now, in seconds (``None`` until synced).
+        """
+        if self._offset is None:
+            return None
+        return (self._offset + self._drift * (time.monotonic_ns() - self._epoch)) * 1e-9
+
+    @property
+    def drift(self):
+        """
+        Rate of the vehicle clock relative to the host clock, minus one (``2e-5`` is 20 ppm fast).
+        """
+        return self._drift
+
+    @property
+    def rtt(self):
+        """
+        Shortest round-trip time of the recent answers, in seconds (``None`` until synced).
+        """
+        if not self._samples:
+            return None
+        return min(rtt for _, _, rtt in self._samples) * 1e-9
+
+    def to_host_ns(self, boot_ns):
+        """
+        Convert a vehicle boot time in nanoseconds to ``time.monotonic_ns()`` (``None`` until synced).
+        """
+        if self._offset is None:
+            return None
+        # Solve host = boot - (offset + drift * (host - epoch)) for host.
+        return self._epoch + int(round((boot_ns - self._epoch - self._offset) / (1.0 + self._drift)))
+
+    def to_host_time(self, boot_ms, wall=False):
+        """
+        Convert a vehicle ``time_boot_ms`` to host time in seconds (``None`` until synced).
+
+        :param bool wall: Return ``time.time()`` seconds rather than ``time.monotonic()`` seconds.
+        """
+        host_ns = self.to_host_ns(boot_ms * 1000000)
+        if host_ns is None:
+            return None
+        return host_ns * 1e-9 + (_wall_offset() if wall else 0.0)
+
+    def to_host_times(self, boot_ms, wall=False):
+        """
+        Convert many ``time_boot_ms`` values at once (see :py:func:`to_host_time`).
+
+        :param boot_ms: A sequence, or a NumPy array (converted in one vectorized operation).
+        :returns: A NumPy array of float seconds if ``boot_ms`` is one, otherwise a list (``None`` until
+            synced).
+        """
+        if self._offset is None:
+            return None
+        # host = epoch + (boot - epoch - offset) / (1 + drift), as scale * boot_ms + base in seconds.
+        ratio = 1.0 / (1.0 + self._drift)
+        scale = 1e-3 * ratio
+        base = (self._epoch - (self._epoch + self._offset) * ratio) * 1e-9
+        if wall:
+            base += _wall_offset()
+        if hasattr(boot_ms, 'astype'):
+            return boot_ms.astype('f8') * scale + base
+        return [value * scale + base for value in boot_ms]
+
+
+def _wall_offset():
+    return time.time() - time.monotonic()
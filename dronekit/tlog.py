@@ -0,0 +1,636 @@
+"""
+Telemetry log (tlog) recording and playback.
+
+A tlog is the raw MAVLink byte stream with each packet prefixed by the time it was received, as a
+big-endian 64-bit count of microseconds since the Unix epoch. It is the format written by ground
+stations such as Mission Planner and MAVProxy, and can be read back with
+``pymavlink.mavutil.mavlink_connection(path)``.
+
+:py:class:`TlogRecorder` is normally enabled through :py:func:`connect() <dronekit.connect>`:
+
+.. code:: python
+
+    from dronekit import connect
+    from dronekit.tlog import TlogRecorder
+
+    # Log everything to flight.tlog
+    vehicle = connect('127.0.0.1:14550', tlog='flight.tlog')
+
+    # Start a new gzip-compressed file every 64 MiB or 10 minutes
+    vehicle = connect('127.0.0.1:14550',
+                      tlog=TlogRecorder('flight.tlog', max_bytes=64 << 20, max_seconds=600, compression='gzip'))
+
+The receive thread only appends ``(timestamp, packet)`` to a deque, which needs no lock, so it is never
+held up by disk I/O. A dedicated writer thread drains the deque in batches and writes them through a
+large buffer.
+
+Recorded logs can be played back through a :py:class:`Vehicle <dronekit.Vehicle>` with the ``tlog:``
+connection string (see :py:class:`TlogReplay`):
+
+.. code:: python
+
+    from dronekit.tlog import wait_replay
+
+    vehicle = connect('tlog:flight.tlog', replay_speed=None)
+    vehicle.add_attribute_listener('attitude', attitude_callback)
+    wait_replay(vehicle)
+
+For analysis, :py:class:`TlogReader` gives random access to the messages of a log by time and type:
+
+.. code:: python
+
+    from dronekit.tlog import TlogReader
+
+    log = TlogReader('flight.tlog')
+    for msg in log.messages('GLOBAL_POSITION_INT', start=log.start_time + 60):
+        print(msg.lat, msg.lon)
+"""
+
+import bisect
+import bz2
+import collections
+import gzip
+import io
+import logging
+import lzma
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from array import array
+
+import monotonic
+from pymavlink import mavutil
+
+_COMPRESSION = {
+    'gzip': ('.gz', gzip.open),
+    'bz2': ('.bz2', bz2.open),
+    'xz': ('.xz', lzma.open),
+}
+
+_timestamp = struct.Struct('>Q')
+
+_INDEX_MAGIC = b'DKTLIDX1'
+# magic, size and modification time of the log, number of entries
+_index_header = struct.Struct('<8sqqq')
+# A clock step of more than this between two messages is reported as a discontinuity.
+_MAX_TIMESTAMP_JUMP = 3 * 24 * 60 * 60
+
+
+class TlogRecorder(object):
+    """
+    Writes MAVLink packets to a tlog file from a background thread.
+
+    When ``max_bytes`` or ``max_seconds`` is set the log is split into segments named
+    ``<name>-001.tlog``, ``<name>-002.tlog`` and so on; otherwise everything is written to ``path``.
+    With compression the matching extension (``.gz``, ``.bz2`` or ``.xz``) is appended to each file name.
+
+    :param str path: File name of the log.
+    :param int max_bytes: Start a new segment once this many (uncompressed) bytes have been written.
+    :param float max_seconds: Start a new segment after this many seconds.
+    :param str compression: ``None``, ``'gzip'``, ``'bz2'`` or ``'xz'``.
+    :param bool record_sent: Also record the packets sent to the vehicle (default ``True``), as ground
+        stations do.
+    :param float flush_interval: How often, in seconds, the writer thread drains pending packets.
+    :param int buffer_size: Size of the file write buffer in bytes (of uncompressed data, with ``compression``).
+    """
+
+    def __init__(self, path, max_bytes=None, max_seconds=None, compression=None, record_sent=True,
+                 flush_interval=0.1, buffer_size=1 << 20):
+        if compression is not None and compression not in _COMPRESSION:
+            raise ValueError('Unknown tlog compression %r (expected one of %s)' %
+                             (compression, ', '.join(sorted(_COMPRESSION))))
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compression = compression
+        self.record_sent = record_sent
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+
+        #: Names of the files written so far, oldest first.
+        self.files = []
+        #: Number of packets written.
+        self.packets = 0
+        #: Number of bytes written (before compression).
+        self.bytes_written = 0
+
+        self._logger = logging.getLogger(__name__)
+        self._pending = collections.deque()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+        self._file = None
+        self._segment_bytes = 0
+        self._segment_start = 0
+
+    def record(self, packet, timestamp=None):
+        """
+        Queue a packet for writing. Safe to call from any thread, and never blocks.
+
+        :param bytes packet: The raw MAVLink packet (for example ``msg.get_msgbuf()``).
+        :param float timestamp: Receive time in seconds since the epoch (now, by default).
+        """
+        self._pending.append((time.time() if timestamp is None else timestamp, packet))
+
+    def start(self):
+        """
+        Start the writer thread. Packets recorded before this are kept and written first.
+        """
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='tlog-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """
+        Write out everything recorded so far, close the file and stop the writer thread.
+        """
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        else:
+            self._drain()
+        self._close_file()
+
+    def _segment_name(self):
+        path = self.path
+        if self.max_bytes or self.max_seconds:
+            root, ext = os.path.splitext(path)
+            path = '%s-%03d%s' % (root, len(self.files) + 1, ext or '.tlog')
+        if self.compression:
+            path += _COMPRESSION[self.compression][0]
+        return path
+
+    def _open_file(self):
+        path = self._segment_name()
+        if self.compression:
+            # Buffer in front of the compressor, so that it gets large blocks too.
+            self._file = io.BufferedWriter(_COMPRESSION[self.compression][1](path, 'wb'), self.buffer_size)
+        else:
+            self._file = open(path, 'wb', buffering=self.buffer_size)
+        self.files.append(path)
+        self._segment_bytes = 0
+        self._segment_start = monotonic.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _due_for_rotation(self):
+        if self.max_bytes and self._segment_bytes >= self.max_bytes:
+            return True
+        if self.max_seconds and monotonic.monotonic() - self._segment_start >= self.max_seconds:
+            return True
+        return False
+
+    def _drain(self):
+        pending = self._pending
+        pack = _timestamp.pack
+        chunk = []
+        size = 0
+        while True:
+            try:
+                timestamp, packet = pending.popleft()
+            except IndexError:
+                break
+            if self._file is None:
+                self._open_file()
+            chunk.append(pack(int(timestamp * 1.0e6)))
+            chunk.append(packet)
+            size += 8 + len(packet)
+            self.packets += 1
+            if self.max_bytes and self._segment_bytes + size >= self.max_bytes:
+                self._write(chunk, size)
+                chunk = []
+                size = 0
+                self._close_file()
+        if chunk:
+            self._write(chunk, size)
+        if self._file is not None and self.max_seconds and self._due_for_rotation():
+            self._close_file()
+
+    def _write(self, chunk, size):
+        self._file.write(b''.join(chunk))
+        self._segment_bytes += size
+        self.bytes_written += size
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.flush_interval)
+            try:
+                self._drain()
+            except Exception:
+                self._logger.exception('Exception while writing tlog', exc_info=True)
+        try:
+            self._drain()
+        except Exception:
+            self._logger.exception('Exception while writing tlog', exc_info=True)
+
+
+class TlogReplay(mavutil.mavlogfile):
+    """
+    A connection that plays back a tlog as if the packets were arriving from the vehicle.
+
+    :py:func:`connect() <dronekit.connect>` creates one for ``tlog:<filename>`` connection strings. Playback
+    starts paused, so that listeners can be added to the vehicle before any packets are delivered; start it
+    with :py:func:`start_replay` or :py:func:`wait_replay`. Packets sent by the ground station (those with
+    the connection's own ``source_system``) are skipped, as are packets that cannot be parsed.
+
+    :param str filename: The log to play back. Logs compressed by :py:class:`TlogRecorder` are read directly.
+    :param float speed: Playback speed relative to the recorded timestamps: ``1`` for real time, ``10`` for
+        ten times faster, or ``None`` to deliver packets as fast as they can be handled.
+    :param bool capture: Keep the packets written to the connection in :py:attr:`sent` rather than
+        discarding them.
+    """
+
+    def __init__(self, filename, speed=1.0, capture=False, source_system=255, source_component=0,
+                 use_native=False):
+        mavutil.mavlogfile.__init__(self, filename, source_system=source_system,
+                                    source_component=source_component, use_native=use_native)
+        for ext, opener in _COMPRESSION.values():
+            if filename.endswith(ext):
+                self.f.close()
+                self.f = opener(filename, 'rb')
+                self.filesize = 0
+        self.speed = speed or None
+        #: Packets written to the connection, if ``capture`` is set.
+        self.sent = [] if capture else None
+        #: Set while the log is being played.
+        self.playing = threading.Event()
+        #: Set once the whole log has been delivered.
+        self.finished = threading.Event()
+        self._next = None
+        self._origin = None
+
+    def play(self):
+        """
+        Start (or resume) delivering packets.
+        """
+        self.playing.set()
+
+    def pause(self):
+        """
+        Stop delivering packets until :py:func:`play` is called. Pauses do not count towards playback time.
+        """
+        self.playing.clear()
+        self._origin = None
+
+    def write(self, buf):
+        if self.sent is not None:
+            self.sent.append(buf)
+
+    def _read(self):
+        while True:
+            msg = mavutil.mavlogfile.recv_msg(self)
+            if msg is None:
+                return None
+            if msg.get_type() != 'BAD_DATA' and msg.get_srcSystem() != self.source_system:
+                return msg
+
+    def _peek(self):
+        # The next message to deliver, or None at the end of the log.
+        if self._next is None and not self.finished.is_set():
+            self._next = self._read()
+            if self._next is None:
+                self.finished.set()
+        return self._next
+
+    def _wait(self):
+        # Seconds until the pending message is due.
+        if self.speed is None:
+            return 0
+        now = monotonic.monotonic()
+        if self._origin is None:
+            self._origin = (now, self._next._timestamp)
+        start, first = self._origin
+        return start + (self._next._timestamp - first) / self.speed - now
+
+    def select(self, timeout):
+        if not self.playing.is_set() or self._peek() is None:
+            time.sleep(timeout)
+            return False
+        delay = self._wait()
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+        return True
+
+    def recv_msg(self):
+        if not self.playing.is_set() or self._peek() is None or self._wait() > 0:
+            return None
+        msg, self._next = self._next, None
+        return msg
+
+
+def _replay(vehicle):
+    master = vehicle._handler.master
+    if not isinstance(master, TlogReplay):
+        raise ValueError('Vehicle is not connected to a tlog replay')
+    return master
+
+
+def start_replay(vehicle):
+    """
+    Start playing the log of a vehicle connected with a ``tlog:`` connection string.
+
+    :returns: The :py:class:`TlogReplay` connection, which can be used to pause the replay or to read the
+        captured packets.
+    """
+    replay = _replay(vehicle)
+    replay.play()
+    return replay
+
+
+def wait_replay(vehicle, timeout=None):
+    """
+    Play the log of a vehicle connected with a ``tlog:`` connection string, and wait until every packet
+    has been delivered to the vehicle.
+
+    :returns: ``True`` if the replay finished, ``False`` if ``timeout`` (in seconds) expired first.
+    """
+    return start_replay(vehicle).finished.wait(timeout)
+
+
+def _message_ids(types):
+    # Message ids for a message name or list of names.
+    if isinstance(types, str):
+        types = [types]
+    ids = set()
+    for name in types:
+        msgid = getattr(mavutil.mavlink, 'MAVLINK_MSG_ID_' + name.upper(), None)
+        if msgid is None:
+            raise ValueError('Unknown MAVLink message type %r' % name)
+        ids.add(msgid)
+    return ids
+
+
+def _packet_length(data, i):
+    # Length of the packet after the timestamp at offset i, or None if there is no packet start there.
+    magic = data[i + 8]
+    if magic == 0xFE:
+        return 8 + data[i + 9]
+    if magic == 0xFD:
+        return 12 + data[i + 9] + (13 if data[i + 10] & 0x01 else 0)
+    return None
+
+
+def _scan(data):
+    """
+    Index a tlog held in ``data`` (bytes or mmap), returning ``(offsets, timestamps, msgids)``.
+
+    Each offset is that of the 8-byte timestamp in front of a packet. Bytes that are not a packet with a
+    valid checksum (for example a truncated packet at the end of the log) are skipped, and the scan resyncs
+    on the next valid packet. Timestamps are not checked: they jump when the clock of the recording
+    computer is set.
+    """
+    offsets = array('Q')
+    timestamps = array('d')
+    msgids = array('I')
+    unpack_timestamp = _timestamp.unpack_from
+    x25crc = mavutil.mavlink.x25crc
+    crc_extras = dict((msgid, bytearray([cls.crc_extra])) for msgid, cls in mavutil.mavlink.mavlink_map.items())
+    size = len(data)
+    i = 0
+    while i + 16 <= size:
+        length = _packet_length(data, i)
+        end = i + 8 + length if length is not None else size + 1
+        if end > size:
+            i += 1
+            continue
+        start = i + 8
+        if data[start] == 0xFE:
+            msgid = data[start + 5]
+            crc_end = end - 2
+        else:
+            msgid = data[start + 7] | data[start + 8] << 8 | data[start + 9] << 16
+            crc_end = start + 10 + data[start + 1]
+        crc_extra = crc_extras.get(msgid)
+        if crc_extra is None:
+            # A message the dialect does not know, so its checksum cannot be checked: accept it if
+            # another packet (or the end of the log) follows.
+            if end + 8 < size and data[end + 8] not in (0xFE, 0xFD):
+                i += 1
+                continue
+        else:
+            crc = x25crc(data[start + 1:crc_end])
+            crc.accumulate(crc_extra)
+            if crc.crc != data[crc_end] | data[crc_end + 1] << 8:
+                i += 1
+                continue
+        offsets.append(i)
+        timestamps.append(unpack_timestamp(data, i)[0] * 1.0e-6)
+        msgids.append(msgid)
+        i = end
+    return offsets, timestamps, msgids
+
+
+class TlogReader(object):
+    """
+    Random access to the messages of an (uncompressed) tlog.
+
+    The log is memory-mapped and indexed once: the offset, timestamp and message id of every packet are
+    recorded in a sidecar file (``<path>.idx`` by default) that is reused as long as the log is unchanged.
+    Messages are only decoded when they are read, so iterating over one message type costs nothing for
+    the others.
+
+    :param str path: The log file.
+    :param str index_path: Where to keep the index (``None`` for ``<path>.idx``, ``False`` to not keep one).
+    """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = path + '.idx' if index_path is None else index_path
+        self._file = open(path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._key = (stat.st_size, int(stat.st_mtime * 1e9))
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self._mav = mavutil.mavlink.MAVLink(None)
+        self._mav.robust_parsing = True
+        if not self._load_index():
+            self.offsets, self.timestamps, self.msgids = _scan(self._data)
+            self._save_index()
+
+    def close(self):
+        """
+        Unmap and close the log.
+        """
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        return self.decode(i)
+
+    def _load_index(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as f:
+            header = f.read(_index_header.size)
+            if len(header) != _index_header.size:
+                return False
+            magic, size, mtime, count = _index_header.unpack(header)
+            if magic != _INDEX_MAGIC or (size, mtime) != self._key:
+                return False
+            columns = (array('Q'), array('d'), array('I'))
+            try:
+                for column in columns:
+                    column.fromfile(f, count)
+            except EOFError:
+                return False
+        self.offsets, self.timestamps, self.msgids = columns
+        return True
+
+    def _save_index(self):
+        if not self.index_path:
+            return
+        try:
+            with open(self.index_path, 'wb') as f:
+                f.write(_index_header.pack(_INDEX_MAGIC, self._key[0], self._key[1], len(self.offsets)))
+                for column in (self.offsets, self.timestamps, self.msgids):
+                    column.tofile(f)
+        except (IOError, OSError) as e:
+            logging.getLogger(__name__).debug('Could not save tlog index %s: %s' % (self.index_path, e))
+
+    @property
+    def start_time(self):
+        """
+        Timestamp (seconds since the epoch) of the first message, or ``None`` for an empty log.
+        """
+        return self.timestamps[0] if self.timestamps else None
+
+    @property
+    def end_time(self):
+        """
+        Timestamp (seconds since the epoch) of the last message, or ``None`` for an empty log.
+        """
+        return self.timestamps[-1] if self.timestamps else None
+
+    @property
+    def discontinuities(self):
+        """
+        Indices of the messages at which the clock of the log jumps by more than three days, forwards or
+        backwards. This happens when the recording computer sets its clock during the flight, for example a
+        companion computer without a real-time clock that syncs NTP after boot.
+        """
+        timestamps = self.timestamps
+        return [i for i in range(1, len(timestamps))
+                if abs(timestamps[i] - timestamps[i - 1]) > _MAX_TIMESTAMP_JUMP]
+
+    def seek(self, timestamp):
+        """
+        Return the index of the first message received at or after ``timestamp`` (seconds since the epoch).
+
+        The timestamps are searched by bisection, in the order of the log, so the result is only exact when
+        they are sorted. Packets recorded by the send and receive threads can be a few microseconds out of
+        order, which only moves the result by as many messages. A log whose clock was set during the flight
+        (see :py:attr:`discontinuities`) has to be searched one segment at a time.
+        """
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def packet(self, i):
+        """
+        Return the raw bytes of message ``i``.
+        """
+        offset = self.offsets[i]
+        return self._data[offset + 8:offset + 8 + _packet_length(self._data, offset)]
+
+    def decode(self, i):
+        """
+        Decode message ``i``. Its receive time is in ``msg._timestamp``, as for ``mavutil`` logs.
+        """
+        msg = self._mav.decode(bytearray(self.packet(i)))
+        msg._timestamp = self.timestamps[i]
+        return msg
+
+    def indices(self, type=None, start=None, end=None):
+        """
+        Return the indices of the messages of a type (a name or list of names, or ``None`` for all)
+        received between ``start`` and ``end`` (seconds since the epoch, both optional).
+        """
+        first = 0 if start is None else self.seek(start)
+        last = len(self) if end is None else self.seek(end)
+        if type is None:
+            return range(first, last)
+        ids = _message_ids(type)
+        msgids = self.msgids
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is not None:
+            selected = numpy.frombuffer(msgids, dtype=numpy.uint32)[first:last]
+            return (numpy.flatnonzero(numpy.isin(selected, list(ids))) + first).tolist()
+        if len(ids) == 1:
+            (msgid,) = ids
+            return [i for i in range(first, last) if msgids[i] == msgid]
+        return [i for i in range(first, last) if msgids[i] in ids]
+
+    def messages(self, type=None, start=None, end=None):
+        """
+        Iterate over the decoded messages selected as for :py:func:`indices`.
+        """
+        decode = self.decode
+        for i in self.indices(type, start, end):
+            yield decode(i)
+
+    def map(self, fn, type=None, start=None, end=None, processes=None, chunk_size=50000):
+        """
+        Decode the selected messages in parallel worker processes, in chunks of ``chunk_size``, and call
+        ``fn(messages)`` on the list of messages of each chunk.
+
+        ``fn`` must be picklable (a module-level function). Decoding is usually the bulk of the work, so
+        ``fn`` would typically reduce each chunk to something small, such as a summary or a few columns.
+
+        :returns: The results of ``fn`` for each chunk, in log order.
+        """
+        selected = self.indices(type, start, end)
+        tasks = []
+        for first in range(0, len(selected), chunk_size):
+            chunk = selected[first:first + chunk_size]
+            tasks.append((self.path, fn,
+                          array('Q', [self.offsets[i] for i in chunk]),
+                          array('d', [self.timestamps[i] for i in chunk])))
+        if not tasks:
+            return []
+        pool = multiprocessing.Pool(processes)
+        try:
+            return pool.map(_decode_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+
+# Per-process state of TlogReader.map workers: path -> (file, mmap, parser)
+_worker_logs = {}
+
+
+def _decode_chunk(task):
+    path, fn, offsets, timestamps = task
+    if path not in _worker_logs:
+        f = open(path, 'rb')
+        mav = mavutil.mavlink.MAVLink(None)
+        mav.robust_parsing = True
+        _worker_logs[path] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), mav)
+    _, data, mav = _worker_logs[path]
+    msgs = []
+    for offset, timestamp in zip(offsets, timestamps):
+        msg = mav.decode(bytearray(data[offset + 8:offset + 8 + _packet_length(data, offset)]))
+        msg._timestamp = timestamp
+        msgs.append(msg)
+    return fn(msgs)
@@ -23,3 +23,17 @@ class ErrprinterHandler(logging.Handler):
     def emit(self, record):
         msg = self.format(record)
         self.errprinter(msg)
+
+
+def message_payload(msg):
+    """
+    Return the payload of a packed or received MAVLink message as it is on the wire (MAVLink 2 payloads
+    have their trailing zero bytes removed), or ``None`` if the message has not been packed.
+
+    ``msg.get_payload()`` is not used because it assumes a MAVLink 1 header.
+    """
+    buf = msg.get_msgbuf()
+    if not buf:
+        return None
+    header = 10 if buf[0] == 0xFD else 6
+    return bytes(buf[header:header + buf[1]])
@@ -13,6 +13,7 @@ Full documentation is provided at http://python.dronekit.io/examples/flight_repl
 from __future__ import print_function
 
 from dronekit import connect, Command, VehicleMode, LocationGlobalRelative
+from dronekit.tlog import TlogReader
 from pymavlink import mavutil
 import json, urllib, math
 import time
@@ -60,20 +61,14 @@ def position_messages_from_tlog(filename):
     """
     Given telemetry log, get a series of wpts approximating the previous flight
     """
-    # Pull out just the global position msgs
+    # Pull out just the global position msgs (the other messages are never decoded)
     messages = []
-    mlog = mavutil.mavlink_connection(filename)
-    while True:
-        try:
-            m = mlog.recv_match(type=['GLOBAL_POSITION_INT'])
-            if m is None:
-                break
-        except Exception:
-            break
-        # ignore we get where there is no fix:
-        if m.lat == 0:
-            continue
-        messages.append(m)
+    with TlogReader(filename) as mlog:
+        for m in mlog.messages('GLOBAL_POSITION_INT'):
+            # ignore we get where there is no fix:
+            if m.lat == 0:
+                continue
+            messages.append(m)
 
     # Shrink the number of points for readability and to stay within autopilot memory limits. 
     # For coding simplicity we:
@@ -6,15 +6,15 @@
 mission_import_export.py: 
 
 This example demonstrates how to import and export files in the Waypoint file format 
-(http://qgroundcontrol.org/mavlink/waypoint_protocol#waypoint_file_format). The commands are imported
-into a list, and can be modified before saving and/or uploading.
+(http://qgroundcontrol.org/mavlink/waypoint_protocol#waypoint_file_format) using
+CommandSequence.load() and CommandSequence.save().
 
 Documentation is provided at http://python.dronekit.io/examples/mission_import_export.html
 """
 from __future__ import print_function
 
 
-from dronekit import connect, Command
+from dronekit import connect
 import time
 
 
@@ -48,93 +48,31 @@ while not vehicle.is_armable:
     time.sleep(1)
 
 
-def readmission(aFileName):
-    """
-    Load a mission from a file into a list. The mission definition is in the Waypoint file
-    format (http://qgroundcontrol.org/mavlink/waypoint_protocol#waypoint_file_format).
-
-    This function is used by upload_mission().
-    """
-    print("\nReading mission from file: %s" % aFileName)
-    cmds = vehicle.commands
-    missionlist=[]
-    with open(aFileName) as f:
-        for i, line in enumerate(f):
-            if i==0:
-                if not line.startswith('QGC WPL 110'):
-                    raise Exception('File is not supported WP version')
-            else:
-                linearray=line.split('\t')
-                ln_index=int(linearray[0])
-                ln_currentwp=int(linearray[1])
-                ln_frame=int(linearray[2])
-                ln_command=int(linearray[3])
-                ln_param1=float(linearray[4])
-                ln_param2=float(linearray[5])
-                ln_param3=float(linearray[6])
-                ln_param4=float(linearray[7])
-                ln_param5=float(linearray[8])
-                ln_param6=float(linearray[9])
-                ln_param7=float(linearray[10])
-                ln_autocontinue=int(linearray[11].strip())
-                cmd = Command( 0, 0, 0, ln_frame, ln_command, ln_currentwp, ln_autocontinue, ln_param1, ln_param2, ln_param3, ln_param4, ln_param5, ln_param6, ln_param7)
-                missionlist.append(cmd)
-    return missionlist
-
-
 def upload_mission(aFileName):
     """
-    Upload a mission from a file. 
+    Upload a mission from a file in the Waypoint file format
+    (http://qgroundcontrol.org/mavlink/waypoint_protocol#waypoint_file_format).
     """
-    #Read mission from file
-    missionlist = readmission(aFileName)
-    
     print("\nUpload mission from a file: %s" % aFileName)
-    #Clear existing mission from vehicle
-    print(' Clear mission')
     cmds = vehicle.commands
-    cmds.clear()
-    #Add new mission to vehicle
-    for command in missionlist:
-        cmds.add(command)
+    #Replace the existing mission with the one in the file
+    cmds.load(aFileName)
     print(' Upload mission')
-    vehicle.commands.upload()
+    cmds.upload()
 
 
-def download_mission():
+def save_mission(aFileName):
     """
-    Downloads the current mission and returns it in a list.
-    It is used in save_mission() to get the file information to save.
+    Save the mission on the vehicle to a file in the Waypoint file format.
     """
+    print("\nSave mission from Vehicle to file: %s" % aFileName)
+    #Download mission from vehicle
     print(" Download mission from vehicle")
-    missionlist=[]
     cmds = vehicle.commands
     cmds.download()
     cmds.wait_ready()
-    for cmd in cmds:
-        missionlist.append(cmd)
-    return missionlist
-
-def save_mission(aFileName):
-    """
-    Save a mission in the Waypoint file format 
-    (http://qgroundcontrol.org/mavlink/waypoint_protocol#waypoint_file_format).
-    """
-    print("\nSave mission from Vehicle to file: %s" % aFileName)    
-    #Download mission from vehicle
-    missionlist = download_mission()
-    #Add file-format information
-    output='QGC WPL 110\n'
-    #Add home location as 0th waypoint
-    home = vehicle.home_location
-    output+="%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (0,1,0,16,0,0,0,0,home.lat,home.lon,home.alt,1)
-    #Add commands
-    for cmd in missionlist:
-        commandline="%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (cmd.seq,cmd.current,cmd.frame,cmd.command,cmd.param1,cmd.param2,cmd.param3,cmd.param4,cmd.x,cmd.y,cmd.z,cmd.autocontinue)
-        output+=commandline
-    with open(aFileName, 'w') as file_:
-        print(" Write mission to file")
-        file_.write(output)
+    print(" Write mission to file")
+    cmds.save(aFileName)
         
         
 def printfile(aFileName):